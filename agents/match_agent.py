@@ -1,308 +1,402 @@
 import asyncio
+import itertools
+import os
+import socket
+import time
 import uuid
 import logging
+from collections import deque
 from datetime import datetime
 import json
-from typing import Any, Optional, Dict, List, Set, Tuple
+from typing import Any, Deque, Optional, Dict, List, Set, Tuple
 
 from mcp.server.fastmcp import FastMCP
-from mcp.client.streamable_http import streamablehttp_client
-from mcp import ClientSession
-
-# Configure basic logging
-# Set to DEBUG to see detailed Scorer logs
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+from mcp.types import CallToolResult
+
+from common import metrics, tracing
+from common.debug import start_loop_monitor
+from common.mcp_client import call_mcp_tool_async, read_versioned
+from common.leases import FileLeaseStore, PartitionOwnership, RedisLeaseStore
+from common.logging_setup import configure_logging
+from common.memo import LruTtlCache
+from common.ngram_index import CharNGramIndex
+from common.price_index import PriceIndex
+from common.read_cache import ReadCache
+from common.scoring import Scorer
+from common.server import instrument_server
+
+# Configure logging (LOG_LEVEL=DEBUG to see sampled Scorer traces)
+configure_logging("match-agent")
 
 # MCP Server for this agent
 mcp_server = FastMCP("match-agent")
-mcp_server.settings.port = 9002 # Port for this agent's MCP server
+mcp_server.settings.port = int(os.getenv("MATCH_AGENT_PORT", "9002")) # Port for this agent's MCP server (one per replica)
 mcp_server.settings.host = "0.0.0.0" # Recommended for Docker
+instrument_server(mcp_server) # Metrics middleware for every tool below
 
 # Endpoints for other agents (clients of this agent)
-NEED_MCP_URL  = "http://needs-worker:9001/mcp"
-OFFER_MCP_URL = "http://opportunity-agent:9003/mcp"
-SUPPLY_MCP_URL = "http://supplier-agent:9005/mcp" 
+NEED_MCP_URL  = os.getenv("NEED_MCP_URL", "http://needs-worker:9001/mcp")
+OFFER_MCP_URL = os.getenv("OFFER_MCP_URL", "http://opportunity-agent:9003/mcp")
+SUPPLY_MCP_URL = os.getenv("SUPPLY_MCP_URL", "http://supplier-agent:9005/mcp")
+
+# Replicas: with MATCH_LEASE_BACKEND=redis or file, needs are split by id into MATCH_PARTITIONS partitions
+# and each replica only matches the partitions it holds leases for (common/leases.py); "none" runs alone
+MATCH_LEASE_BACKEND = os.getenv("MATCH_LEASE_BACKEND", "none")
+MATCH_REPLICA_ID = os.getenv("MATCH_REPLICA_ID", f"{socket.gethostname()}-{os.getpid()}")
+MATCH_PARTITIONS = int(os.getenv("MATCH_PARTITIONS", "64"))
+MATCH_LEASE_TTL_SECONDS = float(os.getenv("MATCH_LEASE_TTL_SECONDS", "15"))
+MATCH_LEASE_DIR = os.getenv("MATCH_LEASE_DIR", "/tmp/match-leases") # file backend: shared by replicas on one host
+REDIS_HOST = os.getenv("REDIS_HOST", "redis-ai")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+
+# Seconds between background sync_and_match cycles
+MATCH_CYCLE_INTERVAL_SECONDS = float(os.getenv("MATCH_CYCLE_INTERVAL_SECONDS", "30"))
+
+# match_propose memo: scores keyed by the scoring-relevant fields of the pair
+PROPOSE_MEMO_SIZE = int(os.getenv("PROPOSE_MEMO_SIZE", "10000"))
+PROPOSE_MEMO_TTL_SECONDS = float(os.getenv("PROPOSE_MEMO_TTL_SECONDS", "300"))
+
+# Typo-tolerant name retrieval: per need, the FUZZY_TOP_K most similar offer names (char 3-grams)
+# scoring at least FUZZY_MIN_SIMILARITY earn the fuzzy_name score term. Lower the threshold or raise
+# FUZZY_MAX_DF_RATIO (share of names an n-gram may occur in and still be looked up) for more recall.
+FUZZY_TOP_K = int(os.getenv("FUZZY_TOP_K", "10"))
+FUZZY_MIN_SIMILARITY = float(os.getenv("FUZZY_MIN_SIMILARITY", "0.3"))
+FUZZY_MAX_DF_RATIO = float(os.getenv("FUZZY_MAX_DF_RATIO", "0.5"))
+
+# Price pruning: a need with a max_price is only scored against offers priced within the scorer's
+# lenient band (plus offers without a price), found with a bisect over a per-cycle price index.
+# Over-budget offers then no longer match on their name alone; MATCH_PRICE_PRUNING=0 scans every pair.
+MATCH_PRICE_PRUNING = os.getenv("MATCH_PRICE_PRUNING", "1") != "0"
+
+# Match stream: the most recent MATCH_EVENT_BUFFER matches with increasing sequence numbers, read with a
+# cursor through match_events (the insight worker's analytics), so readers see each match once
+MATCH_EVENT_BUFFER = int(os.getenv("MATCH_EVENT_BUFFER", "10000"))
 
 # In-memory caches
 NEEDS_CACHE: List[Dict[str, Any]]  = []
 OFFERS_CACHE: List[Dict[str, Any]] = []
 MATCHES: List[Dict[str, Any]]      = []
-
-# Helper: MCP tool call (asynchronous)
-async def call_mcp_tool_async(mcp_url: str, tool_name: str, arguments: Optional[Dict[str, Any]] = None) -> Optional[Any]:
-    try:
-        async with streamablehttp_client(mcp_url) as (read_stream, write_stream, _):
-            async with ClientSession(read_stream, write_stream) as session:
-                await session.initialize()
-                logging.debug(f"[match_agent_client] Calling MCP tool '{tool_name}' at {mcp_url} with arguments: {arguments}")
-                response = await session.call_tool(tool_name, arguments=arguments or {})
-                logging.debug(f"[match_agent_client] MCP response from '{tool_name}': {response}")
-                return response
-    except Exception as e:
-        logging.error(f"[match_agent_client] MCP call to tool '{tool_name}' at {mcp_url} failed: {e}", exc_info=True)
+for _store_name, _store in (("needs_cache", NEEDS_CACHE), ("offers_cache", OFFERS_CACHE), ("matches", MATCHES)):
+    metrics.register_store_gauge(mcp_server.name, _store_name, _store)
+MATCH_READS = ReadCache(mcp_server.name, "matches") # Versions match_list; bumped when a cycle replaces MATCHES
+MATCH_EVENTS: Deque[Dict[str, Any]] = deque(maxlen=MATCH_EVENT_BUFFER)
+MATCH_EVENT_SEQ = itertools.count(1)
+
+# Match-cycle phase timings: a histogram across cycles plus the most recent cycle as gauges
+MATCH_CYCLE_PHASES = ("fetch", "score", "fulfill", "total")
+MATCH_PHASE_SECONDS = {
+    phase: metrics.REGISTRY.histogram("match_cycle_phase_seconds", "Time spent in each match-cycle phase.", agent=mcp_server.name, phase=phase)
+    for phase in MATCH_CYCLE_PHASES
+}
+LAST_CYCLE_PHASE_SECONDS: Dict[str, float] = {phase: 0.0 for phase in MATCH_CYCLE_PHASES}
+MATCH_PAIRS_SCORED = metrics.REGISTRY.counter("match_pairs_scored_total", "Need/offer pairs scored by match cycles.", agent=mcp_server.name)
+MATCH_PAIRS_PRUNED = metrics.REGISTRY.counter("match_pairs_pruned_total", "Need/offer pairs skipped by price pruning.", agent=mcp_server.name)
+for _phase in MATCH_CYCLE_PHASES:
+    metrics.REGISTRY.gauge("match_cycle_last_phase_seconds", "Phase durations of the most recent match cycle.",
+                           lambda phase=_phase: LAST_CYCLE_PHASE_SECONDS[phase], agent=mcp_server.name, phase=_phase)
+
+# Scoring pipeline (common/scoring.py): SCORER_PIPELINE picks the stages, SCORER_HARD_FILTERS the ones that
+# reject a pair on a miss. Override some weights at startup with SCORER_WEIGHTS='{"exact_name": 4.0}' or at
+# runtime via scorer_configure. A pair becomes a match when it scores above MATCH_SCORE_THRESHOLD; cycle
+# scoring stops a pair as soon as it cannot get there.
+MATCH_SCORE_THRESHOLD = float(os.getenv("MATCH_SCORE_THRESHOLD", "0"))
+
+scorer = Scorer(json.loads(os.getenv("SCORER_WEIGHTS", "{}")), threshold=MATCH_SCORE_THRESHOLD, agent=mcp_server.name)
+OFFER_NAME_INDEX = CharNGramIndex(max_df_ratio=FUZZY_MAX_DF_RATIO) # sku -> offer name, synced from OFFERS_CACHE each cycle
+metrics.REGISTRY.gauge("fuzzy_index_entries", "Offer names held by the fuzzy retrieval index.", lambda: len(OFFER_NAME_INDEX), agent=mcp_server.name)
+PROPOSE_MEMO = LruTtlCache("match_propose", PROPOSE_MEMO_SIZE, PROPOSE_MEMO_TTL_SECONDS, agent=mcp_server.name)
+
+def sync_offer_name_index() -> None:
+    added, removed = OFFER_NAME_INDEX.sync((offer['sku'], offer.get('name', ''))
+                                           for offer in OFFERS_CACHE if isinstance(offer, dict) and offer.get('sku'))
+    if added or removed:
+        logging.debug("[match_agent_sync] Fuzzy index: %d offer names added or renamed, %d removed, %d indexed.", added, removed, len(OFFER_NAME_INDEX))
+
+def fuzzy_candidates(text: str) -> Dict[str, float]:
+    """sku -> name similarity for the offers most similar to `text` (empty when fuzzy_name is disabled)."""
+    if not text or not scorer.has_stage("name") or not scorer.weights["fuzzy_name"]:
+        return {}
+    return dict(OFFER_NAME_INDEX.query(text, FUZZY_TOP_K, FUZZY_MIN_SIMILARITY))
+
+def build_ownership() -> Optional[PartitionOwnership]:
+    if MATCH_LEASE_BACKEND == "redis":
+        store = RedisLeaseStore(REDIS_HOST, REDIS_PORT, prefix=mcp_server.name)
+    elif MATCH_LEASE_BACKEND == "file":
+        store = FileLeaseStore(MATCH_LEASE_DIR)
+    elif MATCH_LEASE_BACKEND == "none":
         return None
-
-# Helper: Parse MCP tool result
-def parse_mcp_list_result(tool_response: Optional[Any], tool_name_for_log: str = "MCP tool") -> List[Dict[str, Any]]:
-    parsed_list: List[Dict[str, Any]] = []
-    if tool_response is None:
-        logging.warning(f"[match_agent_parser] {tool_name_for_log} call returned None, cannot parse to list.")
-        return parsed_list
-    
-    if hasattr(tool_response, 'content') and isinstance(tool_response.content, list):
-        logging.debug(f"[match_agent_parser] Processing CallToolResult from {tool_name_for_log} with {len(tool_response.content)} items in content.")
-        for text_content_item in tool_response.content:
-            if hasattr(text_content_item, 'text') and isinstance(text_content_item.text, str):
-                try:
-                    item_data = json.loads(text_content_item.text)
-                    if isinstance(item_data, dict):
-                        parsed_list.append(item_data)
-                    elif isinstance(item_data, list):
-                        for sub_item in item_data:
-                            if isinstance(sub_item, dict):
-                                parsed_list.append(sub_item)
-                            else:
-                                logging.warning(f"[match_agent_parser] Sub-item in JSON list from {tool_name_for_log} is not a dict: {type(sub_item)}")
-                    else:
-                        logging.warning(f"[match_agent_parser] Parsed item from {tool_name_for_log} is not a dict or list: {type(item_data)}")
-                except json.JSONDecodeError as je:
-                    logging.error(f"[match_agent_parser] Failed to parse JSON from TextContent in {tool_name_for_log} response: '{text_content_item.text}'. Error: {je}")
+    else:
+        raise ValueError(f"Unknown MATCH_LEASE_BACKEND: {MATCH_LEASE_BACKEND}")
+    return PartitionOwnership(MATCH_REPLICA_ID, MATCH_PARTITIONS, store, MATCH_LEASE_TTL_SECONDS)
+
+OWNERSHIP = build_ownership()
+metrics.REGISTRY.gauge("match_partitions_owned", "Need partitions this replica holds leases for.",
+                       lambda: len(OWNERSHIP.owned) if OWNERSHIP is not None else MATCH_PARTITIONS, agent=mcp_server.name)
+
+def build_offer_price_index(offers: List[Dict[str, Any]]) -> Tuple[PriceIndex, List[int]]:
+    """Price index over positions in `offers`, plus the positions of offers without a usable price."""
+    priced, unpriced = [], []
+    for position, offer in enumerate(offers):
+        price = Scorer.offer_price(offer)
+        if price is None:
+            unpriced.append(position)
+        else:
+            priced.append((position, price, None))
+    return PriceIndex.build(priced), unpriced
+
+def candidate_offer_positions(need: Dict[str, Any], price_index: PriceIndex, unpriced: List[int], offer_count: int) -> List[int]:
+    """Positions of the offers worth scoring for a need, in catalog order."""
+    max_price = Scorer.need_max_price(need)
+    if max_price is None:
+        return list(range(offer_count))
+    positions = [position for _, position in price_index.range(scorer.affordable_limit(max_price))]
+    positions.extend(unpriced)
+    positions.sort()
+    return positions
+
+def propose_score(need: Dict[str, Any], offer: Dict[str, Any]) -> float:
+    """scorer.score() memoized on Scorer.features(); a scorer reconfiguration clears the memo."""
+    PROPOSE_MEMO.ensure_version(scorer.fingerprint)
+    features = scorer.features(need, offer)
+    return PROPOSE_MEMO.get_or_compute(features, lambda: scorer.score_features(features, need.get('id'), offer.get('sku')))
+
+async def fulfill_match(need_id: str, offer_sku: str) -> Tuple[bool, bool]:
+    """Marks the need fulfilled and deducts one unit of the offer's stock; returns (fulfilled, delivered)."""
+    fulfillment_successful = False
+    delivery_successful = False
+
+    logging.info("[match_agent_sync] Attempting to fulfill need %s", need_id)
+    fulfillment_args = {"id": need_id} 
+    fulfillment_response_raw = await call_mcp_tool_async(NEED_MCP_URL, "need_fulfill", arguments=fulfillment_args)
+
+    if fulfillment_response_raw and hasattr(fulfillment_response_raw, 'content') and isinstance(fulfillment_response_raw.content, list) and fulfillment_response_raw.content:
+        try:
+            fulfillment_data = json.loads(fulfillment_response_raw.content[0].text)
+            if isinstance(fulfillment_data, dict) and fulfillment_data.get("status") == "fulfilled":
+                fulfillment_successful = True
+                logging.info("[match_agent_sync] Fulfillment call for need %s reported success.", need_id)
             else:
-                logging.warning(f"[match_agent_parser] Item in {tool_name_for_log} response.content is not TextContent or 'text' is not str: {text_content_item}")
-    elif isinstance(tool_response, list):
-        logging.info(f"[match_agent_parser] Received direct list from {tool_name_for_log}.")
-        for item in tool_response:
-            if isinstance(item, dict):
-                parsed_list.append(item)
+                logging.warning(f"[match_agent_sync] Fulfillment for need {need_id} reported: {fulfillment_data.get('status', 'unknown status')} - {fulfillment_data.get('message', '')}")
+        except (json.JSONDecodeError, AttributeError, IndexError, TypeError) as e: # Added TypeError
+            logging.error(f"[match_agent_sync] Error parsing fulfillment response for need {need_id}: {e}. Raw: {fulfillment_response_raw.content[0].text if fulfillment_response_raw.content and hasattr(fulfillment_response_raw.content[0], 'text') else 'No parsable content'}")
+    else:
+        logging.warning(f"[match_agent_sync] Fulfillment call for need {need_id} failed or returned unexpected response: {fulfillment_response_raw}")
+
+    if not fulfillment_successful:
+        # need_fulfill is the commit point: only the caller that closed the need deducts stock, so a need
+        # matched to several offers, or by two replicas during a lease handoff, is delivered once
+        return fulfillment_successful, delivery_successful
+
+    logging.info("[match_agent_sync] Attempting to deliver/deduct stock for offer %s", offer_sku)
+    delivery_args = {"sku": offer_sku, "quantity": 1, "merchant_id": "match_fulfillment_process"}
+    delivery_response_raw = await call_mcp_tool_async(SUPPLY_MCP_URL, "supply_deliver", arguments=delivery_args)
+
+    if delivery_response_raw and hasattr(delivery_response_raw, 'content') and isinstance(delivery_response_raw.content, list) and delivery_response_raw.content:
+        try:
+            delivery_data = json.loads(delivery_response_raw.content[0].text)
+            if isinstance(delivery_data, dict) and delivery_data.get("status") == "delivered":
+                delivery_successful = True
+                logging.info("[match_agent_sync] Delivery call for offer %s reported success.", offer_sku)
             else:
-                logging.warning(f"[match_agent_parser] Item in direct list from {tool_name_for_log} is not a dict: {type(item)}")
+                logging.warning(f"[match_agent_sync] Delivery for offer {offer_sku} reported: {delivery_data.get('status', 'unknown status')} - {delivery_data.get('message', '')}")
+        except (json.JSONDecodeError, AttributeError, IndexError, TypeError) as e: # Added TypeError
+            logging.error(f"[match_agent_sync] Error parsing delivery response for offer {offer_sku}: {e}. Raw: {delivery_response_raw.content[0].text if delivery_response_raw.content and hasattr(delivery_response_raw.content[0], 'text') else 'No parsable content'}")
     else:
-        logging.warning(f"[match_agent_parser] Received an unexpected {tool_name_for_log} response type for list extraction: {type(tool_response)} - {tool_response}")
-    return parsed_list
-
-class Scorer:
-    def score(self, need: Dict[str, Any], offer: Dict[str, Any]) -> float:
-        score = 0.0
-        need_name = need.get('what', '').lower().strip()
-        offer_name = offer.get('name', '').lower().strip()
-        common_tokens = set() 
-        logging.debug(f"[Scorer] Scoring Need: '{need_name}' (ID: {need.get('id')}) vs Offer: '{offer_name}' (SKU: {offer.get('sku')})")
-
-        if need_name and offer_name: 
-            if need_name == offer_name: 
-                score += 3.0
-            elif need_name in offer_name or offer_name in need_name: 
-                score += 1.5
-            
-            need_tokens = set(need_name.split())
-            offer_tokens = set(offer_name.split())
-            common_tokens = need_tokens.intersection(offer_tokens) 
-            if common_tokens:
-                score += len(common_tokens) * 0.75 
-                logging.debug(f"[Scorer] Common tokens: {common_tokens}, score added: {len(common_tokens) * 0.75}")
-
-        logging.debug(f"[Scorer] Score after text match: {score}")
-        
-        max_price = None
-        max_price_elem = need.get('elements', {}).get('max_price', {})
-        if isinstance(max_price_elem, dict): 
-            alts = max_price_elem.get('alternatives', [])
-            for alt_val in alts: 
-                if isinstance(alt_val, (int, float)):
-                    max_price = float(alt_val)
-                    break
-                elif isinstance(alt_val, str):
-                    try:
-                        max_price = float(alt_val)
-                        break 
-                    except ValueError:
-                        continue 
-        
-        logging.debug(f"[Scorer] Parsed max_price from need: {max_price}")
-        
-        offer_price = offer.get('price')
-        if isinstance(offer_price, str): 
-            try:
-                offer_price = float(offer_price)
-            except ValueError:
-                logging.warning(f"[Scorer] Could not parse offer_price string: {offer.get('price')}")
-                offer_price = None
-
-        logging.debug(f"[Scorer] Offer price: {offer_price} (type: {type(offer_price)})")
-
-        if isinstance(offer_price, (int, float)) and max_price is not None:
-            if offer_price <= max_price:
-                score += 1.5 
-                logging.debug(f"[Scorer] Price match success (offer <= max_price). Score increased by 1.5.")
-            elif offer_price <= max_price * 1.1: 
-                score += 0.5 
-                logging.debug(f"[Scorer] Price match lenient (offer <= 110% of max_price). Score increased by 0.5.")
-        
-        if score == 0 and (need_name or offer_name): 
-             if common_tokens: 
-                 score += 0.1
-
-        final_score = round(score, 2)
-        logging.debug(f"[Scorer] Final score for Need ID {need.get('id')} and Offer SKU {offer.get('sku')}: {final_score}")
-        return final_score
+        logging.warning(f"[match_agent_sync] Delivery call for offer {offer_sku} failed or returned unexpected response: {delivery_response_raw}")
+    return fulfillment_successful, delivery_successful
 
-scorer = Scorer()
+async def sync_and_match_cycle() -> None:
+    """Runs a single fetch -> score -> fulfill cycle and replaces MATCHES with its results."""
+    with tracing.start_span("match.cycle", service=mcp_server.name):
+        await _run_match_cycle()
 
-async def sync_and_match_background_task():
+async def _run_match_cycle() -> None:
     global NEEDS_CACHE, OFFERS_CACHE, MATCHES
-    while True:
-        logging.info("[match_agent_sync] Starting sync_and_match cycle.")
-
-        # Create a set of (need_id, offer_sku) tuples from existing matches
-        # to avoid creating duplicate match entries across cycles.
-        existing_match_pairs: Set[Tuple[Optional[str], Optional[str]]] = set()
-        for m in MATCHES:
-            if m.get('need_id') and m.get('offer_sku'): # Ensure both keys exist
-                existing_match_pairs.add((m['need_id'], m['offer_sku']))
-        
-        needs_response_raw = await call_mcp_tool_async(NEED_MCP_URL, 'need_list', arguments={"status_filter": "open"})
-        current_needs = parse_mcp_list_result(needs_response_raw, "need_list")
-        if current_needs: 
-            NEEDS_CACHE[:] = current_needs
-        elif needs_response_raw is not None: 
-            NEEDS_CACHE[:] = []
-
-        offers_response_raw = await call_mcp_tool_async(OFFER_MCP_URL, 'offer_list')
-        current_offers = parse_mcp_list_result(offers_response_raw, "offer_list")
-        if current_offers: 
-            OFFERS_CACHE[:] = current_offers
-        elif offers_response_raw is not None: 
-            OFFERS_CACHE[:] = []
-        
-        new_matches_list: List[Dict[str, Any]] = [] 
-        # Tracks (need_id, offer_sku) pairs processed *within this current cycle*
-        # to avoid redundant processing if caches have duplicates internally.
-        processed_pairs_in_this_cycle: Set[Tuple[Optional[str], Optional[str]]] = set()
-
-        if not NEEDS_CACHE:
-            logging.info("[match_agent_sync] No needs in cache to match.")
-        if not OFFERS_CACHE:
-            logging.info("[match_agent_sync] No offers in cache to match.")
-
-        if NEEDS_CACHE and OFFERS_CACHE:
-            for need in NEEDS_CACHE:
-                need_id = need.get('id')
-                if not need_id:
-                    logging.warning(f"[match_agent_sync] Skipping need without ID: {need.get('what')}")
-                    continue
+    logging.info("[match_agent_sync] Starting sync_and_match cycle.")
+    cycle_started = time.perf_counter()
+
+    # Create a set of (need_id, offer_sku) tuples from existing matches
+    # to avoid creating duplicate match entries across cycles.
+    existing_match_pairs: Set[Tuple[Optional[str], Optional[str]]] = set()
+    for m in MATCHES:
+        if m.get('need_id') and m.get('offer_sku'): # Ensure both keys exist
+            existing_match_pairs.add((m['need_id'], m['offer_sku']))
+    
+    need_list_args: Dict[str, Any] = {"status_filter": "open"}
+    if OWNERSHIP is not None:
+        need_list_args.update(partitions=sorted(OWNERSHIP.owned), partition_count=MATCH_PARTITIONS)
+    # Versioned reads: an unchanged list costs a "not modified" reply and reuses the last decoded copy
+    current_needs, _ = await read_versioned(NEED_MCP_URL, 'need_list', need_list_args)
+    if current_needs is not None: # A failed call keeps the previous cycle's needs
+        NEEDS_CACHE[:] = current_needs
+    if OWNERSHIP is not None: # Leases may have moved while the list was in flight, or since the kept needs were fetched
+        NEEDS_CACHE[:] = [need for need in NEEDS_CACHE if OWNERSHIP.owns(str(need.get('id', '')))]
+
+    # Only the cheapest viable offer per SKU competes; other merchants' offers for it would score the same names
+    current_offers, _ = await read_versioned(OFFER_MCP_URL, 'offer_list', {"best_only": True})
+    if current_offers is not None:
+        OFFERS_CACHE[:] = current_offers
+    sync_offer_name_index()
+    fetch_seconds = time.perf_counter() - cycle_started
+    score_seconds = 0.0
+    fulfill_seconds = 0.0
+    
+    new_matches_list: List[Dict[str, Any]] = [] 
+    # Tracks (need_id, offer_sku) pairs processed *within this current cycle*
+    # to avoid redundant processing if caches have duplicates internally.
+    processed_pairs_in_this_cycle: Set[Tuple[Optional[str], Optional[str]]] = set()
+
+    if not NEEDS_CACHE:
+        logging.info("[match_agent_sync] No needs in cache to match.")
+    if not OFFERS_CACHE:
+        logging.info("[match_agent_sync] No offers in cache to match.")
+
+    if NEEDS_CACHE and OFFERS_CACHE:
+        pruning = MATCH_PRICE_PRUNING and scorer.has_stage("price") # Without a price stage, price says nothing about a pair
+        price_index, unpriced_offers = build_offer_price_index(OFFERS_CACHE) if pruning else (None, [])
+        for need in NEEDS_CACHE:
+            need_id = need.get('id')
+            if not need_id:
+                logging.warning(f"[match_agent_sync] Skipping need without ID: {need.get('what')}")
+                continue
+            fuzzy = fuzzy_candidates(need.get('what', ''))
+            if price_index is not None:
+                positions = candidate_offer_positions(need, price_index, unpriced_offers, len(OFFERS_CACHE))
+                MATCH_PAIRS_PRUNED.inc(len(OFFERS_CACHE) - len(positions))
+                candidates = [OFFERS_CACHE[position] for position in positions]
+            else:
+                candidates = OFFERS_CACHE
 
-                for offer in OFFERS_CACHE:
-                    offer_sku = offer.get('sku')
-                    if not offer_sku:
-                        logging.warning(f"[match_agent_sync] Skipping offer without SKU: {offer.get('name')}")
-                        continue
-                    
-                    current_pair_key = (need_id, offer_sku)
-
-                    # Check if this pair already exists in the global MATCHES list from previous cycles
-                    if current_pair_key in existing_match_pairs:
-                        logging.debug(f"[match_agent_sync] Match for pair {current_pair_key} already exists in global MATCHES. Skipping re-creation.")
-                        # If it already exists, we might want to add it to new_matches_list to keep it,
-                        # or assume it will be re-evaluated if still valid. For now, skip re-adding.
-                        # To keep it: find the existing match and add it to new_matches_list.
-                        # For simplicity here, we are rebuilding MATCHES, so if it's not re-added, it's gone.
-                        # A better approach for persistence would be to only add *new* matches.
-                        # For now, this check prevents re-processing and re-fulfilling.
-                        processed_pairs_in_this_cycle.add(current_pair_key) # Mark as seen to avoid re-scoring in this cycle
-                        continue 
-
-                    # Check if this pair was already processed in *this current cycle*
-                    if current_pair_key in processed_pairs_in_this_cycle:
-                        logging.debug(f"[match_agent_sync] Pair {current_pair_key} already processed in this specific cycle. Skipping.")
-                        continue
+            for offer in candidates:
+                offer_sku = offer.get('sku')
+                if not offer_sku:
+                    logging.warning(f"[match_agent_sync] Skipping offer without SKU: {offer.get('name')}")
+                    continue
+                
+                current_pair_key = (need_id, offer_sku)
+
+                # Check if this pair already exists in the global MATCHES list from previous cycles
+                if current_pair_key in existing_match_pairs:
+                    logging.debug("[match_agent_sync] Match for pair %s already exists in global MATCHES. Skipping re-creation.", current_pair_key)
+                    # If it already exists, we might want to add it to new_matches_list to keep it,
+                    # or assume it will be re-evaluated if still valid. For now, skip re-adding.
+                    # To keep it: find the existing match and add it to new_matches_list.
+                    # For simplicity here, we are rebuilding MATCHES, so if it's not re-added, it's gone.
+                    # A better approach for persistence would be to only add *new* matches.
+                    # For now, this check prevents re-processing and re-fulfilling.
+                    processed_pairs_in_this_cycle.add(current_pair_key) # Mark as seen to avoid re-scoring in this cycle
+                    continue 
+
+                # Check if this pair was already processed in *this current cycle*
+                if current_pair_key in processed_pairs_in_this_cycle:
+                    logging.debug("[match_agent_sync] Pair %s already processed in this specific cycle. Skipping.", current_pair_key)
+                    continue
+                
+                processed_pairs_in_this_cycle.add(current_pair_key) # Mark as processed for this cycle
+
+                score_started = time.perf_counter()
+                score_val = scorer.score(need, offer, fuzzy.get(offer_sku, 0.0))
+                MATCH_PAIRS_SCORED.inc()
+                score_elapsed = time.perf_counter() - score_started
+                score_seconds += score_elapsed
+                if score_val > MATCH_SCORE_THRESHOLD:
+                    fulfill_started = time.perf_counter()
+                    match_id = str(uuid.uuid4())
+                    logging.info("[match_agent_sync] New match identified: ID %s, Need %s, Offer %s, Score %s", match_id, need_id, offer_sku, score_val)
+                    if tracing.is_sampled():
+                        score_ended_ns = time.time_ns()
+                        tracing.record_span("scorer.score", score_ended_ns - int(score_elapsed * 1e9), score_ended_ns,
+                                            {"need_id": need_id, "sku": offer_sku, "score": score_val})
                     
-                    processed_pairs_in_this_cycle.add(current_pair_key) # Mark as processed for this cycle
-
-                    score_val = scorer.score(need, offer)
-                    if score_val > 0: 
-                        match_id = str(uuid.uuid4())
-                        logging.info(f"[match_agent_sync] New match identified: ID {match_id}, Need {need_id}, Offer {offer_sku}, Score {score_val}")
-                        
-                        fulfillment_successful = False
-                        delivery_successful = False
-
-                        logging.info(f"[match_agent_sync] Attempting to fulfill need {need_id}")
-                        fulfillment_args = {"id": need_id} 
-                        fulfillment_response_raw = await call_mcp_tool_async(NEED_MCP_URL, "need_fulfill", arguments=fulfillment_args)
-                        
-                        if fulfillment_response_raw and hasattr(fulfillment_response_raw, 'content') and isinstance(fulfillment_response_raw.content, list) and fulfillment_response_raw.content:
-                            try:
-                                fulfillment_data = json.loads(fulfillment_response_raw.content[0].text)
-                                if isinstance(fulfillment_data, dict) and fulfillment_data.get("status") == "fulfilled":
-                                    fulfillment_successful = True
-                                    logging.info(f"[match_agent_sync] Fulfillment call for need {need_id} reported success.")
-                                else:
-                                    logging.warning(f"[match_agent_sync] Fulfillment for need {need_id} reported: {fulfillment_data.get('status', 'unknown status')} - {fulfillment_data.get('message', '')}")
-                            except (json.JSONDecodeError, AttributeError, IndexError, TypeError) as e: # Added TypeError
-                                logging.error(f"[match_agent_sync] Error parsing fulfillment response for need {need_id}: {e}. Raw: {fulfillment_response_raw.content[0].text if fulfillment_response_raw.content and hasattr(fulfillment_response_raw.content[0], 'text') else 'No parsable content'}")
-                        else:
-                            logging.warning(f"[match_agent_sync] Fulfillment call for need {need_id} failed or returned unexpected response: {fulfillment_response_raw}")
-                        
-                        logging.info(f"[match_agent_sync] Attempting to deliver/deduct stock for offer {offer_sku}")
-                        delivery_args = {"sku": offer_sku, "quantity": 1, "merchant_id": "match_fulfillment_process"}
-                        delivery_response_raw = await call_mcp_tool_async(SUPPLY_MCP_URL, "supply_deliver", arguments=delivery_args)
-
-                        if delivery_response_raw and hasattr(delivery_response_raw, 'content') and isinstance(delivery_response_raw.content, list) and delivery_response_raw.content:
-                            try:
-                                delivery_data = json.loads(delivery_response_raw.content[0].text)
-                                if isinstance(delivery_data, dict) and delivery_data.get("status") == "delivered":
-                                    delivery_successful = True
-                                    logging.info(f"[match_agent_sync] Delivery call for offer {offer_sku} reported success.")
-                                else:
-                                    logging.warning(f"[match_agent_sync] Delivery for offer {offer_sku} reported: {delivery_data.get('status', 'unknown status')} - {delivery_data.get('message', '')}")
-                            except (json.JSONDecodeError, AttributeError, IndexError, TypeError) as e: # Added TypeError
-                                logging.error(f"[match_agent_sync] Error parsing delivery response for offer {offer_sku}: {e}. Raw: {delivery_response_raw.content[0].text if delivery_response_raw.content and hasattr(delivery_response_raw.content[0], 'text') else 'No parsable content'}")
-                        else:
-                            logging.warning(f"[match_agent_sync] Delivery call for offer {offer_sku} failed or returned unexpected response: {delivery_response_raw}")
-
-                        new_matches_list.append({
-                            'id': match_id,
-                            'need_id': need_id,
-                            'offer_sku': offer_sku,
-                            'score': score_val,
-                            'timestamp': datetime.utcnow().isoformat() + 'Z',
-                            'fulfillment_attempted': True,
-                            'fulfillment_successful': fulfillment_successful,
-                            'delivery_attempted': True,
-                            'delivery_successful': delivery_successful
-                        })
-        
-        # Preserve existing matches that were not re-evaluated as new
-        # This logic ensures MATCHES is additive for new unique pairs,
-        # and existing ones are kept if not re-processed.
-        # However, the current design rebuilds MATCHES from new_matches_list.
-        # To truly avoid duplicates AND keep old ones, we'd modify MATCHES in place or merge.
-        
-        # For now, the logic is: if a pair (need,offer) was in MATCHES at start of cycle,
-        # it's skipped for re-processing and re-fulfillment.
-        # The new_matches_list will only contain *newly formed* unique matches from this cycle.
-        # To keep old matches, they would need to be added back if not re-processed.
-        # A simpler model for this iteration: MATCHES is the result of *this cycle's new findings*.
-        # The `existing_match_pairs` check prevents re-fulfilling.
-        # If the goal is that MATCHES should be a persistent list of *all unique matches ever found and not explicitly removed*,
-        # then the update logic for MATCHES needs to be an append of new_matches_list items not already in MATCHES.
-
-        # Current logic: MATCHES is overwritten with only newly processed, unique matches from this cycle.
-        # This means if a need/offer disappears from cache, its old match also disappears from MATCHES.
-        # The `existing_match_pairs` check primarily prevents re-triggering fulfillment for matches
-        # that might still be formed from cached items but were already in MATCHES.
-
-        # Let's refine: The `MATCHES` list should reflect current valid matches.
-        # The `existing_match_pairs` check is good to prevent re-fulfillment.
-        # The `new_matches_list` should be what forms the new `MATCHES`.
-        MATCHES[:] = new_matches_list
-        logging.info(f"[match_agent_sync] Sync complete: {len(NEEDS_CACHE)} needs, {len(OFFERS_CACHE)} offers → {len(MATCHES)} new unique matches processed this cycle.")
-        await asyncio.sleep(30)
+                    with tracing.start_span("match.fulfill", attributes={"need_id": need_id, "sku": offer_sku, "score": score_val}):
+                        fulfillment_successful, delivery_successful = await fulfill_match(need_id, offer_sku)
+                    fulfill_seconds += time.perf_counter() - fulfill_started
+
+                    match = {
+                        'id': match_id,
+                        'seq': next(MATCH_EVENT_SEQ),
+                        'need_id': need_id,
+                        'offer_sku': offer_sku,
+                        'merchant_id': offer.get('merchant_id'),
+                        'score': score_val,
+                        'timestamp': datetime.utcnow().isoformat() + 'Z',
+                        'classification': need.get('classification'),
+                        'need_created_at': need.get('created_at'),
+                        'price': Scorer.offer_price(offer),
+                        'max_price': Scorer.need_max_price(need),
+                        'fulfillment_attempted': True,
+                        'fulfillment_successful': fulfillment_successful,
+                        'delivery_attempted': fulfillment_successful,
+                        'delivery_successful': delivery_successful
+                    }
+                    new_matches_list.append(match)
+                    MATCH_EVENTS.append(match)
+                    if fulfillment_successful:
+                        break # The need is closed: every later offer would only cost a need_fulfill call answered "not found"
+    
+    # Preserve existing matches that were not re-evaluated as new
+    # This logic ensures MATCHES is additive for new unique pairs,
+    # and existing ones are kept if not re-processed.
+    # However, the current design rebuilds MATCHES from new_matches_list.
+    # To truly avoid duplicates AND keep old ones, we'd modify MATCHES in place or merge.
+    
+    # For now, the logic is: if a pair (need,offer) was in MATCHES at start of cycle,
+    # it's skipped for re-processing and re-fulfillment.
+    # The new_matches_list will only contain *newly formed* unique matches from this cycle.
+    # To keep old matches, they would need to be added back if not re-processed.
+    # A simpler model for this iteration: MATCHES is the result of *this cycle's new findings*.
+    # The `existing_match_pairs` check prevents re-fulfilling.
+    # If the goal is that MATCHES should be a persistent list of *all unique matches ever found and not explicitly removed*,
+    # then the update logic for MATCHES needs to be an append of new_matches_list items not already in MATCHES.
+
+    # Current logic: MATCHES is overwritten with only newly processed, unique matches from this cycle.
+    # This means if a need/offer disappears from cache, its old match also disappears from MATCHES.
+    # The `existing_match_pairs` check primarily prevents re-triggering fulfillment for matches
+    # that might still be formed from cached items but were already in MATCHES.
+
+    # Let's refine: The `MATCHES` list should reflect current valid matches.
+    # The `existing_match_pairs` check is good to prevent re-fulfillment.
+    # The `new_matches_list` should be what forms the new `MATCHES`.
+    if MATCHES or new_matches_list:
+        MATCH_READS.bump()
+    MATCHES[:] = new_matches_list
+    LAST_CYCLE_PHASE_SECONDS.update(fetch=fetch_seconds, score=score_seconds, fulfill=fulfill_seconds,
+                                    total=time.perf_counter() - cycle_started)
+    for phase, seconds in LAST_CYCLE_PHASE_SECONDS.items():
+        MATCH_PHASE_SECONDS[phase].observe(seconds)
+    logging.info(f"[match_agent_sync] Sync complete: {len(NEEDS_CACHE)} needs, {len(OFFERS_CACHE)} offers → {len(MATCHES)} new unique matches processed this cycle.")
+
+async def sync_and_match_background_task():
+    while True:
+        await sync_and_match_cycle()
+        await asyncio.sleep(MATCH_CYCLE_INTERVAL_SECONDS)
 
 @mcp_server.tool("match_list")
-def match_list_tool() -> List[Dict[str, Any]]:
-    logging.info(f"[match_agent_server] match_list_tool (MCP tool 'match_list') called. Returning {len(MATCHES)} matches.")
-    return MATCHES
+def match_list_tool(known_version: Optional[str] = None, accept: Optional[str] = None) -> CallToolResult:
+    """
+    The matches of the latest cycle. The version is in the result's _meta; pass it back as
+    `known_version` to get a {"status": "not_modified"} reply while no cycle changed them.
+    `accept` lists the bulk encodings the caller reads (common.bulk).
+    """
+    logging.debug("[match_agent_server] match_list_tool (MCP tool 'match_list') called. Returning %d matches.", len(MATCHES))
+    return MATCH_READS.respond(("match_list",), known_version, lambda: MATCHES, accept)
+
+@mcp_server.tool("match_events")
+def match_events_tool(after: int = 0, limit: int = 1000) -> Dict[str, Any]:
+    """
+    The matches with a sequence number above `after`, oldest first, at most `limit` of them. Pass the returned
+    `next` as `after` to continue; `dropped` counts matches that left the buffer before this reader got them.
+    A cursor ahead of the stream (the agent restarted) starts over from the oldest buffered match.
+    """
+    newest = MATCH_EVENTS[-1]['seq'] if MATCH_EVENTS else 0
+    if after > newest:
+        after = 0
+    if not MATCH_EVENTS or after >= newest:
+        return {"events": [], "next": after, "dropped": 0}
+    oldest = MATCH_EVENTS[0]['seq']
+    start = max(after + 1, oldest)
+    events = list(itertools.islice(MATCH_EVENTS, start - oldest, start - oldest + max(1, limit)))
+    return {"events": events, "next": events[-1]['seq'], "dropped": start - after - 1}
 
 @mcp_server.tool("match_propose")
 def match_propose_tool(need: Dict[str, Any], offer: Dict[str, Any]) -> Dict[str, Any]:
@@ -310,8 +404,8 @@ def match_propose_tool(need: Dict[str, Any], offer: Dict[str, Any]) -> Dict[str,
         logging.warning(f"[match_agent_server] match_propose_tool called with invalid need/offer types.")
         return {"error": "Invalid input format for need/offer.", "score": 0, "status": "error"}
         
-    score_val = scorer.score(need, offer)
-    logging.info(f"[match_agent_server] match_propose_tool called for need '{need.get('id')}' and offer '{offer.get('sku')}'. Score: {score_val}")
+    score_val = propose_score(need, offer)
+    logging.debug("[match_agent_server] match_propose_tool called for need '%s' and offer '%s'. Score: %s", need.get('id'), offer.get('sku'), score_val)
     # Note: This propose tool does NOT currently trigger need fulfillment or stock deduction.
     return {
         'need_id': need.get('id'),
@@ -321,12 +415,87 @@ def match_propose_tool(need: Dict[str, Any], offer: Dict[str, Any]) -> Dict[str,
         'timestamp': datetime.utcnow().isoformat() + 'Z'
     }
 
+@mcp_server.tool("match_propose_many")
+def match_propose_many_tool(pairs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Scores a batch of {"need": ..., "offer": ...} pairs; results are in input order and shaped like match_propose's.
+    """
+    results = []
+    timestamp = datetime.utcnow().isoformat() + 'Z'
+    for pair in pairs:
+        need = pair.get("need") if isinstance(pair, dict) else None
+        offer = pair.get("offer") if isinstance(pair, dict) else None
+        if not isinstance(need, dict) or not isinstance(offer, dict):
+            results.append({"error": "Invalid input format for need/offer.", "score": 0, "status": "error"})
+            continue
+        results.append({
+            'need_id': need.get('id'),
+            'offer_sku': offer.get('sku'),
+            'score': propose_score(need, offer),
+            'status': 'success',
+            'timestamp': timestamp
+        })
+    logging.debug("[match_agent_server] match_propose_many_tool scored %d pairs. Memo: %s", len(results), PROPOSE_MEMO.stats())
+    return results
+
+@mcp_server.tool("scorer_configure")
+def scorer_configure_tool(weights: Optional[Dict[str, float]] = None, stages: Optional[List[str]] = None,
+                          hard_filters: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Updates some of the Scorer's weights, its stages (e.g. ["name", "price", "category"]) or the
+    stages run as hard filters (common/scoring.py), and returns the active configuration with the
+    match_propose memo statistics. Call with no arguments to just read it.
+    """
+    if weights or stages is not None or hard_filters is not None:
+        try:
+            scorer.configure(weights, stages, hard_filters)
+        except (ValueError, TypeError) as e:
+            logging.warning(f"[match_agent_server] scorer_configure_tool rejected weights {weights}, stages {stages}, hard filters {hard_filters}: {e}")
+            return {"status": "error", "message": str(e), "weights": scorer.weights, "stages": scorer.describe()}
+        logging.info("[match_agent_server] Scorer updated: stages %s, weights %s", [stage.name for stage in scorer.stages], scorer.weights)
+    return {"status": "success", "weights": scorer.weights, "stages": scorer.describe(), "threshold": MATCH_SCORE_THRESHOLD,
+            "propose_memo": PROPOSE_MEMO.stats()}
+
+@mcp_server.tool("match_candidates")
+def match_candidates_tool(what: str, k: Optional[int] = None, min_similarity: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Offers from the last cycle whose names are most similar to `what` (typo-tolerant, char 3-grams).
+    Defaults to FUZZY_TOP_K and FUZZY_MIN_SIMILARITY.
+    """
+    hits = OFFER_NAME_INDEX.query(what, k or FUZZY_TOP_K, FUZZY_MIN_SIMILARITY if min_similarity is None else min_similarity)
+    names = {offer.get('sku'): offer.get('name') for offer in OFFERS_CACHE if isinstance(offer, dict)}
+    return [{"offer_sku": sku, "name": names.get(sku), "similarity": similarity} for sku, similarity in hits]
+
+@mcp_server.tool("match_ownership")
+def match_ownership_tool() -> Dict[str, Any]:
+    """
+    This replica's id, the need partitions it holds leases for and the live replicas it sees.
+    """
+    if OWNERSHIP is None:
+        return {"replica_id": MATCH_REPLICA_ID, "backend": "none", "partitions": MATCH_PARTITIONS, "owned": list(range(MATCH_PARTITIONS))}
+    return {"replica_id": MATCH_REPLICA_ID, "backend": MATCH_LEASE_BACKEND, "partitions": MATCH_PARTITIONS,
+            "owned": sorted(OWNERSHIP.owned), "members": OWNERSHIP.members, "rebalances": OWNERSHIP.rebalances}
+
+def startup() -> None:
+    """Starts the lease keeper and the match cycle; call it with the event loop running."""
+    if OWNERSHIP is not None:
+        asyncio.create_task(OWNERSHIP.run()) # Cycles match nothing until the first leases are held
+    asyncio.create_task(sync_and_match_background_task())
+    start_loop_monitor()
+
+async def shutdown() -> None:
+    if OWNERSHIP is not None:
+        await OWNERSHIP.leave()
+
 async def main():
     logging.info("[match_agent] Match Agent (MCP Server) starting...")
-    asyncio.create_task(sync_and_match_background_task())
+    startup()
     
     logging.info(f"[match_agent] MCP server starting on {mcp_server.settings.host}:{mcp_server.settings.port}")
-    await mcp_server.run_streamable_http_async()
+    try:
+        await mcp_server.run_streamable_http_async()
+    finally:
+        await shutdown()
 
 if __name__ == '__main__':
     try:
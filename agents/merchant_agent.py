@@ -1,19 +1,23 @@
 import uuid
 import random
 import time
-from datetime import datetime
 import asyncio
 import logging
 
 from mcp.client.streamable_http import streamablehttp_client
 from mcp import ClientSession
 
-# Configure basic logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from common.logging_setup import configure_logging
+from common.mcp_client import parse_mcp_list_result, parse_mcp_single_dict_result
+from common.pricing import reprice_and_publish
+
+# Configure logging (LOG_LEVEL / LOG_FORMAT from the environment)
+configure_logging("merchant-agent")
 
 # MCP endpoints
 SUPPLY_MCP_URL = "http://supplier-agent:9005/mcp"
 OFFER_MCP_URL  = "http://opportunity-agent:9003/mcp"
+NEED_MCP_URL   = "http://needs-worker:9001/mcp" # need_demand, for pricing
 
 # Define merchant profiles
 MERCHANT_TYPES = [
@@ -75,7 +79,8 @@ def create_merchants(n=8):
             "name": name,
             "type": profile["type"],
             "specialty": profile["specialty"],
-            "markup": profile["markup"]
+            "markup": profile["markup"],
+            "inventory": {} # sku -> quantity held, offered at the prices common.pricing sets each cycle
         })
     logging.info(f"Created {len(MERCHANTS)} merchants.")
 
@@ -83,12 +88,7 @@ def create_merchants(n=8):
 def simulate_cycle():
     logging.info("Starting merchant simulation cycle...")
     # Get supplies from supplier-agent (MCP)
-    supplies_response = asyncio.run(call_mcp_tool(SUPPLY_MCP_URL, "supply_list"))
-    supplies = []
-    if isinstance(supplies_response, list):
-        supplies = supplies_response
-    elif supplies_response is not None:
-        logging.warning(f"Received non-list response from supply_list: {type(supplies_response)} - {supplies_response}")
+    supplies = parse_mcp_list_result(asyncio.run(call_mcp_tool(SUPPLY_MCP_URL, "supply_list")), "supply_list")
 
     if not supplies:
         logging.warning("No supplies received from supplier-agent. Skipping offer creation for this cycle.")
@@ -114,38 +114,20 @@ def simulate_cycle():
         logging.info(f"Merchant {m['name']} attempting to purchase {quantity_to_purchase}x {item_to_purchase['sku']} from supplier via MCP.")
         purchase_args = {"sku": item_to_purchase["sku"], "quantity": quantity_to_purchase, "merchant_id": m["id"]}
         # Note: supplier_id is not part of supply_deliver tool in supplier_agent.py based on previous conversions
-        purchase_resp = asyncio.run(call_mcp_tool(SUPPLY_MCP_URL, "supply_deliver", arguments=purchase_args))
+        purchase_resp = parse_mcp_single_dict_result(asyncio.run(call_mcp_tool(SUPPLY_MCP_URL, "supply_deliver", arguments=purchase_args)), "supply_deliver")
         
         if purchase_resp and purchase_resp.get("status") == "delivered":
             delivered_quantity = purchase_resp.get('quantity_delivered', 0)
             logging.info(f"Merchant {m['name']} successfully purchased {delivered_quantity}x {item_to_purchase['sku']} via MCP.")
             
-            price_bought = item_to_purchase.get("price", 0)
-            sell_price = round(price_bought * (1 + m["markup"]), 2)
-            
-            offer_payload = {
-                "sku": item_to_purchase["sku"],
-                "supplier_sku": item_to_purchase.get("sku"), # Assuming this is what you intend
-                "merchant_id": m["id"],
-                "merchant_name": m["name"],
-                "type": item_to_purchase.get("type"),
-                "name": item_to_purchase.get("name"),
-                "price": sell_price,
-                "quantity": delivered_quantity # Use actual delivered quantity
-            }
-            
-            # Publish offer to opportunity-agent (MCP)
-            mcp_offer_args = {"offer": offer_payload}
-            logging.info(f"Merchant {m['name']} attempting to publish offer for {offer_payload['sku']} via MCP to opportunity-agent.")
-            offer_publish_response = asyncio.run(call_mcp_tool(OFFER_MCP_URL, "offer_publish", arguments=mcp_offer_args))
-            
-            if offer_publish_response and offer_publish_response.get("status") == "stored":
-                logging.info(f"[{datetime.utcnow().isoformat()}Z] Merchant {m['name']} listed {offer_payload['quantity']}x {offer_payload['sku']} at {sell_price}. MCP Response: {offer_publish_response}")
-            else:
-                logging.warning(f"[{datetime.utcnow().isoformat()}Z] Merchant {m['name']} failed to list offer for {offer_payload['sku']}. MCP Response: {offer_publish_response}")
+            inventory = m["inventory"]
+            inventory[item_to_purchase["sku"]] = inventory.get(item_to_purchase["sku"], 0) + delivered_quantity
         else:
             logging.warning(f"Merchant {m['name']} failed to purchase {item_to_purchase['sku']} via MCP. Response: {purchase_resp}")
 
+    # Price everything the merchants hold from this cycle's demand, stock and competing offers, in one batch
+    asyncio.run(reprice_and_publish(MERCHANTS, supplies, NEED_MCP_URL, OFFER_MCP_URL))
+
 if __name__ == "__main__":
     create_merchants(n=8) # Default to 8 merchants
     logging.info("Merchant Agent (Simulator using MCP) started. Press Ctrl+C to stop.")
@@ -1,22 +1,45 @@
 from mcp.server.fastmcp import FastMCP
+from mcp.types import CallToolResult
 import logging
+
+from common import metrics
+from common.debug import start_loop_monitor
+from common.journal import Journal
+from common.logging_setup import configure_logging
+from common.order_book import OrderBook
+from common.read_cache import ReadCache
+from common.server import instrument_server
 # import socket # Not strictly needed if host is hardcoded to "0.0.0.0"
 from datetime import datetime
+from typing import Optional
 
-# In-memory store of published offers, now a dictionary keyed by SKU
-OFFERS: dict[str, dict] = {}
+# In-memory order book of published offers: one per (sku, merchant_id), cheapest first per SKU
+OFFERS = OrderBook()
 
 # Initialize MCP server
 mcp = FastMCP("opportunity-agent")
 mcp.settings.port = 9003
 mcp.settings.host = "0.0.0.0" # Recommended for Docker
+instrument_server(mcp) # Metrics middleware for every tool below
+metrics.register_store_gauge(mcp.name, "offers", OFFERS)
+OFFERS_JOURNAL = Journal("offers", OFFERS.items) # No-op unless STORE_DATA_DIR is set; keyed by (sku, merchant_id)
+OFFER_READS = ReadCache(mcp.name, "offers") # Versions offer_list; bumped on every publish / withdraw
+
+def restore_offers() -> None:
+    for journal_key, offer in OFFERS_JOURNAL.recover().items():
+        key, _ = OFFERS.publish(offer)
+        if journal_key != key: # Journals written before the order book were keyed by SKU alone
+            OFFERS_JOURNAL.delete(journal_key)
+            OFFERS_JOURNAL.put(key, offer)
+    OFFER_READS.bump()
 
 @mcp.tool("offer_publish")
 def offer_publish(offer: dict) -> dict:
     """
-    Publish a new offer or update an existing one based on SKU.
+    Publish a new offer or update the merchant's existing one for the SKU.
     Expects a dictionary for 'offer' containing at least 'sku'.
-    Other common fields: 'merchant_id', 'name', 'price', 'quantity'.
+    Other common fields: 'merchant_id', 'name', 'price', 'quantity'. Merchants each keep
+    their own offer per SKU; offers with quantity <= 0 are kept but never ranked as best.
     """
     if not isinstance(offer, dict):
         logging.warning(f"[opportunity_agent] offer_publish received non-dict offer: {type(offer)}")
@@ -27,42 +50,119 @@ def offer_publish(offer: dict) -> dict:
         logging.warning(f"[opportunity_agent] offer_publish received offer with missing or invalid SKU: {offer}")
         return {"status": "error", "message": "Offer SKU is missing or invalid.", "offer_data": offer, "timestamp": datetime.utcnow().isoformat() + "Z"}
 
-    action = "updated" if offer_sku in OFFERS else "added"
-    OFFERS[offer_sku] = offer # Add or update the offer
+    key, replaced = OFFERS.publish(offer)
+    OFFERS_JOURNAL.put(key, offer)
+    OFFER_READS.bump()
+    action = "updated" if replaced else "added"
     
-    logging.info(f"[opportunity_agent] Offer {action}: SKU '{offer_sku}'. Current total offers: {len(OFFERS)}")
-    logging.debug(f"[opportunity_agent] Offer details: {offer}")
+    logging.info("[opportunity_agent] Offer %s: SKU '%s' by merchant '%s'. Current total offers: %d", action, offer_sku, key[1], len(OFFERS))
+    logging.debug("[opportunity_agent] Offer details: %s", offer)
     
-    return {"status": action, "offer_sku": offer_sku, "timestamp": datetime.utcnow().isoformat() + "Z"}
+    return {"status": action, "offer_sku": offer_sku, "merchant_id": key[1], "timestamp": datetime.utcnow().isoformat() + "Z"}
+
+@mcp.tool("offer_publish_many")
+def offer_publish_many(offers: list) -> dict:
+    """
+    Publish or update a batch of offers in one call (merchant repricing cycles).
+    Entries that are not dicts with a string 'sku' are skipped and reported in 'rejected' by their index.
+    """
+    if not isinstance(offers, list):
+        logging.warning(f"[opportunity_agent] offer_publish_many received non-list offers: {type(offers)}")
+        return {"status": "error", "message": "Invalid offers format, expected a list.", "timestamp": datetime.utcnow().isoformat() + "Z"}
+
+    added, updated, rejected = 0, 0, []
+    for index, offer in enumerate(offers):
+        if not isinstance(offer, dict) or not isinstance(offer.get("sku"), str) or not offer["sku"]:
+            rejected.append({"index": index, "message": "Offer SKU is missing or invalid."})
+            continue
+        key, replaced = OFFERS.publish(offer)
+        OFFERS_JOURNAL.put(key, offer)
+        if replaced:
+            updated += 1
+        else:
+            added += 1
+    if added or updated:
+        OFFER_READS.bump()
+    logging.info("[opportunity_agent] Batch of %d offers: %d added, %d updated, %d rejected. Current total offers: %d",
+                 len(offers), added, updated, len(rejected), len(OFFERS))
+    return {"status": "stored", "added": added, "updated": updated, "rejected": rejected, "timestamp": datetime.utcnow().isoformat() + "Z"}
+
+@mcp.tool("offer_withdraw")
+def offer_withdraw(sku: str, merchant_id: str) -> dict:
+    """
+    Remove a merchant's offer for a SKU.
+    """
+    offer = OFFERS.withdraw(sku, merchant_id)
+    if offer is None:
+        return {"status": "not_found", "sku": sku, "merchant_id": merchant_id, "message": "No offer from this merchant for the SKU.", "timestamp": datetime.utcnow().isoformat() + "Z"}
+    OFFERS_JOURNAL.delete((sku, merchant_id))
+    OFFER_READS.bump()
+    logging.info("[opportunity_agent] Offer withdrawn: SKU '%s' by merchant '%s'. Current total offers: %d", sku, merchant_id, len(OFFERS))
+    return {"status": "withdrawn", "offer_sku": sku, "merchant_id": merchant_id, "timestamp": datetime.utcnow().isoformat() + "Z"}
 
 @mcp.tool("offer_list")
-def offer_list() -> list:
+def offer_list(best_only: bool = False, known_version: Optional[str] = None, accept: Optional[str] = None) -> CallToolResult:
+    """
+    List all stored offers, or with best_only only the cheapest viable offer of each SKU.
+    The collection version is in the result's _meta; pass it back as `known_version` to get a
+    {"status": "not_modified"} reply instead of the list while no offer changed. `accept` lists the
+    bulk encodings the caller reads (common.bulk); without it the list is JSON.
     """
-    List all stored offers.
+    logging.debug("[opportunity_agent] offer_list(best_only=%s) called.", best_only)
+    return OFFER_READS.respond(("offer_list", best_only), known_version,
+                               lambda: OFFERS.best_per_sku() if best_only else list(OFFERS.values()), accept)
+
+@mcp.tool("offer_best")
+def offer_best(sku: str, k: int = 1) -> list:
+    """
+    The k cheapest viable offers for a SKU, cheapest first.
+    """
+    return OFFERS.best(sku, k)
+
+@mcp.tool("offer_query")
+def offer_query(max_price: float, category: Optional[str] = None, tolerance: float = 0.0) -> list:
+    """
+    Viable offers priced at most max_price * (1 + tolerance), cheapest first; category
+    restricts the search to offers with that 'category'.
     """
-    # Return the values of the dictionary (the offer objects) as a list
-    list_of_offers = list(OFFERS.values())
-    logging.info(f"[opportunity_agent] Returning {len(list_of_offers)} offers.")
-    return list_of_offers
+    offers = OFFERS.under(max_price, category, tolerance)
+    logging.debug("[opportunity_agent] offer_query(max_price=%s, category=%s, tolerance=%s) -> %d offers.", max_price, category, tolerance, len(offers))
+    return offers
+
+@mcp.tool("offer_list_by_sku")
+def offer_list_by_sku(sku: str) -> list:
+    """
+    Every merchant's offer for a SKU, cheapest first.
+    """
+    return OFFERS.by_sku(sku)
 
 @mcp.tool("get_offer_by_sku")
-def get_offer_by_sku(sku: str) -> dict:
+def get_offer_by_sku(sku: str, merchant_id: Optional[str] = None) -> dict:
     """
-    Retrieve a specific offer by its SKU.
+    Retrieve a merchant's offer for a SKU, or the cheapest viable one when no merchant is given.
     """
     if not isinstance(sku, str):
         return {"status": "error", "message": "Invalid SKU format provided."}
         
-    offer = OFFERS.get(sku)
+    if merchant_id is not None:
+        offer = OFFERS.get(sku, merchant_id)
+    else:
+        best = OFFERS.best(sku)
+        offer = best[0] if best else None
     if offer:
-        logging.info(f"[opportunity_agent] Returning offer for SKU: {sku}")
+        logging.debug("[opportunity_agent] Returning offer for SKU: %s", sku)
         return {"status": "found", "offer": offer, "timestamp": datetime.utcnow().isoformat() + "Z"}
     else:
-        logging.info(f"[opportunity_agent] Offer not found for SKU: {sku}")
+        logging.debug("[opportunity_agent] Offer not found for SKU: %s", sku)
         return {"status": "not_found", "sku": sku, "message": "Offer with the specified SKU does not exist.", "timestamp": datetime.utcnow().isoformat() + "Z"}
 
+def startup() -> None:
+    restore_offers()
+    start_loop_monitor()
+
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    configure_logging("opportunity-agent")
+    startup()
     # You could pre-populate some offers here for testing if needed
     # OFFERS["TESTSKU001"] = {"sku": "TESTSKU001", "name": "Test Offer", "price": 9.99, "quantity": 10, "merchant_id": "MERCHTEST"}
     logging.info(f"Opportunity Agent (MCP - Upgraded) starting on port {mcp.settings.port} host {mcp.settings.host}")
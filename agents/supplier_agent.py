@@ -1,7 +1,22 @@
 from mcp.server.fastmcp import FastMCP
+from mcp.types import CallToolResult
+import asyncio
 import logging
+import os
+import time
 import uuid
 from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from common import metrics
+from common.debug import start_loop_monitor
+from common.journal import Journal
+from common.logging_setup import configure_logging
+from common.read_cache import ReadCache
+from common.server import instrument_server
+from common.stock_forecast import DeliveryHistory, ReplenishmentScheduler
 
 # In-memory store of supplies
 SUPPLIES = {} # Using a dictionary to store supplies by SKU
@@ -10,9 +25,49 @@ SUPPLIES = {} # Using a dictionary to store supplies by SKU
 mcp = FastMCP("supplier-agent")
 mcp.settings.port = 9005
 mcp.settings.host = "0.0.0.0" # Recommended for Docker
+instrument_server(mcp) # Metrics middleware for every tool below
+metrics.register_store_gauge(mcp.name, "supplies", SUPPLIES)
+SUPPLIES_JOURNAL = Journal("supplies", SUPPLIES.items) # No-op unless STORE_DATA_DIR is set
+SUPPLY_READS = ReadCache(mcp.name, "supplies") # Versions supply_list; bumped on every change to SUPPLIES, stock included
+
+# Depletion tracking: units requested per SKU in SUPPLY_HISTORY_BUCKETS buckets of SUPPLY_HISTORY_BUCKET_SECONDS,
+# weighted with a SUPPLY_FORECAST_HALF_LIFE_SECONDS half-life for the demand rate behind the forecasts
+SUPPLY_HISTORY_BUCKET_SECONDS = float(os.getenv("SUPPLY_HISTORY_BUCKET_SECONDS", "60"))
+SUPPLY_HISTORY_BUCKETS = int(os.getenv("SUPPLY_HISTORY_BUCKETS", "240"))
+SUPPLY_FORECAST_HALF_LIFE_SECONDS = float(os.getenv("SUPPLY_FORECAST_HALF_LIFE_SECONDS", "1800"))
+# Replenishment: every SUPPLY_REPLENISH_INTERVAL_SECONDS, SKUs that would run out before an order placed now
+# arrives (SUPPLY_REPLENISH_LEAD_SECONDS) get one for SUPPLY_REPLENISH_COVER_SECONDS of demand beyond that
+SUPPLY_REPLENISH_ENABLED = os.getenv("SUPPLY_REPLENISH_ENABLED", "1") != "0"
+SUPPLY_REPLENISH_INTERVAL_SECONDS = float(os.getenv("SUPPLY_REPLENISH_INTERVAL_SECONDS", "30"))
+SUPPLY_REPLENISH_LEAD_SECONDS = float(os.getenv("SUPPLY_REPLENISH_LEAD_SECONDS", "300"))
+SUPPLY_REPLENISH_COVER_SECONDS = float(os.getenv("SUPPLY_REPLENISH_COVER_SECONDS", "3600"))
+# supply_forecast's watchlist: SKUs forecast to run out within this many seconds
+SUPPLY_WATCHLIST_SECONDS = float(os.getenv("SUPPLY_WATCHLIST_SECONDS", "3600"))
+
+DELIVERY_HISTORY = DeliveryHistory(SUPPLY_HISTORY_BUCKET_SECONDS, SUPPLY_HISTORY_BUCKETS, SUPPLY_FORECAST_HALF_LIFE_SECONDS)
+SUPPLY_STOCKOUTS = metrics.REGISTRY.counter("supply_stockouts_total", "Deliveries refused for lack of stock.", agent=mcp.name)
+
+def stock_of(skus: List[str]) -> np.ndarray:
+    stock = [SUPPLIES.get(sku, {}).get("stock", 0) for sku in skus]
+    return np.array([value if isinstance(value, (int, float)) else 0 for value in stock], dtype=np.float64)
+
+def restock(sku: str, units: int) -> None:
+    """Replenishment callback: a restock order for `sku` arrived."""
+    supply_item = SUPPLIES.get(sku)
+    if supply_item is None:
+        logging.warning("[supplier_agent] Restock of %d x %s arrived for an unknown SKU; dropped.", units, sku)
+        return
+    supply_item["stock"] = supply_item.get("stock", 0) + units
+    supply_item["last_restocked_at"] = datetime.utcnow().isoformat() + "Z"
+    SUPPLIES_JOURNAL.put(sku, supply_item)
+    SUPPLY_READS.bump()
+    logging.info("[supplier_agent] Restocked %d x %s. New stock: %s", units, sku, supply_item["stock"])
+
+REPLENISHER = ReplenishmentScheduler(mcp.name, DELIVERY_HISTORY, stock_of, restock, SUPPLY_REPLENISH_INTERVAL_SECONDS,
+                                     SUPPLY_REPLENISH_LEAD_SECONDS, SUPPLY_REPLENISH_COVER_SECONDS)
 
 def initialize_supplies():
-    """Initializes some default supplies."""
+    """Initializes some default supplies, keeping any recovered from the journal."""
     default_supplies_data = [
         {"sku": "CEREAL001", "name": "Breakfast Cereal", "type": "Goods", "category": "food", "stock": 100, "price": 3.50},
         {"sku": "CLEANSRV01", "name": "Office Cleaning Service", "type": "Services", "category": "cleaning", "stock": 50, "price": 150.00}, # Stock for services can mean capacity
@@ -21,9 +76,14 @@ def initialize_supplies():
         {"sku": "FINCONSULT01", "name": "Financial Consulting Hour", "type": "financial services", "category": "consulting", "stock": 200, "price": 120.00},
         {"sku": "GENCONSULT01", "name": "General Consulting Hour", "type": "consulting services", "category": "consulting", "stock": 150, "price": 100.00},
     ]
+    added = 0
     for supply_data in default_supplies_data:
-        SUPPLIES[supply_data["sku"]] = supply_data
-    logging.info(f"Initialized {len(SUPPLIES)} default supplies.")
+        if supply_data["sku"] not in SUPPLIES:
+            SUPPLIES[supply_data["sku"]] = supply_data
+            added += 1
+        DELIVERY_HISTORY.row(supply_data["sku"])
+    SUPPLY_READS.bump()
+    logging.info(f"Initialized {added} default supplies ({len(SUPPLIES)} total).")
 
 @mcp.tool("supply_add")
 def supply_add(supply: dict) -> dict:
@@ -37,18 +97,46 @@ def supply_add(supply: dict) -> dict:
 
     sku = supply["sku"]
     SUPPLIES[sku] = supply
-    logging.info(f"[supplier_agent] Added/Updated supply: {sku}, Stock: {supply.get('stock')}")
+    SUPPLIES_JOURNAL.put(sku, supply)
+    SUPPLY_READS.bump()
+    DELIVERY_HISTORY.row(sku)
+    logging.info("[supplier_agent] Added/Updated supply: %s, Stock: %s", sku, supply.get('stock'))
     return {"status": "added_or_updated", "sku": sku, "timestamp": datetime.utcnow().isoformat() + "Z"}
 
+@mcp.tool("supply_add_many")
+def supply_add_many(supplies: list) -> dict:
+    """
+    Add or update several supplies in one call.
+    Entries without a 'sku' are skipped and reported in 'rejected' by their index.
+    """
+    if not isinstance(supplies, list):
+        logging.warning(f"[supplier_agent] supply_add_many received non-list supplies: {type(supplies)}")
+        return {"status": "error", "message": "Invalid supplies format, expected a list."}
+
+    skus, rejected = [], []
+    for index, supply in enumerate(supplies):
+        if not isinstance(supply, dict) or not supply.get("sku"):
+            rejected.append({"index": index, "message": "Invalid supply data or missing SKU."})
+            continue
+        SUPPLIES[supply["sku"]] = supply
+        SUPPLIES_JOURNAL.put(supply["sku"], supply)
+        DELIVERY_HISTORY.row(supply["sku"])
+        skus.append(supply["sku"])
+    if skus:
+        SUPPLY_READS.bump()
+    logging.info("[supplier_agent] Added/Updated %d supplies in bulk, %d rejected.", len(skus), len(rejected))
+    return {"status": "added_or_updated", "skus": skus, "rejected": rejected, "timestamp": datetime.utcnow().isoformat() + "Z"}
+
 @mcp.tool("supply_list")
-def supply_list() -> list:
+def supply_list(known_version: Optional[str] = None, accept: Optional[str] = None) -> CallToolResult:
     """
     List all available supplies.
+    The collection version is in the result's _meta; pass it back as `known_version` to get a
+    {"status": "not_modified"} reply instead of the list while no supply changed. `accept` lists the
+    bulk encodings the caller reads (common.bulk); without it the list is JSON.
     """
-    # Return a list of supply objects (the values of the dictionary)
-    list_of_supplies = list(SUPPLIES.values())
-    logging.info(f"[supplier_agent] Returning {len(list_of_supplies)} supplies.")
-    return list_of_supplies
+    logging.debug("[supplier_agent] supply_list called (%d supplies).", len(SUPPLIES))
+    return SUPPLY_READS.respond(("supply_list",), known_version, lambda: list(SUPPLIES.values()), accept)
 
 @mcp.tool("supply_deliver")
 def supply_deliver(sku: str, quantity: int, merchant_id: str) -> dict:
@@ -61,19 +149,80 @@ def supply_deliver(sku: str, quantity: int, merchant_id: str) -> dict:
 
     if sku in SUPPLIES:
         supply_item = SUPPLIES[sku]
+        DELIVERY_HISTORY.record(sku, quantity) # Refused requests are demand too
         if supply_item["stock"] >= quantity:
             supply_item["stock"] -= quantity
-            logging.info(f"[supplier_agent] Delivered {quantity} of {sku} to {merchant_id}. New stock: {supply_item['stock']}")
+            SUPPLIES_JOURNAL.put(sku, supply_item)
+            SUPPLY_READS.bump()
+            logging.info("[supplier_agent] Delivered %s of %s to %s. New stock: %s", quantity, sku, merchant_id, supply_item['stock'])
             return {"status": "delivered", "sku": sku, "quantity_delivered": quantity, "remaining_stock": supply_item["stock"], "timestamp": datetime.utcnow().isoformat() + "Z"}
         else:
+            SUPPLY_STOCKOUTS.inc()
             logging.warning(f"[supplier_agent] Insufficient stock for {sku}. Requested: {quantity}, Available: {supply_item['stock']}")
             return {"status": "error", "message": "Insufficient stock", "sku": sku, "requested": quantity, "available": supply_item["stock"]}
     else:
         logging.warning(f"[supplier_agent] Supply SKU not found: {sku}")
         return {"status": "error", "message": "SKU not found", "sku": sku}
 
-if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+def _iso(epoch: float) -> Optional[str]:
+    return datetime.utcfromtimestamp(epoch).isoformat() + "Z" if np.isfinite(epoch) else None
+
+@mcp.tool("supply_forecast")
+def supply_forecast(sku: Optional[str] = None, limit: int = 100) -> dict:
+    """
+    Demand rate, time to stockout and restock orders per SKU, soonest stockout first (at most `limit`
+    SKUs, or just `sku`), plus the watchlist of SKUs forecast to run out within SUPPLY_WATCHLIST_SECONDS.
+    """
+    now = time.time()
+    forecast = REPLENISHER.forecast(now)
+    order = np.argsort(forecast["seconds_to_stockout"], kind="stable")
+
+    def entry(i: int) -> Dict[str, Any]:
+        name = DELIVERY_HISTORY.skus[i]
+        seconds = float(forecast["seconds_to_stockout"][i])
+        arrival = REPLENISHER.on_order.get(name)
+        return {
+            "sku": name,
+            "stock": float(forecast["stock"][i]),
+            "on_order": float(forecast["on_order"][i]),
+            "demand_per_hour": round(float(forecast["rate"][i]) * 3600, 3),
+            "hours_to_stockout": round(seconds / 3600, 3) if np.isfinite(seconds) else None,
+            "stockout_at": _iso(now + seconds),
+            "reorder_point": round(float(forecast["reorder_point"][i]), 2),
+            "restock_arrives_at": _iso(arrival[0]) if arrival else None,
+        }
+
+    if sku is not None:
+        row = DELIVERY_HISTORY.rows.get(sku)
+        skus = [entry(row)] if row is not None else []
+    else:
+        skus = [entry(i) for i in order[:max(0, limit)].tolist()]
+    watch = order[forecast["seconds_to_stockout"][order] < SUPPLY_WATCHLIST_SECONDS]
+    return {
+        "generated_at": _iso(now),
+        "skus": skus,
+        "watchlist": [entry(i) for i in watch[:max(0, limit)].tolist()],
+        "watchlist_size": int(len(watch)),
+        "replenishment": {"enabled": SUPPLY_REPLENISH_ENABLED, "lead_seconds": SUPPLY_REPLENISH_LEAD_SECONDS,
+                          "orders_in_transit": len(REPLENISHER.on_order)},
+    }
+
+def startup() -> None:
+    """Restores the journal, seeds the demo supplies and starts replenishment; call it with the event loop running."""
+    SUPPLIES.update(SUPPLIES_JOURNAL.recover())
+    SUPPLY_READS.bump()
+    for sku in SUPPLIES:
+        DELIVERY_HISTORY.row(sku)
     initialize_supplies() # Initialize with some data
+    if SUPPLY_REPLENISH_ENABLED:
+        REPLENISHER.start()
+    start_loop_monitor()
+
+async def main():
+    configure_logging("supplier-agent")
+    startup()
     logging.info(f"Supplier Agent (MCP) starting on port {mcp.settings.port} host {mcp.settings.host}")
-    mcp.run(transport="streamable-http")
\ No newline at end of file
+    await mcp.run_streamable_http_async()
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+All-in-one deployment: the needs worker, opportunity, supplier and match agents and the insight
+worker in one asyncio process, for small deployments and CI.
+
+Inter-agent calls (match -> needs/opportunity/supplier, insight -> match) are routed to the
+in-process servers by `common.mcp_client.register_local_server`. They run the same tools
+through the same middleware (metrics, admission control, capture, tracing) and return the same
+results, but skip HTTP, sockets and the per-call MCP session. The agents keep their
+configured URLs (NEED_MCP_URL, ...), and those URLs simply resolve in-process.
+
+    PYTHONPATH=. python all_in_one.py           # in-process only
+    PYTHONPATH=. python all_in_one.py --http    # also serve each agent's MCP endpoint on its usual port
+
+With --http (or ALL_IN_ONE_HTTP=1) the dashboard, load generators and other external clients
+can still reach every agent over HTTP on ports 9001/9002/9003/9005/9006.
+"""
+import time
+
+_STARTED = time.perf_counter()  # Before the agent imports, which are most of the startup time
+
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from common.logging_setup import configure_logging
+from common.mcp_client import register_local_server
+
+ALL_IN_ONE_HTTP = os.getenv("ALL_IN_ONE_HTTP", "0") != "0"
+
+# Agent name -> (module, FastMCP attribute), in startup order
+AGENT_MODULES = {
+    "needs-worker": ("workers.needs_worker", "mcp_server"),
+    "opportunity-agent": ("agents.opportunity_agent", "mcp"),
+    "supplier-agent": ("agents.supplier_agent", "mcp"),
+    "match-agent": ("agents.match_agent", "mcp_server"),
+    "insight-worker": ("workers.insight_worker", "mcp_server"),
+}
+
+# (calling agent, its URL setting, agent that serves it)
+ROUTES = [
+    ("match-agent", "NEED_MCP_URL", "needs-worker"),
+    ("match-agent", "OFFER_MCP_URL", "opportunity-agent"),
+    ("match-agent", "SUPPLY_MCP_URL", "supplier-agent"),
+    ("insight-worker", "MATCH_MCP_URL", "match-agent"),
+]
+
+
+def load_agents() -> Dict[str, Any]:
+    configure_logging("all-in-one")
+    return {agent: importlib.import_module(module_path) for agent, (module_path, _) in AGENT_MODULES.items()}
+
+
+def server_of(modules: Dict[str, Any], agent: str) -> Any:
+    return getattr(modules[agent], AGENT_MODULES[agent][1])
+
+
+def route_locally(modules: Dict[str, Any]) -> List[str]:
+    """Registers every inter-agent URL with the in-process server behind it; returns the URLs."""
+    urls = []
+    for caller, setting, target in ROUTES:
+        url = getattr(modules[caller], setting)
+        register_local_server(url, server_of(modules, target))
+        urls.append(url)
+    return urls
+
+
+async def run(http: bool) -> None:
+    modules = load_agents()
+    for url in route_locally(modules):
+        logging.info("[all_in_one] %s is served in-process.", url)
+    for module in modules.values():
+        module.startup()
+    logging.info("[all_in_one] %d agents ready in %.3fs (HTTP endpoints %s).", len(modules),
+                 time.perf_counter() - _STARTED, "on" if http else "off")
+    try:
+        if http:
+            await asyncio.gather(*(server_of(modules, agent).run_streamable_http_async() for agent in modules))
+        else:
+            await asyncio.Event().wait()
+    finally:
+        await modules["match-agent"].shutdown()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the core agents in one process.")
+    parser.add_argument("--http", action="store_true", default=ALL_IN_ONE_HTTP,
+                        help="Also serve each agent's MCP endpoint over HTTP (ALL_IN_ONE_HTTP=1).")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(run(args.http))
+    except KeyboardInterrupt:
+        logging.info("[all_in_one] Stopped by user.")
+
+
+if __name__ == "__main__":
+    main()
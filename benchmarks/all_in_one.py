@@ -0,0 +1,170 @@
+"""
+All-in-one process vs one process per agent: startup time, memory and inter-agent call latency.
+
+- startup: wall time from spawning until every agent answers an MCP call over HTTP, for
+  `all_in_one.py --http` and for the five agent scripts started side by side (the compose
+  layout without containers), plus the resident memory of the processes once ready
+- latency: the calls the agents make to each other, as they make them
+  (`call_mcp_tool_async`: one HTTP session per call), over one long-lived HTTP session, and
+  dispatched in-process as the all-in-one launcher routes them
+
+Uses the agents' usual ports (9001-9006), so nothing else may be listening there.
+
+    python -m benchmarks.all_in_one --calls 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import all_in_one
+from benchmarks.pipeline_throughput import _percentiles
+from common.mcp_client import call_mcp_tool_async, call_tool_with_backoff, mcp_session, register_local_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+AGENT_SCRIPTS = {
+    "needs-worker": ("workers/needs_worker.py", 9001),
+    "opportunity-agent": ("agents/opportunity_agent.py", 9003),
+    "supplier-agent": ("agents/supplier_agent.py", 9005),
+    "match-agent": ("agents/match_agent.py", 9002),
+    "insight-worker": ("workers/insight_worker.py", 9006),
+}
+# A cheap read-only tool per agent, for readiness checks and latency samples
+PROBE_TOOLS = {
+    "needs-worker": ("need_summary", {}),
+    "opportunity-agent": ("offer_list", {"best_only": True}),
+    "supplier-agent": ("supply_list", {}),
+    "match-agent": ("match_list", {}),
+    "insight-worker": ("prediction_list", {}),
+}
+
+
+def _url(port: int) -> str:
+    return f"http://127.0.0.1:{port}/mcp"
+
+
+def _env() -> Dict[str, str]:
+    return dict(os.environ, PYTHONPATH=REPO_ROOT, LOG_LEVEL="WARNING",
+                NEED_MCP_URL=_url(9001), OFFER_MCP_URL=_url(9003), SUPPLY_MCP_URL=_url(9005), MATCH_MCP_URL=_url(9002))
+
+
+def _rss_kb(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _port_open(port: int) -> bool:
+    with socket.socket() as sock:
+        sock.settimeout(0.2)
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+
+async def wait_until_ready(started: float, timeout: float) -> float:
+    pending = dict(AGENT_SCRIPTS)
+    while pending:
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError(f"agents not ready after {timeout}s: {sorted(pending)}")
+        for agent, (_, port) in list(pending.items()):
+            if _port_open(port):
+                tool, arguments = PROBE_TOOLS[agent]
+                if await call_mcp_tool_async(_url(port), tool, arguments) is not None:
+                    del pending[agent]
+        await asyncio.sleep(0.02)
+    return time.perf_counter() - started
+
+
+def stop(processes: List[subprocess.Popen]) -> None:
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def measure_startup(commands: List[List[str]], timeout: float) -> Dict[str, Any]:
+    started = time.perf_counter()
+    processes = [subprocess.Popen(command, cwd=REPO_ROOT, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for command in commands]
+    try:
+        ready = await wait_until_ready(started, timeout)
+        rss = [_rss_kb(process.pid) for process in processes]
+        return {"processes": len(processes), "ready_s": round(ready, 3),
+                "rss_kb": sum(value for value in rss if value) if all(rss) else None}
+    finally:
+        stop(processes)
+
+
+async def sample(label: str, calls: int, call) -> Dict[str, Any]:
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        result = await call()
+        if result is None or getattr(result, "isError", False):
+            raise RuntimeError(f"{label}: call failed: {result}")
+        latencies.append(time.perf_counter() - start)
+    return _percentiles(latencies)
+
+
+async def measure_latency(calls: int, timeout: float) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"per_call_session": {}, "shared_session": {}, "in_process": {}}
+    processes = [subprocess.Popen([sys.executable, script], cwd=REPO_ROOT, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for script, _ in AGENT_SCRIPTS.values()]
+    try:
+        await wait_until_ready(time.perf_counter(), timeout)
+        for agent, (_, port) in AGENT_SCRIPTS.items():
+            tool, arguments = PROBE_TOOLS[agent]
+            results["per_call_session"][f"{agent}/{tool}"] = await sample(
+                agent, calls, lambda: call_mcp_tool_async(_url(port), tool, arguments))
+            async with mcp_session(_url(port)) as session:
+                results["shared_session"][f"{agent}/{tool}"] = await sample(
+                    agent, calls, lambda: call_tool_with_backoff(session, tool, arguments))
+    finally:
+        stop(processes)
+
+    modules = all_in_one.load_agents()
+    for agent in AGENT_SCRIPTS:
+        local_url = f"http://{agent}.in-process/mcp"
+        register_local_server(local_url, all_in_one.server_of(modules, agent))
+        tool, arguments = PROBE_TOOLS[agent]
+        if agent == "supplier-agent":
+            modules[agent].initialize_supplies()  # The separate process seeded its demo supplies too
+        results["in_process"][f"{agent}/{tool}"] = await sample(agent, calls, lambda: call_mcp_tool_async(local_url, tool, arguments))
+    return results
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    separate = await measure_startup([[sys.executable, script] for script, _ in AGENT_SCRIPTS.values()], args.timeout)
+    combined = await measure_startup([[sys.executable, "all_in_one.py", "--http"]], args.timeout)
+    latency = await measure_latency(args.calls, args.timeout)
+    return {
+        "benchmark": "all_in_one",
+        "cpus": os.cpu_count(),
+        "startup": {"separate_processes": separate, "all_in_one": combined},
+        "latency": latency,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="All-in-one launcher vs one process per agent.")
+    parser.add_argument("--calls", type=int, default=200, help="Latency samples per agent and mode.")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
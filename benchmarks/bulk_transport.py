@@ -0,0 +1,96 @@
+"""
+Bytes on the wire and decode time of a large offer_list (`common.bulk`) in each encoding.
+
+Builds --offers synthetic offers shaped like the merchants' published ones (sku, supplier_sku,
+merchant_id, merchant_name, type, name, price, quantity) and serializes them as the MCP result
+a server sends:
+
+- fastmcp_json: the list returned as a plain tool result (one indented TextContent per offer),
+  as offer_list did before versioned reads
+- json: one compact JSON TextContent (versioned reads without `accept`)
+- msgpack+zstd, msgpack+gzip, json+zstd, json+gzip: bulk results, where installed
+
+Reports wire bytes (the JSON-serialized CallToolResult), server encode time and client decode time
+(validating the CallToolResult from the wire, then `parse_mcp_list_result`), and checks that
+each encoding decodes to the original offers.
+
+    python -m benchmarks.bulk_transport --offers 100000
+"""
+import argparse
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from mcp.server.fastmcp.utilities.func_metadata import func_metadata
+from mcp.types import CallToolResult
+
+from common import bulk
+from common.mcp_client import parse_mcp_list_result
+from common.read_cache import ReadCache
+
+MERCHANT_TYPES = ["Retailer", "Wholesaler", "Reseller", "Boutique"]
+
+
+def synthetic_offers(rng: random.Random, count: int, skus: int, merchants: int) -> List[Dict[str, Any]]:
+    offers = []
+    for i in range(count):
+        sku, merchant = rng.randrange(skus), rng.randrange(merchants)
+        offers.append({"sku": f"SKU-{sku:05d}", "supplier_sku": f"SKU-{sku:05d}", "merchant_id": f"merchant-{merchant:04d}",
+                       "merchant_name": f"{MERCHANT_TYPES[merchant % 4]} {merchant}", "type": rng.choice(["Goods", "Services", "Land"]),
+                       "name": f"item {sku}", "price": round(rng.uniform(1, 500), 2), "quantity": rng.randint(1, 100)})
+    return offers
+
+
+def best_of(repeat: int, fn: Callable[[], Any]) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def fastmcp_result(offers: List[Dict[str, Any]]) -> CallToolResult:
+    def offer_list() -> list:
+        return offers
+    result = func_metadata(offer_list).convert_result(offers)
+    content, structured = result if isinstance(result, tuple) else (result, None)
+    return CallToolResult(content=list(content), structuredContent=structured)
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    offers = synthetic_offers(random.Random(args.seed), args.offers, args.skus, args.merchants)
+    builders: Dict[str, Callable[[], CallToolResult]] = {"fastmcp_json": lambda: fastmcp_result(offers)}
+    for encoding in [bulk.JSON] + bulk.available_encodings():
+        builders[encoding] = lambda encoding=encoding: ReadCache._result(offers, "bench-1", encoding)
+
+    report: Dict[str, Any] = {}
+    for name, build in builders.items():
+        result = build()
+        wire = result.model_dump_json(by_alias=True, exclude_none=True)
+        decode = lambda: parse_mcp_list_result(CallToolResult.model_validate_json(wire), "offer_list")
+        report[name] = {
+            "wire_bytes": len(wire.encode()),
+            "encode_ms": round(best_of(args.repeat, build) * 1000, 1),
+            "decode_ms": round(best_of(args.repeat, decode) * 1000, 1),
+            "round_trip_ok": decode() == offers,
+        }
+    baseline = report["fastmcp_json"]["wire_bytes"]
+    for row in report.values():
+        row["wire_ratio"] = round(row["wire_bytes"] / baseline, 4)
+    return {"benchmark": "bulk_transport", "offers": args.offers, "encodings": report}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Wire size and decode time of bulk encodings vs JSON.")
+    parser.add_argument("--offers", type=int, default=100000)
+    parser.add_argument("--skus", type=int, default=5000)
+    parser.add_argument("--merchants", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per timing; the best is reported.")
+    parser.add_argument("--seed", type=int, default=1234)
+    print(json.dumps(run(parser.parse_args(argv)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
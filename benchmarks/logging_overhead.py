@@ -0,0 +1,177 @@
+"""
+Match-cycle CPU time with logging at DEBUG vs INFO, before and after the logging rework.
+
+"Before" is the scorer as it was with six f-string debug calls per pair, writing through a
+synchronous StreamHandler. "After" is the current `Scorer` (lazy, 1-in-N sampled debug
+output) behind the queue-backed JSON handler from `common.logging_setup`. Both write to
+os.devnull, so the numbers are formatting/dispatch cost rather than terminal speed.
+
+    python -m benchmarks.logging_overhead --needs 200 --offers 200
+"""
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from agents import match_agent
+from common import scoring
+from common.logging_setup import TEXT_FORMAT, JsonFormatter, _QueueHandler
+from common.mcp_client import parse_mcp_list_result
+
+
+# Verbatim copy of Scorer before the logging rework, kept as the benchmark baseline
+class LegacyScorer:
+    def score(self, need: Dict[str, Any], offer: Dict[str, Any]) -> float:
+        score = 0.0
+        need_name = need.get('what', '').lower().strip()
+        offer_name = offer.get('name', '').lower().strip()
+        common_tokens = set() 
+        logging.debug(f"[Scorer] Scoring Need: '{need_name}' (ID: {need.get('id')}) vs Offer: '{offer_name}' (SKU: {offer.get('sku')})")
+
+        if need_name and offer_name: 
+            if need_name == offer_name: 
+                score += 3.0
+            elif need_name in offer_name or offer_name in need_name: 
+                score += 1.5
+            
+            need_tokens = set(need_name.split())
+            offer_tokens = set(offer_name.split())
+            common_tokens = need_tokens.intersection(offer_tokens) 
+            if common_tokens:
+                score += len(common_tokens) * 0.75 
+                logging.debug(f"[Scorer] Common tokens: {common_tokens}, score added: {len(common_tokens) * 0.75}")
+
+        logging.debug(f"[Scorer] Score after text match: {score}")
+        
+        max_price = None
+        max_price_elem = need.get('elements', {}).get('max_price', {})
+        if isinstance(max_price_elem, dict): 
+            alts = max_price_elem.get('alternatives', [])
+            for alt_val in alts: 
+                if isinstance(alt_val, (int, float)):
+                    max_price = float(alt_val)
+                    break
+                elif isinstance(alt_val, str):
+                    try:
+                        max_price = float(alt_val)
+                        break 
+                    except ValueError:
+                        continue 
+        
+        logging.debug(f"[Scorer] Parsed max_price from need: {max_price}")
+        
+        offer_price = offer.get('price')
+        if isinstance(offer_price, str): 
+            try:
+                offer_price = float(offer_price)
+            except ValueError:
+                logging.warning(f"[Scorer] Could not parse offer_price string: {offer.get('price')}")
+                offer_price = None
+
+        logging.debug(f"[Scorer] Offer price: {offer_price} (type: {type(offer_price)})")
+
+        if isinstance(offer_price, (int, float)) and max_price is not None:
+            if offer_price <= max_price:
+                score += 1.5 
+                logging.debug(f"[Scorer] Price match success (offer <= max_price). Score increased by 1.5.")
+            elif offer_price <= max_price * 1.1: 
+                score += 0.5 
+                logging.debug(f"[Scorer] Price match lenient (offer <= 110% of max_price). Score increased by 0.5.")
+        
+        if score == 0 and (need_name or offer_name): 
+             if common_tokens: 
+                 score += 0.1
+
+        final_score = round(score, 2)
+        logging.debug(f"[Scorer] Final score for Need ID {need.get('id')} and Offer SKU {offer.get('sku')}: {final_score}")
+        return final_score
+
+
+def make_payloads(rng: random.Random, needs: int, offers: int) -> Dict[str, Any]:
+    words = ["standard", "premium", "laptop", "cereal", "cleaning", "service", "consulting", "hour", "road", "desk"]
+    need_items = [{"id": f"need-{i}", "what": " ".join(rng.sample(words, 2)),
+                   "elements": {"max_price": {"alternatives": [rng.randint(5, 500)]}}} for i in range(needs)]
+    offer_items = [{"sku": f"SKU-{i}", "name": " ".join(rng.sample(words, 3)), "price": round(rng.uniform(5, 500), 2)}
+                   for i in range(offers)]
+
+    def as_tool_result(items: List[Dict[str, Any]]) -> Any:
+        return SimpleNamespace(content=[SimpleNamespace(text=json.dumps(item)) for item in items])
+
+    return {"needs": as_tool_result(need_items), "offers": as_tool_result(offer_items)}
+
+
+def run_cycle(score: Callable[[Dict[str, Any], Dict[str, Any]], float], payloads: Dict[str, Any]) -> float:
+    """Parse both list responses and score every pair, as the match cycle's CPU-bound part does."""
+    started = time.perf_counter()
+    needs = parse_mcp_list_result(payloads["needs"], "need_list")
+    offers = parse_mcp_list_result(payloads["offers"], "offer_list")
+    for need in needs:
+        for offer in offers:
+            score(need, offer)
+    return time.perf_counter() - started
+
+
+def install_before(level: str, sink: Any) -> Optional[logging.handlers.QueueListener]:
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    _reset_root(handler, level)
+    return None
+
+
+def install_after(level: str, sink: Any) -> Optional[logging.handlers.QueueListener]:
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(JsonFormatter("benchmark"))
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _reset_root(_QueueHandler(log_queue), level)
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
+def _reset_root(handler: logging.Handler, level: str) -> None:
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Match-cycle time at DEBUG vs INFO, before and after the logging rework.")
+    parser.add_argument("--needs", type=int, default=200)
+    parser.add_argument("--offers", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3, help="Cycles per configuration; the fastest is reported.")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args(argv)
+
+    payloads = make_payloads(random.Random(args.seed), args.needs, args.offers)
+    variants = {
+        "before": (install_before, LegacyScorer().score),
+        "after": (install_after, match_agent.Scorer().score),
+    }
+    results: Dict[str, Dict[str, float]] = {}
+    with open(os.devnull, "w") as sink:
+        for variant, (install, score) in variants.items():
+            for level in ("DEBUG", "INFO"):
+                listener = install(level, sink)
+                best = min(run_cycle(score, payloads) for _ in range(args.repeat))
+                if listener is not None:
+                    listener.stop()
+                results.setdefault(variant, {})[level] = round(best * 1000.0, 3)
+
+    print(json.dumps({
+        "benchmark": "logging_overhead",
+        "pairs": args.needs * args.offers,
+        "scorer_debug_sample_every": scoring.SCORER_DEBUG_SAMPLE_EVERY,
+        "cycle_ms": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
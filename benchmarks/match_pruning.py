@@ -0,0 +1,70 @@
+"""
+Scoring-phase cost of the match cycle with and without price pruning (`MATCH_PRICE_PRUNING`).
+
+Runs the cycle's candidate selection and scoring in-process on synthetic needs and offers
+(no MCP calls, no fulfillment) and reports pairs scored, time, and how many positive-score
+pairs each mode finds; pruning only drops pairs whose offer is priced above the need's
+lenient band, which can then only have scored on their names.
+
+    python -m benchmarks.match_pruning --needs 2000 --offers 5000
+"""
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from agents import match_agent
+from benchmarks.pipeline_throughput import make_need, make_offer
+
+
+def score_all(needs: List[Dict[str, Any]], offers: List[Dict[str, Any]], pruning: bool) -> Dict[str, Any]:
+    started = time.perf_counter()
+    price_index, unpriced = match_agent.build_offer_price_index(offers) if pruning else (None, [])
+    index_seconds = time.perf_counter() - started
+    pairs = positive = 0
+    for need in needs:
+        if price_index is not None:
+            candidates = [offers[p] for p in match_agent.candidate_offer_positions(need, price_index, unpriced, len(offers))]
+        else:
+            candidates = offers
+        for offer in candidates:
+            pairs += 1
+            if match_agent.scorer.score(need, offer) > 0:
+                positive += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "pairs_scored": pairs,
+        "positive_pairs": positive,
+        "seconds": round(elapsed, 4),
+        "index_build_ms": round(index_seconds * 1000, 3),
+        "pairs_per_sec": round(pairs / elapsed) if elapsed else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Match-cycle price pruning benchmark.")
+    parser.add_argument("--needs", type=int, default=2000)
+    parser.add_argument("--offers", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    offers = [make_offer(rng, i) for i in range(args.offers)]
+    needs = [make_need(rng) for _ in range(args.needs)]
+    full = score_all(needs, offers, pruning=False)
+    pruned = score_all(needs, offers, pruning=True)
+    report = {
+        "benchmark": "match_pruning",
+        "needs": args.needs,
+        "offers": args.offers,
+        "full_scan": full,
+        "price_pruned": pruned,
+        "pairs_pruned_pct": round(100.0 * (1 - pruned["pairs_scored"] / full["pairs_scored"]), 2) if full["pairs_scored"] else None,
+        "speedup": round(full["seconds"] / pruned["seconds"], 2) if pruned["seconds"] else None,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Match throughput with several match-agent replicas sharing the need partitions.
+
+Boots the needs, opportunity and supplier agents in-process (as pipeline_throughput does),
+then for each replica count starts that many `agents/match_agent.py` processes on this host
+with the file lease backend. Once the replicas hold every partition between them, a batch of
+needs is added and the run lasts until all of them are fulfilled. Each run also checks that
+every need was fulfilled once and that exactly one unit of stock was delivered per need.
+
+    python -m benchmarks.match_replicas --replicas 1 2 4 --needs 400 --offers 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.pipeline_throughput import Pipeline, _free_port, make_need, seed_catalog
+from common.mcp_client import call_mcp_tool_async, parse_mcp_single_dict_result
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def spawn_replicas(pipeline: Pipeline, count: int, lease_dir: str, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    replicas = []
+    for i in range(count):
+        port = _free_port()
+        env = dict(os.environ, PYTHONPATH=REPO_ROOT, LOG_LEVEL=args.log_level,
+                   NEED_MCP_URL=pipeline.urls["needs-worker"], OFFER_MCP_URL=pipeline.urls["opportunity-agent"],
+                   SUPPLY_MCP_URL=pipeline.urls["supplier-agent"], MATCH_AGENT_PORT=str(port),
+                   MATCH_LEASE_BACKEND="file", MATCH_LEASE_DIR=lease_dir, MATCH_REPLICA_ID=f"replica-{i}",
+                   MATCH_PARTITIONS=str(args.partitions), MATCH_LEASE_TTL_SECONDS=str(args.lease_ttl),
+                   MATCH_CYCLE_INTERVAL_SECONDS=str(args.match_interval))
+        process = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, "agents", "match_agent.py")], env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        replicas.append({"process": process, "url": f"http://127.0.0.1:{port}/mcp"})
+    return replicas
+
+
+async def wait_for_full_coverage(replicas: List[Dict[str, Any]], partitions: int, timeout: float) -> float:
+    """Waits until the replicas' leases cover every partition exactly once."""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        owned: List[int] = []
+        for replica in replicas:
+            result = parse_mcp_single_dict_result(await call_mcp_tool_async(replica["url"], "match_ownership"), "match_ownership")
+            if not result:
+                break
+            owned.extend(result.get("owned", []))
+        else:
+            if sorted(owned) == list(range(partitions)):
+                return time.perf_counter() - started
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"replicas did not cover all {partitions} partitions within {timeout}s")
+
+
+def stop_replicas(replicas: List[Dict[str, Any]]) -> None:
+    for replica in replicas:
+        replica["process"].send_signal(signal.SIGINT)
+    for replica in replicas:
+        try:
+            replica["process"].wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            replica["process"].kill()
+
+
+async def run_once(pipeline: Pipeline, replica_count: int, rng: random.Random, args: argparse.Namespace) -> Dict[str, Any]:
+    needs_worker = pipeline.modules["needs-worker"]
+    supplier = pipeline.modules["supplier-agent"]
+    lease_dir = tempfile.mkdtemp(prefix="match-leases-")
+    replicas = spawn_replicas(pipeline, replica_count, lease_dir, args)
+    try:
+        coverage_seconds = await wait_for_full_coverage(replicas, args.partitions, timeout=60)
+        fulfilled_before = needs_worker.NEEDS_FULFILLED_COUNT
+        stock_before = sum(supply["stock"] for supply in supplier.SUPPLIES.values())
+
+        needs = [make_need(rng) for _ in range(args.needs)]
+        for need in needs:  # Every need can afford every offer, so each run ends with all needs fulfilled
+            need["elements"]["max_price"]["alternatives"] = [10 ** 6]
+        started = time.perf_counter()
+        for need in needs:
+            needs_worker.store_need(need)
+        ids = {need["id"] for need in needs}
+        while any(need.get("id") in ids for need in needs_worker.NEEDS):
+            if time.perf_counter() - started > args.timeout:
+                break
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        open_left = sum(1 for need in needs_worker.NEEDS if need.get("id") in ids)
+        # supply_deliver follows need_fulfill; let the last deliveries land before counting stock
+        settle_until = time.perf_counter() + 10
+        while (stock_before - sum(supply["stock"] for supply in supplier.SUPPLIES.values())
+               < needs_worker.NEEDS_FULFILLED_COUNT - fulfilled_before) and time.perf_counter() < settle_until:
+            await asyncio.sleep(0.05)
+    finally:
+        stop_replicas(replicas)
+        shutil.rmtree(lease_dir, ignore_errors=True)
+
+    fulfilled = needs_worker.NEEDS_FULFILLED_COUNT - fulfilled_before
+    delivered = stock_before - sum(supply["stock"] for supply in supplier.SUPPLIES.values())
+    return {
+        "replicas": replica_count,
+        "lease_coverage_s": round(coverage_seconds, 3),
+        "seconds": round(elapsed, 3),
+        "needs_per_sec": round((args.needs - open_left) / elapsed, 1) if elapsed else None,
+        "needs_left_open": open_left,
+        "fulfilled": fulfilled,
+        "units_delivered": delivered,
+        "exactly_once": fulfilled == args.needs - open_left == delivered,
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    pipeline = Pipeline()
+    await pipeline.start()
+    try:
+        await seed_catalog(pipeline, rng, args.offers)
+        runs = [await run_once(pipeline, count, rng, args) for count in args.replicas]
+    finally:
+        await pipeline.stop()
+    base = runs[0]["needs_per_sec"] if runs and runs[0]["needs_per_sec"] else None
+    for result in runs:
+        result["speedup"] = round(result["needs_per_sec"] / base, 2) if base and result["needs_per_sec"] else None
+    return {"benchmark": "match_replicas", "needs": args.needs, "offers": args.offers, "partitions": args.partitions, "runs": runs}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Multi-replica match agent benchmark (file leases, one host).")
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--needs", type=int, default=400)
+    parser.add_argument("--offers", type=int, default=5)
+    parser.add_argument("--partitions", type=int, default=64)
+    parser.add_argument("--lease-ttl", type=float, default=3.0)
+    parser.add_argument("--match-interval", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Give up on a run after this many seconds.")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
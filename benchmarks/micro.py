@@ -0,0 +1,450 @@
+"""
+Microbenchmarks for the hot paths, with JSON baselines and a regression gate.
+
+Each case is run at every size in --sizes (default 1k, 10k and 100k) on seeded synthetic data,
+so two runs with the same seed measure the same work:
+
+- scorer_score: Scorer.score over size pairs, grouped by need as in a match cycle
+- parse_list_json / parse_list_bulk: parse_mcp_list_result on a list of size offers, as compact
+  JSON and in the most compact bulk encoding available (common.bulk)
+- predictor_predict: the insight worker's MLPredictor.predict on size matches (the score
+  passthrough unless a model is installed)
+- need_list: need_list(status_filter="open") over size needs, rebuilt every round
+- need_fulfill: 100 need_fulfill calls against a store of size needs
+- offer_publish: size offer_publish calls into an empty order book
+- offer_list: offer_list(best_only=True) over size offers, rebuilt every round
+- supply_deliver: 1000 supply_deliver calls against size SKUs
+- match_cycle: one full match cycle over size needs (at most 10k) and 100 offers. need_list,
+  offer_list, need_fulfill and supply_deliver are served by an in-process stub, not the real agents.
+
+Every round is timed on its own, after an untimed setup. The reported figures are the min,
+median, mean and stdev of --rounds rounds, after --warmup untimed ones. Logging below ERROR is
+disabled, so the cost of the log sink is left out. Durable stores (STORE_DATA_DIR) are never
+touched.
+
+    python -m benchmarks.micro run --output baseline.json
+    python -m benchmarks.micro run --only scorer_score,match_cycle --sizes 1000,10000 --output current.json
+    python -m benchmarks.micro compare baseline.json current.json --max-regression 10
+    python -m benchmarks.micro run --compare baseline.json        # run, then gate against the baseline
+
+compare exits with status 1 if any case is slower than the baseline by more than
+--max-regression percent, measured on --metric (min by default, the least noisy figure), or
+if a baseline case is missing from the current report (renamed, or skipped, e.g. parse_list_bulk
+without a codec installed) unless --allow-missing is given. run --compare only expects the
+baseline cases it was asked to run (--only, --sizes). Compare only runs from the same machine.
+"""
+import os
+
+os.environ.pop("STORE_DATA_DIR", None) # Before the agents create their journals: benchmarks never write real stores
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import platform
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from mcp.server.fastmcp import FastMCP
+from mcp.types import CallToolResult, TextContent
+
+from benchmarks.pipeline_throughput import ADJECTIVES, NOUNS
+from common import bulk
+from common.mcp_client import parse_mcp_list_result, register_local_server
+from common.read_cache import ReadCache, encode
+
+DEFAULT_SIZES = "1000,10000,100000"
+MATCH_CYCLE_MAX_NEEDS = 10000 # One cycle over 100k needs takes minutes; the gate would never run
+MATCH_CYCLE_OFFERS = 100
+
+
+class Case:
+    """One benchmark at one size: `run` is timed, `setup` runs untimed before every round."""
+
+    def __init__(self, run: Callable[[], Any], setup: Optional[Callable[[], Any]] = None, ops: int = 1,
+                 teardown: Optional[Callable[[], Any]] = None) -> None:
+        self.run = run
+        self.setup = setup
+        self.ops = ops
+        self.teardown = teardown
+
+
+# --- Seeded data ---
+
+def _id(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _name(rng: random.Random) -> str:
+    return f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}" if rng.random() < 0.5 else rng.choice(NOUNS)
+
+
+def make_needs(rng: random.Random, count: int, budget: tuple = (5.0, 500.0)) -> List[Dict[str, Any]]:
+    return [{"id": _id(rng), "what": _name(rng), "classification": rng.choice(["Goods", "Services"]),
+             "elements": {"max_price": {"alternatives": [round(rng.uniform(*budget), 2)], "must": True}},
+             "status": "open", "created_at": "2026-01-01T00:00:00Z", "expires_at": None, "context": {}}
+            for _ in range(count)]
+
+
+def make_offers(rng: random.Random, count: int, price: tuple = (5.0, 500.0)) -> List[Dict[str, Any]]:
+    offers = []
+    for i in range(count):
+        sku = f"MICRO-{i:06d}"
+        offers.append({"sku": sku, "supplier_sku": sku, "merchant_id": f"micro-merchant-{i % 16}", "merchant_name": f"Micro Merchant {i % 16}",
+                       "type": "product", "name": _name(rng).title(), "price": round(rng.uniform(*price), 2), "quantity": rng.randint(1, 1000)})
+    return offers
+
+
+def make_matches(rng: random.Random, count: int) -> List[Dict[str, Any]]:
+    return [{"id": _id(rng), "need_id": _id(rng), "offer_sku": f"MICRO-{rng.randrange(count):06d}", "score": round(rng.uniform(0.1, 6.0), 2),
+             "classification": rng.choice(["Goods", "Services"]), "price": round(rng.uniform(5, 500), 2), "max_price": round(rng.uniform(5, 500), 2)}
+            for _ in range(count)]
+
+
+# --- Cases ---
+
+def scorer_score(size: int, rng: random.Random) -> Case:
+    from agents import match_agent
+
+    offers = make_offers(rng, 100)
+    pairs = [(need, offer) for need in make_needs(rng, max(1, size // len(offers))) for offer in offers]
+
+    def run() -> None:
+        score = match_agent.scorer.score
+        for need, offer in pairs:
+            score(need, offer)
+
+    return Case(run, ops=len(pairs))
+
+
+def _list_result(size: int, rng: random.Random, encoding: str) -> CallToolResult:
+    return ReadCache._result(make_offers(rng, size), "micro-1", encoding)
+
+
+def parse_list_json(size: int, rng: random.Random) -> Case:
+    result = _list_result(size, rng, bulk.JSON)
+    return Case(lambda: parse_mcp_list_result(result, "offer_list"), ops=size)
+
+
+def parse_list_bulk(size: int, rng: random.Random) -> Optional[Case]:
+    encodings = bulk.available_encodings()
+    if size < bulk.BULK_MIN_RECORDS or not encodings:
+        return None
+    result = _list_result(size, rng, encodings[0])
+    return Case(lambda: parse_mcp_list_result(result, "offer_list"), ops=size)
+
+
+def predictor_predict(size: int, rng: random.Random) -> Case:
+    from workers import insight_worker
+
+    matches = make_matches(rng, size)
+    return Case(lambda: insight_worker.predictor.predict(matches), ops=size)
+
+
+def need_list(size: int, rng: random.Random) -> Case:
+    from workers import needs_worker
+
+    needs = make_needs(rng, size)
+
+    def setup() -> None:
+        needs_worker.NEEDS[:] = needs
+        needs_worker.NEED_READS.bump() # A fresh version, so the list is built and serialized again
+
+    return Case(lambda: needs_worker.need_list_tool(status_filter="open"), setup, teardown=needs_worker.NEEDS.clear)
+
+
+def need_fulfill(size: int, rng: random.Random) -> Case:
+    from workers import needs_worker
+
+    needs = make_needs(rng, size)
+    ids = [need["id"] for need in rng.sample(needs, min(100, size))]
+
+    def setup() -> None:
+        needs_worker.NEEDS[:] = needs
+
+    def run() -> None:
+        for need_id in ids:
+            needs_worker.need_fulfill_tool(need_id)
+
+    return Case(run, setup, ops=len(ids), teardown=needs_worker.NEEDS.clear)
+
+
+def offer_publish(size: int, rng: random.Random) -> Case:
+    from agents import opportunity_agent
+    from common.order_book import OrderBook
+
+    offers = make_offers(rng, size)
+    original = opportunity_agent.OFFERS
+
+    def setup() -> None:
+        opportunity_agent.OFFERS = OrderBook()
+
+    def run() -> None:
+        for offer in offers:
+            opportunity_agent.offer_publish(offer)
+
+    def teardown() -> None:
+        opportunity_agent.OFFERS = original
+
+    return Case(run, setup, ops=size, teardown=teardown)
+
+
+def offer_list(size: int, rng: random.Random) -> Case:
+    from agents import opportunity_agent
+    from common.order_book import OrderBook
+
+    book = OrderBook()
+    for offer in make_offers(rng, size):
+        book.publish(offer)
+    original = opportunity_agent.OFFERS
+
+    def setup() -> None:
+        opportunity_agent.OFFERS = book
+        opportunity_agent.OFFER_READS.bump()
+
+    def teardown() -> None:
+        opportunity_agent.OFFERS = original
+
+    return Case(lambda: opportunity_agent.offer_list(best_only=True), setup, teardown=teardown)
+
+
+def supply_deliver(size: int, rng: random.Random) -> Case:
+    from agents import supplier_agent
+
+    skus = [f"MICRO-SUPPLY-{i:06d}" for i in range(size)]
+    supplies = {sku: {"sku": sku, "name": f"Supply {i}", "type": "product", "price": 10.0, "stock": 10 ** 9} for i, sku in enumerate(skus)}
+    deliveries = [rng.choice(skus) for _ in range(1000)]
+    original = dict(supplier_agent.SUPPLIES)
+
+    def setup() -> None:
+        supplier_agent.SUPPLIES.clear()
+        supplier_agent.SUPPLIES.update(supplies)
+
+    def run() -> None:
+        for sku in deliveries:
+            supplier_agent.supply_deliver(sku, 1, "micro")
+
+    def teardown() -> None:
+        supplier_agent.SUPPLIES.clear()
+        supplier_agent.SUPPLIES.update(original)
+
+    return Case(run, setup, ops=len(deliveries), teardown=teardown)
+
+
+def _stub_server(needs: List[Dict[str, Any]], offers: List[Dict[str, Any]]) -> FastMCP:
+    """need_list, offer_list, need_fulfill and supply_deliver with fixed answers, like the real agents' JSON replies."""
+    stub = FastMCP("micro-stub")
+    needs_reply = CallToolResult(content=[TextContent(type="text", text=encode(needs))])
+    offers_reply = CallToolResult(content=[TextContent(type="text", text=encode(offers))])
+
+    @stub.tool("need_list")
+    def stub_need_list(status_filter: Optional[str] = None, known_version: Optional[str] = None, accept: Optional[str] = None) -> CallToolResult:
+        return needs_reply
+
+    @stub.tool("offer_list")
+    def stub_offer_list(best_only: bool = False, known_version: Optional[str] = None, accept: Optional[str] = None) -> CallToolResult:
+        return offers_reply
+
+    @stub.tool("need_fulfill")
+    def stub_need_fulfill(id: str) -> Dict[str, Any]:
+        return {"status": "fulfilled", "id": id}
+
+    @stub.tool("supply_deliver")
+    def stub_supply_deliver(sku: str, quantity: int = 1, merchant_id: str = "") -> Dict[str, Any]:
+        return {"status": "delivered", "sku": sku}
+
+    return stub
+
+
+def match_cycle(size: int, rng: random.Random) -> Optional[Case]:
+    if size > MATCH_CYCLE_MAX_NEEDS:
+        return None
+    from agents import match_agent
+
+    # Budgets below all but one offer's price: a little over half the needs match once, so fulfillment is
+    # timed without dominating the cycle, and the count does not hinge on the cheapest random prices
+    offers = make_offers(rng, MATCH_CYCLE_OFFERS, price=(20.0, 500.0))
+    offers[0]["price"] = 5.0
+    stub = _stub_server(make_needs(rng, size, budget=(1.0, 10.0)), offers)
+    for url in (match_agent.NEED_MCP_URL, match_agent.OFFER_MCP_URL, match_agent.SUPPLY_MCP_URL):
+        register_local_server(url, stub)
+
+    def setup() -> None:
+        match_agent.MATCHES.clear() # Otherwise the previous round's pairs are skipped as already matched
+
+    return Case(match_agent.sync_and_match_cycle, setup, teardown=setup)
+
+
+CASES: Dict[str, Callable[[int, random.Random], Optional[Case]]] = {
+    "scorer_score": scorer_score,
+    "parse_list_json": parse_list_json,
+    "parse_list_bulk": parse_list_bulk,
+    "predictor_predict": predictor_predict,
+    "need_list": need_list,
+    "need_fulfill": need_fulfill,
+    "offer_publish": offer_publish,
+    "offer_list": offer_list,
+    "supply_deliver": supply_deliver,
+    "match_cycle": match_cycle,
+}
+
+
+# --- Running ---
+
+def measure(case: Case, rounds: int, warmup: int, loop: asyncio.AbstractEventLoop) -> List[float]:
+    times = []
+    for round_index in range(warmup + rounds):
+        if case.setup is not None:
+            case.setup()
+        gc.collect()
+        started = time.perf_counter()
+        result = case.run()
+        if asyncio.iscoroutine(result):
+            loop.run_until_complete(result)
+        elapsed = time.perf_counter() - started
+        if round_index >= warmup:
+            times.append(elapsed)
+    return times
+
+
+def run_suite(names: List[str], sizes: List[int], rounds: int, warmup: int, seed: int) -> Dict[str, Any]:
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    results: Dict[str, Any] = {}
+    try:
+        for name in names:
+            for size in sizes:
+                case = CASES[name](size, random.Random(f"{seed}-{name}-{size}"))
+                if case is None:
+                    continue
+                try:
+                    times = measure(case, rounds, warmup, loop)
+                finally:
+                    if case.teardown is not None:
+                        case.teardown()
+                median = statistics.median(times)
+                results[f"{name}[{size}]"] = {
+                    "case": name, "size": size, "rounds": rounds, "ops": case.ops,
+                    "min_s": round(min(times), 6), "median_s": round(median, 6), "mean_s": round(statistics.fmean(times), 6),
+                    "stdev_s": round(statistics.stdev(times), 6) if len(times) > 1 else 0.0,
+                    "ops_per_sec": round(case.ops / median, 1) if median else None,
+                }
+                print(f"{name}[{size}]: median {median * 1000:.3f} ms, min {min(times) * 1000:.3f} ms ({case.ops} ops/round)", file=sys.stderr)
+    finally:
+        loop.close()
+    return {
+        "suite": "micro",
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], max_regression: float, metric: str,
+            expected: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
+    """
+    One row per case in either report (baseline cases only where `expected` accepts them); a case
+    regressed when it is slower than max_regression percent, and is missing when only the baseline has it.
+    """
+    def order(key: str) -> tuple:
+        name, _, size = key.partition("[")
+        return name, int(size.rstrip("]") or 0)
+
+    baseline_keys = {key for key, result in baseline["results"].items() if expected is None or expected(result)}
+    rows = []
+    for key in sorted(baseline_keys | set(current["results"]), key=order):
+        before, after = baseline["results"].get(key), current["results"].get(key)
+        row: Dict[str, Any] = {"case": key, "baseline_s": before and before[metric], "current_s": after and after[metric]}
+        if before is None or after is None:
+            row["status"] = "new" if before is None else "missing"
+        else:
+            change = 100.0 * (after[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+            row["change_pct"] = round(change, 2)
+            row["status"] = "regressed" if change > max_regression else "improved" if change < -max_regression else "ok"
+        rows.append(row)
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]], metric: str, max_regression: float, allow_missing: bool = False) -> bool:
+    """Prints the table; returns True when nothing regressed and (unless allow_missing) no baseline case is missing."""
+    print(f"{'case':<32} {'baseline ms':>12} {'current ms':>12} {'change':>9}  status ({metric}, limit +{max_regression:g}%)")
+    for row in rows:
+        before = f"{row['baseline_s'] * 1000:.3f}" if row["baseline_s"] is not None else "-"
+        after = f"{row['current_s'] * 1000:.3f}" if row["current_s"] is not None else "-"
+        change = f"{row['change_pct']:+.1f}%" if "change_pct" in row else "-"
+        print(f"{row['case']:<32} {before:>12} {after:>12} {change:>9}  {row['status']}")
+    regressed = [row["case"] for row in rows if row["status"] == "regressed"]
+    if regressed:
+        print(f"{len(regressed)} case(s) regressed by more than {max_regression:g}%: {', '.join(regressed)}")
+    missing = [row["case"] for row in rows if row["status"] == "missing"]
+    if missing:
+        print(f"{len(missing)} baseline case(s) missing from the current report{' (allowed)' if allow_missing else ''}: {', '.join(missing)}")
+    return not regressed and (allow_missing or not missing)
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Hot-path microbenchmarks with JSON baselines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the suite and print (or save) a JSON report.")
+    run_parser.add_argument("--only", default="", help=f"Comma-separated cases (default all): {', '.join(CASES)}")
+    run_parser.add_argument("--sizes", default=DEFAULT_SIZES)
+    run_parser.add_argument("--rounds", type=int, default=5)
+    run_parser.add_argument("--warmup", type=int, default=1)
+    run_parser.add_argument("--seed", type=int, default=1234)
+    run_parser.add_argument("--output", help="Write the report here (e.g. a new baseline).")
+    run_parser.add_argument("--compare", metavar="BASELINE", help="Compare with this baseline afterwards and fail on regressions.")
+
+    compare_parser = commands.add_parser("compare", help="Compare two reports; exit 1 on regressions.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    for sub in (run_parser, compare_parser):
+        sub.add_argument("--max-regression", type=float, default=10.0, help="Allowed slowdown per case, in percent.")
+        sub.add_argument("--metric", choices=["min_s", "median_s", "mean_s"], default="min_s")
+        sub.add_argument("--allow-missing", action="store_true", help="Do not fail on baseline cases the current report lacks.")
+
+    commands.add_parser("list", help="List the cases.")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        print("\n".join(CASES))
+        return
+    if args.command == "compare":
+        rows = compare(_load(args.baseline), _load(args.current), args.max_regression, args.metric)
+        ok = print_comparison(rows, args.metric, args.max_regression, args.allow_missing)
+        sys.exit(0 if ok else 1)
+
+    names = [name.strip() for name in args.only.split(",") if name.strip()] or list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown cases {unknown}; available: {', '.join(CASES)}")
+    logging.disable(logging.WARNING)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    report = run_suite(names, sizes, max(1, args.rounds), max(0, args.warmup), args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        rows = compare(_load(args.compare), report, args.max_regression, args.metric,
+                       expected=lambda result: result["case"] in names and result["size"] in sizes)
+        ok = print_comparison(rows, args.metric, args.max_regression, args.allow_missing)
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+End-to-end throughput benchmark for the agent pipeline.
+
+Boots needs-worker, opportunity-agent, supplier-agent, match-agent and insight-worker
+inside a single asyncio process, each serving streamable HTTP on its own localhost port,
+then drives synthetic load through them and prints a JSON report:
+
+    python -m benchmarks.pipeline_throughput --needs 2000 --offers 200 --rate 500 --output bench.json
+
+Run it from the repository root. The report is meant to be diffed between versions, so
+every number in it is machine readable (latencies in milliseconds, RSS in kilobytes).
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import platform
+import random
+import resource
+import socket
+import subprocess
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from mcp.client.streamable_http import streamablehttp_client
+from mcp import ClientSession
+
+from common import mcp_client
+
+HOST = "127.0.0.1"
+
+# Module path -> attribute holding its FastMCP instance
+AGENT_MODULES = {
+    "needs-worker": ("workers.needs_worker", "mcp_server"),
+    "opportunity-agent": ("agents.opportunity_agent", "mcp"),
+    "supplier-agent": ("agents.supplier_agent", "mcp"),
+    "match-agent": ("agents.match_agent", "mcp_server"),
+    "insight-worker": ("workers.insight_worker", "mcp_server"),
+}
+
+# Vocabulary shared by synthetic needs and offers so that text scoring finds overlaps
+ADJECTIVES = ["standard", "premium", "compact", "industrial", "office", "organic", "portable", "wireless"]
+NOUNS = ["laptop", "cereal", "cleaning service", "consulting hour", "road construction", "printer",
+         "headphones", "desk", "coffee", "generator"]
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def _current_rss_kb() -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _rss_sample() -> Dict[str, Optional[int]]:
+    return {"current_kb": _current_rss_kb(), "peak_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def _percentiles(values_seconds: List[float]) -> Dict[str, Any]:
+    if not values_seconds:
+        return {"count": 0}
+    ordered = sorted(values_seconds)
+    n = len(ordered)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(n - 1, int(q * n))] * 1000.0, 3)
+
+    return {
+        "count": n,
+        "min_ms": round(ordered[0] * 1000.0, 3),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000.0, 3),
+        "mean_ms": round(sum(ordered) / n * 1000.0, 3),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_offer(rng: random.Random, index: int) -> Dict[str, Any]:
+    name = f"{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS).title()}"
+    sku = f"BENCH-{index:06d}"
+    return {
+        "sku": sku,
+        "supplier_sku": sku,
+        "merchant_id": f"bench-merchant-{index % 16}",
+        "merchant_name": f"Bench Merchant {index % 16}",
+        "type": "Goods",
+        "name": name,
+        "price": round(rng.uniform(5, 500), 2),
+        "quantity": 1000,
+    }
+
+
+def make_need(rng: random.Random) -> Dict[str, Any]:
+    what = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}" if rng.random() < 0.5 else rng.choice(NOUNS)
+    return {
+        "id": str(uuid.uuid4()),
+        "what": what,
+        "classification": rng.choice(["Goods", "Services"]),
+        "elements": {"max_price": {"alternatives": [round(rng.uniform(5, 500), 2)], "must": True}},
+    }
+
+
+class Pipeline:
+    """The five agents, each served by its own uvicorn instance on a free localhost port."""
+
+    def __init__(self) -> None:
+        self.modules: Dict[str, Any] = {}
+        self.urls: Dict[str, str] = {}
+        self._servers: List[uvicorn.Server] = []
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        for agent, (module_path, server_attr) in AGENT_MODULES.items():
+            module = importlib.import_module(module_path)
+            port = _free_port()
+            config = uvicorn.Config(getattr(module, server_attr).streamable_http_app(), host=HOST, port=port,
+                                    log_level="warning", lifespan="on")
+            server = uvicorn.Server(config)
+            self._servers.append(server)
+            self._tasks.append(asyncio.create_task(server.serve()))
+            self.modules[agent] = module
+            self.urls[agent] = f"http://{HOST}:{port}/mcp"
+
+        while not all(s.started for s in self._servers):
+            await asyncio.sleep(0.01)
+
+        match_agent = self.modules["match-agent"]
+        match_agent.NEED_MCP_URL = self.urls["needs-worker"]
+        match_agent.OFFER_MCP_URL = self.urls["opportunity-agent"]
+        match_agent.SUPPLY_MCP_URL = self.urls["supplier-agent"]
+        self.modules["insight-worker"].MATCH_MCP_URL = self.urls["match-agent"]
+
+    async def stop(self) -> None:
+        for server in self._servers:
+            server.should_exit = True
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def seed_catalog(pipeline: Pipeline, rng: random.Random, offer_count: int) -> None:
+    """Publishes synthetic offers, each backed by a supply with effectively unlimited stock."""
+    supplier = pipeline.modules["supplier-agent"]
+    async with streamablehttp_client(pipeline.urls["opportunity-agent"]) as (read_stream, write_stream, _):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            for i in range(offer_count):
+                offer = make_offer(rng, i)
+                supplier.SUPPLIES[offer["sku"]] = {
+                    "sku": offer["sku"], "name": offer["name"], "type": offer["type"],
+                    "price": offer["price"], "stock": 10 ** 9,
+                }
+                await session.call_tool("offer_publish", arguments={"offer": offer})
+
+
+async def drive_needs(url: str, needs: List[Dict[str, Any]], rate: float, concurrency: int,
+                      submitted_at: Dict[str, float], latencies: List[float]) -> float:
+    """Submits needs at `rate` per second (0 = unthrottled) over `concurrency` sessions."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for need in needs:
+        queue.put_nowait(need)
+    started = time.perf_counter()
+    interval = 1.0 / rate if rate > 0 else 0.0
+    issued = 0
+    issue_lock = asyncio.Lock()
+
+    async def worker() -> None:
+        nonlocal issued
+        async with streamablehttp_client(url) as (read_stream, write_stream, _):
+            async with ClientSession(read_stream, write_stream) as session:
+                await session.initialize()
+                while True:
+                    try:
+                        need = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    if interval:
+                        async with issue_lock:
+                            slot = started + issued * interval
+                            issued += 1
+                        delay = slot - time.perf_counter()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    t0 = time.perf_counter()
+                    submitted_at[need["id"]] = t0
+                    await session.call_tool("need_add", arguments={"need_data": need})
+                    latencies.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    pipeline = Pipeline()
+    await pipeline.start()
+    logging.getLogger().setLevel(args.log_level)
+    rss = {"after_boot": _rss_sample()}
+
+    try:
+        await seed_catalog(pipeline, rng, args.offers)
+
+        match_agent = pipeline.modules["match-agent"]
+        tool_latencies: Dict[str, List[float]] = {"need_fulfill": [], "supply_deliver": [], "need_list": [], "offer_list": []}
+        original_call = match_agent.call_mcp_tool_async
+
+        async def timed_call(mcp_url: str, tool_name: str, arguments: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Optional[Any]:
+            t0 = time.perf_counter()
+            try:
+                return await original_call(mcp_url, tool_name, arguments, **kwargs)
+            finally:
+                tool_latencies.setdefault(tool_name, []).append(time.perf_counter() - t0)
+
+        match_agent.call_mcp_tool_async = timed_call
+        mcp_client.call_mcp_tool_async = timed_call # need_list / offer_list go through read_versioned
+
+        needs = [make_need(rng) for _ in range(args.needs)]
+        submitted_at: Dict[str, float] = {}
+        ingest_latencies: List[float] = []
+        need_to_match: Dict[str, float] = {}
+        cycle_durations: List[float] = []
+        matches_total = 0
+        loading_done = asyncio.Event()
+
+        async def match_loop() -> None:
+            nonlocal matches_total
+            idle_cycles = 0
+            while len(cycle_durations) < args.max_cycles:
+                t0 = time.perf_counter()
+                await match_agent.sync_and_match_cycle()
+                t1 = time.perf_counter()
+                cycle_durations.append(t1 - t0)
+                matches_total += len(match_agent.MATCHES)
+                for m in match_agent.MATCHES:
+                    need_id = m.get("need_id")
+                    if need_id in submitted_at and need_id not in need_to_match:
+                        need_to_match[need_id] = t1 - submitted_at[need_id]
+                if loading_done.is_set():
+                    idle_cycles = idle_cycles + 1 if not match_agent.MATCHES else 0
+                    if idle_cycles >= 2 or len(need_to_match) >= len(needs):
+                        return
+                if args.match_interval:
+                    await asyncio.sleep(args.match_interval)
+                else:
+                    await asyncio.sleep(0)
+
+        matcher = asyncio.create_task(match_loop())
+        ingest_seconds = await drive_needs(pipeline.urls["needs-worker"], needs, args.rate, args.concurrency,
+                                           submitted_at, ingest_latencies)
+        loading_done.set()
+        rss["after_ingest"] = _rss_sample()
+        await matcher
+        match_agent.call_mcp_tool_async = mcp_client.call_mcp_tool_async = original_call
+        rss["after_matching"] = _rss_sample()
+
+        insight = pipeline.modules["insight-worker"]
+        t0 = time.perf_counter()
+        await insight.predict_cycle()
+        insight_seconds = time.perf_counter() - t0
+        rss["after_insight"] = _rss_sample()
+    finally:
+        await pipeline.stop()
+
+    return {
+        "benchmark": "pipeline_throughput",
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "config": {
+            "needs": args.needs, "offers": args.offers, "rate": args.rate,
+            "concurrency": args.concurrency, "max_cycles": args.max_cycles,
+            "match_interval": args.match_interval, "seed": args.seed,
+        },
+        "ingest": {
+            "needs_submitted": len(ingest_latencies),
+            "seconds": round(ingest_seconds, 4),
+            "needs_per_sec": round(len(ingest_latencies) / ingest_seconds, 2) if ingest_seconds else None,
+            "need_add_latency": _percentiles(ingest_latencies),
+        },
+        "match": {
+            "cycles": len(cycle_durations),
+            "matches": matches_total,
+            "needs_matched": len(need_to_match),
+            "cycle_duration": _percentiles(cycle_durations),
+            "need_to_match": _percentiles(list(need_to_match.values())),
+            "pairs_scored": match_agent.MATCH_PAIRS_SCORED.value,
+            "pairs_pruned": match_agent.MATCH_PAIRS_PRUNED.value,
+        },
+        "fulfillment": {tool: _percentiles(values) for tool, values in tool_latencies.items()},
+        "insight": {"predict_cycle_ms": round(insight_seconds * 1000.0, 3), "predictions": len(insight.PREDICTIONS)},
+        "rss": rss,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="In-process end-to-end throughput benchmark for the agent pipeline.")
+    parser.add_argument("--needs", type=int, default=1000, help="Number of synthetic needs to submit.")
+    parser.add_argument("--offers", type=int, default=100, help="Number of synthetic offers to publish before the run.")
+    parser.add_argument("--rate", type=float, default=0.0, help="Target need submissions per second (0 = as fast as possible).")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent need submission sessions.")
+    parser.add_argument("--max-cycles", type=int, default=50, help="Upper bound on match cycles.")
+    parser.add_argument("--match-interval", type=float, default=0.0, help="Seconds to wait between match cycles.")
+    parser.add_argument("--seed", type=int, default=1234, help="Seed for the synthetic data generator.")
+    parser.add_argument("--log-level", default="WARNING", help="Root log level while the benchmark runs.")
+    parser.add_argument("--output", help="Write the JSON report to this path as well as stdout.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
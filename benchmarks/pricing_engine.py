@@ -0,0 +1,120 @@
+"""
+Cost of one merchant pricing pass (`common.pricing`) at marketplace scale, without MCP calls.
+
+Builds synthetic signals for --skus SKUs (cost, stock, open needs and budgets for a share of
+them, a competing best offer for most) and --merchants merchants with the MERCHANT_TYPES
+markups, then times:
+
+- signals: turning the supply / need_demand / offer_list rows into arrays
+- table: `PricingEngine.price`, every merchant x SKU priced (via the distinct markups)
+- pairs: prices of the --carried SKUs each merchant holds, i.e. what gets published
+- dense: the full merchants x SKUs matrix, for comparison
+- scalar: the same formula one pair at a time in Python, on a sample, to check the results
+
+    python -m benchmarks.pricing_engine --merchants 10000 --skus 1000
+"""
+import argparse
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from common.pricing import MarketSignals, PricingEngine, normalize_what
+from workers.merchant_simulator import MERCHANT_TYPES
+
+
+def best_of(repeat: int, fn: Callable[[], Any]) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def synthetic_market(rng: random.Random, skus: int, merchants: int):
+    supplies = [{"sku": f"SKU-{i:05d}", "name": f"item {i}", "type": "Goods", "price": round(rng.uniform(1, 500), 2),
+                 "stock": rng.randint(0, 200)} for i in range(skus)]
+    demand = []
+    for supply in rng.sample(supplies, skus // 2):
+        budgets = sorted(supply["price"] * rng.uniform(0.8, 2.0) for _ in range(4))
+        demand.append({"what": normalize_what(supply["name"]), "open": rng.randint(1, 300), "with_budget": 4,
+                       "max_price_p25": budgets[1], "max_price_p50": budgets[2], "max_price_p75": budgets[3], "max_price_p90": budgets[3]})
+    merchant_ids = [f"m-{i}" for i in range(merchants)]
+    best = [{"sku": supply["sku"], "price": round(supply["price"] * rng.uniform(1.0, 1.4), 2), "merchant_id": rng.choice(merchant_ids)}
+            for supply in supplies if rng.random() < 0.8]
+    markups = np.array([rng.choice(MERCHANT_TYPES)["markup"] for _ in range(merchants)])
+    return supplies, demand, best, merchant_ids, markups
+
+
+def scalar_price(engine: PricingEngine, signals: MarketSignals, markup: float, j: int, own_best: bool) -> float:
+    cost, demand, stock = float(signals.cost[j]), float(signals.demand[j]), float(signals.stock[j])
+    price = (1 + markup) * (cost * (1 + engine.demand_weight * demand / (demand + stock + 1)))
+    budget, best = float(signals.budget[j]), float(signals.best_price[j])
+    if budget == budget:
+        price = min(price, budget)
+    if best == best and not own_best:
+        price = min(price, best * (1 - engine.undercut))
+    return round(max(price, cost * (1 + engine.min_margin)), 2)
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    supplies, demand, best, merchant_ids, markups = synthetic_market(rng, args.skus, args.merchants)
+    engine = PricingEngine()
+    merchant_index = {merchant_id: i for i, merchant_id in enumerate(merchant_ids)}
+
+    signals = MarketSignals(supplies, demand, best)
+    best_owner = np.array([merchant_index.get(owner, -1) for owner in signals.best_merchant], dtype=np.int64)
+    table = engine.price(markups, signals, best_owner)
+    pair_merchants = np.repeat(np.arange(args.merchants), args.carried)
+    pair_skus = np.array([rng.randrange(args.skus) for _ in range(len(pair_merchants))])
+
+    timings = {
+        "signals_ms": best_of(args.repeat, lambda: MarketSignals(supplies, demand, best)),
+        "table_ms": best_of(args.repeat, lambda: engine.price(markups, signals, best_owner)),
+        "pairs_ms": best_of(args.repeat, lambda: table.prices(pair_merchants, pair_skus)),
+        "dense_ms": best_of(args.repeat, table.dense),
+    }
+    prices = table.prices(pair_merchants, pair_skus)
+    sample = rng.sample(range(len(pair_merchants)), min(args.check, len(pair_merchants)))
+    started = time.perf_counter()
+    differences = [
+        abs(scalar_price(engine, signals, float(markups[pair_merchants[k]]), int(pair_skus[k]),
+                         best_owner[pair_skus[k]] == pair_merchants[k]) - prices[k])
+        for k in sample
+    ]
+    scalar_seconds_per_pair = (time.perf_counter() - started) / max(1, len(sample))
+    dense = table.dense()
+    return {
+        "benchmark": "pricing_engine",
+        "merchants": args.merchants,
+        "skus": args.skus,
+        "distinct_markups": int(len(table.capped)),
+        "carried_pairs": int(len(pair_merchants)),
+        **{name: round(seconds * 1000, 3) for name, seconds in timings.items()},
+        "scalar_estimate_ms": {"pairs": round(scalar_seconds_per_pair * len(pair_merchants) * 1000, 1),
+                               "dense": round(scalar_seconds_per_pair * dense.size * 1000, 1)},
+        "checked_pairs": len(sample),
+        # np.round and round() may round a price that lands on a half cent differently
+        "mismatches_over_one_cent": sum(1 for difference in differences if difference > 0.01 + 1e-9),
+        "max_difference": round(max(differences, default=0.0), 6),
+        "dense_matches_pairs": bool(np.array_equal(dense[pair_merchants, pair_skus], prices)),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Vectorized merchant pricing pass.")
+    parser.add_argument("--merchants", type=int, default=10000)
+    parser.add_argument("--skus", type=int, default=1000)
+    parser.add_argument("--carried", type=int, default=20, help="SKUs each merchant holds (and publishes).")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per timing; the best is reported.")
+    parser.add_argument("--check", type=int, default=20000, help="Pairs checked against the scalar formula.")
+    parser.add_argument("--seed", type=int, default=1234)
+    print(json.dumps(run(parser.parse_args(argv)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
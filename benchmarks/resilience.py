@@ -0,0 +1,169 @@
+"""
+Deadlines, circuit breakers and hedging of `call_mcp_tool_async` against a stand-in MCP server
+with injected latency and faults, served in-process on a localhost port.
+
+Scenarios, in order: healthy calls; a hung server (calls time out until the breaker opens, then
+fail fast); a half-open probe that fails and re-opens; recovery through a successful probe; the
+server going down and coming back; the caller's deadline arriving in the server's tool; and
+hedged vs plain reads when a few calls hit a latency spike. Every scenario records checks, and
+the script exits non-zero if any fails.
+
+    python -m benchmarks.resilience --calls 300 --tail-rate 0.02 --tail-delay 0.5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from mcp.server.fastmcp import FastMCP
+
+from benchmarks.pipeline_throughput import HOST, _free_port, _percentiles
+from common import resilience
+from common.mcp_client import call_mcp_tool_async, parse_mcp_single_dict_result
+from common.server import instrument_server
+
+FAULTS: Dict[str, Any] = {"delay": 0.0, "tail_rate": 0.0, "tail_delay": 0.0}
+
+standin = FastMCP("resilience-standin")
+instrument_server(standin)
+
+
+@standin.tool("standin_read")
+async def standin_read() -> Dict[str, Any]:
+    """A read whose latency follows FAULTS."""
+    delay = FAULTS["delay"]
+    if FAULTS["tail_rate"] and random.random() < FAULTS["tail_rate"]:
+        delay += FAULTS["tail_delay"]
+    if delay:
+        await asyncio.sleep(delay)
+    return {"status": "ok"}
+
+
+@standin.tool("standin_deadline")
+def standin_deadline() -> Dict[str, Any]:
+    """The deadline an outgoing call made from inside this tool would get."""
+    return {"deadline": resilience.call_deadline(timeout=3600)}
+
+
+class StandinServer:
+    def __init__(self, port: int) -> None:
+        self.port = port
+        self.url = f"http://{HOST}:{port}/mcp"
+        self._server: Optional[uvicorn.Server] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        standin._session_manager = None  # A session manager runs once; a restarted server needs a new one
+        config = uvicorn.Config(standin.streamable_http_app(), host=HOST, port=self.port, log_level="error", lifespan="on")
+        self._server = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+
+    async def stop(self) -> None:
+        self._server.should_exit = True
+        self._server.force_exit = True  # Do not wait for hung requests
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+async def timed_calls(url: str, count: int, timeout: float, idempotent: bool = False) -> Dict[str, Any]:
+    latencies, ok = [], 0
+    for _ in range(count):
+        started = time.perf_counter()
+        result = await call_mcp_tool_async(url, "standin_read", timeout=timeout, idempotent=idempotent)
+        latencies.append(time.perf_counter() - started)
+        ok += result is not None and not getattr(result, "isError", False)
+    return {"ok": ok, "latency": _percentiles(latencies)}
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    server = StandinServer(_free_port())
+    await server.start()
+    breaker = resilience.breaker_for(server.url)
+    breaker.failure_threshold, breaker.open_seconds = args.failures, args.open_seconds
+    report: Dict[str, Any] = {"benchmark": "resilience", "scenarios": {}, "checks": {}}
+    scenarios, checks = report["scenarios"], report["checks"]
+
+    try:
+        healthy = await timed_calls(server.url, 10, args.timeout)
+        scenarios["healthy"] = {**healthy, "state": breaker.state}
+        checks["healthy_calls_succeed"] = healthy["ok"] == 10 and breaker.state == resilience.CLOSED
+
+        FAULTS["delay"] = 3600.0  # Hung server: accepts the request, never answers
+        timeouts_before = breaker.timeouts.value
+        tripping = await timed_calls(server.url, args.failures, args.timeout)
+        fast = await timed_calls(server.url, 50, args.timeout)
+        scenarios["hung_server"] = {"until_open": tripping, "while_open": fast, "state": breaker.state,
+                                    "timeouts": breaker.timeouts.value - timeouts_before}
+        checks["timeouts_open_breaker"] = breaker.state == resilience.OPEN and tripping["ok"] == 0
+        checks["timeouts_bounded_by_deadline"] = tripping["latency"]["max_ms"] < (args.timeout + 0.5) * 1000
+        checks["open_breaker_fails_fast"] = fast["ok"] == 0 and fast["latency"]["p99_ms"] < 5.0
+
+        await asyncio.sleep(args.open_seconds)
+        probe = await timed_calls(server.url, 1, args.timeout)
+        scenarios["failed_probe"] = {**probe, "state": breaker.state}
+        checks["failed_probe_reopens"] = probe["ok"] == 0 and breaker.state == resilience.OPEN
+
+        FAULTS["delay"] = 0.0
+        await asyncio.sleep(args.open_seconds)
+        recovered = await timed_calls(server.url, 5, args.timeout)
+        scenarios["recovery"] = {**recovered, "state": breaker.state}
+        checks["successful_probe_closes"] = recovered["ok"] == 5 and breaker.state == resilience.CLOSED
+
+        await server.stop()
+        down = await timed_calls(server.url, args.failures + 10, args.timeout)
+        scenarios["server_down"] = {**down, "state": breaker.state}
+        checks["connection_errors_open_breaker"] = down["ok"] == 0 and breaker.state == resilience.OPEN
+        await server.start()
+        await asyncio.sleep(args.open_seconds)
+        back = await timed_calls(server.url, 5, args.timeout)
+        scenarios["server_back"] = {**back, "state": breaker.state}
+        checks["server_back_closes"] = back["ok"] == 5 and breaker.state == resilience.CLOSED
+
+        sent = time.time() + 5.0
+        seen = parse_mcp_single_dict_result(await call_mcp_tool_async(server.url, "standin_deadline", deadline=sent), "standin_deadline")
+        scenarios["deadline_propagation"] = {"sent": sent, "seen_in_tool": seen and seen.get("deadline")}
+        checks["deadline_propagates"] = bool(seen) and abs(seen["deadline"] - sent) < 0.001
+
+        FAULTS.update(tail_rate=args.tail_rate, tail_delay=args.tail_delay)
+        resilience.MCP_HEDGE_ENABLED = False
+        plain = await timed_calls(server.url, args.calls, 10.0, idempotent=True)
+        resilience.MCP_HEDGE_ENABLED = True
+        hedges_before, wins_before = breaker.hedges.value, breaker.hedge_wins.value
+        hedged = await timed_calls(server.url, args.calls, 10.0, idempotent=True)
+        scenarios["hedging"] = {"tail_rate": args.tail_rate, "tail_delay_s": args.tail_delay, "plain": plain, "hedged": hedged,
+                                "hedges_sent": breaker.hedges.value - hedges_before, "hedge_wins": breaker.hedge_wins.value - wins_before}
+        checks["hedging_cuts_p99"] = hedged["ok"] == args.calls and hedged["latency"]["p99_ms"] < plain["latency"]["p99_ms"]
+    finally:
+        FAULTS.update(delay=0.0, tail_rate=0.0)
+        await server.stop()
+    report["passed"] = all(checks.values())
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Resilience of inter-agent MCP calls under injected faults.")
+    parser.add_argument("--calls", type=int, default=300, help="Calls per hedging run.")
+    parser.add_argument("--timeout", type=float, default=0.3, help="Per-call timeout in the fault scenarios.")
+    parser.add_argument("--failures", type=int, default=5, help="Consecutive failures that open the breaker.")
+    parser.add_argument("--open-seconds", type=float, default=1.0)
+    parser.add_argument("--tail-rate", type=float, default=0.02)
+    parser.add_argument("--tail-delay", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--log-level", default="ERROR", help="The fault scenarios log a warning per failed call.")
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(args.log_level)
+    random.seed(args.seed)
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if not report["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
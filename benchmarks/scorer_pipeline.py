@@ -0,0 +1,78 @@
+"""
+Cost of the match cycle's scoring with different scorer pipelines (`common.scoring`).
+
+Scores every synthetic need against every synthetic offer (no pruning, no MCP calls) with each
+configuration and reports pairs per second, positive pairs and, per stage, the pairs it scored,
+rejected (hard filters) and stopped early (could not beat the threshold):
+
+- default: name,price, as deployed
+- hard_price: price as a hard filter, so over-budget pairs never reach the name stage
+- threshold: default stages with --threshold, so pairs that cannot beat it stop after price
+- all_stages: name,price,category,constraint
+
+    python -m benchmarks.scorer_pipeline --needs 500 --offers 2000
+"""
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.pipeline_throughput import make_need, make_offer
+from common import metrics
+from common.scoring import Scorer
+
+
+def stage_counts(agent: str) -> Dict[str, Dict[str, float]]:
+    snapshot = metrics.REGISTRY.snapshot()
+    counts: Dict[str, Dict[str, float]] = {}
+    for family, column in (("scorer_stage_pairs_total", "pairs"), ("scorer_stage_rejections_total", "rejected"),
+                           ("scorer_stage_short_circuits_total", "stopped")):
+        for series in snapshot[family]["series"]:
+            if series["labels"]["agent"] == agent:
+                counts.setdefault(series["labels"]["stage"], {})[column] = series["value"]
+    return counts
+
+
+def run_pipeline(name: str, scorer: Scorer, needs: List[Dict[str, Any]], offers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    positive = 0
+    for need in needs:
+        for offer in offers:
+            if scorer.score(need, offer) > scorer.threshold:
+                positive += 1
+    elapsed = time.perf_counter() - started
+    pairs = len(needs) * len(offers)
+    return {
+        "stages": [stage.name + (" (hard)" if stage.hard else "") for stage in scorer.stages],
+        "threshold": scorer.threshold,
+        "seconds": round(elapsed, 4),
+        "pairs_per_sec": round(pairs / elapsed) if elapsed else None,
+        "positive_pairs": positive,
+        "per_stage": stage_counts(scorer.agent),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Scoring throughput of scorer pipelines.")
+    parser.add_argument("--needs", type=int, default=500)
+    parser.add_argument("--offers", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=4.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    offers = [make_offer(rng, i) for i in range(args.offers)]
+    needs = [make_need(rng) for _ in range(args.needs)]
+    pipelines = {
+        "default": Scorer(stages="name,price", hard_filters="", agent="bench-default"),
+        "hard_price": Scorer(stages="name,price", hard_filters="price", agent="bench-hard-price"),
+        "threshold": Scorer(stages="name,price", hard_filters="", threshold=args.threshold, agent="bench-threshold"),
+        "all_stages": Scorer(stages="name,price,category,constraint", hard_filters="", agent="bench-all-stages"),
+    }
+    report = {name: run_pipeline(name, scorer, needs, offers) for name, scorer in pipelines.items()}
+    print(json.dumps({"benchmark": "scorer_pipeline", "needs": args.needs, "offers": args.offers, "pipelines": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
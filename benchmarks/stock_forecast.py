@@ -0,0 +1,123 @@
+"""
+Stock depletion forecasting and replenishment (`common.stock_forecast`) in simulated time.
+
+- simulation: --skus SKUs with Poisson demand (rates spread log-uniformly over --min-rate ..
+  --max-rate units/hour, tripled for a tenth of them halfway through) drain their stock for
+  --hours, once without replenishment and once with the scheduler the supplier agent runs.
+  Reports the fill rate (units delivered / requested), refused requests, units ordered and
+  average stock held.
+- forecast: time for one vectorized forecast (demand rates and time to stockout) over
+  --forecast-skus SKUs with full histories.
+
+    python -m benchmarks.stock_forecast --skus 500 --hours 12
+"""
+import argparse
+import json
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from common.stock_forecast import DeliveryHistory, ReplenishmentScheduler
+
+
+def simulate(args: argparse.Namespace, replenish: bool) -> Dict[str, Any]:
+    rng = np.random.default_rng(args.seed)
+    skus = [f"SKU-{i:05d}" for i in range(args.skus)]
+    rates = np.exp(rng.uniform(math.log(args.min_rate), math.log(args.max_rate), args.skus)) / 3600 # units/second
+    stock = dict(zip(skus, np.floor(rates * 3600 * rng.uniform(1, 4, args.skus)).tolist())) # 1-4 hours of demand
+    surge = rng.random(args.skus) < 0.1
+
+    # No rows up front: record() adds each SKU on its first request, growing the history well past
+    # its initial capacity, as supply_deliver does for SKUs that reached SUPPLIES without a row
+    history = DeliveryHistory(args.bucket_seconds, args.buckets, args.half_life)
+
+    def restock(sku: str, units: int) -> None:
+        stock[sku] += units
+
+    scheduler = ReplenishmentScheduler("bench", history, lambda names: np.array([stock[name] for name in names]), restock,
+                                       args.interval, args.lead, args.cover)
+    requested = delivered = refused = held = 0.0
+    started = time.time()
+    steps = int(args.hours * 3600 / args.step)
+    next_plan = started
+    for step in range(steps):
+        now = started + step * args.step
+        step_rates = np.where(surge & (step >= steps // 2), rates * 3, rates)
+        demand = rng.poisson(step_rates * args.step)
+        for i in np.flatnonzero(demand).tolist():
+            sku, units = skus[i], int(demand[i])
+            history.record(sku, units, now)
+            requested += units
+            if stock[sku] >= units:
+                stock[sku] -= units
+                delivered += units
+            else:
+                refused += 1
+        if replenish and now >= next_plan:
+            scheduler.run_once(now)
+            next_plan = now + args.interval
+        elif replenish:
+            scheduler.receive_due(now)
+        held += sum(stock.values()) * args.step
+    return {
+        "fill_rate": round(delivered / requested, 4) if requested else None,
+        "requests_refused": int(refused),
+        "units_requested": int(requested),
+        "orders": int(scheduler.orders.value),
+        "units_ordered": int(scheduler.ordered_units.value),
+        "average_units_held": round(held / (steps * args.step)),
+    }
+
+
+def forecast_cost(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = np.random.default_rng(args.seed)
+    history = DeliveryHistory(args.bucket_seconds, args.buckets, args.half_life)
+    skus = [f"SKU-{i:06d}" for i in range(args.forecast_skus)]
+    for sku in skus:
+        history.row(sku)
+    history.first_bucket[:] = history.current - args.buckets # Full histories
+    history.units[:len(skus)] = rng.poisson(2.0, (len(skus), args.buckets))
+    stock = rng.integers(0, 500, len(skus)).astype(np.float64)
+    scheduler = ReplenishmentScheduler("bench-forecast", history, lambda names: stock, lambda sku, units: None,
+                                       args.interval, args.lead, args.cover)
+    timings = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        scheduler.plan(scheduler.forecast())
+        timings.append(time.perf_counter() - t0)
+    return {"skus": len(skus), "buckets": args.buckets, "history_mb": round(history.units.nbytes / 2 ** 20, 1),
+            "forecast_and_plan_ms": round(min(timings) * 1000, 3)}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Stock forecasting and replenishment in simulated time.")
+    parser.add_argument("--skus", type=int, default=500)
+    parser.add_argument("--hours", type=float, default=12)
+    parser.add_argument("--step", type=float, default=10, help="Simulated seconds per step.")
+    parser.add_argument("--min-rate", type=float, default=0.5, help="Units/hour, slowest SKU.")
+    parser.add_argument("--max-rate", type=float, default=100, help="Units/hour, fastest SKU.")
+    parser.add_argument("--bucket-seconds", type=float, default=60)
+    parser.add_argument("--buckets", type=int, default=240)
+    parser.add_argument("--half-life", type=float, default=1800)
+    parser.add_argument("--interval", type=float, default=30)
+    parser.add_argument("--lead", type=float, default=300)
+    parser.add_argument("--cover", type=float, default=3600)
+    parser.add_argument("--forecast-skus", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args(argv)
+    report = {
+        "benchmark": "stock_forecast",
+        "simulated_hours": args.hours,
+        "skus": args.skus,
+        "without_replenishment": simulate(args, replenish=False),
+        "with_replenishment": simulate(args, replenish=True),
+        "forecast": forecast_cost(args),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
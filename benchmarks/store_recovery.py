@@ -0,0 +1,97 @@
+"""
+Write throughput and startup recovery time of the store journal (`common.journal`).
+
+Two layouts are measured for the same number of need-like records:
+
+- "log_only": every record is still in the write-ahead log (no snapshot yet)
+- "snapshot_tail": a compacted snapshot of the records plus a log tail of updates
+
+    python -m benchmarks.store_recovery --records 1000000 --tail 100000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from common import journal
+from common.journal import Journal
+
+
+def make_need(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "what": rng.choice(["laptop", "office cleaning", "breakfast cereal", "consulting hour", "road construction"]),
+        "classification": rng.choice(["Goods", "Services", "Land"]),
+        "elements": {"max_price": {"alternatives": [round(rng.uniform(5, 1500), 2)]}, "quantity": {"alternatives": [rng.randint(1, 5)]}},
+        "status": "open",
+        "created_at": "2025-01-01T00:00:00Z",
+        "expires_at": None,
+        "context": {"entity_id": f"entity-{rng.randint(1, 1000)}"},
+    }
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def write_records(data_dir: str, records: List[Dict[str, Any]], store: Dict[str, Any], snapshot: bool) -> float:
+    writer = Journal("needs", store.items, data_dir=data_dir)
+    store.update(writer.recover())
+    started = time.perf_counter()
+    for record in records:
+        store[record["id"]] = record
+        writer.put(record["id"], record)
+    elapsed = time.perf_counter() - started
+    writer.close(snapshot=snapshot)
+    return elapsed
+
+
+def measure_recovery(data_dir: str) -> Dict[str, Any]:
+    reader = Journal("needs", lambda: [], data_dir=data_dir)
+    started = time.perf_counter()
+    recovered = reader.recover()
+    elapsed = time.perf_counter() - started
+    reader.close(snapshot=False)
+    return {"records": len(recovered), "recovery_s": round(elapsed, 3), "records_per_s": round(len(recovered) / elapsed) if elapsed else None}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Store journal write and recovery benchmark.")
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=int, default=100_000, help="Updates logged after the snapshot in the snapshot_tail layout.")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--dir", default=None, help="Scratch directory (default: a temporary directory, removed afterwards).")
+    args = parser.parse_args(argv)
+
+    journal.STORE_SNAPSHOT_EVERY = 2 ** 62  # Snapshots only where the layout asks for them
+    rng = random.Random(args.seed)
+    records = [make_need(rng) for _ in range(args.records)]
+    tail = []
+    for record in rng.sample(records, min(args.tail, len(records))):
+        tail.append(dict(record, status="fulfilled"))
+
+    scratch = args.dir or tempfile.mkdtemp(prefix="store-recovery-")
+    report: Dict[str, Any] = {"benchmark": "store_recovery", "records": args.records, "tail": len(tail), "layouts": {}}
+    try:
+        log_dir = os.path.join(scratch, "log_only")
+        write_s = write_records(log_dir, records, {}, snapshot=False)
+        report["append_records_per_s"] = round(len(records) / write_s)
+        report["layouts"]["log_only"] = dict(measure_recovery(log_dir), disk_bytes=_dir_bytes(log_dir))
+
+        snapshot_dir = os.path.join(scratch, "snapshot_tail")
+        write_records(snapshot_dir, records, {}, snapshot=True)
+        write_records(snapshot_dir, tail, {}, snapshot=False)
+        report["layouts"]["snapshot_tail"] = dict(measure_recovery(snapshot_dir), disk_bytes=_dir_bytes(snapshot_dir))
+    finally:
+        if args.dir is None:
+            shutil.rmtree(scratch, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Cost of a need_list poll (`common.read_cache`) with --needs open needs, in process (FastMCP call_tool
+plus the client-side parse, no HTTP):
+
+- plain: the list returned as before, converted by FastMCP (one TextContent per need, plus
+  structured output)
+- changed: the versioned tool right after a change, serializing the list once
+- cached: a second reader at the same version, served the serialized response
+- not_modified: a reader whose known_version is current, reusing its decoded copy
+
+Reports milliseconds per poll and reply bytes.
+
+    python -m benchmarks.versioned_reads --needs 10000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from mcp.server.fastmcp import FastMCP
+
+from common.mcp_client import parse_mcp_list_result
+
+logging.disable(logging.WARNING)
+
+
+def reply_bytes(result: Any) -> int:
+    content = result[0] if isinstance(result, tuple) else getattr(result, "content", result)
+    return sum(len(item.text.encode()) for item in content)
+
+
+async def timed(repeat: int, call: Any) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from workers import needs_worker
+
+    for i in range(args.needs):
+        needs_worker.store_need({"what": f"item {i % 500}", "classification": "Goods",
+                                 "elements": {"max_price": {"alternatives": [10 + i % 90]}}})
+    plain = FastMCP("plain-needs")
+
+    @plain.tool("need_list")
+    def plain_need_list(status_filter: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [need for need in needs_worker.NEEDS if need.get("status") == status_filter] if status_filter else needs_worker.NEEDS
+
+    server = needs_worker.mcp_server
+    arguments = {"status_filter": "open"}
+
+    async def poll_plain() -> Any:
+        result = await plain.call_tool("need_list", arguments)
+        return parse_mcp_list_result(type("Result", (), {"content": list(result[0])})(), "need_list")
+
+    async def poll_versioned(known_version: Optional[str] = None) -> Any:
+        result = await server.call_tool("need_list", {**arguments, "known_version": known_version})
+        return result if result.meta.get("not_modified") else parse_mcp_list_result(result, "need_list")
+
+    async def poll_changed() -> Any:
+        needs_worker.NEED_READS.bump()
+        return await poll_versioned()
+
+    listed = reply_bytes(await server.call_tool("need_list", arguments))
+    sizes = {"plain": reply_bytes(await plain.call_tool("need_list", arguments)), "changed": listed, "cached": listed,
+             "not_modified": reply_bytes(await server.call_tool("need_list", {**arguments, "known_version": needs_worker.NEED_READS.version}))}
+    timings = {
+        "plain": await timed(args.repeat, poll_plain),
+        "changed": await timed(args.repeat, poll_changed),
+        "cached": await timed(args.repeat, poll_versioned),
+        "not_modified": await timed(args.repeat, lambda: poll_versioned(needs_worker.NEED_READS.version)),
+    }
+    return {
+        "benchmark": "versioned_reads",
+        "needs": args.needs,
+        **{name: {"ms_per_poll": round(seconds * 1000, 3), "reply_bytes": sizes[name]} for name, seconds in timings.items()},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="need_list polling with and without versioned reads.")
+    parser.add_argument("--needs", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5, help="Polls per mode; the best is reported.")
+    print(json.dumps(asyncio.run(run(parser.parse_args(argv))), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Admission control for the agents' MCP tools, so a burst sheds load instead of slowing every caller.
+
+Each tool call passes two checks before its handler runs:
+
+- a token bucket per (agent, client) (ADMISSION_CLIENT_RATE calls/s, ADMISSION_CLIENT_BURST);
+  the client is the `x-client-id` header, else the peer address, else "local" (in-process calls)
+- a gate per tool allowing ADMISSION_MAX_IN_FLIGHT concurrent handlers, with a FIFO queue of
+  ADMISSION_QUEUE_SIZE waiters. A waiter is rejected up front when the estimated queue wait
+  (position x recent handler latency / max in flight) exceeds its budget: the caller's
+  deadline (`deadline` in the request `_meta`, epoch seconds) or ADMISSION_QUEUE_TIMEOUT_SECONDS.
+
+Rejections raise `AdmissionRejected`, which FastMCP returns as an error result whose text
+carries {"error": "overloaded", "reason", "retry_after", "tool"}; `retry_after_from_result`
+reads it back on the client side. Per-tool limits can be overridden with
+ADMISSION_TOOL_LIMITS='{"need_add_many": {"max_in_flight": 4, "queue_size": 32}}'.
+Set ADMISSION_ENABLED=0 to skip the checks entirely.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from mcp.server.lowlevel.server import request_ctx
+
+from common import metrics
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") != "0"
+ADMISSION_CLIENT_RATE = float(os.getenv("ADMISSION_CLIENT_RATE", "0"))           # calls/s per client; 0 = unlimited
+ADMISSION_CLIENT_BURST = float(os.getenv("ADMISSION_CLIENT_BURST", str(max(1.0, 2 * ADMISSION_CLIENT_RATE))))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))        # concurrent handlers per tool
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "256"))             # waiting calls per tool
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+ADMISSION_TOOL_LIMITS: Dict[str, Dict[str, int]] = json.loads(os.getenv("ADMISSION_TOOL_LIMITS", "{}"))
+
+OVERLOADED = "overloaded"
+MAX_CLIENT_BUCKETS = 10000
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, tool: str, reason: str, retry_after: Optional[float]) -> None:
+        """retry_after is None when retrying cannot help (the caller's deadline has passed)."""
+        self.tool = tool
+        self.reason = reason
+        self.retry_after = round(max(retry_after, 0.001), 3) if retry_after is not None else None
+        super().__init__(json.dumps({"error": OVERLOADED, "reason": reason, "retry_after": self.retry_after, "tool": tool}))
+
+
+def retry_after_from_result(result: Any) -> Optional[float]:
+    """The retry_after of a retryable admission rejection returned by call_tool, else None."""
+    if result is None or not getattr(result, "isError", False):
+        return None
+    for item in getattr(result, "content", None) or []:
+        text = getattr(item, "text", None)
+        if not isinstance(text, str) or OVERLOADED not in text or "{" not in text:
+            continue
+        try:
+            payload = json.loads(text[text.index("{"):])
+        except ValueError:
+            continue
+        if isinstance(payload, dict) and payload.get("error") == OVERLOADED and payload.get("retry_after") is not None:
+            return float(payload["retry_after"])
+    return None
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Takes a token; returns 0 on success, else the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class ToolGate:
+    """At most `max_in_flight` concurrent handlers; later calls wait in a bounded FIFO queue."""
+
+    def __init__(self, tool: str, max_in_flight: int, queue_size: int) -> None:
+        self.tool = tool
+        self.max_in_flight = max(1, max_in_flight)
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.service_seconds = 0.01  # EWMA of handler latency, for queue wait estimates
+        self.queued = metrics.Counter()
+
+    def estimated_wait(self, position: int) -> float:
+        return position * self.service_seconds / self.max_in_flight
+
+    async def acquire(self, budget: float) -> None:
+        if self.in_flight < self.max_in_flight and not self.waiters:
+            self.in_flight += 1
+            return
+        position = len(self.waiters) + 1
+        if len(self.waiters) >= self.queue_size:
+            raise AdmissionRejected(self.tool, "queue_full", self.estimated_wait(position))
+        if self.estimated_wait(position) > budget:
+            raise AdmissionRejected(self.tool, "deadline", self.estimated_wait(position))
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.queued.inc()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), budget)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over as we gave up: pass it on
+                self.release()
+            else:
+                waiter.cancel()
+                try:
+                    self.waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionRejected(self.tool, "queue_timeout", self.estimated_wait(len(self.waiters) + 1)) from None
+            raise
+
+    def release(self, elapsed: Optional[float] = None) -> None:
+        if elapsed is not None:
+            self.service_seconds += 0.2 * (elapsed - self.service_seconds)
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # The slot moves to the waiter; in_flight is unchanged
+                return
+        self.in_flight -= 1
+
+
+def _client_and_deadline() -> Tuple[str, Optional[float]]:
+    context = request_ctx.get(None)
+    if context is None:
+        return "local", None
+    meta = context.meta
+    deadline = getattr(meta, "deadline", None) if meta is not None else None
+    request = context.request
+    client = "local"
+    if request is not None:
+        headers = getattr(request, "headers", None)
+        peer = getattr(request, "client", None)
+        client = (headers.get("x-client-id") if headers is not None else None) or (peer.host if peer is not None else "local")
+    try:
+        return client, float(deadline) if deadline is not None else None
+    except (TypeError, ValueError):
+        return client, None
+
+
+def client_id() -> str:
+    """The calling client as admission control identifies it ("local" outside a request)."""
+    return _client_and_deadline()[0]
+
+
+class AdmissionController:
+    def __init__(self, agent: str) -> None:
+        self.agent = agent
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.rejections: Dict[Tuple[str, str], metrics.Counter] = {}
+
+    def _reject(self, error: AdmissionRejected) -> AdmissionRejected:
+        counter = self.rejections.get((error.tool, error.reason))
+        if counter is None:
+            counter = metrics.REGISTRY.counter("admission_rejections_total", "Tool calls rejected by admission control.",
+                                               agent=self.agent, tool=error.tool, reason=error.reason)
+            self.rejections[(error.tool, error.reason)] = counter
+        counter.inc()
+        return error
+
+    def _check_rate(self, tool: str, client: str) -> None:
+        if ADMISSION_CLIENT_RATE <= 0:
+            return
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            if len(self.buckets) >= MAX_CLIENT_BUCKETS:
+                self.buckets.clear()  # Forgetting clients only grants them a fresh burst
+            bucket = self.buckets[client] = TokenBucket(ADMISSION_CLIENT_RATE, ADMISSION_CLIENT_BURST)
+        wait = bucket.take()
+        if wait:
+            raise self._reject(AdmissionRejected(tool, "rate_limited", wait))
+
+    def guard(self, tool: str, call: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        limits = ADMISSION_TOOL_LIMITS.get(tool, {})
+        gate = ToolGate(tool, int(limits.get("max_in_flight", ADMISSION_MAX_IN_FLIGHT)), int(limits.get("queue_size", ADMISSION_QUEUE_SIZE)))
+        labels = {"agent": self.agent, "tool": tool}
+        metrics.REGISTRY.gauge("admission_queue_depth", "Tool calls waiting for an in-flight slot.", lambda: len(gate.waiters), **labels)
+        metrics.REGISTRY.gauge("admission_in_flight", "Tool handlers currently running.", lambda: gate.in_flight, **labels)
+        gate.queued = metrics.REGISTRY.counter("admission_queued_total", "Tool calls that waited for an in-flight slot.", **labels)
+        perf_counter = time.perf_counter
+
+        async def admitted(**kwargs: Any) -> Any:
+            client, deadline = _client_and_deadline()
+            self._check_rate(tool, client)
+            budget = ADMISSION_QUEUE_TIMEOUT_SECONDS
+            if deadline is not None:
+                budget = min(budget, deadline - time.time())
+                if budget <= 0:
+                    raise self._reject(AdmissionRejected(tool, "deadline_exceeded", None))
+            try:
+                await gate.acquire(budget)
+            except AdmissionRejected as e:
+                raise self._reject(e)
+            start = perf_counter()
+            try:
+                return await call(**kwargs)
+            finally:
+                gate.release(perf_counter() - start)
+
+        return admitted
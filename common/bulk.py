@@ -0,0 +1,128 @@
+"""
+Compact bulk encoding for large list-tool results, negotiated per call.
+
+List tools take an `accept` argument: a comma-separated list of encodings in order of
+preference, e.g. "msgpack+zstd,msgpack+gzip,json+gzip". The server answers with the first one
+it can produce; clients that send nothing (plain MCP clients, the dashboard) and lists shorter
+than BULK_MIN_RECORDS get JSON text as before.
+
+A bulk result is a single EmbeddedResource whose blob (base64, as MCP carries binary) is the
+compressed, columnar form of the records:
+
+    {"v": 1, "n": <rows>, "names": [...], "columns": [[...], ...],
+     "dictionaries": {<column index>: [distinct values]}, "absent": {<column index>: [rows]}}
+
+Each key is sent once. String columns with few distinct values (classification,
+merchant_name, type, ...) are sent as indices into a dictionary. Rows that lack a key are
+listed in "absent", so decoded records match the originals key for key. msgpack and zstd are
+used when the `msgpack` / `zstandard` packages are installed; JSON and gzip always work.
+`decode_records` is called by the shared list parser (`common.mcp_client`), so callers see
+plain lists of dicts either way.
+"""
+import base64
+import gzip
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from mcp.types import BlobResourceContents, EmbeddedResource
+
+try:
+    import msgpack  # Optional dependency: smaller and faster to decode than JSON
+except ImportError:
+    msgpack = None
+try:
+    import zstandard  # Optional dependency: faster than gzip at a similar ratio
+except ImportError:
+    zstandard = None
+
+BULK_MIN_RECORDS = int(os.getenv("BULK_MIN_RECORDS", "256"))
+BULK_GZIP_LEVEL = int(os.getenv("BULK_GZIP_LEVEL", "6"))
+BULK_ZSTD_LEVEL = int(os.getenv("BULK_ZSTD_LEVEL", "3"))
+BULK_DICTIONARY_RATIO = 0.25 # String columns with at most this share of distinct values are dictionary-encoded
+
+MIME_PREFIX = "application/vnd.agent-records.v1+"
+JSON = "json"
+
+
+def available_encodings() -> List[str]:
+    """Encodings this process can produce and read, most compact first."""
+    formats = (["msgpack"] if msgpack is not None else []) + ["json"]
+    compressions = (["zstd"] if zstandard is not None else []) + ["gzip"]
+    return [f"{fmt}+{compression}" for fmt in formats for compression in compressions]
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """The first encoding in `accept` this process supports, or plain JSON."""
+    supported = set(available_encodings())
+    for encoding in (accept or "").split(","):
+        encoding = encoding.strip().lower()
+        if encoding in supported:
+            return encoding
+    return JSON
+
+
+def _columnar(records: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    names: Dict[str, int] = {}
+    for record in records:
+        for name in record:
+            if name not in names:
+                names[name] = len(names)
+    columns, dictionaries, absent = [], {}, {}
+    for name, index in names.items():
+        missing = [row for row, record in enumerate(records) if name not in record]
+        if missing:
+            absent[str(index)] = missing
+        values = [record.get(name) for record in records]
+        if all(type(value) is str for value in values):
+            distinct = list(dict.fromkeys(values))
+            if len(distinct) <= BULK_DICTIONARY_RATIO * len(values):
+                positions = {value: position for position, value in enumerate(distinct)}
+                dictionaries[str(index)] = distinct
+                values = [positions[value] for value in values]
+        columns.append(values)
+    return {"v": 1, "n": len(records), "names": list(names), "columns": columns, "dictionaries": dictionaries, "absent": absent}
+
+
+def _records(table: Dict[str, Any]) -> List[Dict[str, Any]]:
+    names, columns = table["names"], list(table["columns"])
+    for index, distinct in table.get("dictionaries", {}).items():
+        column = int(index)
+        columns[column] = [distinct[position] for position in columns[column]]
+    records = [dict(zip(names, row)) for row in zip(*columns)] if names else [{} for _ in range(table["n"])]
+    for index, rows in table.get("absent", {}).items():
+        name = names[int(index)]
+        for row in rows:
+            del records[row][name]
+    return records
+
+
+def encode_records(records: Sequence[Dict[str, Any]], encoding: str) -> EmbeddedResource:
+    fmt, compression = encoding.split("+")
+    table = _columnar(records)
+    data = msgpack.packb(table, use_bin_type=True) if fmt == "msgpack" else json.dumps(table, separators=(",", ":"), default=str).encode()
+    if compression == "zstd":
+        data = zstandard.ZstdCompressor(level=BULK_ZSTD_LEVEL).compress(data)
+    else:
+        data = gzip.compress(data, compresslevel=BULK_GZIP_LEVEL)
+    return EmbeddedResource(type="resource", resource=BlobResourceContents(
+        uri=f"bulk://records/{len(records)}", mimeType=MIME_PREFIX + encoding, blob=base64.b64encode(data).decode("ascii")))
+
+
+def bulk_encoding(content: Any) -> Optional[str]:
+    """The encoding of a content item produced by encode_records, else None."""
+    mime_type = getattr(getattr(content, "resource", None), "mimeType", None) or ""
+    return mime_type[len(MIME_PREFIX):] if mime_type.startswith(MIME_PREFIX) else None
+
+
+def decode_records(content: Any) -> List[Dict[str, Any]]:
+    """Records of a content item produced by encode_records; raises ValueError for an encoding this process cannot read."""
+    encoding = bulk_encoding(content)
+    fmt, _, compression = (encoding or "").partition("+")
+    if (fmt == "msgpack" and msgpack is None) or (compression == "zstd" and zstandard is None) \
+            or fmt not in ("msgpack", "json") or compression not in ("zstd", "gzip"):
+        raise ValueError(f"unsupported bulk encoding {encoding!r}")
+    data = base64.b64decode(content.resource.blob)
+    data = zstandard.ZstdDecompressor().decompress(data) if compression == "zstd" else gzip.decompress(data)
+    return _records(msgpack.unpackb(data, raw=False, strict_map_key=False) if fmt == "msgpack" else json.loads(data))
+
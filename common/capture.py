@@ -0,0 +1,152 @@
+"""
+Traffic capture for record-and-replay load tests (see `common.replay_cli`).
+
+With CAPTURE_FILE set, every MCP tool call a server receives is recorded as one JSON line:
+
+    {"ts": <start, epoch s>, "agent", "tool", "client", "args", "latency_ms", "response_bytes", "status"}
+
+`status` is "ok", "error" (raised, or returned {"status": "error"}) or "rejected" (admission
+control). `latency_ms` is what the caller saw, including admission queueing.
+`response_bytes` is the compact JSON size of the result, summed per content item the way
+FastMCP splits list results; the replayer measures replies the same way. Results the tool
+prebuilt (versioned reads, `common.read_cache`) count their text or bulk blob as sent.
+
+Records are encoded on the calling thread (arguments before the handler runs, since handlers
+may modify them) and written by a daemon thread every
+CAPTURE_FLUSH_SECONDS. Each flush appends one gzip member with a single O_APPEND write,
+so several agents can share one file and a crash loses at most the last unflushed batch.
+`gzip.open` reads the concatenated members as one stream. In-process calls to the plain
+tool functions are not captured.
+"""
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional
+
+from common import metrics
+from common.admission import AdmissionRejected
+
+CAPTURE_FILE = os.getenv("CAPTURE_FILE")
+CAPTURE_FLUSH_SECONDS = float(os.getenv("CAPTURE_FLUSH_SECONDS", "1"))
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def response_bytes(result: Any) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple)):
+        return sum(response_bytes(item) for item in result)
+    if isinstance(result, str):
+        return len(result.encode())
+    if isinstance(getattr(result, "content", None), list): # A prebuilt CallToolResult (common.read_cache)
+        return sum(len((getattr(item, "text", None) or getattr(getattr(item, "resource", None), "blob", "")).encode()) for item in result.content)
+    try:
+        return len(json.dumps(result, separators=(",", ":"), ensure_ascii=False, default=str).encode())
+    except (TypeError, ValueError):
+        return 0
+
+
+class CaptureWriter:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._pending: "queue.SimpleQueue[str]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, line: str) -> None:
+        self._pending.put(line)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(CAPTURE_FLUSH_SECONDS)
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            lines = []
+            while True:
+                try:
+                    lines.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            if not lines:
+                return
+            data = gzip.compress(("\n".join(lines) + "\n").encode(), compresslevel=6)
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                logging.warning(f"[capture] Could not append {len(lines)} records to {self.path}: {e}")
+
+
+_WRITER: Optional[CaptureWriter] = CaptureWriter(CAPTURE_FILE) if CAPTURE_FILE else None
+
+
+def capture_tool(agent: str, tool_name: str, call: Callable[..., Awaitable[Any]],
+                 client_of: Callable[[], str]) -> Callable[..., Awaitable[Any]]:
+    """Wraps an async tool callable so each call is appended to the capture log."""
+    writer = _WRITER
+    if writer is None:
+        return call
+    records = metrics.REGISTRY.counter("capture_records_total", "Tool calls written to the capture log.", agent=agent, tool=tool_name)
+    perf_counter = time.perf_counter
+
+    async def captured(**kwargs: Any) -> Any:
+        ts = time.time()
+        args = _encode(kwargs)
+        start = perf_counter()
+        status, result = "ok", None
+        try:
+            result = await call(**kwargs)
+            if type(result) is dict and result.get("status") == "error":
+                status = "error"
+            return result
+        except AdmissionRejected:
+            status = "rejected"
+            raise
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            latency_ms = round((perf_counter() - start) * 1000, 3)
+            writer.submit(f'{{"ts":{ts},"agent":{_encode(agent)},"tool":{_encode(tool_name)},"client":{_encode(client_of())},'
+                          f'"args":{args},"latency_ms":{latency_ms},"response_bytes":{response_bytes(result)},"status":"{status}"}}')
+            records.inc()
+
+    return captured
+
+
+def load_records(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Reads capture files (gzip members or plain JSON lines); a torn last member ends that file."""
+    for path in paths:
+        with open(path, "rb") as f:
+            compressed = f.read(2) == GZIP_MAGIC # CaptureWriter always writes gzip members, whatever the file is called
+        with (gzip.open if compressed else open)(path, "rt") as f:
+            try:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # The cut-off last line of a truncated batch
+                    yield record
+            except (EOFError, gzip.BadGzipFile) as e:
+                logging.warning(f"[capture] {path} ends in a truncated record batch, skipped: {e}")
@@ -0,0 +1,375 @@
+"""
+On-demand profiling, memory introspection and event-loop stall detection for the agents.
+
+With DEBUG_TOOLS_ENABLED=1, `common.server.instrument_server` mounts three admin tools on the agent:
+
+- debug_profile(seconds, mode, sort, top): profiles the event-loop thread for `seconds` and
+  returns its top functions. mode="sample" (default) has a background thread read the loop
+  thread's stack every DEBUG_PROFILE_INTERVAL_SECONDS, which costs the loop next to nothing;
+  mode="cprofile" runs cProfile instead, with exact call counts but a lot of overhead while it runs.
+- debug_memory(top, stop_tracing): starts tracemalloc on the first call. Every call after that
+  returns the allocation sites that grew most since the previous call. It also returns item
+  counts and sampled size estimates for every store registered with
+  `metrics.register_store_gauge` (NEEDS, OFFERS, SUPPLIES, MATCHES, PREDICTIONS, ...).
+  DEBUG_TRACEMALLOC=1 starts tracing at import time, so startup allocations are included.
+- debug_loop(limit): recent event-loop stalls and lag statistics.
+
+Stall detection is on unless LOOP_MONITOR_ENABLED=0, and `start_loop_monitor()` is called from
+each agent's startup(). A heartbeat task measures how late the loop wakes it up (the
+`event_loop_lag_seconds` histogram). A watchdog thread records the loop thread's stack when a
+heartbeat is more than LOOP_BLOCK_THRESHOLD_SECONDS overdue. When the loop gets going again,
+the stall is logged with that stack (the code that was blocking) and counted in
+`event_loop_stalls_total`.
+
+Profiles, tracemalloc and the monitor are per process, so in all-in-one mode they cover every agent.
+"""
+import asyncio
+import cProfile
+import collections
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import traceback
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from common import metrics
+
+DEBUG_TOOLS_ENABLED = os.getenv("DEBUG_TOOLS_ENABLED", "0") != "0"
+DEBUG_TRACEMALLOC = os.getenv("DEBUG_TRACEMALLOC", "0") != "0"
+DEBUG_TRACEMALLOC_FRAMES = int(os.getenv("DEBUG_TRACEMALLOC_FRAMES", "1")) # Frames kept per allocation; more costs memory
+DEBUG_PROFILE_MAX_SECONDS = float(os.getenv("DEBUG_PROFILE_MAX_SECONDS", "60"))
+DEBUG_PROFILE_INTERVAL_SECONDS = float(os.getenv("DEBUG_PROFILE_INTERVAL_SECONDS", "0.005"))
+DEBUG_MEMORY_SAMPLE = int(os.getenv("DEBUG_MEMORY_SAMPLE", "200")) # Items per store measured for the size estimate
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "1") != "0"
+LOOP_MONITOR_INTERVAL_SECONDS = float(os.getenv("LOOP_MONITOR_INTERVAL_SECONDS", "0.05"))
+LOOP_BLOCK_THRESHOLD_SECONDS = float(os.getenv("LOOP_BLOCK_THRESHOLD_SECONDS", "0.1"))
+LOOP_STALL_HISTORY = int(os.getenv("LOOP_STALL_HISTORY", "50"))
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_IDLE_FUNCTIONS = {"select", "poll", "epoll", "kqueue", "_poll"}  # Leaf frames of a loop waiting in its selector
+_TRACEMALLOC_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+                        tracemalloc.Filter(False, "<unknown>")]
+
+_profile_running = False
+_memory_baseline: Optional[tracemalloc.Snapshot] = None
+_memory_baseline_at: Optional[float] = None
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _short_path(filename: str) -> str:
+    """The path relative to the working directory, else its last two parts."""
+    if filename.startswith(os.getcwd() + os.sep):
+        return os.path.relpath(filename)
+    return os.sep.join(filename.rsplit(os.sep, 2)[-2:])
+
+
+def _where(filename: str, line: int, name: str) -> str:
+    return f"{_short_path(filename)}:{line}({name})"
+
+
+def _stack(frame: Any, limit: int = 20) -> List[str]:
+    return [f"{_where(entry.filename, entry.lineno, entry.name)} {entry.line or ''}".rstrip()
+            for entry in traceback.extract_stack(frame, limit=limit)]
+
+
+# --- Profiling ---
+
+def _sample(thread_id: int, seconds: float, interval: float) -> Tuple[int, int, collections.Counter, collections.Counter]:
+    """Runs in a worker thread: (samples, idle samples, self counts, total counts) of `thread_id`'s stack."""
+    own, total = collections.Counter(), collections.Counter()
+    samples = idle = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            samples += 1
+            code = frame.f_code
+            if code.co_name in _IDLE_FUNCTIONS and code.co_filename.endswith("selectors.py"):
+                idle += 1
+            else:
+                own[(code.co_filename, code.co_firstlineno, code.co_name)] += 1
+                seen = set()
+                while frame is not None:
+                    key = (frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name)
+                    if key not in seen:
+                        seen.add(key)
+                        total[key] += 1
+                    frame = frame.f_back
+        time.sleep(interval)
+    return samples, idle, own, total
+
+
+async def _sampled_profile(seconds: float, sort: str, top: int) -> Dict[str, Any]:
+    samples, idle, own, total = await asyncio.to_thread(_sample, threading.get_ident(), seconds, DEBUG_PROFILE_INTERVAL_SECONDS)
+    ranked = own if sort == "self" else total
+    busy = max(1, samples - idle)
+    return {
+        "samples": samples,
+        "busy_share": round((samples - idle) / samples, 4) if samples else 0.0,
+        "top": [{"function": _where(*key), "self_share": round(own[key] / busy, 4), "total_share": round(total[key] / busy, 4)}
+                for key, _ in ranked.most_common(top)],
+    }
+
+
+async def _cprofile(seconds: float, sort: str, top: int) -> Dict[str, Any]:
+    # The profiler hooks the thread it is enabled on, so it sees every task and callback the loop runs meanwhile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    stats = pstats.Stats(profiler).stats
+    column = 2 if sort == "self" else 3  # (primitive calls, calls, self time, cumulative time, callers)
+    ranked = sorted(stats.items(), key=lambda item: item[1][column], reverse=True)[:top]
+    return {
+        "functions": len(stats),
+        "top": [{"function": _where(*key), "calls": calls, "self_seconds": round(self_time, 6), "cumulative_seconds": round(cumulative, 6)}
+                for key, (_, calls, self_time, cumulative, _) in ranked],
+    }
+
+
+async def profile(seconds: float = 5.0, mode: str = "sample", sort: str = "self", top: int = 25) -> Dict[str, Any]:
+    global _profile_running
+    if mode not in ("sample", "cprofile") or sort not in ("self", "cumulative"):
+        return {"status": "error", "message": "mode must be 'sample' or 'cprofile' and sort 'self' or 'cumulative'."}
+    if _profile_running:
+        return {"status": "error", "message": "A profile is already running in this process."}
+    seconds = min(max(seconds, 0.1), DEBUG_PROFILE_MAX_SECONDS)
+    _profile_running = True
+    started = time.time()
+    try:
+        result = await (_sampled_profile if mode == "sample" else _cprofile)(seconds, sort, max(1, top))
+    finally:
+        _profile_running = False
+    logging.info("[debug] %s profile of %.1fs taken.", mode, seconds)
+    return {"status": "success", "mode": mode, "sort": sort, "seconds": round(seconds, 3), "started_at": _iso(started), **result}
+
+
+# --- Memory ---
+
+def _deep_size(obj: Any, seen: set) -> Tuple[int, int]:
+    """(bytes, objects) reachable from obj through containers, each object counted once."""
+    size = objects = 0
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        objects += 1
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, collections.deque)):
+            pending.extend(item)
+    return size, objects
+
+
+def _evenly(items: List[Any], count: int) -> List[Any]:
+    if len(items) <= count:
+        return items
+    step = len(items) / count
+    return [items[int(i * step)] for i in range(count)]
+
+
+def store_footprint(collection: Any, sample: int = DEBUG_MEMORY_SAMPLE) -> Dict[str, Any]:
+    """Item count plus the bytes and objects held, measured on up to `sample` items and scaled to the rest."""
+    values = getattr(collection, "values", None) # Mappings and mapping-like stores (OrderBook) hold their records as values
+    items: List[Any] = list(values() if callable(values) else collection)
+    measured = _evenly(items, max(1, sample))
+    seen: set = set()
+    sizes = [_deep_size(item, seen) for item in measured] # Shared objects (interned strings, ...) count once
+    scale = len(items) / len(measured) if measured else 0.0
+    container = sys.getsizeof(collection) + (sum(sys.getsizeof(key) for key in collection) if isinstance(collection, dict) else 0)
+    return {
+        "items": len(items),
+        "objects_estimate": int(round(sum(objects for _, objects in sizes) * scale)) + 1,
+        "bytes_estimate": int(round(sum(size for size, _ in sizes) * scale)) + container,
+        "sampled": len(measured),
+    }
+
+
+def _stores(agent: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    out = {}
+    for (owner, store), collection in list(metrics.STORES.items()):
+        if agent is None or owner == agent:
+            try:
+                out[f"{owner}/{store}"] = store_footprint(collection)
+            except Exception as e: # A store mutated while it was being measured
+                out[f"{owner}/{store}"] = {"error": str(e)}
+    return out
+
+
+def start_tracing() -> None:
+    global _memory_baseline, _memory_baseline_at
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(DEBUG_TRACEMALLOC_FRAMES)
+        _memory_baseline, _memory_baseline_at = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS), time.time()
+        logging.info("[debug] tracemalloc started (%d frames per allocation).", DEBUG_TRACEMALLOC_FRAMES)
+
+
+def memory(agent: Optional[str] = None, top: int = 20, stop_tracing: bool = False) -> Dict[str, Any]:
+    global _memory_baseline, _memory_baseline_at
+    result: Dict[str, Any] = {"status": "success", "stores": _stores(agent)}
+    if not tracemalloc.is_tracing():
+        start_tracing()
+        result["tracemalloc"] = {"started": True, "message": "Tracing started; call again to see what grew since now."}
+        return result
+    snapshot = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS)
+    current, peak = tracemalloc.get_traced_memory()
+    diff = snapshot.compare_to(_memory_baseline, "lineno") if _memory_baseline is not None else snapshot.statistics("lineno")
+    result["tracemalloc"] = {
+        "since": _iso(_memory_baseline_at) if _memory_baseline_at else None,
+        "traced_bytes": current,
+        "peak_traced_bytes": peak,
+        "top": [{"where": f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                 "size": stat.size, "size_diff": getattr(stat, "size_diff", stat.size),
+                 "count": stat.count, "count_diff": getattr(stat, "count_diff", stat.count)}
+                for stat in diff[:max(1, top)]],
+    }
+    _memory_baseline, _memory_baseline_at = snapshot, time.time()
+    if stop_tracing:
+        tracemalloc.stop()
+        _memory_baseline = _memory_baseline_at = None
+        result["tracemalloc"]["stopped"] = True
+        logging.info("[debug] tracemalloc stopped.")
+    return result
+
+
+# --- Event-loop stalls ---
+
+class LoopMonitor:
+    def __init__(self, interval: float, threshold: float, history: int) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: Deque[Dict[str, Any]] = collections.deque(maxlen=history)
+        self.max_lag = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._last_beat = time.monotonic()
+        self._blocked_stack: Optional[List[str]] = None
+        self.lag = metrics.REGISTRY.histogram("event_loop_lag_seconds", "How late the event loop ran a heartbeat timer.", LAG_BUCKETS)
+        self.stall_count = metrics.REGISTRY.counter("event_loop_stalls_total", "Times the event loop was blocked past the threshold.")
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        self._loop, self._loop_thread = loop, threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = loop.create_task(self._heartbeat(), name="loop-monitor")
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+        logging.info("[debug] Event-loop monitor started (stalls over %.0f ms are logged).", self.threshold * 1000)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+            lag = max(0.0, now - expected)
+            self.lag.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            stack, self._blocked_stack = self._blocked_stack, None  # Only ever describes the wait that just ended
+            if lag >= self.threshold:
+                self._record_stall(lag, stack)
+
+    def _record_stall(self, lag: float, stack: Optional[List[str]]) -> None:
+        self.stall_count.inc()
+        self.stalls.append({"at": _iso(time.time() - lag), "blocked_seconds": round(lag, 4), "stack": stack})
+        where = stack[-1] if stack else "unknown (stack not captured)"
+        logging.warning("[debug] Event loop blocked for %.0f ms in %s", lag * 1000, where)
+        if stack:
+            logging.debug("[debug] Blocking stack:\n  %s", "\n  ".join(stack))
+
+    def _watch(self) -> None:
+        # Runs in its own thread; catches the loop thread's stack while it is still blocked
+        while True:
+            time.sleep(self.threshold / 2)
+            loop, task = self._loop, self._task
+            if loop is None or task is None or task.done() or not loop.is_running() or self._blocked_stack is not None:
+                continue
+            if time.monotonic() - self._last_beat > self.interval + self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._blocked_stack = _stack(frame)
+
+    def report(self, limit: int = 20) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval,
+            "threshold_seconds": self.threshold,
+            "running": self._task is not None and not self._task.done(),
+            "stalls_total": int(self.stall_count.value),
+            "max_lag_seconds": round(self.max_lag, 4),
+            "lag": self.lag.snapshot(),
+            "recent_stalls": list(self.stalls)[-max(0, limit):] if limit > 0 else [],
+        }
+
+
+LOOP_MONITOR = LoopMonitor(LOOP_MONITOR_INTERVAL_SECONDS, LOOP_BLOCK_THRESHOLD_SECONDS, LOOP_STALL_HISTORY)
+
+
+def start_loop_monitor() -> None:
+    """Starts stall detection on the running loop (once per loop); call it from an agent's startup()."""
+    if LOOP_MONITOR_ENABLED:
+        LOOP_MONITOR.start()
+
+
+# --- Tools ---
+
+def mount(server: Any) -> None:
+    """Adds the debug_profile, debug_memory and debug_loop tools to a FastMCP server."""
+    agent = server.name
+
+    @server.tool("debug_profile")
+    async def debug_profile(seconds: float = 5.0, mode: str = "sample", sort: str = "self", top: int = 25) -> Dict[str, Any]:
+        """
+        Profiles this process's event loop for `seconds` (at most DEBUG_PROFILE_MAX_SECONDS) and returns the top functions.
+
+        Args:
+            seconds: How long to profile.
+            mode: "sample" (stack sampling, negligible overhead; shares of busy samples) or
+                  "cprofile" (exact call counts and times, slows the loop while it runs).
+            sort: "self" (time in the function itself) or "cumulative" (including its callees).
+            top: Number of functions returned.
+        """
+        return await profile(seconds, mode, sort, top)
+
+    @server.tool("debug_memory")
+    def debug_memory(top: int = 20, stop_tracing: bool = False) -> Dict[str, Any]:
+        """
+        Item counts and size estimates of this agent's stores, and the allocation sites that grew most
+        since the previous call (tracemalloc, started by the first call).
+
+        Args:
+            top: Number of allocation sites returned.
+            stop_tracing: Stop tracemalloc after this snapshot (it slows every allocation while on).
+        """
+        return memory(agent, top, stop_tracing)
+
+    @server.tool("debug_loop")
+    def debug_loop(limit: int = 20) -> Dict[str, Any]:
+        """
+        Event-loop lag statistics and the most recent stalls over LOOP_BLOCK_THRESHOLD_SECONDS,
+        each with the stack of the code that was blocking the loop.
+        """
+        return LOOP_MONITOR.report(limit)
+
+
+if DEBUG_TOOLS_ENABLED and DEBUG_TRACEMALLOC:
+    start_tracing()
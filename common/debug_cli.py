@@ -0,0 +1,57 @@
+"""
+Checks for the debug tools in `common.debug`.
+
+    # Load every agent, put a record in each durable store through its tools, then run
+    # debug_memory's store measurement; exits 1 if any registered store cannot be measured
+    python -m common.debug_cli stores
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+os.environ.pop("STORE_DATA_DIR", None) # Before the agents create their journals: the check never writes real stores
+
+from all_in_one import AGENT_MODULES
+from common import debug, metrics
+
+
+def seed_stores(modules: Dict[str, Any]) -> None:
+    """One record per durable store, added the way the agents add them (MATCHES and the rest stay as loaded)."""
+    modules["needs-worker"].need_add_tool({"what": "debug check laptop", "elements": {"max_price": {"alternatives": [100]}}})
+    modules["opportunity-agent"].offer_publish({"sku": "DEBUGCHECK01", "merchant_id": "debug-check", "name": "Debug Check Laptop",
+                                                "type": "product", "price": 90.0, "quantity": 1})
+    modules["supplier-agent"].supply_add({"sku": "DEBUGCHECK01", "name": "Debug Check Laptop", "type": "product", "stock": 1, "price": 80.0})
+
+
+def check_stores() -> List[str]:
+    """Names of the registered stores debug_memory could not measure."""
+    modules = {agent: importlib.import_module(module_path) for agent, (module_path, _) in AGENT_MODULES.items()}
+    seed_stores(modules)
+    stores = debug.memory(top=1)["stores"]
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    print(json.dumps(stores, indent=2))
+    missing = [f"{owner}/{store}" for owner, store in metrics.STORES if f"{owner}/{store}" not in stores]
+    return [name for name, footprint in stores.items() if "error" in footprint] + missing
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Checks for the debug tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stores", help="Measure every registered store as debug_memory does.")
+    parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+    failed = check_stores()
+    if failed:
+        print(f"debug_memory failed on {len(failed)} store(s): {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+    print(f"debug_memory measured all {len(metrics.STORES)} registered stores.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
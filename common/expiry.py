@@ -0,0 +1,105 @@
+"""
+Deadline scheduler for records that carry an `expires_at`.
+
+Deadlines live in a min-heap of (deadline, seq, key). `schedule` is O(log n); `cancel` is
+O(1) and lazy: the heap entry stays behind and is skipped when it surfaces (the heap is
+rebuilt once stale entries outnumber live ones). A single asyncio task sleeps until the
+earliest deadline, or until an earlier one is scheduled, and hands every due key to
+`on_expire` in one batch.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Heaps smaller than this are never compacted; rebuilding them buys nothing
+_COMPACT_MIN_HEAP = 1024
+
+
+def parse_deadline(value: Any) -> Optional[float]:
+    """Accepts epoch seconds or an ISO-8601 timestamp (naive means UTC); returns epoch seconds or None."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    return None
+
+
+class ExpiryScheduler:
+    def __init__(self, name: str, on_expire: Callable[[List[str]], None]) -> None:
+        self.name = name
+        self._on_expire = on_expire
+        self._heap: List[Tuple[float, int, str]] = []
+        self._live: Dict[str, int] = {}  # key -> seq of its current heap entry
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def schedule(self, key: str, deadline: float) -> None:
+        """Schedules (or reschedules) `key`. Starts the sweeper if called inside a running loop."""
+        seq = next(self._seq)
+        self._live[key] = seq
+        heapq.heappush(self._heap, (deadline, seq, key))
+        if self._heap[0][1] == seq:
+            self._wakeup.set()  # New earliest deadline: the sweeper must re-arm its timer
+        try:
+            self.start()
+        except RuntimeError:
+            pass  # No running loop yet; main() starts the sweeper
+
+    def cancel(self, key: str) -> bool:
+        if self._live.pop(key, None) is None:
+            return False
+        if len(self._heap) > _COMPACT_MIN_HEAP and len(self._heap) > 2 * len(self._live):
+            self._heap = [entry for entry in self._heap if self._live.get(entry[2]) == entry[1]]
+            heapq.heapify(self._heap)
+        return True
+
+    def next_deadline(self) -> Optional[float]:
+        while self._heap and self._live.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List[str]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, key = heapq.heappop(self._heap)
+            if self._live.get(key) == seq:
+                del self._live[key]
+                due.append(key)
+        return due
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name=f"{self.name}-expiry")
+            logging.info("[expiry] %s sweeper started with %d pending deadlines.", self.name, len(self._live))
+
+    async def _run(self) -> None:
+        while True:
+            due = self.pop_due(time.time())
+            if due:
+                try:
+                    self._on_expire(due)
+                except Exception as e:
+                    logging.error(f"[expiry] {self.name} expiry callback failed for {len(due)} keys: {e}", exc_info=True)
+            deadline = self.next_deadline()
+            self._wakeup.clear()
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
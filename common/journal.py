@@ -0,0 +1,298 @@
+"""
+Embedded durability for the agents' in-memory stores (for deployments without Redis).
+
+Each store gets a directory under STORE_DATA_DIR holding a segmented write-ahead log and
+compacted snapshots. Mutating tools record the resulting state of a key (`put`) or its
+removal (`delete`); a snapshot holds the store exactly as of its LSN, so it plus the log
+tail after that LSN replays to the latest state.
+
+- `put`/`delete` encode the record on the caller's thread and queue it; a writer thread
+  appends queued records in batches and fsyncs once per batch (group commit). A hard kill
+  loses at most the last STORE_FSYNC_MS of writes.
+- Segments roll over at STORE_SEGMENT_BYTES. Every STORE_SNAPSHOT_EVERY records (and at
+  exit) the store is snapshotted: encoded on the caller's thread, written by a background
+  thread. Segments the snapshot covers are then deleted.
+- `recover()` mmaps the newest snapshot and replays the log tail, truncating a torn record
+  at the end of the last segment.
+
+Durability is off unless STORE_DATA_DIR is set; `put`/`delete` are then no-ops.
+
+Record framing (log and snapshot): <u32 payload length><u32 crc32(payload)><payload>. Log
+payloads are pickled `(lsn, "p", key, value)` / `(lsn, "d", key)` tuples; snapshots start
+with SNAPSHOT_MAGIC and <u64 lsn><u64 count>, then pickled lists of up to SNAPSHOT_CHUNK
+(key, value) pairs. Pickle decodes these records about 3x faster than JSON; the files are
+private to the agent that wrote them and must not be accepted from elsewhere.
+"""
+import atexit
+import gc
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+STORE_DATA_DIR = os.getenv("STORE_DATA_DIR")
+STORE_FSYNC_MS = float(os.getenv("STORE_FSYNC_MS", "50"))
+STORE_SEGMENT_BYTES = int(os.getenv("STORE_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+STORE_SNAPSHOT_EVERY = int(os.getenv("STORE_SNAPSHOT_EVERY", "100000"))
+
+FRAME = struct.Struct("<II")
+SNAPSHOT_MAGIC = b"AESNAP01"
+SNAPSHOT_HEADER = struct.Struct("<QQ")
+SNAPSHOT_CHUNK = 1024
+
+
+def _frame(payload: bytes) -> bytes:
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_frames(buffer: Any, offset: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """Yields (end_offset, payload) for each intact frame; stops at the first torn or corrupt one."""
+    size = len(buffer)
+    while offset + FRAME.size <= size:
+        length, crc = FRAME.unpack_from(buffer, offset)
+        end = offset + FRAME.size + length
+        if end > size:
+            return
+        payload = buffer[offset + FRAME.size:end]
+        if zlib.crc32(payload) != crc:
+            return
+        yield end, payload
+        offset = end
+
+
+def _fsync_dir(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    def __init__(self, name: str, items: Callable[[], Iterable[Tuple[str, Any]]], data_dir: Optional[str] = None) -> None:
+        """`items` returns the store's current (key, value) pairs; it is called on the writing thread."""
+        self.name = name
+        self.items = items
+        root = data_dir if data_dir is not None else STORE_DATA_DIR
+        self.enabled = bool(root)
+        self.path = os.path.join(root, name) if root else None
+        self.lsn = 0
+        self.records_since_snapshot = 0
+        self._pending: List[Any] = []
+        self._cond = threading.Condition()
+        self._writer: Optional[threading.Thread] = None
+        self._snapshotter: Optional[threading.Thread] = None
+        self._segment = None
+        self._segment_index = 0
+        self._closed = False
+
+    # --- Recovery ---
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        found = []
+        for entry in os.listdir(self.path):
+            if entry.startswith("wal-") and entry.endswith(".log"):
+                found.append((int(entry[4:-4]), os.path.join(self.path, entry)))
+        return sorted(found)
+
+    def _snapshots(self) -> List[Tuple[int, str]]:
+        found = []
+        for entry in os.listdir(self.path):
+            if entry.startswith("snapshot-") and entry.endswith(".bin"):
+                found.append((int(entry[9:-4]), os.path.join(self.path, entry)))
+        return sorted(found)
+
+    def recover(self) -> Dict[str, Any]:
+        """Rebuilds the store from disk (snapshot + log tail) and starts the writer. Returns {key: value}."""
+        state: Dict[str, Any] = {}
+        if not self.enabled:
+            return state
+        os.makedirs(self.path, exist_ok=True)
+        started = time.perf_counter()
+        # Recovery only allocates (no cycles to collect); pausing the GC makes it ~2.5x faster
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            state, replayed = self._replay()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        self.records_since_snapshot = replayed
+        logging.info("[journal] %s: recovered %d records (%d replayed from the log) in %.3fs.",
+                     self.name, len(state), replayed, time.perf_counter() - started)
+        self._start()
+        return state
+
+    def _replay(self) -> Tuple[Dict[str, Any], int]:
+        state: Dict[str, Any] = {}
+        snapshot_lsn = 0
+        snapshots = self._snapshots()
+        if snapshots:
+            snapshot_lsn, snapshot_path = snapshots[-1]
+            state = self._load_snapshot(snapshot_path)
+        self.lsn = snapshot_lsn
+
+        replayed = 0
+        segments = self._segments()
+        for position, (index, segment_path) in enumerate(segments):
+            size = os.path.getsize(segment_path)
+            valid_end = 0
+            if size:
+                with open(segment_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    for valid_end, payload in _read_frames(buffer):
+                        record = pickle.loads(payload)
+                        if record[0] <= snapshot_lsn:
+                            continue
+                        if record[1] == "p":
+                            state[record[2]] = record[3]
+                        else:
+                            state.pop(record[2], None)
+                        self.lsn = record[0]
+                        replayed += 1
+            if valid_end < size:
+                if position == len(segments) - 1:
+                    logging.warning("[journal] %s: truncating torn tail of %s at byte %d of %d.", self.name, segment_path, valid_end, size)
+                    os.truncate(segment_path, valid_end)
+                else:
+                    logging.error("[journal] %s: corrupt record in %s at byte %d; skipping the rest of that segment.", self.name, segment_path, valid_end)
+            self._segment_index = index
+        return state, replayed
+
+    def _load_snapshot(self, snapshot_path: str) -> Dict[str, Any]:
+        state: Dict[str, Any] = {}
+        with open(snapshot_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if buffer[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError(f"{snapshot_path} is not a store snapshot")
+            _, count = SNAPSHOT_HEADER.unpack_from(buffer, len(SNAPSHOT_MAGIC))
+            for _, payload in _read_frames(buffer, len(SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size):
+                state.update(pickle.loads(payload))
+        if len(state) != count:
+            raise ValueError(f"{snapshot_path} holds {len(state)} of {count} records")
+        return state
+
+    # --- Writing ---
+
+    def _start(self) -> None:
+        self._segment_index += 1
+        self._segment = open(os.path.join(self.path, f"wal-{self._segment_index:08d}.log"), "ab")
+        _fsync_dir(self.path)
+        self._writer = threading.Thread(target=self._run_writer, name=f"{self.name}-journal", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _append(self, record: Tuple[Any, ...]) -> None:
+        frame = _frame(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+        with self._cond:
+            self._pending.append(frame)
+            self.records_since_snapshot += 1
+            if self.records_since_snapshot >= STORE_SNAPSHOT_EVERY and self._snapshotter is None:
+                self._request_snapshot()
+            self._cond.notify()
+
+    def put(self, key: str, value: Any) -> None:
+        if self.enabled and self._writer is not None:
+            self.lsn += 1
+            self._append((self.lsn, "p", key, value))
+
+    def delete(self, key: str) -> None:
+        if self.enabled and self._writer is not None:
+            self.lsn += 1
+            self._append((self.lsn, "d", key))
+
+    def _request_snapshot(self) -> None:
+        # Called with _cond held, on the thread that mutates the store. The values are pickled here, as
+        # _append does for records: tools keep changing the live dicts in place after this returns.
+        # The tuple tells the writer to roll the segment here and snapshot everything before it.
+        items = list(self.items())
+        frames = [_frame(pickle.dumps(items[start:start + SNAPSHOT_CHUNK], pickle.HIGHEST_PROTOCOL))
+                  for start in range(0, len(items), SNAPSHOT_CHUNK)]
+        self._pending.append((self.lsn, len(items), frames))
+        self.records_since_snapshot = 0
+
+    def _run_writer(self) -> None:
+        while True:
+            with self._cond:
+                if not self._pending and not self._closed:
+                    self._cond.wait(STORE_FSYNC_MS / 1000)
+                batch, self._pending = self._pending, []
+                closed = self._closed
+            if batch:
+                self._write_batch(batch)
+            if closed:
+                return
+            if batch:
+                time.sleep(STORE_FSYNC_MS / 1000)  # Let the next group of records accumulate
+
+    def _write_batch(self, batch: List[Any]) -> None:
+        for item in batch:
+            if isinstance(item, tuple):
+                snapshot_lsn, count, frames = item
+                self._roll_segment()
+                self._snapshotter = threading.Thread(target=self._write_snapshot, args=(snapshot_lsn, count, frames, self._segment_index),
+                                                     name=f"{self.name}-snapshot", daemon=True)
+                self._snapshotter.start()
+                continue
+            self._segment.write(item)
+            if self._segment.tell() >= STORE_SEGMENT_BYTES:
+                self._roll_segment()
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+
+    def _roll_segment(self) -> None:
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+        self._segment.close()
+        self._segment_index += 1
+        self._segment = open(os.path.join(self.path, f"wal-{self._segment_index:08d}.log"), "ab")
+        _fsync_dir(self.path)
+
+    def _write_snapshot(self, snapshot_lsn: int, count: int, frames: List[bytes], first_live_segment: int) -> None:
+        started = time.perf_counter()
+        final_path = os.path.join(self.path, f"snapshot-{snapshot_lsn:020d}.bin")
+        tmp_path = final_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(SNAPSHOT_MAGIC + SNAPSHOT_HEADER.pack(snapshot_lsn, count))
+                for frame in frames:
+                    f.write(frame)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, final_path)
+            _fsync_dir(self.path)
+            for index, segment_path in self._segments():
+                if index < first_live_segment:
+                    os.remove(segment_path)
+            for lsn, snapshot_path in self._snapshots():
+                if lsn < snapshot_lsn:
+                    os.remove(snapshot_path)
+            logging.info("[journal] %s: snapshot of %d records at lsn %d written in %.3fs.",
+                         self.name, count, snapshot_lsn, time.perf_counter() - started)
+        except Exception as e: # The log still holds every record; the next snapshot retries
+            logging.error(f"[journal] {self.name}: snapshot at lsn {snapshot_lsn} failed: {e}", exc_info=True)
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+        finally:
+            with self._cond:
+                self._snapshotter = None
+
+    def close(self, snapshot: bool = True) -> None:
+        """Flushes the log and, unless `snapshot` is False, snapshots what was logged since the last one. Runs at exit."""
+        if self._writer is None or self._closed:
+            return
+        with self._cond:
+            if snapshot and self.records_since_snapshot and self._snapshotter is None:
+                self._request_snapshot()
+            self._closed = True
+            self._cond.notify()
+        self._writer.join()
+        snapshotter = self._snapshotter
+        if snapshotter is not None:
+            snapshotter.join()
+        self._segment.close()
@@ -0,0 +1,221 @@
+"""
+Partitioned ownership for agents that run as several replicas (e.g. the match agent).
+
+Keys (need ids) hash to one of `partitions` fixed partitions. Live replicas heartbeat into a
+shared lease store; each partition's preferred owner is picked by rendezvous hashing over the
+live replicas, so a join or leave only moves the partitions that the joining/leaving replica
+wins or held. A replica works on a partition only while it holds that partition's lease; it
+renews its leases every ttl/3, releases partitions that moved to a newer replica, and picks up
+partitions whose lease expired because their owner died.
+
+Two lease stores are provided:
+
+- `RedisLeaseStore` (needs the `redis` package): SET NX PX leases renewed with a
+  compare-and-expire script, members in a sorted set scored by heartbeat expiry
+- `FileLeaseStore`: the same state in a JSON file guarded by `fcntl.flock`, for several
+  replicas on one host without Redis
+
+Leases only keep replicas off each other's partitions in steady state; during a handoff two
+replicas may briefly both hold a stale view, so the work done under a lease must itself be
+idempotent.
+"""
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from typing import Iterable, List, Optional, Set
+
+
+def partition_of(key: str, partitions: int) -> int:
+    return zlib.crc32(key.encode()) % partitions
+
+
+def rendezvous_owner(partition: int, members: Iterable[str]) -> Optional[str]:
+    best, best_weight = None, -1
+    for member in members:
+        weight = int.from_bytes(hashlib.blake2b(f"{partition}:{member}".encode(), digest_size=8).digest(), "big")
+        if weight > best_weight:
+            best, best_weight = member, weight
+    return best
+
+
+class FileLeaseStore:
+    def __init__(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "leases.json")
+        self.lock_path = os.path.join(directory, "leases.lock")
+
+    def _transaction(self, update) -> object:
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.path) as f:
+                        state = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    state = {"members": {}, "leases": {}}
+                result = update(state, time.time())
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self.path)
+                return result
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    async def heartbeat(self, member: str, ttl: float) -> List[str]:
+        def update(state, now):
+            members = {m: expiry for m, expiry in state["members"].items() if expiry > now}
+            members[member] = now + ttl
+            state["members"] = members
+            return sorted(members)
+        return await asyncio.to_thread(self._transaction, update)
+
+    async def acquire(self, partitions: Iterable[int], owner: str, ttl: float) -> Set[int]:
+        wanted = [str(p) for p in partitions]
+
+        def update(state, now):
+            held = set()
+            for p in wanted:
+                lease = state["leases"].get(p)
+                if lease is None or lease["owner"] == owner or lease["expiry"] <= now:
+                    state["leases"][p] = {"owner": owner, "expiry": now + ttl}
+                    held.add(int(p))
+            return held
+        return await asyncio.to_thread(self._transaction, update)
+
+    async def release(self, partitions: Iterable[int], owner: str) -> None:
+        released = [str(p) for p in partitions]
+
+        def update(state, now):
+            for p in released:
+                if state["leases"].get(p, {}).get("owner") == owner:
+                    del state["leases"][p]
+        await asyncio.to_thread(self._transaction, update)
+
+    async def leave(self, member: str) -> None:
+        def update(state, now):
+            state["members"].pop(member, None)
+            for p in [p for p, lease in state["leases"].items() if lease["owner"] == member]:
+                del state["leases"][p]
+        await asyncio.to_thread(self._transaction, update)
+
+
+class RedisLeaseStore:
+    # Renews the lease if we hold it, takes it if it is free; returns 1 when held afterwards
+    _ACQUIRE = """
+local current = redis.call('GET', KEYS[1])
+if current == ARGV[1] then
+  redis.call('PEXPIRE', KEYS[1], ARGV[2])
+  return 1
+end
+if not current then
+  redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+  return 1
+end
+return 0
+"""
+    _RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+    def __init__(self, host: str, port: int, prefix: str) -> None:
+        import redis.asyncio as aioredis  # Optional dependency, only needed for this backend
+        self.client = aioredis.Redis(host=host, port=port, decode_responses=True)
+        self.prefix = prefix
+        self._acquire = self.client.register_script(self._ACQUIRE)
+        self._release = self.client.register_script(self._RELEASE)
+
+    def _lease_key(self, partition: int) -> str:
+        return f"{self.prefix}:lease:{partition}"
+
+    async def heartbeat(self, member: str, ttl: float) -> List[str]:
+        now = time.time()
+        members_key = f"{self.prefix}:members"
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zadd(members_key, {member: now + ttl})
+            pipe.zremrangebyscore(members_key, "-inf", now)
+            pipe.zrange(members_key, 0, -1)
+            results = await pipe.execute()
+        return sorted(results[-1])
+
+    async def acquire(self, partitions: Iterable[int], owner: str, ttl: float) -> Set[int]:
+        wanted = list(partitions)
+        ttl_ms = int(ttl * 1000)
+        async with self.client.pipeline(transaction=False) as pipe:
+            for p in wanted:
+                await self._acquire(keys=[self._lease_key(p)], args=[owner, ttl_ms], client=pipe)
+            results = await pipe.execute()
+        return {p for p, held in zip(wanted, results) if held}
+
+    async def release(self, partitions: Iterable[int], owner: str) -> None:
+        async with self.client.pipeline(transaction=False) as pipe:
+            for p in partitions:
+                await self._release(keys=[self._lease_key(p)], args=[owner], client=pipe)
+            await pipe.execute()
+
+    async def leave(self, member: str) -> None:
+        await self.client.zrem(f"{self.prefix}:members", member)
+
+
+class PartitionOwnership:
+    """The partitions this replica currently holds leases for, kept up to date by `run()`."""
+
+    def __init__(self, replica_id: str, partitions: int, store, ttl_seconds: float) -> None:
+        self.replica_id = replica_id
+        self.partitions = partitions
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self._owned: Set[int] = set()
+        self._valid_until = 0.0
+        self.members: List[str] = []
+        self.rebalances = 0
+
+    @property
+    def owned(self) -> Set[int]:
+        """Held partitions; empty once the leases may have lapsed without a successful refresh."""
+        return self._owned if time.monotonic() < self._valid_until else set()
+
+    def owns(self, key: str) -> bool:
+        return partition_of(key, self.partitions) in self.owned
+
+    async def refresh(self) -> Set[int]:
+        """Heartbeats, releases partitions preferred elsewhere and acquires/renews the rest."""
+        started = time.monotonic()
+        self.members = await self.store.heartbeat(self.replica_id, self.ttl_seconds)
+        desired = {p for p in range(self.partitions) if rendezvous_owner(p, self.members) == self.replica_id}
+        moved = self._owned - desired
+        if moved:
+            self._owned -= moved
+            await self.store.release(moved, self.replica_id)
+        held = await self.store.acquire(desired, self.replica_id, self.ttl_seconds)
+        if held != self._owned:
+            self.rebalances += 1
+            logging.info("[leases] %s holds %d of %d partitions (%d live replicas; %d released, %d gained).",
+                         self.replica_id, len(held), self.partitions, len(self.members), len(moved), len(held - self._owned))
+        self._owned = held
+        self._valid_until = started + self.ttl_seconds * 0.9  # Stop before the store could hand them to another replica
+        return held
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep working on what we hold until the leases would have expired
+                logging.error(f"[leases] {self.replica_id}: lease refresh failed: {e}", exc_info=True)
+            await asyncio.sleep(self.ttl_seconds / 3)
+
+    async def leave(self) -> None:
+        """Hands back every lease at shutdown, so other replicas take over without waiting for the ttl."""
+        owned, self._owned = self._owned, set()
+        if owned:
+            await self.store.release(owned, self.replica_id)
+        await self.store.leave(self.replica_id)
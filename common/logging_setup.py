@@ -0,0 +1,100 @@
+"""
+Process-wide logging configuration for agents and workers.
+
+`configure_logging(service)` replaces the per-script `logging.basicConfig` calls. Records are
+handed to a QueueHandler on the calling thread and written by a QueueListener thread, so a
+slow stderr never blocks the event loop. Settings come from the environment:
+
+- LOG_LEVEL: root level (default INFO)
+- LOG_FORMAT: `json` (default, one object per line) or `text`
+- LOG_LIBRARY_LEVEL: level for chatty third-party loggers such as httpx and the MCP
+  server's per-request messages (default WARNING)
+
+Hot paths should use %-style arguments (formatted only if the record is emitted) or guard
+expensive debug output with `logging.root.isEnabledFor(logging.DEBUG)`.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
+from typing import Optional
+
+from common import tracing
+
+LIBRARY_LOGGERS = ("httpx", "httpcore", "mcp.server.lowlevel.server", "mcp.server.streamable_http",
+                   "mcp.server.streamable_http_manager", "mcp.client.streamable_http", "uvicorn.access")
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service: str) -> None:
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+            entry["span_id"] = getattr(record, "span_id", None)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Merges the message and captures traceback/trace ids on the caller's thread, then enqueues."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        span = tracing.current_span()
+        if span is not None and span.sampled:
+            record.trace_id, record.span_id = span.trace_id, span.span_id
+        return record
+
+
+def configure_logging(service: str) -> None:
+    """Installs the queue-backed root handler once per process; later calls are no-ops."""
+    global _listener
+    if _listener is not None:
+        return
+
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    library_level = os.getenv("LOG_LIBRARY_LEVEL", "WARNING").upper()
+
+    stream_handler = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    else:
+        stream_handler.setFormatter(JsonFormatter(service))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(level)
+    for name in LIBRARY_LOGGERS:
+        logging.getLogger(name).setLevel(library_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
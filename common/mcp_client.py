@@ -0,0 +1,356 @@
+"""
+Shared MCP client helpers: one tool call per streamable-HTTP session (or a long-lived session
+for bulk callers), plus parsers that turn CallToolResult content back into Python dicts/lists.
+
+Calls rejected by a server's admission control (`common.admission`) are retried up to
+MCP_CLIENT_MAX_RETRIES times, after the server's retry_after plus exponential jitter. Set
+MCP_CLIENT_ID to be rate-limited under a stable name instead of the peer address.
+
+Every remote call carries a deadline and goes through its endpoint's circuit breaker;
+idempotent reads may be hedged (`common.resilience`).
+
+`read_versioned` polls versioned list/read tools (`common.read_cache`): it sends the version of
+its last decoded copy and reuses that copy when the server answers "not modified". List reads
+also send MCP_BULK_ACCEPT (default: every bulk encoding this process reads, `common.bulk`;
+"json" turns it off), and `parse_mcp_list_result` decodes bulk results into the same dicts.
+
+URLs registered with `register_local_server` (the all-in-one launcher) are served by a FastMCP
+instance in this process: calls dispatch straight to its registered tool, through the same
+middleware, argument validation and result conversion, and return the same CallToolResult,
+without HTTP or an MCP session. Only the JSON-schema pre-check of the arguments is skipped;
+pydantic still validates them.
+"""
+import asyncio
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from mcp.client.streamable_http import streamablehttp_client
+from mcp import ClientSession
+from mcp.types import CallToolResult, TextContent
+
+from common import bulk, metrics, resilience, tracing
+from common.admission import retry_after_from_result
+
+# Older mcp releases have no `meta` parameter on call_tool; trace context is dropped there
+_CALL_TOOL_ACCEPTS_META = "meta" in inspect.signature(ClientSession.call_tool).parameters
+
+MCP_CLIENT_ID = os.getenv("MCP_CLIENT_ID")
+MCP_CLIENT_MAX_RETRIES = int(os.getenv("MCP_CLIENT_MAX_RETRIES", "3"))
+MCP_CLIENT_BACKOFF_BASE_SECONDS = float(os.getenv("MCP_CLIENT_BACKOFF_BASE_SECONDS", "0.1"))
+MCP_CLIENT_BACKOFF_MAX_SECONDS = float(os.getenv("MCP_CLIENT_BACKOFF_MAX_SECONDS", "5"))
+MCP_BULK_ACCEPT = os.getenv("MCP_BULK_ACCEPT", ",".join(bulk.available_encodings()))
+
+
+# MCP URL -> FastMCP server hosted in this process
+_LOCAL_SERVERS: Dict[str, Any] = {}
+
+
+def register_local_server(mcp_url: str, server: Any) -> None:
+    _LOCAL_SERVERS[mcp_url.rstrip("/")] = server
+
+
+def local_server(mcp_url: str) -> Optional[Any]:
+    return _LOCAL_SERVERS.get(mcp_url.rstrip("/")) if _LOCAL_SERVERS else None
+
+
+class LocalSession:
+    """Stands in for ClientSession against an in-process FastMCP server."""
+
+    def __init__(self, server: Any) -> None:
+        self.server = server
+
+    async def initialize(self) -> None:
+        return None
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None, meta: Optional[Dict[str, Any]] = None) -> CallToolResult:
+        # Trace context needs no meta here: the caller's current span is still current in the tool
+        try:
+            result = await self.server.call_tool(name, arguments or {})
+        except Exception as e:
+            # As the lowlevel server reports a failed tool (FastMCP raises "Error executing tool <name>: ...")
+            return CallToolResult(content=[TextContent(type="text", text=str(e))], isError=True)
+        if isinstance(result, CallToolResult):
+            return result
+        if isinstance(result, tuple):
+            content, structured = result
+        elif isinstance(result, dict):
+            content, structured = [TextContent(type="text", text=json.dumps(result, indent=2))], result
+        else:
+            content, structured = result, None
+        return CallToolResult(content=list(content), structuredContent=structured)
+
+
+def _client_headers() -> Optional[Dict[str, str]]:
+    return {"x-client-id": MCP_CLIENT_ID} if MCP_CLIENT_ID else None
+
+
+def backoff_delay(attempt: int, retry_after: float) -> float:
+    """The server's retry_after plus full jitter over an exponential step, capped."""
+    step = MCP_CLIENT_BACKOFF_BASE_SECONDS * (2 ** attempt)
+    return min(MCP_CLIENT_BACKOFF_MAX_SECONDS, retry_after + random.uniform(0, step))
+
+
+async def call_tool_with_backoff(session: ClientSession, tool_name: str, arguments: Optional[Dict[str, Any]] = None,
+                                 meta: Optional[Dict[str, Any]] = None) -> Any:
+    """session.call_tool, retrying admission-control rejections with jittered backoff."""
+    for attempt in range(MCP_CLIENT_MAX_RETRIES + 1):
+        if meta is not None and _CALL_TOOL_ACCEPTS_META:
+            response = await session.call_tool(tool_name, arguments=arguments or {}, meta=meta)
+        else:
+            response = await session.call_tool(tool_name, arguments=arguments or {})
+        retry_after = retry_after_from_result(response)
+        if retry_after is None:
+            return response
+        if attempt == MCP_CLIENT_MAX_RETRIES:
+            logging.warning("[mcp_client] '%s' still rejected as overloaded after %d retries.", tool_name, attempt)
+            return response
+        delay = backoff_delay(attempt, retry_after)
+        logging.info("[mcp_client] '%s' rejected as overloaded; retrying in %.3fs (attempt %d).", tool_name, delay, attempt + 1)
+        await asyncio.sleep(delay)
+    return response
+
+
+async def _call_over_http(mcp_url: str, tool_name: str, arguments: Optional[Dict[str, Any]], meta: Dict[str, Any]) -> Any:
+    async with streamablehttp_client(mcp_url, headers=_client_headers()) as (read_stream, write_stream, _):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            logging.debug("[mcp_client] Calling MCP tool '%s' at %s with arguments: %s", tool_name, mcp_url, arguments)
+            response = await call_tool_with_backoff(session, tool_name, arguments, meta=meta)
+            logging.debug("[mcp_client] MCP response from '%s': %s", tool_name, response)
+            return response
+
+
+async def _hedged(mcp_url: str, tool_name: str, arguments: Optional[Dict[str, Any]], meta: Dict[str, Any],
+                  delay: float, breaker: resilience.CircuitBreaker) -> Any:
+    """Sends a second identical call if the first has not answered after `delay`; the first answer wins."""
+    first = asyncio.create_task(_call_over_http(mcp_url, tool_name, arguments, meta))
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return first.result()
+        breaker.hedges.inc()
+        logging.debug("[mcp_client] '%s' at %s slower than %.3fs; sending a hedge request.", tool_name, mcp_url, delay)
+        tasks.add(asyncio.create_task(_call_over_http(mcp_url, tool_name, arguments, meta)))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        breaker.hedge_wins.inc()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _leaf_error(e: BaseException) -> BaseException:
+    """The transport's own error, out of the task groups the MCP client wraps it in."""
+    while isinstance(e, BaseExceptionGroup) and len(e.exceptions) == 1:
+        e = e.exceptions[0]
+    return e
+
+
+# Helper: MCP tool call (asynchronous)
+async def call_mcp_tool_async(mcp_url: str, tool_name: str, arguments: Optional[Dict[str, Any]] = None,
+                              timeout: Optional[float] = None, deadline: Optional[float] = None,
+                              idempotent: bool = False) -> Optional[Any]:
+    """
+    Calls a tool on an MCP server asynchronously. Returns None if the call fails, misses its
+    deadline (`timeout` seconds, default MCP_CALL_TIMEOUT_SECONDS; `deadline` in epoch seconds;
+    or the deadline of the request being served) or the endpoint's circuit is open.
+    Pass idempotent=True for reads that may safely be sent twice, to allow hedging.
+    """
+    with tracing.start_span(f"mcp.call {tool_name}", kind="client", attributes={"mcp.url": mcp_url, "mcp.tool": tool_name}) as span:
+        server = local_server(mcp_url)
+        if server is not None:
+            try:
+                return await call_tool_with_backoff(LocalSession(server), tool_name, arguments)
+            except Exception as e:
+                span.set_error(e)
+                logging.error(f"[mcp_client] In-process call to tool '{tool_name}' at {mcp_url} failed: {e}", exc_info=True)
+                return None
+
+        breaker = resilience.breaker_for(mcp_url)
+        expires = resilience.call_deadline(timeout, deadline)
+        remaining = expires - time.time()
+        if remaining <= 0:
+            span.set_error(resilience.DeadlineExceeded(tool_name))
+            logging.warning("[mcp_client] Not calling '%s' at %s: the deadline has already passed.", tool_name, mcp_url)
+            return None
+        try:
+            breaker.before_call()
+        except resilience.CircuitOpenError as e:
+            span.set_error(e)
+            logging.debug("[mcp_client] Not calling '%s': %s", tool_name, e)
+            return None
+
+        meta = {**tracing.inject(span), "deadline": expires}
+        window = resilience.latency_for(mcp_url, tool_name)
+        hedge_delay = window.hedge_delay() if idempotent and resilience.MCP_HEDGE_ENABLED and breaker.state == resilience.CLOSED else None
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(remaining):
+                if hedge_delay is not None and hedge_delay < remaining:
+                    response = await _hedged(mcp_url, tool_name, arguments, meta, hedge_delay, breaker)
+                else:
+                    response = await _call_over_http(mcp_url, tool_name, arguments, meta)
+        except TimeoutError as e:
+            breaker.timeouts.inc()
+            breaker.record_failure()
+            span.set_error(e)
+            logging.warning("[mcp_client] MCP call to tool '%s' at %s timed out after %.3fs (breaker %s).",
+                            tool_name, mcp_url, time.perf_counter() - started, breaker.state)
+            return None
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            breaker.record_failure()
+            span.set_error(e)
+            # Connection failures repeat every cycle while an endpoint is down: the traceback only at DEBUG
+            logging.warning("[mcp_client] MCP call to tool '%s' at %s failed: %s (breaker %s).", tool_name, mcp_url,
+                            _leaf_error(e), breaker.state, exc_info=logging.getLogger().isEnabledFor(logging.DEBUG))
+            return None
+        breaker.record_success()
+        window.observe(time.perf_counter() - started)
+        return response
+
+
+@asynccontextmanager
+async def mcp_session(mcp_url: str) -> AsyncIterator[ClientSession]:
+    """
+    Opens one initialized session for many calls, saving the per-call handshake of
+    call_mcp_tool_async. Errors propagate to the caller; use call_tool_with_backoff on it to
+    honor admission control.
+    """
+    server = local_server(mcp_url)
+    if server is not None:
+        yield LocalSession(server)
+        return
+    async with streamablehttp_client(mcp_url, headers=_client_headers()) as (read_stream, write_stream, _):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            yield session
+
+
+# Helper: Parse MCP tool result expected to be a list of dictionaries
+def parse_mcp_list_result(tool_response: Optional[Any], tool_name_for_log: str = "MCP tool") -> List[Dict[str, Any]]:
+    parsed_list: List[Dict[str, Any]] = []
+    if tool_response is None:
+        logging.warning(f"[mcp_client_parser] {tool_name_for_log} call returned None, cannot parse to list.")
+        return parsed_list
+
+    if hasattr(tool_response, 'content') and isinstance(tool_response.content, list):
+        logging.debug("[mcp_client_parser] Processing CallToolResult from %s with %d items in content.", tool_name_for_log, len(tool_response.content))
+        for text_content_item in tool_response.content:
+            if bulk.bulk_encoding(text_content_item) is not None:
+                try:
+                    parsed_list.extend(bulk.decode_records(text_content_item))
+                except Exception as e: # Corrupt or unreadable blob: zlib, zstd, msgpack and JSON raise different errors
+                    logging.error(f"[mcp_client_parser] Failed to decode the bulk result of {tool_name_for_log}: {e}")
+            elif hasattr(text_content_item, 'text') and isinstance(text_content_item.text, str):
+                try:
+                    item_data = json.loads(text_content_item.text)
+                    if isinstance(item_data, dict):
+                        parsed_list.append(item_data)
+                    elif isinstance(item_data, list):
+                        for sub_item in item_data:
+                            if isinstance(sub_item, dict):
+                                parsed_list.append(sub_item)
+                            else:
+                                logging.warning(f"[mcp_client_parser] Sub-item in JSON list from {tool_name_for_log} is not a dict: {type(sub_item)}")
+                    else:
+                        logging.warning(f"[mcp_client_parser] Parsed item from {tool_name_for_log} is not a dict or list: {type(item_data)}")
+                except json.JSONDecodeError as je:
+                    logging.error(f"[mcp_client_parser] Failed to parse JSON from TextContent in {tool_name_for_log} response: '{text_content_item.text}'. Error: {je}")
+            else:
+                logging.warning(f"[mcp_client_parser] Item in {tool_name_for_log} response.content is not TextContent or 'text' is not str: {text_content_item}")
+    elif isinstance(tool_response, list):
+        logging.debug("[mcp_client_parser] Received direct list from %s.", tool_name_for_log)
+        for item in tool_response:
+            if isinstance(item, dict):
+                parsed_list.append(item)
+            else:
+                logging.warning(f"[mcp_client_parser] Item in direct list from {tool_name_for_log} is not a dict: {type(item)}")
+    else:
+        logging.warning(f"[mcp_client_parser] Received an unexpected {tool_name_for_log} response type for list extraction: {type(tool_response)} - {tool_response}")
+    return parsed_list
+
+
+# Helper: Parse MCP tool result expected to be a single dictionary
+def parse_mcp_single_dict_result(tool_response: Optional[Any], tool_name_for_log: str = "MCP tool") -> Optional[Dict[str, Any]]:
+    if tool_response is None:
+        logging.warning(f"[mcp_client_parser] {tool_name_for_log} call returned None.")
+        return None
+
+    if hasattr(tool_response, 'content') and isinstance(tool_response.content, list):
+        if not tool_response.content:
+            logging.warning(f"[mcp_client_parser] {tool_name_for_log} response content is empty list.")
+            return None
+        first_content_item = tool_response.content[0]
+        if hasattr(first_content_item, 'text') and isinstance(first_content_item.text, str):
+            try:
+                parsed_dict = json.loads(first_content_item.text)
+                if isinstance(parsed_dict, dict):
+                    return parsed_dict
+                logging.error(f"[mcp_client_parser] Parsed JSON from {tool_name_for_log} is not a dict: {type(parsed_dict)}")
+                return None
+            except json.JSONDecodeError as je:
+                logging.error(f"[mcp_client_parser] Failed to parse JSON from {tool_name_for_log}: '{first_content_item.text}'. Error: {je}")
+                return None
+        logging.warning(f"[mcp_client_parser] {tool_name_for_log} response content item is not TextContent or 'text' is not str: {first_content_item}")
+        return None
+    elif isinstance(tool_response, dict): # Direct dict response
+        return tool_response
+    else:
+        logging.warning(f"[mcp_client_parser] Unexpected {tool_name_for_log} response type for single dict: {type(tool_response)}")
+        return None
+
+
+# Versioned reads (`common.read_cache`): "<url> <tool> <arguments>" -> (version, last decoded result)
+VERSIONED_COPIES: Dict[str, Tuple[str, Any]] = {}
+
+
+async def read_versioned(mcp_url: str, tool_name: str, arguments: Optional[Dict[str, Any]] = None,
+                         parse: Callable[[Optional[Any], str], Any] = parse_mcp_list_result,
+                         timeout: Optional[float] = None) -> Tuple[Optional[Any], bool]:
+    """
+    Calls a versioned read tool with the version of the last copy it returned for the same URL,
+    tool and arguments, and returns (result, changed). A "not modified" reply returns the kept
+    copy with changed=False, so callers must treat results as read-only. The result is None when
+    the call failed. Tools that send no version are parsed every time. List reads accept the
+    MCP_BULK_ACCEPT encodings.
+    """
+    key = f"{mcp_url.rstrip('/')} {tool_name} {json.dumps(arguments or {}, sort_keys=True, default=str)}"
+    copy = VERSIONED_COPIES.get(key)
+    call_arguments = dict(arguments or {})
+    if copy is not None:
+        call_arguments["known_version"] = copy[0]
+    if parse is parse_mcp_list_result and MCP_BULK_ACCEPT:
+        call_arguments["accept"] = MCP_BULK_ACCEPT
+    response = await call_mcp_tool_async(mcp_url, tool_name, call_arguments, timeout=timeout, idempotent=True)
+    if response is None:
+        return None, False
+    meta = getattr(response, "meta", None) or {}
+    version = meta.get("version")
+    if meta.get("not_modified") and copy is not None and version == copy[0]:
+        metrics.REGISTRY.counter("mcp_versioned_reads_total", "Versioned reads by outcome.", tool=tool_name, result="not_modified").inc()
+        return copy[1], False
+    result = parse(response, tool_name)
+    if version is not None and not getattr(response, "isError", False):
+        VERSIONED_COPIES[key] = (version, result)
+    else:
+        VERSIONED_COPIES.pop(key, None)
+    metrics.REGISTRY.counter("mcp_versioned_reads_total", "Versioned reads by outcome.", tool=tool_name, result="modified").inc()
+    return result, True
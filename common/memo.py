@@ -0,0 +1,65 @@
+"""
+Bounded LRU memo with a per-entry TTL and a version tag.
+
+Entries are dropped when they are older than `ttl_seconds`, when the memo holds more than
+`maxsize` of them (least recently used first), or all at once when the owner's version
+changes (e.g. a new scorer configuration). Hits, misses, evictions, expirations and
+invalidations are exported as counters in `common.metrics`.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from common import metrics
+
+
+class LruTtlCache:
+    def __init__(self, name: str, maxsize: int, ttl_seconds: float, agent: str) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.version: Optional[Hashable] = None
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        labels = {"agent": agent, "cache": name}
+        self.hits = metrics.REGISTRY.counter("memo_hits_total", "Memo lookups answered from the cache.", **labels)
+        self.misses = metrics.REGISTRY.counter("memo_misses_total", "Memo lookups that had to compute the value.", **labels)
+        self.evictions = metrics.REGISTRY.counter("memo_evictions_total", "Entries dropped to stay within maxsize.", **labels)
+        self.expirations = metrics.REGISTRY.counter("memo_expirations_total", "Entries dropped because their TTL passed.", **labels)
+        self.invalidations = metrics.REGISTRY.counter("memo_invalidations_total", "Full clears caused by a version change.", **labels)
+        metrics.REGISTRY.gauge("memo_entries", "Entries currently held by the memo.", lambda: len(self._entries), **labels)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def ensure_version(self, version: Hashable) -> None:
+        """Clears the memo if it was filled under a different version."""
+        if version != self.version:
+            if self._entries:
+                self.invalidations.inc()
+                self._entries.clear()
+            self.version = version
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits.inc()
+                return entry[1]
+            del self._entries[key]
+            self.expirations.inc()
+        self.misses.inc()
+        value = compute()
+        self._entries[key] = (now + self.ttl_seconds, value)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions.inc()
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries), "maxsize": self.maxsize, "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits.value, "misses": self.misses.value, "evictions": self.evictions.value,
+            "expirations": self.expirations.value, "invalidations": self.invalidations.value,
+        }
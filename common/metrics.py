@@ -0,0 +1,224 @@
+"""
+In-process metrics for the agents' MCP servers.
+
+A single module-level `REGISTRY` holds counters, histograms and callback gauges. Recording
+is kept to a couple of attribute updates and a bisect so that it can stay on for every tool
+call; all formatting work happens only when `/metrics` is scraped or `metrics_snapshot` is
+called. Set METRICS_ENABLED=0 to skip tool wrapping entirely.
+"""
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+# Serialize one in every N tool payloads to estimate request/response sizes
+PAYLOAD_SAMPLE_EVERY = max(1, int(os.getenv("METRICS_PAYLOAD_SAMPLE_EVERY", "50")))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"count": self.count, "sum": self.sum,
+                "buckets": {str(b): c for b, c in zip(self.bounds + ("+Inf",), self.counts)}}
+
+
+class _Family:
+    __slots__ = ("name", "kind", "help", "series", "bounds")
+
+    def __init__(self, name: str, kind: str, help_text: str, bounds: Optional[Tuple[float, ...]] = None) -> None:
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.bounds = bounds
+        self.series: Dict[LabelKey, Any] = {}
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + escaped + "}"
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._families: Dict[str, _Family] = {}
+
+    def _family(self, name: str, kind: str, help_text: str, bounds: Optional[Tuple[float, ...]] = None) -> _Family:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = _Family(name, kind, help_text, bounds)
+        elif family.kind != kind:
+            raise ValueError(f"Metric '{name}' already registered as a {family.kind}")
+        return family
+
+    def counter(self, name: str, help_text: str, **labels: str) -> Counter:
+        family = self._family(name, "counter", help_text)
+        key = _label_key(labels)
+        if key not in family.series:
+            family.series[key] = Counter()
+        return family.series[key]
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: str) -> Histogram:
+        family = self._family(name, "histogram", help_text, buckets)
+        key = _label_key(labels)
+        if key not in family.series:
+            family.series[key] = Histogram(family.bounds or buckets)
+        return family.series[key]
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], float], **labels: str) -> None:
+        """Registers a gauge whose value is read from `fn` at scrape time."""
+        self._family(name, "gauge", help_text).series[_label_key(labels)] = fn
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for family in self._families.values():
+            series_out = []
+            for key, series in family.series.items():
+                entry: Dict[str, Any] = {"labels": dict(key)}
+                if family.kind == "counter":
+                    entry["value"] = series.value
+                elif family.kind == "gauge":
+                    entry["value"] = _read_gauge(family.name, series)
+                else:
+                    entry.update(series.snapshot())
+                series_out.append(entry)
+            out[family.name] = {"type": family.kind, "help": family.help, "series": series_out}
+        return out
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        for family in self._families.values():
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for key, series in family.series.items():
+                if family.kind == "counter":
+                    lines.append(f"{family.name}{_format_labels(key)} {series.value}")
+                elif family.kind == "gauge":
+                    lines.append(f"{family.name}{_format_labels(key)} {_read_gauge(family.name, series)}")
+                else:
+                    cumulative = 0
+                    for bound, count in zip(series.bounds + (float("inf"),), series.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{family.name}_bucket{_format_labels(key, ('le', le))} {cumulative}")
+                    lines.append(f"{family.name}_sum{_format_labels(key)} {series.sum}")
+                    lines.append(f"{family.name}_count{_format_labels(key)} {series.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _read_gauge(name: str, fn: Callable[[], float]) -> Optional[float]:
+    try:
+        return fn()
+    except Exception as e:
+        logging.warning(f"[metrics] Gauge '{name}' failed to read: {e}")
+        return None
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _payload_size(payload: Any) -> int:
+    if isinstance(getattr(payload, "content", None), list): # A prebuilt CallToolResult (common.read_cache)
+        return sum(len(getattr(item, "text", None) or getattr(getattr(item, "resource", None), "blob", "")) for item in payload.content)
+    try:
+        return len(json.dumps(payload, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def instrument_tool(agent: str, tool_name: str, call: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Wraps an async tool callable with call/error counters, latency and sampled payload sizes."""
+    calls = REGISTRY.counter("mcp_tool_calls_total", "Tool calls received.", agent=agent, tool=tool_name)
+    errors = REGISTRY.counter("mcp_tool_errors_total", "Tool calls that raised or returned status=error.", agent=agent, tool=tool_name)
+    latency = REGISTRY.histogram("mcp_tool_latency_seconds", "Tool handler latency.", agent=agent, tool=tool_name)
+    request_size = REGISTRY.histogram("mcp_tool_request_bytes", "Sampled JSON size of tool arguments.", SIZE_BUCKETS, agent=agent, tool=tool_name)
+    response_size = REGISTRY.histogram("mcp_tool_response_bytes", "Sampled JSON size of tool results.", SIZE_BUCKETS, agent=agent, tool=tool_name)
+    perf_counter = time.perf_counter
+    bounds, buckets = latency.bounds, latency.counts
+
+    async def instrumented(**kwargs: Any) -> Any:
+        calls.value += 1
+        start = perf_counter()
+        try:
+            result = await call(**kwargs)
+        except BaseException:
+            errors.value += 1
+            latency.observe(perf_counter() - start)
+            raise
+        elapsed = perf_counter() - start
+        # Histogram.observe inlined: this runs on every tool call
+        buckets[bisect_left(bounds, elapsed)] += 1
+        latency.sum += elapsed
+        latency.count += 1
+        if type(result) is dict and result.get("status") == "error":
+            errors.value += 1
+        if not (calls.value - 1) % PAYLOAD_SAMPLE_EVERY:
+            request_size.observe(_payload_size(kwargs))
+            response_size.observe(_payload_size(result))
+        return result
+
+    return instrumented
+
+
+# (agent, store) -> collection, for the gauge below and debug_memory (common.debug)
+STORES: Dict[Tuple[str, str], Any] = {}
+
+
+def register_store_gauge(agent: str, store: str, collection: Any) -> None:
+    """Exposes len(collection) as the `agent_store_size` gauge."""
+    STORES[(agent, store)] = collection
+    REGISTRY.gauge("agent_store_size", "Number of items held in an in-memory store.", lambda: len(collection), agent=agent, store=store)
+
+
+def mount(server: Any) -> None:
+    """Adds the Prometheus `/metrics` route and the `metrics_snapshot` tool to a FastMCP server."""
+    from starlette.requests import Request
+    from starlette.responses import PlainTextResponse
+
+    @server.custom_route("/metrics", methods=["GET"])
+    async def metrics_route(request: Request) -> PlainTextResponse:
+        return PlainTextResponse(REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    @server.tool("metrics_snapshot")
+    def metrics_snapshot() -> Dict[str, Any]:
+        """
+        Returns every metric held by this process as a JSON-friendly dictionary.
+        """
+        return REGISTRY.snapshot()
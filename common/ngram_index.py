@@ -0,0 +1,119 @@
+"""
+Typo-tolerant retrieval over short names (offer names) with character n-grams.
+
+Each name is reduced to its set of padded character n-grams (" laptop " -> " la", "lap", ...),
+kept in an inverted index (n-gram -> keys). A query only visits the postings of its own
+n-grams, and skips n-grams that occur in more than `max_df_ratio` of the names, so its cost
+follows the rare n-grams it shares rather than the number of names indexed. Candidates are
+ranked by the IDF-weighted share of the query's n-grams they contain, discounted for names much
+longer than the query, so "laptops" finds "Standard Laptop" although no whole token matches.
+
+IDF is computed from live document frequencies at query time, so `add`/`remove` are
+O(n-grams of the name) and the index never needs a rebuild.
+"""
+import heapq
+import math
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+
+class CharNGramIndex:
+    def __init__(self, n: int = 3, max_df_ratio: float = 0.5) -> None:
+        self.n = n
+        self.max_df_ratio = max_df_ratio
+        self._docs: Dict[str, Tuple[str, FrozenSet[str]]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._docs
+
+    def grams(self, text: str) -> FrozenSet[str]:
+        padded = f" {' '.join(text.lower().split())} "
+        if len(padded) <= self.n:
+            return frozenset((padded,)) if padded.strip() else frozenset()
+        return frozenset(padded[i:i + self.n] for i in range(len(padded) - self.n + 1))
+
+    def add(self, key: str, text: str) -> None:
+        current = self._docs.get(key)
+        if current is not None:
+            if current[0] == text:
+                return
+            self.remove(key)
+        grams = self.grams(text)
+        self._docs[key] = (text, grams)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        current = self._docs.pop(key, None)
+        if current is None:
+            return
+        for gram in current[1]:
+            posting = self._postings[gram]
+            posting.discard(key)
+            if not posting:
+                del self._postings[gram]
+
+    def sync(self, items: Iterable[Tuple[str, str]]) -> Tuple[int, int]:
+        """Makes the index hold exactly `items` (key, text); only new, renamed or removed keys are touched."""
+        seen = set()
+        added = 0
+        for key, text in items:
+            seen.add(key)
+            current = self._docs.get(key)
+            if current is None or current[0] != text:
+                self.add(key, text)
+                added += 1
+        stale = [key for key in self._docs if key not in seen]
+        for key in stale:
+            self.remove(key)
+        return added, len(stale)
+
+    def _idf_squared(self, gram: str, doc_count: int) -> float:
+        idf = math.log((doc_count + 1) / (len(self._postings.get(gram, ())) + 1)) + 1.0
+        return idf * idf
+
+    def query(self, text: str, k: int = 10, min_similarity: float = 0.0) -> List[Tuple[str, float]]:
+        """Returns up to `k` (key, similarity) pairs, best first, with similarity in [0, 1]."""
+        doc_count = len(self._docs)
+        query_grams = self.grams(text)
+        if not doc_count or not query_grams:
+            return []
+        max_df = max(1, int(doc_count * self.max_df_ratio))
+        weighted = sorted(((self._idf_squared(gram, doc_count), gram) for gram in query_grams), reverse=True)
+        total = sum(weight for weight, _ in weighted)
+
+        # Prefix filter: a name sharing none of the rarest grams holding (1 - min_similarity) of the
+        # query weight cannot reach min_similarity, so only those grams' postings yield candidates;
+        # the remaining (frequent) grams only add to candidates already found.
+        shared: Dict[str, float] = {}
+        remaining = total
+        for weight, gram in weighted:
+            posting = self._postings.get(gram)
+            generating = remaining >= min_similarity * total
+            remaining -= weight
+            if not posting or len(posting) > max_df:
+                continue
+            if generating:
+                for key in posting:
+                    shared[key] = shared.get(key, 0.0) + weight
+            elif len(posting) < len(shared):
+                for key in posting:
+                    if key in shared:
+                        shared[key] += weight
+            else:
+                for key in shared:
+                    if key in posting:
+                        shared[key] += weight
+
+        # Weighted share of the query found in the name, discounted for names much longer than the query
+        query_size = len(query_grams)
+        scored = []
+        for key, overlap in shared.items():
+            doc_size = len(self._docs[key][1])
+            similarity = overlap / total * (math.sqrt(query_size / doc_size) if doc_size > query_size else 1.0)
+            if similarity >= min_similarity:
+                scored.append((key, round(similarity, 4)))
+        return heapq.nlargest(k, scored, key=lambda item: item[1])
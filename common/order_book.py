@@ -0,0 +1,147 @@
+"""
+Order book of merchant offers: one offer per (sku, merchant_id), price-ordered per SKU.
+
+Each SKU has a min-heap of (price, seq, merchant_id) over its viable offers (quantity unset
+or positive). Updates and withdrawals retire the old heap entry lazily (its seq no longer
+matches `_live`), so publish/update/withdraw are O(log n), and the best offer is the heap
+top once stale entries are popped (O(1) amortized). A SKU's heap is rebuilt when stale
+entries outnumber the live ones.
+
+Viable offers are also held in a `PriceIndex` partitioned by the offer's category, which
+answers "everything under this budget" queries with a bisect range scan. Its blocked sorted
+lists keep index updates at O(log n + BLOCK_SIZE), so they do not dominate publish.
+"""
+import heapq
+import itertools
+import math
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from common.price_index import PriceIndex
+
+DEFAULT_MERCHANT_ID = "unknown"
+
+OfferKey = Tuple[str, str]
+
+
+def offer_price(offer: Dict[str, Any]) -> float:
+    """Price used for ordering; offers without a usable price sort last."""
+    try:
+        price = float(offer.get("price"))
+    except (TypeError, ValueError):
+        return math.inf
+    return price if not math.isnan(price) else math.inf
+
+
+def is_viable(offer: Dict[str, Any]) -> bool:
+    quantity = offer.get("quantity")
+    if quantity is None:
+        return True
+    try:
+        return float(quantity) > 0
+    except (TypeError, ValueError):
+        return False
+
+
+class OrderBook:
+    def __init__(self) -> None:
+        self._by_sku: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._heaps: Dict[str, List[Tuple[float, int, str]]] = {}
+        self._live: Dict[OfferKey, int] = {}  # (sku, merchant) -> seq of its current heap entry
+        self._seq = itertools.count()
+        self._count = 0
+        self.prices = PriceIndex()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, key: OfferKey) -> bool:
+        return key[1] in self._by_sku.get(key[0], {})
+
+    @staticmethod
+    def key_of(offer: Dict[str, Any]) -> OfferKey:
+        return offer["sku"], str(offer.get("merchant_id") or DEFAULT_MERCHANT_ID)
+
+    def get(self, sku: str, merchant_id: str) -> Optional[Dict[str, Any]]:
+        return self._by_sku.get(sku, {}).get(merchant_id)
+
+    def items(self) -> Iterator[Tuple[OfferKey, Dict[str, Any]]]:
+        for sku, merchants in self._by_sku.items():
+            for merchant_id, offer in merchants.items():
+                yield (sku, merchant_id), offer
+
+    def values(self) -> Iterator[Dict[str, Any]]:
+        for merchants in self._by_sku.values():
+            yield from merchants.values()
+
+    def skus(self) -> List[str]:
+        return list(self._by_sku)
+
+    def publish(self, offer: Dict[str, Any]) -> Tuple[OfferKey, bool]:
+        """Adds or replaces the merchant's offer for the SKU. Returns (key, whether it replaced one)."""
+        sku, merchant_id = key = self.key_of(offer)
+        merchants = self._by_sku.setdefault(sku, {})
+        replaced = merchant_id in merchants
+        if not replaced:
+            self._count += 1
+        merchants[merchant_id] = offer
+        if is_viable(offer):
+            seq = next(self._seq)
+            self._live[key] = seq
+            heapq.heappush(self._heaps.setdefault(sku, []), (offer_price(offer), seq, merchant_id))
+            self.prices.add(key, offer_price(offer), offer.get("category"))
+        else:
+            self._live.pop(key, None)
+            self.prices.remove(key)
+        self._maybe_compact(sku)
+        return key, replaced
+
+    def withdraw(self, sku: str, merchant_id: str) -> Optional[Dict[str, Any]]:
+        merchants = self._by_sku.get(sku)
+        if not merchants or merchant_id not in merchants:
+            return None
+        offer = merchants.pop(merchant_id)
+        self._count -= 1
+        self._live.pop((sku, merchant_id), None)
+        self.prices.remove((sku, merchant_id))
+        if not merchants:
+            del self._by_sku[sku]
+            self._heaps.pop(sku, None)
+        else:
+            self._maybe_compact(sku)
+        return offer
+
+    def _is_live(self, sku: str, entry: Tuple[float, int, str]) -> bool:
+        return self._live.get((sku, entry[2])) == entry[1]
+
+    def _maybe_compact(self, sku: str) -> None:
+        heap = self._heaps.get(sku)
+        if heap is not None and len(heap) > 2 * len(self._by_sku.get(sku, ())) + 16:
+            self._heaps[sku] = [entry for entry in heap if self._is_live(sku, entry)]
+            heapq.heapify(self._heaps[sku])
+
+    def best(self, sku: str, k: int = 1) -> List[Dict[str, Any]]:
+        """The k cheapest viable offers for the SKU, cheapest first (k == 1 is O(1) amortized)."""
+        heap = self._heaps.get(sku)
+        if not heap or k < 1:
+            return []
+        while heap and not self._is_live(sku, heap[0]):
+            heapq.heappop(heap)
+        if not heap:
+            return []
+        merchants = self._by_sku[sku]
+        if k == 1:
+            return [merchants[heap[0][2]]]
+        entries = heapq.nsmallest(k, (entry for entry in heap if self._is_live(sku, entry)))
+        return [merchants[entry[2]] for entry in entries]
+
+    def by_sku(self, sku: str) -> List[Dict[str, Any]]:
+        """Every offer for the SKU (viable or not), cheapest first."""
+        return sorted(self._by_sku.get(sku, {}).values(), key=offer_price)
+
+    def best_per_sku(self) -> List[Dict[str, Any]]:
+        """The cheapest viable offer of every SKU that has one."""
+        return [offers[0] for offers in (self.best(sku) for sku in self._by_sku) if offers]
+
+    def under(self, max_price: float, category: Optional[str] = None, tolerance: float = 0.0) -> List[Dict[str, Any]]:
+        """Viable offers priced at most max_price * (1 + tolerance), optionally in one category, cheapest first."""
+        return [self._by_sku[key[0]][key[1]] for _, key in self.prices.range(max_price * (1 + tolerance), category)]
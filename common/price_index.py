@@ -0,0 +1,139 @@
+"""
+Sorted price index for "offers under budget" range queries.
+
+Entries are (price, key) pairs kept sorted per category partition, so everything priced at
+or below a bound is a bisect plus slices: O(log n + matches). A query without a category
+scans each partition. Keys must be orderable among themselves (they break price ties).
+
+Each partition is a list of sorted blocks of at most 2 * BLOCK_SIZE entries with their last
+entries alongside, so add/remove bisect to a block and move at most one block's entries:
+O(log n + BLOCK_SIZE) rather than the O(n) memmove of one flat sorted list.
+"""
+import bisect
+import math
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+Entry = Tuple[float, Hashable]
+
+
+BLOCK_SIZE = 512
+
+
+class _Blocks:
+    """Sorted entries split into blocks; `maxes[i]` is the last entry of `blocks[i]`."""
+
+    def __init__(self, entries: Optional[List[Entry]] = None) -> None:
+        entries = entries or []
+        self.blocks: List[List[Entry]] = [entries[start:start + BLOCK_SIZE] for start in range(0, len(entries), BLOCK_SIZE)]
+        self.maxes: List[Entry] = [block[-1] for block in self.blocks]
+        self.count = len(entries)
+
+    def add(self, entry: Entry) -> None:
+        self.count += 1
+        if not self.blocks:
+            self.blocks.append([entry])
+            self.maxes.append(entry)
+            return
+        i = min(bisect.bisect_left(self.maxes, entry), len(self.blocks) - 1)
+        block = self.blocks[i]
+        bisect.insort(block, entry)
+        self.maxes[i] = block[-1]
+        if len(block) > 2 * BLOCK_SIZE:
+            self.blocks[i:i + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            self.maxes[i:i + 1] = [block[BLOCK_SIZE - 1], block[-1]]
+
+    def remove(self, entry: Entry) -> None:
+        i = bisect.bisect_left(self.maxes, entry)
+        block = self.blocks[i]
+        del block[bisect.bisect_left(block, entry)]
+        self.count -= 1
+        if block:
+            self.maxes[i] = block[-1]
+        else:
+            del self.blocks[i], self.maxes[i]
+
+    def range(self, low: Any, high: Any) -> List[Entry]:
+        """Entries e with low <= e <= high (bounds compare like entries)."""
+        found: List[Entry] = []
+        for i in range(bisect.bisect_left(self.maxes, low), len(self.blocks)):
+            block = self.blocks[i]
+            start = bisect.bisect_left(block, low) if block[0] < low else 0
+            if high < self.maxes[i]:
+                found.extend(block[start:bisect.bisect_right(block, high)])
+                break
+            found.extend(block[start:])
+        return found
+
+
+class PriceIndex:
+    def __init__(self) -> None:
+        self._partitions: Dict[Optional[str], _Blocks] = {}
+        self._entries: Dict[Hashable, Tuple[Optional[str], float]] = {}
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[Hashable, float, Optional[str]]]) -> "PriceIndex":
+        """Bulk-loads (key, price, category) items with one sort per partition."""
+        index = cls()
+        partitions: Dict[Optional[str], List[Entry]] = {}
+        for key, price, category in items:
+            index._entries[key] = (category, price)
+            partitions.setdefault(category, []).append((price, key))
+        for category, entries in partitions.items():
+            entries.sort()
+            index._partitions[category] = _Blocks(entries)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def add(self, key: Hashable, price: float, category: Optional[str] = None) -> None:
+        self.remove(key)
+        self._entries[key] = (category, price)
+        partition = self._partitions.get(category)
+        if partition is None:
+            partition = self._partitions[category] = _Blocks()
+        partition.add((price, key))
+
+    def remove(self, key: Hashable) -> None:
+        current = self._entries.pop(key, None)
+        if current is None:
+            return
+        category, price = current
+        partition = self._partitions[category]
+        partition.remove((price, key))
+        if not partition.count:
+            del self._partitions[category]
+
+    def range(self, max_price: float, category: Optional[str] = None, min_price: Optional[float] = None) -> List[Entry]:
+        """(price, key) entries with min_price <= price <= max_price, cheapest first."""
+        if category is not None:
+            partitions = [self._partitions[category]] if category in self._partitions else []
+        else:
+            partitions = list(self._partitions.values())
+        # Bisect on price alone: the 1-tuple sorts before every (price, key) with that price
+        low = (min_price,) if min_price is not None else (-math.inf,)
+        high = (max_price, _Top)
+        found: List[Entry] = []
+        for partition in partitions:
+            found.extend(partition.range(low, high))
+        if len(partitions) > 1:
+            found.sort()
+        return found
+
+    def categories(self) -> List[Optional[str]]:
+        return list(self._partitions)
+
+
+class _TopType:
+    """Compares greater than any key, so (price, _Top) sorts after every entry at that price."""
+    def __lt__(self, other: object) -> bool:
+        return False
+
+    def __gt__(self, other: object) -> bool:
+        return True
+
+
+_Top = _TopType()
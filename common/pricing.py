@@ -0,0 +1,202 @@
+"""
+Demand-aware merchant pricing, vectorized with NumPy (agents/merchant_agent.py, workers/merchant_simulator.py).
+
+Once per cycle the merchants pull their market signals: open-need counts and budget
+(max_price) quantiles per need `what` and per `classification` from the needs worker's
+`need_demand`, supplier cost and stock from `supply_list`, and the cheapest offer per SKU from
+`offer_list(best_only=true)`. A supply takes the demand of every `what` whose words all occur in
+its name, without the supplier product creator's "Supply for: " prefix. For example, "Standard
+Laptop" takes both "laptop" and "standard laptop" needs, with plurals folded. A supply that matches
+no `what` uses its type's classification row. Every (merchant, SKU) pair is then priced in one pass:
+
+    pressure = open needs / (open needs + stock + 1)
+    price    = cost * (1 + markup) * (1 + PRICING_DEMAND_WEIGHT * pressure)
+
+capped at the PRICING_BUDGET_QUANTILE of the open needs' budgets and at PRICING_UNDERCUT below
+the best competing offer (not the merchant's own), and never below cost * (1 + PRICING_MIN_MARGIN).
+The results are published with one `offer_publish_many` call.
+
+A merchant only enters the formula through its markup, so `PricingEngine.price` computes a
+table over the distinct markups x SKUs (a few profiles, not thousands of merchants) and
+`PriceTable` gathers pairs from it.
+"""
+import itertools
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from common.mcp_client import call_mcp_tool_async, parse_mcp_list_result, parse_mcp_single_dict_result, read_versioned
+
+PRICING_DEMAND_WEIGHT = float(os.getenv("PRICING_DEMAND_WEIGHT", "0.25"))
+PRICING_BUDGET_QUANTILE = os.getenv("PRICING_BUDGET_QUANTILE", "p75") # p25, p50, p75 or p90 of need_demand
+PRICING_UNDERCUT = float(os.getenv("PRICING_UNDERCUT", "0.01"))
+PRICING_MIN_MARGIN = float(os.getenv("PRICING_MIN_MARGIN", "0.01"))
+
+GENERATED_NAME_PREFIX = "supply for:" # workers/supplier_product_creator.py names supplies "Supply for: <what>"
+MAX_NAME_TOKENS = 8 # Token matching tries every subset of a name's words, so long names are cut
+# Supply `type` words -> need classification (lower case), for the classification fallback
+CLASSIFICATION_OF_TYPE = {"goods": "goods", "good": "goods", "product": "goods", "products": "goods",
+                          "services": "services", "service": "services", "land": "land", "labor": "labor", "capital": "capital"}
+
+
+def normalize_what(text: Any) -> str:
+    """The key need_demand groups by: lower case, single spaces."""
+    return " ".join(str(text or "").lower().split())
+
+
+def demand_key(name: Any) -> str:
+    """The `what` a supply named `name` serves: normalized, without the generated-supply prefix."""
+    key = normalize_what(name)
+    return key[len(GENERATED_NAME_PREFIX):].strip() if key.startswith(GENERATED_NAME_PREFIX) else key
+
+
+def _tokens(key: str) -> frozenset:
+    return frozenset(token[:-1] if len(token) > 3 and token.endswith("s") else token for token in key.split())
+
+
+def _classification(supply_type: Any) -> Optional[str]:
+    for word in normalize_what(supply_type).split():
+        if word in CLASSIFICATION_OF_TYPE:
+            return CLASSIFICATION_OF_TYPE[word]
+    return None
+
+
+def _price(value: Any) -> float:
+    return float(value) if isinstance(value, (int, float)) else np.nan
+
+
+class MarketSignals:
+    """Per-SKU inputs of a pricing pass, as arrays aligned with `skus` (NaN where unknown)."""
+
+    def __init__(self, supplies: Sequence[Dict[str, Any]], demand: Sequence[Dict[str, Any]],
+                 best_offers: Sequence[Dict[str, Any]], budget_quantile: str = PRICING_BUDGET_QUANTILE,
+                 classification_demand: Sequence[Dict[str, Any]] = ()) -> None:
+        """`demand` and `classification_demand` are need_demand rows grouped by what and by classification."""
+        supplies = [supply for supply in supplies if supply.get("sku")]
+        self.demand_by_tokens: Dict[frozenset, List[Dict[str, Any]]] = {}
+        for row in demand:
+            self.demand_by_tokens.setdefault(_tokens(str(row.get("what") or "")), []).append(row)
+        self.demand_by_tokens.pop(frozenset(), None)
+        self.demand_by_classification = {str(row.get("classification") or "").lower(): row for row in classification_demand}
+        best_by_sku = {offer.get("sku"): offer for offer in best_offers}
+        self.skus: List[str] = [supply["sku"] for supply in supplies]
+        self.supplies = supplies
+        self.sku_index = {sku: i for i, sku in enumerate(self.skus)}
+        rows = [self.demand_of(supply) for supply in supplies]
+        best = [best_by_sku.get(sku, {}) for sku in self.skus]
+        self.cost = np.array([_price(supply.get("price")) for supply in supplies], dtype=np.float64)
+        self.stock = np.array([max(0.0, float(supply["stock"])) if isinstance(supply.get("stock"), (int, float)) else 0.0
+                               for supply in supplies], dtype=np.float64)
+        self.demand = np.array([row.get("open", 0) for row in rows], dtype=np.float64)
+        self.budget = np.array([_price(row.get(f"max_price_{budget_quantile}")) for row in rows], dtype=np.float64)
+        self.best_price = np.array([_price(offer.get("price")) for offer in best], dtype=np.float64)
+        self.best_merchant: List[Optional[str]] = [offer.get("merchant_id") for offer in best]
+
+    def __len__(self) -> int:
+        return len(self.skus)
+
+    def demand_of(self, supply: Dict[str, Any]) -> Dict[str, Any]:
+        """The need_demand row for a supply: its token matches combined, else its classification's row."""
+        tokens = sorted(_tokens(demand_key(supply.get("name"))))[:MAX_NAME_TOKENS]
+        matches: List[Dict[str, Any]] = []
+        for size in range(1, len(tokens) + 1):
+            for subset in itertools.combinations(tokens, size):
+                matches.extend(self.demand_by_tokens.get(frozenset(subset), ()))
+        if len(matches) == 1:
+            return matches[0]
+        if matches:
+            # Open needs add up; budgets are not mergeable from quantiles, so the largest group's stand in
+            largest = max(matches, key=lambda match: match.get("open", 0))
+            return {**largest, "open": sum(match.get("open", 0) for match in matches)}
+        return self.demand_by_classification.get(_classification(supply.get("type")) or "", {})
+
+
+class PriceTable:
+    """Prices per distinct markup x SKU, with and without the competitor cap, and each merchant's row."""
+
+    def __init__(self, capped: np.ndarray, uncapped: np.ndarray, rows: np.ndarray, best_owner: np.ndarray) -> None:
+        self.capped = capped
+        self.uncapped = uncapped
+        self.rows = rows
+        self.best_owner = best_owner # Per SKU: index of our merchant holding the best offer, or -1
+
+    def prices(self, merchants: np.ndarray, skus: np.ndarray) -> np.ndarray:
+        """Prices of the (merchants[i], skus[i]) pairs."""
+        rows = self.rows[merchants]
+        return np.where(self.best_owner[skus] == merchants, self.uncapped[rows, skus], self.capped[rows, skus])
+
+    def dense(self) -> np.ndarray:
+        """The full merchants x SKUs price matrix."""
+        matrix = self.capped[self.rows]
+        owned = np.flatnonzero(self.best_owner >= 0)
+        owners = self.best_owner[owned]
+        matrix[owners, owned] = self.uncapped[self.rows[owners], owned]
+        return matrix
+
+
+class PricingEngine:
+    def __init__(self, demand_weight: float = PRICING_DEMAND_WEIGHT, undercut: float = PRICING_UNDERCUT,
+                 min_margin: float = PRICING_MIN_MARGIN) -> None:
+        self.demand_weight = demand_weight
+        self.undercut = undercut
+        self.min_margin = min_margin
+
+    def price(self, markups: np.ndarray, signals: MarketSignals, best_owner: Optional[np.ndarray] = None) -> PriceTable:
+        """Prices every merchant (by markup) x SKU of `signals`; best_owner as in PriceTable."""
+        distinct, rows = np.unique(np.asarray(markups, dtype=np.float64), return_inverse=True)
+        pressure = signals.demand / (signals.demand + signals.stock + 1.0)
+        demand_cost = signals.cost * (1.0 + self.demand_weight * pressure)
+        base = (1.0 + distinct)[:, None] * demand_cost[None, :]
+        floor = signals.cost * (1.0 + self.min_margin)
+        budget_cap = np.where(np.isnan(signals.budget), np.inf, signals.budget)
+        competitor_cap = np.minimum(budget_cap, np.where(np.isnan(signals.best_price), np.inf, signals.best_price * (1.0 - self.undercut)))
+        uncapped = np.round(np.maximum(floor, np.minimum(base, budget_cap)), 2)
+        capped = np.round(np.maximum(floor, np.minimum(base, competitor_cap)), 2)
+        if best_owner is None:
+            best_owner = np.full(len(signals), -1, dtype=np.int64)
+        return PriceTable(capped, uncapped, rows.reshape(-1), best_owner)
+
+
+ENGINE = PricingEngine()
+
+
+async def reprice_and_publish(merchants: List[Dict[str, Any]], supplies: List[Dict[str, Any]],
+                              need_mcp_url: str, offer_mcp_url: str) -> Optional[Dict[str, Any]]:
+    """
+    Prices every SKU each merchant holds (m["inventory"]: sku -> quantity) from this cycle's
+    signals and publishes the offers in one batch; returns offer_publish_many's result.
+    """
+    demand = parse_mcp_list_result(await call_mcp_tool_async(need_mcp_url, "need_demand", idempotent=True), "need_demand")
+    classification_demand = parse_mcp_list_result(await call_mcp_tool_async(need_mcp_url, "need_demand", {"group_by": "classification"},
+                                                                            idempotent=True), "need_demand")
+    best_offers, _ = await read_versioned(offer_mcp_url, "offer_list", {"best_only": True})
+    best_offers = best_offers or []
+    signals = MarketSignals(supplies, demand, best_offers, classification_demand=classification_demand)
+
+    merchant_index = {m["id"]: i for i, m in enumerate(merchants)}
+    best_owner = np.array([merchant_index.get(owner, -1) for owner in signals.best_merchant], dtype=np.int64)
+    pair_merchants, pair_skus, quantities = [], [], []
+    for i, m in enumerate(merchants):
+        for sku, quantity in m.get("inventory", {}).items():
+            j = signals.sku_index.get(sku)
+            if j is not None and quantity > 0 and not np.isnan(signals.cost[j]):
+                pair_merchants.append(i)
+                pair_skus.append(j)
+                quantities.append(quantity)
+    if not pair_merchants:
+        logging.info("[pricing] No priced inventory to publish this cycle.")
+        return None
+
+    table = ENGINE.price(np.array([m["markup"] for m in merchants]), signals, best_owner)
+    prices = table.prices(np.array(pair_merchants), np.array(pair_skus)).tolist()
+    offers = []
+    for i, j, quantity, price in zip(pair_merchants, pair_skus, quantities, prices):
+        m, supply = merchants[i], signals.supplies[j]
+        offers.append({"sku": supply["sku"], "supplier_sku": supply["sku"], "merchant_id": m["id"], "merchant_name": m["name"],
+                       "type": supply.get("type"), "name": supply.get("name"), "price": price, "quantity": quantity})
+    result = parse_mcp_single_dict_result(await call_mcp_tool_async(offer_mcp_url, "offer_publish_many", {"offers": offers}), "offer_publish_many")
+    logging.info("[pricing] Repriced %d offers of %d merchants over %d SKUs (%d with open needs): %s", len(offers), len(merchants),
+                 len(signals), int(np.count_nonzero(signals.demand)), result)
+    return result
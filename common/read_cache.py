@@ -0,0 +1,70 @@
+"""
+Versioned read tools with conditional "not modified" replies.
+
+Each store that serves list/read tools has a `ReadCache`, and the code that mutates the store
+calls `bump()`. Versions are "<process token>-<counter>", so a restarted agent never matches a
+version it handed out before. A read tool takes `known_version` and returns
+`cache.respond(key, known_version, build)`:
+
+- known_version is current: a tiny {"status": "not_modified", "version": ...} result
+- otherwise: the payload as one compact JSON TextContent (a list goes in a single item, which
+  the list parsers accept), or for a long enough list in the bulk encoding the caller accepts
+  (`common.bulk`), built once per version, `key` and encoding and held in an LRU memo
+  (`common.memo`) until the next bump
+
+The version also travels in the result's `_meta` ("version", plus "not_modified": true), where
+`common.mcp_client.read_versioned` picks it up to keep its last decoded copy.
+"""
+import json
+import os
+import uuid
+from typing import Any, Callable, Hashable, Optional
+
+from mcp.types import CallToolResult, TextContent
+
+from common import bulk, metrics
+from common.memo import LruTtlCache
+
+READ_CACHE_ENTRIES = int(os.getenv("READ_CACHE_ENTRIES", "16")) # Serialized responses per collection (argument combinations)
+READ_CACHE_TTL_SECONDS = float(os.getenv("READ_CACHE_TTL_SECONDS", "300"))
+
+
+def encode(payload: Any) -> str:
+    return json.dumps(payload, separators=(",", ":"), default=str)
+
+
+class ReadCache:
+    def __init__(self, agent: str, collection: str) -> None:
+        self.collection = collection
+        self._token = uuid.uuid4().hex[:8]
+        self._counter = 0
+        self.version = f"{self._token}-0"
+        self._responses = LruTtlCache(f"reads_{collection}", READ_CACHE_ENTRIES, READ_CACHE_TTL_SECONDS, agent)
+        self.not_modified = metrics.REGISTRY.counter("read_not_modified_total", "Reads answered 'not modified' for a current known_version.",
+                                                     agent=agent, collection=collection)
+
+    def bump(self) -> None:
+        """Call after every change to the collection."""
+        self._counter += 1
+        self.version = f"{self._token}-{self._counter}"
+
+    def respond(self, key: Hashable, known_version: Optional[str], build: Callable[[], Any],
+                accept: Optional[str] = None) -> CallToolResult:
+        """
+        The read's result at the current version; `build` returns the payload and runs once per
+        version, key and negotiated encoding (`accept`, see common.bulk).
+        """
+        version = self.version
+        if known_version == version:
+            self.not_modified.inc()
+            return CallToolResult(content=[TextContent(type="text", text=encode({"status": "not_modified", "version": version}))],
+                                  _meta={"version": version, "not_modified": True})
+        self._responses.ensure_version(version)
+        encoding = bulk.negotiate(accept)
+        return self._responses.get_or_compute((key, encoding), lambda: self._result(build(), version, encoding))
+
+    @staticmethod
+    def _result(payload: Any, version: str, encoding: str) -> CallToolResult:
+        if encoding != bulk.JSON and isinstance(payload, list) and len(payload) >= bulk.BULK_MIN_RECORDS:
+            return CallToolResult(content=[bulk.encode_records(payload, encoding)], _meta={"version": version, "encoding": encoding})
+        return CallToolResult(content=[TextContent(type="text", text=encode(payload))], _meta={"version": version})
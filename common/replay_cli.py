@@ -0,0 +1,406 @@
+"""
+Replays tool calls recorded by `common.capture` against a running stack and compares latencies.
+
+    # What was recorded: per-tool call counts, statuses, latency percentiles
+    python -m common.replay_cli summary capture.jsonl.gz
+
+    # Original timing (--speed 1), compressed 10x (--speed 10), or back to back (--speed 0)
+    python -m common.replay_cli replay capture.jsonl.gz --speed 1 \\
+        --target needs-worker=http://localhost:9001/mcp --output replay.json
+
+Timed replays issue every call at its recorded offset divided by --speed, so inter-arrival
+gaps and the overlap between calls (concurrency) follow the recording. At --speed 0 calls are
+issued in recorded order as fast as --concurrency allows, which defaults to the recording's
+peak concurrency. Calls are sent over pooled sessions per (target, recorded client), with the
+client as `x-client-id`, so per-client admission limits apply as they did when recording.
+Admission rejections are reported, not retried.
+
+The replay report has the client round-trip latency of every replayed call and its status
+and reply size against the recording. Recorded latencies are server-side, so for a
+like-for-like latency diff, run the target stack with its own CAPTURE_FILE and compare the
+two captures:
+
+    python -m common.replay_cli compare capture.jsonl.gz replayed.jsonl.gz
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+from common.admission import OVERLOADED
+from common.capture import load_records, response_bytes
+
+MIN_WARM_SESSIONS = 4
+MAX_WARM_SESSIONS = 64  # Per (target, client); more are opened on demand
+
+DEFAULT_TARGETS = {
+    "needs-worker": "http://localhost:9001/mcp",
+    "match-agent": "http://localhost:9002/mcp",
+    "opportunity-agent": "http://localhost:9003/mcp",
+    "merchant-agent": "http://localhost:9004/mcp",
+    "supplier-agent": "http://localhost:9005/mcp",
+    "insight-worker": "http://localhost:9006/mcp",
+}
+
+
+def _latency_stats(latencies_ms: List[float]) -> Dict[str, Any]:
+    if not latencies_ms:
+        return {"count": 0}
+    ordered = sorted(latencies_ms)
+    n = len(ordered)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(n - 1, int(q * n))], 3)
+
+    return {"count": n, "min_ms": round(ordered[0], 3), "p50_ms": pick(0.50), "p95_ms": pick(0.95),
+            "p99_ms": pick(0.99), "max_ms": round(ordered[-1], 3), "mean_ms": round(sum(ordered) / n, 3)}
+
+
+def peak_concurrency(intervals: Iterable[Tuple[float, float]]) -> int:
+    events = []
+    for start, end in intervals:
+        events.append((start, 1))
+        events.append((end, -1))
+    peak = current = 0
+    for _, step in sorted(events, key=lambda e: (e[0], e[1])):  # Ends sort before starts at the same instant
+        current += step
+        peak = max(peak, current)
+    return peak
+
+
+def _tool_key(record: Dict[str, Any]) -> str:
+    return f"{record['agent']}/{record['tool']}"
+
+
+def summarize(calls: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Per agent/tool: latency percentiles, status counts and mean response size."""
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for call in calls:
+        grouped.setdefault(_tool_key(call), []).append(call)
+    summary = {}
+    for key, group in sorted(grouped.items()):
+        statuses: Dict[str, int] = {}
+        for call in group:
+            statuses[call["status"]] = statuses.get(call["status"], 0) + 1
+        summary[key] = {
+            "latency": _latency_stats([call["latency_ms"] for call in group]),
+            "statuses": statuses,
+            "response_bytes_mean": round(sum(call["response_bytes"] for call in group) / len(group), 1),
+        }
+    return summary
+
+
+def result_status(result: Any) -> str:
+    if getattr(result, "isError", False):
+        texts = [getattr(item, "text", "") or "" for item in getattr(result, "content", None) or []]
+        return "rejected" if any(OVERLOADED in text for text in texts) else "error"
+    for item in getattr(result, "content", None) or []:
+        try:
+            payload = json.loads(getattr(item, "text", "") or "")
+        except ValueError:
+            continue
+        if isinstance(payload, dict) and payload.get("status") == "error":
+            return "error"
+    return "ok"
+
+
+def result_bytes(result: Any) -> int:
+    """Reply size measured like `capture.response_bytes` measured it on the server."""
+    total = 0
+    for item in getattr(result, "content", None) or []:
+        text = getattr(item, "text", None)
+        if text is None:
+            total += len(getattr(getattr(item, "resource", None), "blob", None) or "") # Bulk results (common.bulk)
+            continue
+        try:
+            total += response_bytes(json.loads(text))
+        except ValueError:
+            total += len(text.encode())
+    return total
+
+
+class _Connection:
+    """One initialized session, owned by its own task (the transport must close in the task that opened it)."""
+
+    def __init__(self, url: str, client: str) -> None:
+        self.url = url
+        self.client = client
+        self.calls: "asyncio.Queue[Optional[Tuple[str, Dict[str, Any], asyncio.Future]]]" = asyncio.Queue()
+        self.ready = asyncio.get_running_loop().create_future()
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        headers = {"x-client-id": self.client} if self.client and self.client != "local" else None
+        try:
+            async with streamablehttp_client(self.url, headers=headers) as (read_stream, write_stream, _):
+                async with ClientSession(read_stream, write_stream) as session:
+                    await session.initialize()
+                    self.ready.set_result(None)
+                    while True:
+                        item = await self.calls.get()
+                        if item is None:
+                            return
+                        tool, arguments, future = item
+                        try:
+                            result = await session.call_tool(tool, arguments=arguments)
+                        except Exception as e:
+                            if not future.done():
+                                future.set_exception(e)
+                        else:
+                            if not future.done():  # The caller may have timed out
+                                future.set_result(result)
+        except Exception as e:
+            if not self.ready.done():
+                self.ready.set_exception(e)
+            raise
+
+    async def call(self, tool: str, arguments: Dict[str, Any]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self.calls.put((tool, arguments, future))
+        return await future
+
+    async def close(self) -> None:
+        await self.calls.put(None)
+        await asyncio.gather(self.task, return_exceptions=True)
+
+
+class SessionPool:
+    def __init__(self) -> None:
+        self._idle: Dict[Tuple[str, str], List[_Connection]] = {}
+        self._all: List[_Connection] = []
+
+    async def acquire(self, url: str, client: str) -> _Connection:
+        idle = self._idle.get((url, client))
+        if idle:
+            return idle.pop()
+        connection = _Connection(url, client)
+        self._all.append(connection)
+        await connection.ready
+        return connection
+
+    async def warm(self, url: str, client: str, count: int) -> None:
+        connections = [_Connection(url, client) for _ in range(count)]
+        self._all.extend(connections)
+        await asyncio.gather(*(connection.ready for connection in connections))
+        self._idle.setdefault((url, client), []).extend(connections)
+
+    def release(self, connection: _Connection) -> None:
+        if not connection.task.done():
+            self._idle.setdefault((connection.url, connection.client), []).append(connection)
+
+    async def close(self) -> None:
+        await asyncio.gather(*(connection.close() for connection in self._all), return_exceptions=True)
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+
+def compare(recorded: List[Dict[str, Any]], replayed: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Per-tool summaries of two captures side by side, with the replayed-minus-recorded diff."""
+    before_by_tool, after_by_tool = summarize(recorded), summarize(replayed)
+    tools = {}
+    for key in sorted(set(before_by_tool) | set(after_by_tool)):
+        before, after = before_by_tool.get(key), after_by_tool.get(key)
+        entry: Dict[str, Any] = {"recorded": before, "replayed": after}
+        if before and after:
+            entry["diff"] = {
+                **{f"{q}_ms": round(after["latency"][f"{q}_ms"] - before["latency"][f"{q}_ms"], 3) for q in ("p50", "p95", "p99")},
+                "p95_ratio": round(after["latency"]["p95_ms"] / before["latency"]["p95_ms"], 3) if before["latency"]["p95_ms"] else None,
+                "response_bytes_mean": round(after["response_bytes_mean"] - before["response_bytes_mean"], 1),
+            }
+        tools[key] = entry
+    return tools
+
+
+async def replay(records: List[Dict[str, Any]], targets: Dict[str, str], speed: float,
+                 concurrency: Optional[int], call_timeout: float, min_sessions: int = MIN_WARM_SESSIONS) -> Dict[str, Any]:
+    records = sorted(records, key=lambda r: r["ts"])
+    skipped: Dict[str, int] = {}
+    runnable = []
+    for record in records:
+        if record["agent"] in targets:
+            runnable.append(record)
+        else:
+            skipped[record["agent"]] = skipped.get(record["agent"], 0) + 1
+    recorded_peak = peak_concurrency((r["ts"], r["ts"] + r["latency_ms"] / 1000) for r in runnable)
+    if concurrency is None and speed <= 0:
+        concurrency = max(1, recorded_peak)
+    limit = asyncio.Semaphore(concurrency) if concurrency else None
+
+    # Before the clock starts, open as many sessions per (target, client) as the recording had calls in flight
+    # (at least min_sessions: client round trips are longer than the recorded server-side latencies)
+    by_connection: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for record in runnable:
+        by_connection.setdefault((targets[record["agent"]], record.get("client") or "local"), []).append(record)
+    pool = SessionPool()
+    try:
+        await asyncio.gather(*(
+            pool.warm(url, client, min(concurrency or MAX_WARM_SESSIONS, MAX_WARM_SESSIONS,
+                                       max(min_sessions, peak_concurrency((r["ts"], r["ts"] + r["latency_ms"] / 1000) for r in group))))
+            for (url, client), group in by_connection.items()))
+    except Exception:
+        await pool.close()
+        raise
+
+    replayed: List[Dict[str, Any]] = []
+    lags_ms: List[float] = []
+
+    async def issue(record: Dict[str, Any], planned: float) -> None:
+        lags_ms.append((time.perf_counter() - planned) * 1000)
+        status, size = "error", 0
+        started = ended = time.perf_counter()
+        try:
+            connection = await pool.acquire(targets[record["agent"]], record.get("client") or "local")
+            started = time.perf_counter()
+            result = await asyncio.wait_for(connection.call(record["tool"], record.get("args") or {}), call_timeout)
+            ended = time.perf_counter()
+            pool.release(connection)  # A timed-out connection is still busy with its call and stays out of the pool
+            status, size = result_status(result), result_bytes(result)
+        except asyncio.TimeoutError:
+            status, ended = "timeout", time.perf_counter()
+        except Exception:
+            status, ended = "error", time.perf_counter()
+        finally:
+            if limit is not None:
+                limit.release()
+        replayed.append({"agent": record["agent"], "tool": record["tool"], "start": started, "end": ended,
+                         "latency_ms": round((ended - started) * 1000, 3), "response_bytes": size, "status": status,
+                         "recorded_status": record["status"]})
+
+    tasks = []
+    origin = runnable[0]["ts"] if runnable else 0.0
+    sessions_warmed = len(pool)
+    t0 = time.perf_counter()
+    try:
+        for record in runnable:
+            planned = t0 + (record["ts"] - origin) / speed if speed > 0 else time.perf_counter()
+            delay = planned - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if limit is not None:
+                await limit.acquire()
+                if speed <= 0:
+                    planned = time.perf_counter()
+            tasks.append(asyncio.create_task(issue(record, planned)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+    finally:
+        sessions = len(pool)
+        await pool.close()
+
+    recorded_span = (runnable[-1]["ts"] - runnable[0]["ts"]) if len(runnable) > 1 else 0.0
+    status_changes: Dict[str, int] = {}
+    for call in replayed:
+        if call["status"] != call["recorded_status"]:
+            change = f"{call['recorded_status']}->{call['status']}"
+            status_changes[change] = status_changes.get(change, 0) + 1
+    return {
+        "speed": speed if speed > 0 else "max",
+        "concurrency_limit": concurrency,
+        "sessions": {"warmed": sessions_warmed, "opened_during_replay": sessions - sessions_warmed},
+        "skipped_agents": skipped,
+        "recorded": {"calls": len(runnable), "duration_s": round(recorded_span, 3),
+                     "calls_per_sec": round(len(runnable) / recorded_span, 1) if recorded_span else None,
+                     "peak_concurrency": recorded_peak},
+        "replayed": {"calls": len(replayed), "duration_s": round(elapsed, 3),
+                     "calls_per_sec": round(len(replayed) / elapsed, 1) if elapsed else None,
+                     "peak_concurrency": peak_concurrency((c["start"], c["end"]) for c in replayed),
+                     "schedule_lag": _latency_stats(lags_ms)},
+        "status_changes": status_changes,
+        # Recorded latencies are server-side; these are client round trips (use `compare` for like-for-like diffs)
+        "client_latency": {key: entry["latency"] for key, entry in summarize(replayed).items()},
+        "tools": compare(runnable, replayed),
+    }
+
+
+def print_report(report: Dict[str, Any], out: Any = sys.stdout) -> None:
+    if "replayed" in report and "schedule_lag" in report["replayed"]:
+        recorded, replayed = report["recorded"], report["replayed"]
+        print(f"speed {report['speed']}  calls {replayed['calls']}/{recorded['calls']}  "
+              f"duration {replayed['duration_s']}s (recorded {recorded['duration_s']}s)  "
+              f"peak concurrency {replayed['peak_concurrency']} (recorded {recorded['peak_concurrency']})  "
+              f"schedule lag p95 {replayed['schedule_lag'].get('p95_ms')} ms", file=out)
+        if report["skipped_agents"]:
+            print(f"skipped (no --target): {report['skipped_agents']}", file=out)
+        if report["status_changes"]:
+            print(f"status changes: {report['status_changes']}", file=out)
+        print("latency: recorded server-side -> replayed client round trip", file=out)
+        rows = {key: (entry["recorded"] or {}).get("latency", {}) for key, entry in report["tools"].items()}
+        after_rows = report["client_latency"]
+    else:
+        print("latency: recorded server-side -> replayed server-side", file=out)
+        rows = {key: (entry["recorded"] or {}).get("latency", {}) for key, entry in report["tools"].items()}
+        after_rows = {key: (entry["replayed"] or {}).get("latency", {}) for key, entry in report["tools"].items()}
+    print(f"{'tool':<40} {'calls':>7} {'p50 ms':>19} {'p95 ms':>19} {'p99 ms':>19}", file=out)
+    for key in report["tools"]:
+        before, after = rows.get(key, {}), after_rows.get(key, {})
+
+        def pair(q: str) -> str:
+            return f"{before.get(q, '-')}->{after.get(q, '-')}"
+
+        print(f"{key:<40} {after.get('count', 0):>7} {pair('p50_ms'):>19} {pair('p95_ms'):>19} {pair('p99_ms'):>19}", file=out)
+
+
+def parse_targets(values: List[str]) -> Dict[str, str]:
+    targets = dict(DEFAULT_TARGETS)
+    for value in values:
+        agent, sep, url = value.partition("=")
+        if not sep or not agent or not url:
+            raise argparse.ArgumentTypeError(f"--target expects agent=url, got '{value}'")
+        targets[agent] = url
+    return targets
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Summarize or replay MCP traffic captured with CAPTURE_FILE.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    summary_parser = sub.add_parser("summary", help="Per-tool statistics of a capture.")
+    summary_parser.add_argument("files", nargs="+")
+    replay_parser = sub.add_parser("replay", help="Re-issue captured calls and compare latencies with the recording.")
+    replay_parser.add_argument("files", nargs="+")
+    replay_parser.add_argument("--target", action="append", default=[], metavar="AGENT=URL",
+                               help="MCP URL per agent name (defaults to the localhost ports of docker-compose).")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="Time compression factor; 0 replays at max speed.")
+    replay_parser.add_argument("--concurrency", type=int, default=None,
+                               help="Cap on calls in flight (default: unlimited when timed, recorded peak at --speed 0).")
+    replay_parser.add_argument("--tools", default=None, help="Comma-separated tool names to replay (default: all).")
+    replay_parser.add_argument("--sessions", type=int, default=MIN_WARM_SESSIONS,
+                               help="Sessions opened per (target, client) before replaying, at least (default %(default)s).")
+    replay_parser.add_argument("--call-timeout", type=float, default=30.0)
+    replay_parser.add_argument("--output", default=None, help="Also write the JSON report here.")
+    replay_parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    compare_parser = sub.add_parser("compare", help="Diff server-side latencies of a recording and a capture taken during its replay.")
+    compare_parser.add_argument("recorded")
+    compare_parser.add_argument("replayed")
+    compare_parser.add_argument("--output", default=None, help="Also write the JSON report here.")
+    compare_parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args(argv)
+
+    if args.command == "summary":
+        records = list(load_records(args.files))
+        print(json.dumps({"calls": len(records), "tools": summarize(records)}, indent=2))
+        return
+    if args.command == "compare":
+        report = {"tools": compare(list(load_records([args.recorded])), list(load_records([args.replayed])))}
+    else:
+        records = list(load_records(args.files))
+        if args.tools:
+            wanted = set(args.tools.split(","))
+            records = [r for r in records if r["tool"] in wanted]
+        report = asyncio.run(replay(records, parse_targets(args.target), args.speed, args.concurrency, args.call_timeout, args.sessions))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Resilience policy for inter-agent MCP calls (used by `common.mcp_client.call_mcp_tool_async`).
+
+- Deadlines: every call gets one, the earliest of MCP_CALL_TIMEOUT_SECONDS from now, the
+  caller's `deadline=` and the deadline inherited from the tool call being served (see
+  `deadline_scope`). It is sent as `deadline` (epoch seconds) in the request `_meta`, where the
+  callee's admission control and its own outgoing calls pick it up.
+- Circuit breakers, one per endpoint URL: MCP_BREAKER_FAILURES consecutive transport
+  failures or timeouts open it, and calls then fail fast without touching the network. After
+  MCP_BREAKER_OPEN_SECONDS one probe call is let through (half-open); its success closes the
+  breaker, its failure re-opens it. Tool errors and admission rejections are answers from
+  a live server and do not count.
+- Hedging, for calls the caller marks idempotent: if no reply has come after the recent
+  MCP_HEDGE_QUANTILE latency of that endpoint and tool (at least MCP_HEDGE_MIN_DELAY_SECONDS,
+  and only after MCP_HEDGE_MIN_SAMPLES calls), a second identical call is sent and the first
+  reply wins. The other call is cancelled.
+
+Breaker state is exported as the `mcp_client_breaker_state` gauge (0 closed, 1 half-open,
+2 open) with transition, fast-fail, timeout and hedge counters.
+"""
+import contextvars
+import math
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+from common import metrics
+
+MCP_CALL_TIMEOUT_SECONDS = float(os.getenv("MCP_CALL_TIMEOUT_SECONDS", "10"))
+MCP_BREAKER_FAILURES = int(os.getenv("MCP_BREAKER_FAILURES", "5"))
+MCP_BREAKER_OPEN_SECONDS = float(os.getenv("MCP_BREAKER_OPEN_SECONDS", "10"))
+MCP_HEDGE_ENABLED = os.getenv("MCP_HEDGE_ENABLED", "1") != "0"
+MCP_HEDGE_QUANTILE = float(os.getenv("MCP_HEDGE_QUANTILE", "0.95"))
+MCP_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("MCP_HEDGE_MIN_DELAY_SECONDS", "0.02"))
+MCP_HEDGE_MIN_SAMPLES = int(os.getenv("MCP_HEDGE_MIN_SAMPLES", "20"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+LATENCY_WINDOW = 256
+
+# Epoch-seconds deadline of the request being served, if its caller sent one
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("mcp_deadline", default=None)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, endpoint: str, retry_in: float) -> None:
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+        super().__init__(f"circuit open for {endpoint}; next probe in {retry_in:.1f}s")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]) -> Iterator[None]:
+    """Makes calls made inside inherit `deadline` (epoch seconds), unless an outer one is earlier."""
+    outer = _deadline.get()
+    if deadline is None or (outer is not None and outer <= deadline):
+        yield
+        return
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def call_deadline(timeout: Optional[float] = None, deadline: Optional[float] = None) -> float:
+    """The epoch-seconds deadline for an outgoing call."""
+    candidates = [time.time() + (MCP_CALL_TIMEOUT_SECONDS if timeout is None else timeout)]
+    if deadline is not None:
+        candidates.append(deadline)
+    inherited = _deadline.get()
+    if inherited is not None:
+        candidates.append(inherited)
+    return min(candidates)
+
+
+class CircuitBreaker:
+    def __init__(self, endpoint: str, failure_threshold: int = MCP_BREAKER_FAILURES,
+                 open_seconds: float = MCP_BREAKER_OPEN_SECONDS) -> None:
+        self.endpoint = endpoint
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        metrics.REGISTRY.gauge("mcp_client_breaker_state", "Circuit breaker state per endpoint (0 closed, 1 half-open, 2 open).",
+                               lambda: STATE_VALUES[self.state], endpoint=endpoint)
+        self.fast_failures = metrics.REGISTRY.counter("mcp_client_breaker_rejections_total",
+                                                      "Calls failed fast by an open circuit breaker.", endpoint=endpoint)
+        self.timeouts = metrics.REGISTRY.counter("mcp_client_timeouts_total", "Calls that ran past their deadline.", endpoint=endpoint)
+        self.hedges = metrics.REGISTRY.counter("mcp_client_hedged_total", "Idempotent calls that sent a hedge request.", endpoint=endpoint)
+        self.hedge_wins = metrics.REGISTRY.counter("mcp_client_hedge_wins_total", "Hedged calls answered first by the hedge.", endpoint=endpoint)
+        self._transitions: Dict[str, metrics.Counter] = {}
+
+    def _move(self, state: str) -> None:
+        if state == self.state:
+            return
+        self.state = state
+        counter = self._transitions.get(state)
+        if counter is None:
+            counter = self._transitions[state] = metrics.REGISTRY.counter(
+                "mcp_client_breaker_transitions_total", "Circuit breaker state changes.", endpoint=self.endpoint, state=state)
+        counter.inc()
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError unless a call may go out now."""
+        if self.state == CLOSED:
+            return
+        if self.state == OPEN:
+            wait = self.opened_at + self.open_seconds - time.monotonic()
+            if wait > 0:
+                self.fast_failures.inc()
+                raise CircuitOpenError(self.endpoint, wait)
+            self._move(HALF_OPEN)
+        if self._probing:  # Half-open lets one probe through at a time
+            self.fast_failures.inc()
+            raise CircuitOpenError(self.endpoint, 0.0)
+        self._probing = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        self._move(CLOSED)
+
+    def record_failure(self) -> None:
+        self._probing = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._move(OPEN)
+
+    def release_probe(self) -> None:
+        """For a probe that ended without a verdict (cancelled, or the caller's deadline had passed)."""
+        self._probing = False
+
+
+class LatencyWindow:
+    """Recent call latencies, for the hedging delay."""
+
+    def __init__(self) -> None:
+        self.samples: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        if len(self.samples) < MCP_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        quantile = ordered[min(len(ordered) - 1, int(math.ceil(MCP_HEDGE_QUANTILE * len(ordered))) - 1)]
+        return max(MCP_HEDGE_MIN_DELAY_SECONDS, quantile)
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_LATENCIES: Dict[Tuple[str, str], LatencyWindow] = {}
+
+
+def breaker_for(endpoint: str) -> CircuitBreaker:
+    breaker = _BREAKERS.get(endpoint)
+    if breaker is None:
+        breaker = _BREAKERS[endpoint] = CircuitBreaker(endpoint)
+    return breaker
+
+
+def latency_for(endpoint: str, tool: str) -> LatencyWindow:
+    window = _LATENCIES.get((endpoint, tool))
+    if window is None:
+        window = _LATENCIES[(endpoint, tool)] = LatencyWindow()
+    return window
+
@@ -0,0 +1,384 @@
+"""
+Need/offer scoring as a pipeline of pluggable stages (used by agents/match_agent.py).
+
+A stage scores one aspect of a pair and declares:
+
+- `cost`: relative cost per pair; the pipeline runs stages cheapest first (hard filters first on ties)
+- `weights`: its default weights, all tunable through `Scorer.configure` / SCORER_WEIGHTS
+- `hard`: whether a miss rejects the pair outright (score 0) instead of just adding nothing.
+  SCORER_HARD_FILTERS turns soft stages into filters, e.g. "price,category".
+
+Registered stages (`STAGES`, extended with `register_stage`):
+
+- name (cost 4): exact / partial name, shared tokens, fuzzy similarity when nothing else matched
+- price (cost 1): offer price within the need's max_price, or within lenient_factor of it
+- category (cost 1): offer type matches the need's classification (goods -> product, else
+  service), plus a bonus when the offer's category equals the need's need_category
+- constraint (cost 2, always hard): the offer must be in stock and must not contradict the
+  need's `must` elements; each of the need's `wants` the offer satisfies adds constraint_want
+
+SCORER_PIPELINE picks the stages per deployment. The default, "name,price", scores exactly as the
+scorer always has. While scoring the match cycle's pairs, the pipeline stops a pair early if
+it is rejected by a hard filter, or if it can no longer beat the match threshold: the score so
+far plus every remaining stage's upper bound for that need. Stopped pairs score 0.
+`score_features` (match_propose) always runs every stage.
+
+Per stage, `scorer_stage_pairs_total`, `scorer_stage_rejections_total` and
+`scorer_stage_short_circuits_total` count the pairs it scored, rejected and stopped. For one
+pair in SCORER_TIMING_SAMPLE_EVERY, `scorer_stage_seconds` times every stage.
+"""
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+from common import metrics
+
+SCORER_PIPELINE = os.getenv("SCORER_PIPELINE", "name,price")
+SCORER_HARD_FILTERS = os.getenv("SCORER_HARD_FILTERS", "")
+
+# Emit the Scorer's per-pair debug trace for one in every N scored pairs (when LOG_LEVEL=DEBUG)
+SCORER_DEBUG_SAMPLE_EVERY = max(1, int(os.getenv("SCORER_DEBUG_SAMPLE_EVERY", "100")))
+
+# Time every stage for one in every N scored pairs; timing all of them would cost more than the cheap stages
+SCORER_TIMING_SAMPLE_EVERY = max(1, int(os.getenv("SCORER_TIMING_SAMPLE_EVERY", "64")))
+
+_OFFER_TYPES = {"product", "service", "goods", "services", "land", "labor", "capital"}
+STAGE_BUCKETS = (1e-06, 2.5e-06, 5e-06, 1e-05, 2.5e-05, 5e-05, 0.0001, 0.00025, 0.001, 0.01)
+
+
+def need_max_price(need: Dict[str, Any]) -> Optional[float]:
+    max_price = None
+    max_price_elem = need.get('elements', {}).get('max_price', {})
+    if isinstance(max_price_elem, dict):
+        alts = max_price_elem.get('alternatives', [])
+        for alt_val in alts:
+            if isinstance(alt_val, (int, float)):
+                max_price = float(alt_val)
+                break
+            elif isinstance(alt_val, str):
+                try:
+                    max_price = float(alt_val)
+                    break
+                except ValueError:
+                    continue
+    return max_price
+
+
+def offer_price(offer: Dict[str, Any]) -> Optional[float]:
+    price = offer.get('price')
+    if isinstance(price, str):
+        try:
+            price = float(price)
+        except ValueError:
+            logging.warning("[Scorer] Could not parse offer_price string: %s", offer.get('price'))
+            price = None
+    elif not isinstance(price, (int, float)):
+        price = None
+    return price
+
+
+class Stage:
+    name = ""
+    cost = 1.0
+    hard = False
+    weights: Dict[str, float] = {}
+
+    def __init__(self, hard: Optional[bool] = None) -> None:
+        self.hard = type(self).hard if hard is None else hard
+
+    def features(self, need: Dict[str, Any], offer: Dict[str, Any]) -> Tuple:
+        """Everything score() reads from the pair, hashable (memo keys are built from it)."""
+        raise NotImplementedError
+
+    def score(self, features: Tuple, weights: Dict[str, float], fuzzy_similarity: float) -> Optional[float]:
+        """The stage's contribution, or None to reject the pair (hard filters only)."""
+        raise NotImplementedError
+
+    def upper_bound(self, need: Dict[str, Any], weights: Dict[str, float]) -> float:
+        """The most this stage can add for `need`, with any offer."""
+        raise NotImplementedError
+
+
+class NameStage(Stage):
+    name = "name"
+    cost = 4.0
+    weights = {
+        "exact_name": 3.0,       # need 'what' equals offer name
+        "partial_name": 1.5,     # one name contains the other
+        "common_token": 0.75,    # per shared token
+        "token_floor": 0.1,      # minimum name score when tokens are shared
+        "fuzzy_name": 1.5,       # x n-gram similarity, when no name or token matched (0 disables the lookup)
+    }
+
+    def features(self, need: Dict[str, Any], offer: Dict[str, Any]) -> Tuple:
+        return need.get('what', '').lower().strip(), offer.get('name', '').lower().strip()
+
+    def score(self, features: Tuple, weights: Dict[str, float], fuzzy_similarity: float) -> Optional[float]:
+        need_name, offer_name = features
+        score = 0.0
+        if need_name and offer_name:
+            if need_name == offer_name:
+                score += weights["exact_name"]
+            elif need_name in offer_name or offer_name in need_name:
+                score += weights["partial_name"]
+            common_tokens = set(need_name.split()).intersection(offer_name.split())
+            if common_tokens:
+                score += len(common_tokens) * weights["common_token"]
+            if score == 0 and fuzzy_similarity:
+                score += fuzzy_similarity * weights["fuzzy_name"]
+            if score == 0 and common_tokens:
+                score = weights["token_floor"]
+        return None if self.hard and score <= 0 else score
+
+    def upper_bound(self, need: Dict[str, Any], weights: Dict[str, float]) -> float:
+        tokens = len(need.get('what', '').split())
+        matched = max(weights["exact_name"], weights["partial_name"], 0.0) + max(weights["common_token"], 0.0) * tokens
+        return max(matched, weights["token_floor"], weights["fuzzy_name"], 0.0)
+
+
+class PriceStage(Stage):
+    name = "price"
+    cost = 1.0
+    weights = {
+        "price_within": 1.5,     # offer price <= need max_price
+        "price_lenient": 0.5,    # offer price <= lenient_factor * max_price
+        "lenient_factor": 1.1,
+    }
+
+    def features(self, need: Dict[str, Any], offer: Dict[str, Any]) -> Tuple:
+        return need_max_price(need), offer_price(offer)
+
+    def score(self, features: Tuple, weights: Dict[str, float], fuzzy_similarity: float) -> Optional[float]:
+        max_price, price = features
+        if price is None or max_price is None:
+            return 0.0 # Nothing to compare; not a miss
+        if price <= max_price:
+            return weights["price_within"]
+        if price <= max_price * weights["lenient_factor"]:
+            return weights["price_lenient"]
+        return None if self.hard else 0.0
+
+    def upper_bound(self, need: Dict[str, Any], weights: Dict[str, float]) -> float:
+        return max(weights["price_within"], weights["price_lenient"], 0.0) if need_max_price(need) is not None else 0.0
+
+
+class CategoryStage(Stage):
+    name = "category"
+    cost = 1.0
+    weights = {
+        "category_type": 0.25,   # offer type matches the need's classification
+        "category_match": 0.5,   # offer category equals the need's need_category
+    }
+
+    def features(self, need: Dict[str, Any], offer: Dict[str, Any]) -> Tuple:
+        classification = str(need.get('classification') or '').lower()
+        kind = ('product' if classification == 'goods' else 'service') if classification else ''
+        return (classification, kind, str(need.get('need_category') or '').lower(),
+                str(offer.get('type') or '').lower(), str(offer.get('category') or '').lower())
+
+    def score(self, features: Tuple, weights: Dict[str, float], fuzzy_similarity: float) -> Optional[float]:
+        classification, kind, need_category, offer_type, offer_category = features
+        score = 0.0
+        if classification and offer_type in _OFFER_TYPES: # Offers carry a supply type (product/service) or a classification
+            if offer_type not in (kind, classification):
+                return None if self.hard else 0.0
+            score += weights["category_type"]
+        if need_category and need_category == offer_category:
+            score += weights["category_match"]
+        return score
+
+    def upper_bound(self, need: Dict[str, Any], weights: Dict[str, float]) -> float:
+        return max(weights["category_type"], 0.0) + max(weights["category_match"], 0.0)
+
+
+class ConstraintStage(Stage):
+    name = "constraint"
+    cost = 2.0
+    hard = True
+    weights = {
+        "constraint_want": 0.25, # per need `wants` entry the offer satisfies
+    }
+
+    @staticmethod
+    def _attribute(offer: Dict[str, Any], element: str) -> Any:
+        attributes = offer.get('attributes')
+        value = attributes.get(element) if isinstance(attributes, dict) else None
+        return offer.get(element) if value is None else value
+
+    def features(self, need: Dict[str, Any], offer: Dict[str, Any]) -> Tuple:
+        stock = offer.get('quantity', offer.get('stock'))
+        in_stock = not isinstance(stock, (int, float)) or stock > 0
+        violated = False
+        elements = need.get('elements')
+        for element, spec in (elements.items() if isinstance(elements, dict) else ()):
+            if element == 'max_price' or not isinstance(spec, dict) or not spec.get('must'):
+                continue # Prices are the price stage's business
+            value = self._attribute(offer, element)
+            if value is not None and str(value).lower() not in {str(alt).lower() for alt in spec.get('alternatives', [])}:
+                violated = True
+                break
+        wants_met = 0
+        for want in need.get('wants') or ():
+            if isinstance(want, dict):
+                value = self._attribute(offer, want.get('element', ''))
+                if value is not None and str(value).lower() in {str(option).lower() for option in want.get('options', [])}:
+                    wants_met += 1
+        return in_stock, violated, wants_met
+
+    def score(self, features: Tuple, weights: Dict[str, float], fuzzy_similarity: float) -> Optional[float]:
+        in_stock, violated, wants_met = features
+        if not in_stock or violated:
+            return None if self.hard else 0.0
+        return wants_met * weights["constraint_want"]
+
+    def upper_bound(self, need: Dict[str, Any], weights: Dict[str, float]) -> float:
+        return max(weights["constraint_want"], 0.0) * len(need.get('wants') or ())
+
+
+STAGES: Dict[str, Type[Stage]] = {}
+
+
+def register_stage(stage: Type[Stage]) -> Type[Stage]:
+    """Makes a Stage subclass selectable by name in SCORER_PIPELINE; usable as a class decorator."""
+    overlap = set(stage.weights) & {name for other in STAGES.values() if other.name != stage.name for name in other.weights}
+    if overlap:
+        raise ValueError(f"Stage '{stage.name}' reuses weight names {sorted(overlap)}")
+    STAGES[stage.name] = stage
+    return stage
+
+
+for _stage in (NameStage, PriceStage, CategoryStage, ConstraintStage):
+    register_stage(_stage)
+
+
+def default_weights() -> Dict[str, float]:
+    """The default weights of every registered stage."""
+    return {name: value for stage in STAGES.values() for name, value in stage.weights.items()}
+
+
+def _names(spec: Any) -> List[str]:
+    items = spec.split(",") if isinstance(spec, str) else list(spec or [])
+    return [str(item).strip().lower() for item in items if str(item).strip()]
+
+
+class _StageMetrics:
+    __slots__ = ("pairs", "rejections", "short_circuits", "seconds")
+
+    def __init__(self, agent: str, stage: str) -> None:
+        self.pairs = metrics.REGISTRY.counter("scorer_stage_pairs_total", "Pairs scored by each scorer stage.", agent=agent, stage=stage)
+        self.rejections = metrics.REGISTRY.counter("scorer_stage_rejections_total", "Pairs rejected by a hard-filter stage.",
+                                                   agent=agent, stage=stage)
+        self.short_circuits = metrics.REGISTRY.counter("scorer_stage_short_circuits_total",
+                                                       "Pairs stopped after this stage because they could no longer beat the threshold.",
+                                                       agent=agent, stage=stage)
+        self.seconds = metrics.REGISTRY.histogram("scorer_stage_seconds", "Time one stage takes on one pair (sampled).",
+                                                  STAGE_BUCKETS, agent=agent, stage=stage)
+
+
+class Scorer:
+    need_max_price = staticmethod(need_max_price)
+    offer_price = staticmethod(offer_price)
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, stages: Any = SCORER_PIPELINE,
+                 hard_filters: Any = SCORER_HARD_FILTERS, threshold: float = 0.0, agent: str = "match-agent") -> None:
+        self.pairs_scored = 0
+        self.threshold = threshold
+        self.agent = agent
+        self._stage_metrics: Dict[str, _StageMetrics] = {}
+        self._bound_need: Optional[Dict[str, Any]] = None
+        self._bounds: List[float] = []
+        self.configure(weights or {}, stages, hard_filters)
+
+    def configure(self, weights: Optional[Dict[str, float]] = None, stages: Any = None, hard_filters: Any = None) -> None:
+        """
+        Updates some weights and/or replaces the stages (names, in any order) or the stages run as
+        hard filters; the fingerprint changes so memoized scores are dropped.
+        """
+        weights = weights or {}
+        unknown = set(weights) - set(default_weights())
+        if unknown:
+            raise ValueError(f"Unknown scorer weights: {sorted(unknown)}")
+        names = _names(stages) if stages is not None else [stage.name for stage in getattr(self, "stages", [])]
+        hard = set(_names(hard_filters)) if hard_filters is not None else {stage.name for stage in getattr(self, "stages", []) if stage.hard}
+        missing = [name for name in names + sorted(hard) if name not in STAGES]
+        if missing or not names:
+            raise ValueError(f"Unknown or no scorer stages: {missing or names}; available: {sorted(STAGES)}")
+        self.weights = {**default_weights(), **getattr(self, "weights", {}), **{k: float(v) for k, v in weights.items()}}
+        built = [STAGES[name](True if name in hard else None) for name in dict.fromkeys(names)]
+        self.stages: List[Stage] = sorted(built, key=lambda stage: (stage.cost, not stage.hard))
+        self._stage_names = {stage.name for stage in self.stages}
+        for stage in self.stages:
+            if stage.name not in self._stage_metrics:
+                self._stage_metrics[stage.name] = _StageMetrics(self.agent, stage.name)
+        self._bound_need = None
+        self.fingerprint = (type(self).__name__, tuple((stage.name, stage.hard) for stage in self.stages), tuple(sorted(self.weights.items())))
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """The stages in run order, with their cost, hardness and current weights."""
+        return [{"name": stage.name, "cost": stage.cost, "hard": stage.hard,
+                 "weights": {name: self.weights[name] for name in stage.weights}} for stage in self.stages]
+
+    def has_stage(self, name: str) -> bool:
+        return name in self._stage_names
+
+    def features(self, need: Dict[str, Any], offer: Dict[str, Any]) -> Tuple:
+        """Everything score() depends on, per stage."""
+        return tuple(stage.features(need, offer) for stage in self.stages)
+
+    def affordable_limit(self, max_price: float) -> float:
+        """Highest offer price that can still earn a price term for this max_price."""
+        return max(max_price, max_price * self.weights["lenient_factor"])
+
+    def _remaining_bounds(self, need: Dict[str, Any]) -> List[float]:
+        """bounds[i]: the most stages i.. can add for `need`; cached for the need being scored."""
+        if need is not self._bound_need:
+            bounds = [0.0] * (len(self.stages) + 1)
+            for i in range(len(self.stages) - 1, -1, -1):
+                bounds[i] = bounds[i + 1] + self.stages[i].upper_bound(need, self.weights)
+            self._bound_need, self._bounds = need, bounds
+        return self._bounds
+
+    def score(self, need: Dict[str, Any], offer: Dict[str, Any], fuzzy_similarity: float = 0.0) -> float:
+        """The pair's score, or 0 as soon as it is rejected or can no longer beat the threshold."""
+        self.pairs_scored += 1
+        trace = self.pairs_scored % SCORER_DEBUG_SAMPLE_EVERY == 0 and logging.root.isEnabledFor(logging.DEBUG)
+        timed = self.pairs_scored % SCORER_TIMING_SAMPLE_EVERY == 0
+        bounds = self._remaining_bounds(need)
+        weights = self.weights
+        if trace:
+            logging.debug("[Scorer] Scoring Need: '%s' (ID: %s) vs Offer: '%s' (SKU: %s)", need.get('what'), need.get('id'), offer.get('name'), offer.get('sku'))
+        total = 0.0
+        for i, stage in enumerate(self.stages):
+            stage_metrics = self._stage_metrics[stage.name]
+            stage_metrics.pairs.inc()
+            started = time.perf_counter() if timed else 0.0
+            contribution = stage.score(stage.features(need, offer), weights, fuzzy_similarity)
+            if timed:
+                stage_metrics.seconds.observe(time.perf_counter() - started)
+            if trace:
+                logging.debug("[Scorer] Stage %s: %s", stage.name, "rejected" if contribution is None else f"+{contribution}")
+            if contribution is None:
+                stage_metrics.rejections.inc()
+                return 0.0
+            total += contribution
+            if total + bounds[i + 1] <= self.threshold and i + 1 < len(self.stages):
+                stage_metrics.short_circuits.inc()
+                if trace:
+                    logging.debug("[Scorer] Stopped after %s: %s + at most %s cannot beat %s", stage.name, total, bounds[i + 1], self.threshold)
+                return 0.0
+        final_score = round(total, 2)
+        if trace:
+            logging.debug("[Scorer] Final score for Need ID %s and Offer SKU %s: %s", need.get('id'), offer.get('sku'), final_score)
+        return final_score
+
+    def score_features(self, features: Sequence[Tuple], need_id: Any = None, offer_sku: Any = None, fuzzy_similarity: float = 0.0) -> float:
+        """The full score from features(); every stage runs, a hard-filter rejection scores 0."""
+        total = 0.0
+        for stage, stage_features in zip(self.stages, features):
+            contribution = stage.score(stage_features, self.weights, fuzzy_similarity)
+            if contribution is None:
+                logging.debug("[Scorer] Need %s / offer %s rejected by %s.", need_id, offer_sku, stage.name)
+                return 0.0
+            total += contribution
+        return round(total, 2)
@@ -0,0 +1,85 @@
+"""
+Shared wiring for the agents' FastMCP servers.
+
+Call `instrument_server(server)` right after creating the FastMCP instance and before any
+`@server.tool(...)` decorator runs. It swaps the server's `tool` decorator for one that
+registers each tool wrapped in the shared middleware (metrics, admission control, traffic
+capture, tracing), while handing the plain function back to the module so in-process callers
+are unaffected. A `deadline` in the request `_meta` is inherited by the MCP calls the tool
+makes (`common.resilience`). With DEBUG_TOOLS_ENABLED=1 the admin tools of `common.debug` are
+mounted as well.
+"""
+import functools
+import inspect
+from typing import Any, Awaitable, Callable, Optional
+
+from mcp.server.lowlevel.server import request_ctx
+
+from common import admission, capture, debug, metrics, resilience, tracing
+
+
+def _incoming_meta() -> Any:
+    context = request_ctx.get(None)
+    return context.meta if context is not None else None
+
+
+def _incoming_deadline(meta: Any) -> Optional[float]:
+    try:
+        return float(meta.deadline) if getattr(meta, "deadline", None) is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _traced(agent: str, tool_name: str, call: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    span_name = f"tool {tool_name}"
+
+    async def traced(**kwargs: Any) -> Any:
+        meta = _incoming_meta()
+        traceparent = getattr(meta, "traceparent", None) if meta is not None else None
+        with tracing.start_span(span_name, kind="server", service=agent, traceparent=traceparent) as span:
+            if span.sampled:
+                span.attributes.update(tracing.id_attributes(kwargs))
+            if meta is None:
+                return await call(**kwargs)
+            with resilience.deadline_scope(_incoming_deadline(meta)):
+                return await call(**kwargs)
+
+    return traced
+
+
+def _wrap_tool(agent: str, tool_name: str, fn: Callable[..., Any], controller: Any = None) -> Callable[..., Awaitable[Any]]:
+    if inspect.iscoroutinefunction(fn):
+        call = fn
+    else:
+        async def call(**kwargs: Any) -> Any:
+            return fn(**kwargs)
+
+    if metrics.METRICS_ENABLED:
+        call = metrics.instrument_tool(agent, tool_name, call)
+    if controller is not None:
+        call = controller.guard(tool_name, call)  # Rejected calls are traced but not timed as handler latency
+    call = capture.capture_tool(agent, tool_name, call, admission.client_id)  # No-op unless CAPTURE_FILE is set
+    call = _traced(agent, tool_name, call)
+
+    # FastMCP reads the signature, docstring and return annotation through __wrapped__
+    return functools.wraps(fn)(call)
+
+
+def instrument_server(server: Any) -> Any:
+    agent = server.name
+    register_tool = server.tool
+    controller = admission.AdmissionController(agent) if admission.ADMISSION_ENABLED else None
+
+    def tool(name: Any = None, *args: Any, **kwargs: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+            tool_name = name or fn.__name__
+            register_tool(tool_name, *args, **kwargs)(_wrap_tool(agent, tool_name, fn, controller))
+            return fn
+        return decorator
+
+    server.tool = tool
+    if metrics.METRICS_ENABLED:
+        metrics.mount(server)
+    if debug.DEBUG_TOOLS_ENABLED:
+        debug.mount(server)
+    return server
@@ -0,0 +1,167 @@
+"""
+Stock depletion tracking, time-to-stockout forecasts and replenishment (used by agents/supplier_agent.py).
+
+`DeliveryHistory` keeps, per SKU, a ring of `buckets` time buckets of `bucket_seconds` each,
+holding the units requested in that interval. Every row is a row of one float32 matrix on a shared
+clock, so advancing time zeroes whole columns and `rates` forecasts every SKU with a single
+matrix-vector product. Buckets are weighted by exp2(-age / half_life), and each row only counts
+the time since the SKU was first seen. Requests that failed for lack of stock count as demand too,
+otherwise an SKU at zero would look like it had none.
+
+`ReplenishmentScheduler` runs every `interval` seconds. It orders stock for every SKU whose
+inventory position (stock + on order) will not last the supplier's lead time plus one more
+check, sized to cover `cover_seconds` of forecast demand beyond the lead time. Orders arrive
+after the lead time through the `restock` callback.
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from common import metrics
+
+
+class DeliveryHistory:
+    def __init__(self, bucket_seconds: float, buckets: int, half_life_seconds: float, capacity: int = 64) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.half_life_seconds = half_life_seconds
+        self.units = np.zeros((capacity, buckets), dtype=np.float32)
+        self.first_bucket = np.zeros(capacity, dtype=np.int64)
+        self.rows: Dict[str, int] = {}
+        self.skus: List[str] = []
+        self.current = int(time.time() // bucket_seconds)
+
+    def __len__(self) -> int:
+        return len(self.skus)
+
+    def _advance(self, now: float) -> None:
+        bucket = int(now // self.bucket_seconds)
+        if bucket <= self.current:
+            return
+        passed = min(bucket - self.current, self.buckets)
+        self.units[:, [(self.current + i) % self.buckets for i in range(1, passed + 1)]] = 0.0
+        self.current = bucket
+
+    def row(self, sku: str) -> int:
+        row = self.rows.get(sku)
+        if row is None:
+            row = self.rows[sku] = len(self.skus)
+            self.skus.append(sku)
+            if row == len(self.units):
+                self.units = np.vstack([self.units, np.zeros_like(self.units)])
+                self.first_bucket = np.concatenate([self.first_bucket, np.zeros_like(self.first_bucket)])
+            self.first_bucket[row] = self.current
+        return row
+
+    def record(self, sku: str, units: float, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        self._advance(now)
+        row = self.row(sku) # First: a new SKU may grow (replace) self.units
+        self.units[row, self.current % self.buckets] += units
+
+    def rates(self, now: Optional[float] = None) -> np.ndarray:
+        """Recent demand per SKU in units per second, aligned with `skus`."""
+        now = time.time() if now is None else now
+        self._advance(now)
+        n = len(self.skus)
+        ages = np.arange(self.buckets)
+        elapsed = max(1e-3, now - self.current * self.bucket_seconds) # Into the current bucket
+        durations = np.full(self.buckets, self.bucket_seconds)
+        durations[0] = elapsed
+        weights = np.exp2(-(ages * self.bucket_seconds + elapsed / 2) / self.half_life_seconds)
+        column_weights = np.empty(self.buckets)
+        column_weights[(self.current - ages) % self.buckets] = weights
+        weighted_units = self.units[:n] @ column_weights.astype(np.float32)
+        observed = np.minimum(self.current - self.first_bucket[:n], self.buckets - 1)
+        # At least one full bucket: a burst in a new SKU's first seconds is not extrapolated to a huge rate
+        weighted_seconds = np.maximum(np.cumsum(weights * durations)[observed], weights[0] * self.bucket_seconds)
+        return weighted_units / weighted_seconds
+
+
+def time_to_stockout(stock: np.ndarray, rates: np.ndarray) -> np.ndarray:
+    """Seconds until each SKU runs out at its current rate: 0 when out, inf without demand."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        seconds = np.where(rates > 0, np.maximum(stock, 0) / rates, np.inf)
+    return np.where(stock <= 0, 0.0, seconds)
+
+
+class ReplenishmentScheduler:
+    def __init__(self, name: str, history: DeliveryHistory, stock_of: Callable[[List[str]], np.ndarray],
+                 restock: Callable[[str, int], None], interval: float, lead_seconds: float, cover_seconds: float) -> None:
+        self.name = name
+        self.history = history
+        self._stock_of = stock_of
+        self._restock = restock
+        self.interval = interval
+        self.lead_seconds = lead_seconds
+        self.cover_seconds = cover_seconds
+        self.on_order: Dict[str, Tuple[float, int]] = {} # sku -> (arrival time, units)
+        self._task: Optional[asyncio.Task] = None
+        self.orders = metrics.REGISTRY.counter("replenishment_orders_total", "Restock orders placed.", agent=name)
+        self.ordered_units = metrics.REGISTRY.counter("replenishment_units_total", "Units ordered by restocking.", agent=name)
+        metrics.REGISTRY.gauge("replenishment_on_order_skus", "SKUs with a restock order in transit.", lambda: len(self.on_order), agent=name)
+
+    def forecast(self, now: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """Stock, units on order, demand rate, time to stockout and reorder point for every tracked SKU."""
+        now = time.time() if now is None else now
+        rates = self.history.rates(now)
+        skus = self.history.skus
+        stock = self._stock_of(skus)
+        on_order = np.array([self.on_order.get(sku, (0.0, 0))[1] for sku in skus], dtype=np.float64)
+        return {
+            "stock": stock,
+            "on_order": on_order,
+            "rate": rates,
+            "seconds_to_stockout": time_to_stockout(stock, rates),
+            "reorder_point": rates * (self.lead_seconds + self.interval),
+        }
+
+    def plan(self, forecast: Dict[str, np.ndarray]) -> List[Tuple[str, int]]:
+        """(sku, units) to order now."""
+        position = forecast["stock"] + forecast["on_order"]
+        due = np.flatnonzero((forecast["rate"] > 0) & (forecast["on_order"] == 0) & (position <= forecast["reorder_point"]))
+        target = forecast["rate"][due] * (self.lead_seconds + self.cover_seconds)
+        units = np.maximum(1, np.ceil(target - position[due])).astype(np.int64)
+        return [(self.history.skus[i], int(n)) for i, n in zip(due.tolist(), units.tolist())]
+
+    def receive_due(self, now: float) -> int:
+        arrived = [sku for sku, (arrival, _) in self.on_order.items() if arrival <= now]
+        for sku in arrived:
+            _, units = self.on_order.pop(sku)
+            try:
+                self._restock(sku, units)
+            except Exception as e:
+                logging.error(f"[replenishment] {self.name} restock of {units} x {sku} failed: {e}", exc_info=True)
+        return len(arrived)
+
+    def run_once(self, now: Optional[float] = None) -> List[Tuple[str, int]]:
+        now = time.time() if now is None else now
+        self.receive_due(now)
+        orders = self.plan(self.forecast(now))
+        for sku, units in orders:
+            self.on_order[sku] = (now + self.lead_seconds, units)
+            self.orders.inc()
+            self.ordered_units.inc(units)
+        if orders:
+            logging.info("[replenishment] %s ordered %d SKUs (%d units), arriving in %.0fs.", self.name, len(orders),
+                         sum(units for _, units in orders), self.lead_seconds)
+        return orders
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name=f"{self.name}-replenishment")
+            logging.info("[replenishment] %s scheduler started (every %.0fs, lead time %.0fs).", self.name, self.interval, self.lead_seconds)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"[replenishment] {self.name} cycle failed: {e}", exc_info=True)
+            # Wake up for arrivals due before the next planning round
+            next_arrival = min((arrival for arrival, _ in self.on_order.values()), default=math.inf)
+            await asyncio.sleep(max(0.0, min(self.interval, next_arrival - time.time())))
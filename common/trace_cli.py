@@ -0,0 +1,173 @@
+"""
+Trace tooling for spans exported by `common.tracing`.
+
+    # OTLP/HTTP JSON collector stand-in: point TRACE_OTLP_ENDPOINT at http://localhost:4318/v1/traces
+    python -m common.trace_cli collect --port 4318 --output traces.jsonl
+
+    # Rebuild the need's path (need_add ... match.cycle -> need_fulfill -> supply_deliver)
+    python -m common.trace_cli critical-path --need-id <uuid> traces.jsonl [more.jsonl ...]
+"""
+import argparse
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional
+
+KIND_NAMES = {1: "internal", 2: "server", 3: "client"}
+
+
+def otlp_to_spans(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flattens an OTLP/HTTP JSON ExportTraceServiceRequest into `common.tracing` span dicts."""
+    spans = []
+    for resource_spans in payload.get("resourceSpans", []):
+        service = None
+        for attr in resource_spans.get("resource", {}).get("attributes", []):
+            if attr.get("key") == "service.name":
+                service = attr.get("value", {}).get("stringValue")
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for s in scope_spans.get("spans", []):
+                start_ns, end_ns = int(s.get("startTimeUnixNano", 0)), int(s.get("endTimeUnixNano", 0))
+                spans.append({
+                    "trace_id": s.get("traceId"), "span_id": s.get("spanId"), "parent_id": s.get("parentSpanId") or None,
+                    "name": s.get("name"), "kind": KIND_NAMES.get(s.get("kind"), "internal"), "service": service,
+                    "start_ns": start_ns, "end_ns": end_ns, "duration_ms": round((end_ns - start_ns) / 1e6, 3),
+                    "status": "error" if s.get("status", {}).get("code") == 2 else "ok",
+                    "attributes": {a["key"]: next(iter(a.get("value", {}).values()), None) for a in s.get("attributes", [])},
+                })
+    return spans
+
+
+def collect(port: int, output: str) -> None:
+    class CollectorHandler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                spans = otlp_to_spans(json.loads(body))
+            except (ValueError, AttributeError, TypeError) as e:
+                self.send_error(400, f"Invalid OTLP JSON payload: {e}")
+                return
+            with open(output, "a") as f:
+                f.write("".join(json.dumps(s) + "\n" for s in spans))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), CollectorHandler)
+    print(f"[trace_cli] Collecting OTLP spans on :{port}/v1/traces into {output}. Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def load_spans(paths: Iterable[str]) -> List[Dict[str, Any]]:
+    spans = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    spans.append(json.loads(line))
+    return spans
+
+
+def _on_path(spans: List[Dict[str, Any]], need_id: str) -> List[Dict[str, Any]]:
+    """Drops spans about a different need (other pairs fulfilled in the same cycle) and their subtrees."""
+    by_id = {s["span_id"]: s for s in spans}
+    verdicts: Dict[str, bool] = {}
+
+    def keep(span: Dict[str, Any]) -> bool:
+        if span["span_id"] not in verdicts:
+            other = span.get("attributes", {}).get("need_id")
+            parent = by_id.get(span.get("parent_id"))
+            verdicts[span["span_id"]] = (other is None or other == need_id) and (parent is None or keep(parent))
+        return verdicts[span["span_id"]]
+
+    return [s for s in spans if keep(s)]
+
+
+def critical_path(root: Dict[str, Any], children: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Walks back from the root's end, always through the child that finished last."""
+    path = [root]
+    cursor = root["end_ns"]
+    chosen = []
+    for child in sorted(children.get(root["span_id"], []), key=lambda s: s["end_ns"], reverse=True):
+        if child["end_ns"] <= cursor:
+            chosen.append(child)
+            cursor = child["start_ns"]
+    for child in reversed(chosen):
+        path.extend(critical_path(child, children))
+    return path
+
+
+def build_report(spans: List[Dict[str, Any]], need_id: str) -> Dict[str, Any]:
+    trace_ids = {s["trace_id"] for s in spans if s.get("attributes", {}).get("need_id") == need_id}
+    traces = []
+    for trace_id in sorted(trace_ids, key=lambda t: min(s["start_ns"] for s in spans if s["trace_id"] == t)):
+        trace_spans = _on_path([s for s in spans if s["trace_id"] == trace_id], need_id)
+        span_ids = {s["span_id"] for s in trace_spans}
+        children: Dict[str, List[Dict[str, Any]]] = {}
+        roots = []
+        for s in trace_spans:
+            if s.get("parent_id") in span_ids:
+                children.setdefault(s["parent_id"], []).append(s)
+            else:
+                roots.append(s)
+        for root in sorted(roots, key=lambda s: s["start_ns"]):
+            path = critical_path(root, children)
+            traces.append({
+                "trace_id": trace_id,
+                "root": root["name"],
+                "service": root.get("service"),
+                "duration_ms": root["duration_ms"],
+                "critical_path": [{
+                    "name": s["name"], "service": s.get("service"), "kind": s.get("kind"),
+                    "offset_ms": round((s["start_ns"] - root["start_ns"]) / 1e6, 3),
+                    "duration_ms": s["duration_ms"],
+                    "self_ms": round(s["duration_ms"] - sum(c["duration_ms"] for c in children.get(s["span_id"], []) if c in path), 3),
+                    "status": s.get("status"),
+                } for s in path],
+            })
+    return {"need_id": need_id, "traces": traces}
+
+
+def print_report(report: Dict[str, Any], out: Any = sys.stdout) -> None:
+    if not report["traces"]:
+        print(f"No spans found for need {report['need_id']}.", file=out)
+        return
+    for trace in report["traces"]:
+        print(f"trace {trace['trace_id']}  {trace['root']} ({trace['service']})  {trace['duration_ms']:.3f} ms", file=out)
+        for step in trace["critical_path"]:
+            flag = "  !" if step["status"] == "error" else ""
+            print(f"  +{step['offset_ms']:>10.3f} ms  {step['duration_ms']:>10.3f} ms  self {step['self_ms']:>10.3f} ms  "
+                  f"{step['service']}: {step['name']}{flag}", file=out)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Trace collector stand-in and critical-path report.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    collect_parser = sub.add_parser("collect", help="Accept OTLP/HTTP JSON spans and append them to a JSONL file.")
+    collect_parser.add_argument("--port", type=int, default=4318)
+    collect_parser.add_argument("--output", default="traces.jsonl")
+    path_parser = sub.add_parser("critical-path", help="Reconstruct the critical path for one need.")
+    path_parser.add_argument("--need-id", required=True)
+    path_parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    path_parser.add_argument("files", nargs="+", help="JSONL span files (TRACE_EXPORT_FILE or collector output).")
+    args = parser.parse_args(argv)
+
+    if args.command == "collect":
+        collect(args.port, args.output)
+    else:
+        report = build_report(load_spans(args.files), args.need_id)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
+
+
+if __name__ == "__main__":
+    main()
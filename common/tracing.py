@@ -0,0 +1,236 @@
+"""
+Lightweight cross-agent tracing.
+
+Trace context travels between agents as a W3C `traceparent` string in the MCP request
+`_meta`: the shared client helper injects it and the server tool wrapper picks it up, so a
+match cycle, the tools it calls and their downstream tools share one trace id.
+
+The sampling decision is taken once at the root span (TRACE_SAMPLE_RATE, default 0 = off)
+and carried in the traceparent flags. Unsampled spans only keep ids for propagation; sampled
+spans are kept in an in-memory ring buffer and, when configured, exported in batches from a
+background thread:
+
+- TRACE_EXPORT_FILE: append one JSON span per line to this file
+- TRACE_OTLP_ENDPOINT: POST OTLP/HTTP JSON batches, e.g. http://localhost:4318/v1/traces
+
+`python -m common.trace_cli` runs a collector stand-in and rebuilds the critical path for a need.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "10000"))
+TRACE_FLUSH_SECONDS = float(os.getenv("TRACE_FLUSH_SECONDS", "2"))
+SERVICE_NAME = os.getenv("SERVICE_NAME", "agent")
+
+# Span attributes copied from tool arguments so spans can be found by need id / SKU
+ID_ATTRIBUTES = {"id": "need_id", "need_id": "need_id", "sku": "sku", "offer_sku": "sku"}
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "sampled", "name", "kind", "service",
+                 "start_ns", "end_ns", "attributes", "status", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 kind: str = "internal", service: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None) -> None:
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.name = name
+        self.kind = kind
+        self.service = service
+        self.attributes = attributes if sampled and attributes else {}
+        self.status = "ok"
+        self.start_ns = time.time_ns() if sampled else 0
+        self.end_ns = 0
+        self._token: Optional[contextvars.Token] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.sampled:
+            self.attributes[key] = value
+
+    def set_error(self, error: BaseException) -> None:
+        if self.sampled:
+            self.status = "error"
+            self.attributes["error"] = f"{type(error).__name__}: {error}"
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Optional[BaseException], tb: Any) -> None:
+        _current_span.reset(self._token)
+        if self.sampled:
+            if exc is not None:
+                self.set_error(exc)
+            self.end_ns = time.time_ns()
+            _EXPORTER.submit(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "kind": self.kind, "service": self.service,
+            "start_ns": self.start_ns, "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status, "attributes": self.attributes,
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def is_sampled() -> bool:
+    span = _current_span.get()
+    return span is not None and span.sampled
+
+
+def _parse_traceparent(traceparent: Any) -> Optional[tuple]:
+    if not isinstance(traceparent, str):
+        return None
+    parts = traceparent.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2], parts[3] == "01"
+
+
+def start_span(name: str, kind: str = "internal", service: Optional[str] = None,
+               traceparent: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None) -> Span:
+    """
+    Starts a span as a child of `traceparent` if given, else of the current span, else as a
+    new root with a fresh sampling decision. Use it as a context manager.
+    """
+    remote = _parse_traceparent(traceparent) if traceparent else None
+    if remote is not None:
+        trace_id, parent_id, sampled = remote
+    else:
+        parent = _current_span.get()
+        if parent is not None:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+            service = service or parent.service
+        else:
+            trace_id, parent_id = "%032x" % random.getrandbits(128), None
+            sampled = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+    return Span(name, trace_id, parent_id, sampled, kind, service or SERVICE_NAME, attributes)
+
+
+def record_span(name: str, start_ns: int, end_ns: int, attributes: Optional[Dict[str, Any]] = None) -> None:
+    """Records an already-finished child of the current span (no-op when unsampled)."""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        return
+    span = Span(name, parent.trace_id, parent.span_id, True, "internal", parent.service, attributes)
+    span.start_ns, span.end_ns = start_ns, end_ns
+    _EXPORTER.submit(span)
+
+
+def inject(span: Optional[Span] = None) -> Dict[str, str]:
+    """Returns the `_meta` entries that carry `span` (or the current span) to a remote tool."""
+    span = span or _current_span.get()
+    return {"traceparent": span.traceparent()} if span is not None else {}
+
+
+def id_attributes(arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Picks need ids / SKUs out of tool arguments, one level deep."""
+    found: Dict[str, Any] = {}
+    for key, value in arguments.items():
+        if isinstance(value, dict):
+            for inner_key, inner_value in value.items():
+                if inner_key in ID_ATTRIBUTES and isinstance(inner_value, str):
+                    found.setdefault(ID_ATTRIBUTES[inner_key], inner_value)
+        elif key in ID_ATTRIBUTES and isinstance(value, str):
+            found[ID_ATTRIBUTES[key]] = value
+    return found
+
+
+def recent_spans() -> List[Dict[str, Any]]:
+    """Sampled spans still held in this process's ring buffer, oldest first."""
+    return [span.to_dict() for span in list(_EXPORTER.buffer)]
+
+
+def to_otlp(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Converts flat span dicts into an OTLP/HTTP JSON ExportTraceServiceRequest."""
+    kinds = {"internal": 1, "server": 2, "client": 3}
+    by_service: Dict[str, List[Dict[str, Any]]] = {}
+    for s in spans:
+        by_service.setdefault(s["service"] or SERVICE_NAME, []).append({
+            "traceId": s["trace_id"], "spanId": s["span_id"], "parentSpanId": s["parent_id"] or "",
+            "name": s["name"], "kind": kinds.get(s["kind"], 1),
+            "startTimeUnixNano": str(s["start_ns"]), "endTimeUnixNano": str(s["end_ns"]),
+            "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in s["attributes"].items()],
+            "status": {"code": 2 if s["status"] == "error" else 1},
+        })
+    return {"resourceSpans": [
+        {"resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+         "scopeSpans": [{"scope": {"name": "agent-ecosystem-ng"}, "spans": service_spans}]}
+        for service, service_spans in by_service.items()
+    ]}
+
+
+class SpanExporter:
+    """Keeps finished spans in a ring buffer and ships them to file/OTLP from a daemon thread."""
+
+    def __init__(self) -> None:
+        self.buffer: Deque[Span] = deque(maxlen=TRACE_BUFFER_SIZE)
+        self._pending: "queue.SimpleQueue[Span]" = queue.SimpleQueue()
+        self._exporting = bool(TRACE_EXPORT_FILE or TRACE_OTLP_ENDPOINT)
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, span: Span) -> None:
+        self.buffer.append(span)
+        if self._exporting:
+            self._pending.put(span)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(TRACE_FLUSH_SECONDS)
+            self.flush()
+
+    def flush(self) -> None:
+        batch = []
+        while True:
+            try:
+                batch.append(self._pending.get_nowait().to_dict())
+            except queue.Empty:
+                break
+        if not batch:
+            return
+        if TRACE_EXPORT_FILE:
+            try:
+                with open(TRACE_EXPORT_FILE, "a") as f:
+                    f.write("".join(json.dumps(s) + "\n" for s in batch))
+            except OSError as e:
+                logging.warning(f"[tracing] Could not write {len(batch)} spans to {TRACE_EXPORT_FILE}: {e}")
+        if TRACE_OTLP_ENDPOINT:
+            request = urllib.request.Request(TRACE_OTLP_ENDPOINT, data=json.dumps(to_otlp(batch)).encode(),
+                                             headers={"Content-Type": "application/json"}, method="POST")
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except OSError as e:
+                logging.warning(f"[tracing] Could not export {len(batch)} spans to {TRACE_OTLP_ENDPOINT}: {e}")
+
+
+_EXPORTER = SpanExporter()
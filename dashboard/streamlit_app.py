@@ -57,16 +57,29 @@ def rpc_call(endpoint: str, method: str, params: Optional[Dict[str, Any]] = None
     return []
 
 # --- MCP Data Fetching Logic ---
+@st.cache_resource
+def _versioned_copies() -> Dict[str, Any]:
+    """Last result and version of each list/read call, kept across reruns (versioned reads, common/read_cache.py)."""
+    return {}
+
 async def _internal_fetch_data_via_mcp(mcp_base_url: str, tool_name: str, arguments: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     mcp_endpoint = f"{mcp_base_url}/mcp"
     logging.info(f"[_internal_fetch_data_via_mcp] Attempting MCP call: URL='{mcp_endpoint}', Tool='{tool_name}', Args='{arguments}'")
+    copies = _versioned_copies()
+    copy_key = f"{mcp_endpoint} {tool_name} {json.dumps(arguments or {}, sort_keys=True)}"
+    copy = copies.get(copy_key)
+    call_arguments = {**(arguments or {}), "known_version": copy[0]} if copy else (arguments or {})
     try:
         async with streamablehttp_client(mcp_endpoint) as (read_stream, write_stream, _):
             async with ClientSession(read_stream, write_stream) as session:
                 await session.initialize()
-                response = await session.call_tool(tool_name, arguments=arguments or {})
+                response = await session.call_tool(tool_name, arguments=call_arguments)
                 
                 logging.debug(f"[_internal_fetch_data_via_mcp] Raw MCP response from '{tool_name}': {response}")
+                meta = getattr(response, "meta", None) or {}
+                if copy and meta.get("not_modified") and meta.get("version") == copy[0]:
+                    logging.info(f"[_internal_fetch_data_via_mcp] '{tool_name}' not modified; reusing {len(copy[1])} items.")
+                    return copy[1]
 
                 data_to_return: List[Any] = []
                 if hasattr(response, 'content') and isinstance(response.content, list):
@@ -106,6 +119,8 @@ async def _internal_fetch_data_via_mcp(mcp_base_url: str, tool_name: str, argume
                             logging.warning(f"[_internal_fetch_data_via_mcp] Item from '{tool_name}' is not a dict: {type(item)}. Skipping.")
                 
                 logging.info(f"[_internal_fetch_data_via_mcp] Processed data for '{tool_name}': {len(processed_data)} items.")
+                if meta.get("version") is not None and not getattr(response, "isError", False):
+                    copies[copy_key] = (meta["version"], processed_data)
                 return processed_data
     except Exception as e:
         logging.error(f"[_internal_fetch_data_via_mcp] MCP call failed for tool '{tool_name}' at {mcp_base_url}: {e}", exc_info=True)
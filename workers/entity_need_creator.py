@@ -1,34 +1,24 @@
+import argparse
 import asyncio
-import uuid
+import json
+import os
+import random
 import time
+import uuid
+from bisect import bisect
 from datetime import datetime
+from itertools import accumulate
 import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from mcp.client.streamable_http import streamablehttp_client
-from mcp import ClientSession
+from common.logging_setup import configure_logging
+from common.mcp_client import call_mcp_tool_async, call_tool_with_backoff, mcp_session, parse_mcp_single_dict_result
 
-# Configure basic logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Configure logging (LOG_LEVEL / LOG_FORMAT from the environment)
+configure_logging("entity-need-creator")
 
 # MCP endpoint for Needs Worker
-NEED_MCP_URL = "http://needs-worker:9001/mcp" # MCP endpoint is typically at /mcp
-
-# Helper to call MCP tool
-async def call_mcp_tool(tool_name, arguments=None):
-    """
-    Calls a tool on the MCP server.
-    """
-    try:
-        async with streamablehttp_client(NEED_MCP_URL) as (read_stream, write_stream, _):
-            async with ClientSession(read_stream, write_stream) as session:
-                await session.initialize()
-                # The MCP tool expects its payload under an 'arguments' dict
-                # with keys that match the parameter names in the tool definition.
-                response = await session.call_tool(tool_name, arguments=arguments or {})
-                return response
-    except Exception as e:
-        logging.error(f"MCP call to tool '{tool_name}' failed: {e}", exc_info=True)
-        return None
+NEED_MCP_URL = os.getenv("NEED_MCP_URL", "http://needs-worker:9001/mcp") # MCP endpoint is typically at /mcp
 
 # Generate sample needs conforming to enhanced need.json schema
 def generate_needs():
@@ -97,12 +87,174 @@ def generate_needs():
         "urgency": "future"
     }
 
-if __name__ == "__main__":
+# --- Synthetic generator mode ---
+
+# Items per classification, most popular first: (what, need_category, typical price).
+# Heads reuse the words suppliers put in their names ("Standard Laptop", "Office Cleaning
+# Service", "Financial Consulting Hour", "Supply for: <what>"), so generated needs overlap with
+# the catalog the way real demand does: some exactly, some partially, some not at all.
+VOCABULARY: Dict[str, List[Tuple[str, str, float]]] = {
+    "Goods": [
+        ("Laptop", "electronics", 600.0), ("Breakfast Cereal", "breakfast", 4.0), ("Phone", "electronics", 400.0),
+        ("Headphones", "electronics", 80.0), ("Office Chair", "furniture", 150.0), ("Coffee Beans", "groceries", 12.0),
+        ("Monitor", "electronics", 200.0), ("Printer Paper", "office_supplies", 10.0), ("Running Shoes", "apparel", 90.0),
+        ("Water Filter", "household", 40.0),
+    ],
+    "Services": [
+        ("Office Cleaning Service", "office_cleaning", 150.0), ("Financial Consulting Hour", "consulting", 120.0),
+        ("General Consulting Hour", "consulting", 100.0), ("Plumbing Repair", "home_services", 90.0),
+        ("Catering Service", "events", 500.0), ("Web Design", "professional_services", 800.0),
+        ("Legal Advice Hour", "professional_services", 200.0),
+    ],
+    "Land": [
+        ("Road Construction", "road_construction", 100000.0), ("Warehouse Lease", "buildings", 20000.0),
+        ("Farmland Plot", "agriculture", 50000.0),
+    ],
+    "Labor": [
+        ("Software Contractor", "contractor_services", 90.0), ("Warehouse Staff", "staffing", 25.0),
+        ("Delivery Driver", "logistics", 22.0),
+    ],
+    "Capital": [
+        ("Equipment Loan", "credit", 10000.0), ("Working Capital Line", "credit", 50000.0),
+        ("Solar Panel Financing", "power_and_water", 15000.0),
+    ],
+}
+MODIFIERS = ["Standard", "Premium", "Basic", "General", "Large", "Small", "Bulk", "Express", "Used", "Eco"]
+BASIC_HUMAN_NEEDS = ["physiological", "safety", "love_belonging", "esteem", "self_actualization"]
+
+DEFAULT_ENTITY_MIX = "individual=6,business=3,government=1"
+DEFAULT_CLASSIFICATION_MIX = "Goods=5,Services=3,Land=0.5,Labor=1,Capital=0.5"
+DEFAULT_URGENCY_MIX = "now=2,soon=5,future=3"
+
+
+def parse_mix(text: str, allowed: Sequence[str]) -> Tuple[List[str], List[float]]:
+    """Parses "a=3,b=1" into choices and cumulative weights for random.choices."""
+    choices, weights = [], []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in allowed:
+            raise ValueError(f"Unknown value {name!r} in mix {text!r}; expected one of {list(allowed)}")
+        choices.append(name)
+        weights.append(float(weight or 1))
+    return choices, list(accumulate(weights))
+
+
+class SyntheticNeedGenerator:
+    """
+    Draws needs from configurable entity/classification/urgency mixes. Within a classification,
+    items follow a Zipf distribution (rank k has weight 1/k^s), and half the names get a modifier.
+    """
+
+    def __init__(self, rng: random.Random, entity_mix: str = DEFAULT_ENTITY_MIX,
+                 classification_mix: str = DEFAULT_CLASSIFICATION_MIX, urgency_mix: str = DEFAULT_URGENCY_MIX,
+                 zipf_s: float = 1.1, modifier_rate: float = 0.5, ttl_seconds: Optional[float] = None,
+                 vocabulary: Optional[Dict[str, List[Tuple[str, str, float]]]] = None) -> None:
+        self.rng = rng
+        self.vocabulary = vocabulary or VOCABULARY
+        self.entities = parse_mix(entity_mix, ["individual", "business", "government"])
+        self.classifications = parse_mix(classification_mix, list(self.vocabulary))
+        self.urgencies = parse_mix(urgency_mix, ["now", "soon", "future"])
+        self.item_weights = {
+            classification: list(accumulate(1.0 / (rank ** zipf_s) for rank in range(1, len(items) + 1)))
+            for classification, items in self.vocabulary.items()
+        }
+        self.modifier_rate = modifier_rate
+        self.ttl_seconds = ttl_seconds
+
+    def _pick(self, mix: Tuple[List[str], List[float]]) -> str:
+        choices, cum_weights = mix
+        return choices[bisect(cum_weights, self.rng.random() * cum_weights[-1])]
+
+    def make(self) -> Dict[str, Any]:
+        rng = self.rng
+        classification = self._pick(self.classifications)
+        cum_weights = self.item_weights[classification]
+        what, category, price = self.vocabulary[classification][bisect(cum_weights, rng.random() * cum_weights[-1])]
+        if rng.random() < self.modifier_rate:
+            what = f"{rng.choice(MODIFIERS)} {what}"
+        entity_type = self._pick(self.entities)
+        need = {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "entity_type": entity_type,
+            "classification": classification,
+            "need_category": category,
+            "what": what,
+            "elements": {
+                "max_price": {"alternatives": [round(price * rng.uniform(0.6, 1.6), 2)], "must": True},
+                "quantity": {"alternatives": [rng.choice((1, 1, 1, 2, 3, 5, 10))], "must": False},
+            },
+            "conditions": [],
+            "musts": [],
+            "wants": [],
+            "urgency": self._pick(self.urgencies),
+        }
+        if entity_type == "individual":
+            need["basic_human_needs"] = rng.sample(BASIC_HUMAN_NEEDS, rng.randint(1, 2))
+        if self.ttl_seconds:
+            need["expires_at"] = datetime.utcfromtimestamp(time.time() + self.ttl_seconds).isoformat() + "Z"
+        return need
+
+
+async def run_generator(args: argparse.Namespace) -> Dict[str, Any]:
+    """Generates `args.count` needs in batches, paced to `args.rate`, into need_add_many or a JSONL file."""
+    vocabulary = None
+    if args.vocabulary:
+        with open(args.vocabulary) as f:
+            vocabulary = {classification: [tuple(item) for item in items] for classification, items in json.load(f).items()}
+    generator = SyntheticNeedGenerator(random.Random(args.seed), args.entity_mix, args.classification_mix, args.urgency_mix,
+                                       args.zipf_s, args.modifier_rate, args.ttl, vocabulary)
+    consumers = 1 if args.output else args.concurrency
+    queue: "asyncio.Queue[Optional[List[Dict[str, Any]]]]" = asyncio.Queue(maxsize=consumers * 2)
+    totals = {"generated": 0, "accepted": 0, "rejected": 0, "failed_batches": 0}
+    started = time.perf_counter()
+
+    async def produce() -> None:
+        while totals["generated"] < args.count:
+            if args.rate > 0:
+                delay = started + totals["generated"] / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            batch = [generator.make() for _ in range(min(args.batch_size, args.count - totals["generated"]))]
+            totals["generated"] += len(batch)
+            await queue.put(batch)
+        for _ in range(consumers):
+            await queue.put(None)
+
+    async def write_jsonl() -> None:
+        with open(args.output, "a") as f:
+            while (batch := await queue.get()) is not None:
+                f.write("".join(json.dumps(need) + "\n" for need in batch))
+                totals["accepted"] += len(batch)
+
+    async def send() -> None:
+        async with mcp_session(args.url) as session:
+            while (batch := await queue.get()) is not None:
+                try:
+                    response = await call_tool_with_backoff(session, "need_add_many", {"needs_data": batch})
+                except Exception as e:
+                    logging.error(f"need_add_many call with {len(batch)} needs failed: {e}")
+                    totals["failed_batches"] += 1
+                    continue
+                result = parse_mcp_single_dict_result(response, "need_add_many")
+                if not result or result.get("status") != "added":
+                    totals["failed_batches"] += 1
+                    continue
+                totals["accepted"] += len(result.get("ids", []))
+                totals["rejected"] += len(result.get("rejected", []))
+
+    sinks = [write_jsonl()] if args.output else [send() for _ in range(consumers)]
+    await asyncio.gather(produce(), *sinks)
+    elapsed = time.perf_counter() - started
+    return dict(totals, seconds=round(elapsed, 3), needs_per_second=round(totals["accepted"] / elapsed, 1) if elapsed else None,
+                target=args.output or args.url)
+
+
+async def submit_examples(url: str, max_needs: int, interval_seconds: float) -> None:
+    """Original demo mode: cycles through the three example needs, one need_add per interval."""
     count = 0
-    max_needs = 1000 # You can adjust this or make it run indefinitely
     generator = generate_needs()
-
-    logging.info(f"Entity Need Creator started. Will submit needs to {NEED_MCP_URL}")
+    logging.info(f"Entity Need Creator started. Will submit needs to {url}")
 
     while count < max_needs:
         try:
@@ -115,15 +267,45 @@ if __name__ == "__main__":
 
         # The 'need_add' tool on needs_worker.py expects a 'need_data' argument.
         # The need_payload itself is the data.
-        mcp_arguments = {"need_data": need_payload} 
-        
+        mcp_arguments = {"need_data": need_payload}
+
         logging.info(f"Submitting need ID {need_payload['id']} via MCP to 'need_add' tool...")
-        # Run the async MCP call
-        result = asyncio.run(call_mcp_tool("need_add", arguments=mcp_arguments))
-        
+        result = await call_mcp_tool_async(url, "need_add", arguments=mcp_arguments)
+
         logging.info(f"[{datetime.utcnow().isoformat()}Z] Submitted need {need_payload['id']}. Response: {result}")
-        
+
         count += 1
-        time.sleep(1) # Adjust sleep time as needed
+        await asyncio.sleep(interval_seconds) # Adjust sleep time as needed
+
+    logging.info(f"Entity Need Creator finished after submitting {count} needs.")
 
-    logging.info(f"Entity Need Creator finished after submitting {count} needs.")
\ No newline at end of file
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Submit example needs, or generate synthetic load for the matcher.")
+    parser.add_argument("--mode", choices=["examples", "synthetic"], default="examples")
+    parser.add_argument("--count", type=int, default=1000, help="Needs to submit (examples) or generate (synthetic).")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between example needs.")
+    parser.add_argument("--url", default=NEED_MCP_URL, help="Needs worker MCP endpoint.")
+    parser.add_argument("--output", default=None, help="Append synthetic needs to this JSONL file instead of calling MCP.")
+    parser.add_argument("--rate", type=float, default=0, help="Target needs/sec; 0 = as fast as possible.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Needs per need_add_many call / file write.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent MCP sessions sending batches.")
+    parser.add_argument("--entity-mix", default=DEFAULT_ENTITY_MIX)
+    parser.add_argument("--classification-mix", default=DEFAULT_CLASSIFICATION_MIX)
+    parser.add_argument("--urgency-mix", default=DEFAULT_URGENCY_MIX)
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="Zipf exponent for item popularity within a classification.")
+    parser.add_argument("--modifier-rate", type=float, default=0.5, help="Share of names with a modifier such as 'Premium'.")
+    parser.add_argument("--ttl", type=float, default=None, help="Set expires_at this many seconds ahead.")
+    parser.add_argument("--vocabulary", default=None, help='JSON file: {"Goods": [["Laptop", "electronics", 600.0], ...], ...}')
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.mode == "examples":
+        asyncio.run(submit_examples(args.url, args.count, args.interval))
+    else:
+        logging.info(f"Entity Need Creator generating {args.count} synthetic needs into {args.output or args.url}")
+        summary = asyncio.run(run_generator(args))
+        logging.info(f"Entity Need Creator finished: {json.dumps(summary)}")
@@ -1,75 +1,264 @@
 import asyncio
+import math
+import os
+import time
 import uuid
 import logging
-from datetime import datetime
-import json # Added for MCP response parsing
+from datetime import datetime, timezone
 from typing import Any, Optional, Dict, List # Added for type hinting
 
 from mcp.server.fastmcp import FastMCP # Changed from jsonrpcserver
-from mcp.client.streamable_http import streamablehttp_client # Added for MCP client
-from mcp import ClientSession # Added for MCP client
+from mcp.types import CallToolResult
 
-# Configure basic logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from common import metrics, tracing
+from common.debug import start_loop_monitor
+from common.mcp_client import call_mcp_tool_async, parse_mcp_single_dict_result, read_versioned
+from common.logging_setup import configure_logging
+from common.read_cache import ReadCache
+from common.server import instrument_server
+
+# Configure logging (LOG_LEVEL / LOG_FORMAT from the environment)
+configure_logging("insight-worker")
 
 # MCP Server for this worker
 mcp_server = FastMCP("insight-worker")
 mcp_server.settings.port = 9006 # Port for this worker's MCP server
 mcp_server.settings.host = "0.0.0.0" # Recommended for Docker
+instrument_server(mcp_server) # Metrics middleware for every tool below
 
 # Endpoint for match-agent (MCP)
-MATCH_MCP_URL = "http://match-agent:9002/mcp" # Updated to MCP endpoint
+MATCH_MCP_URL = os.getenv("MATCH_MCP_URL", "http://match-agent:9002/mcp") # Updated to MCP endpoint
+
+# Seconds between background prediction cycles
+PREDICTION_CYCLE_INTERVAL_SECONDS = float(os.getenv("PREDICTION_CYCLE_INTERVAL_SECONDS", "60"))
+
+# Streaming analytics over the match agent's match_events stream (insight_summary): rates and success
+# ratios as exponentially decaying counts with time constant INSIGHT_EWMA_SECONDS and as exact counts over
+# the last INSIGHT_WINDOW_SECONDS; latency and price/budget percentiles from log-bucketed histograms
+INSIGHT_POLL_SECONDS = float(os.getenv("INSIGHT_POLL_SECONDS", "5"))
+INSIGHT_WINDOW_SECONDS = float(os.getenv("INSIGHT_WINDOW_SECONDS", "300"))
+INSIGHT_EWMA_SECONDS = float(os.getenv("INSIGHT_EWMA_SECONDS", "60"))
+INSIGHT_MAX_CLASSIFICATIONS = int(os.getenv("INSIGHT_MAX_CLASSIFICATIONS", "64")) # Further ones are counted as "other"
+INSIGHT_EVENT_BATCH = int(os.getenv("INSIGHT_EVENT_BATCH", "1000"))
 
 PREDICTIONS: List[Dict[str, Any]] = []
+metrics.register_store_gauge(mcp_server.name, "predictions", PREDICTIONS)
+PREDICTION_READS = ReadCache(mcp_server.name, "predictions") # Versions prediction_list; bumped when PREDICTIONS is rebuilt
+INSIGHT_EVENTS = metrics.REGISTRY.counter("insight_events_total", "Match events folded into the streaming analytics.", agent=mcp_server.name)
+INSIGHT_EVENTS_DROPPED = metrics.REGISTRY.counter("insight_events_dropped_total", "Match events that left the match agent's buffer unread.", agent=mcp_server.name)
 
-# --- MCP Client Helper (for calling match-agent) ---
-async def call_mcp_tool_async(mcp_url: str, tool_name: str, arguments: Optional[Dict[str, Any]] = None) -> Optional[Any]:
-    """
-    Calls a tool on an MCP server asynchronously.
-    """
+def _epoch(timestamp: Any) -> Optional[float]:
+    """Epoch seconds of an ISO-8601 timestamp (naive ones are UTC), or None."""
+    if not isinstance(timestamp, str):
+        return None
     try:
-        async with streamablehttp_client(mcp_url) as (read_stream, write_stream, _):
-            async with ClientSession(read_stream, write_stream) as session:
-                await session.initialize()
-                logging.debug(f"[insight_worker_client] Calling MCP tool '{tool_name}' at {mcp_url} with arguments: {arguments}")
-                response = await session.call_tool(tool_name, arguments=arguments or {})
-                logging.debug(f"[insight_worker_client] MCP response from '{tool_name}': {response}")
-                return response
-    except Exception as e:
-        logging.error(f"[insight_worker_client] MCP call to tool '{tool_name}' at {mcp_url} failed: {e}", exc_info=True)
+        parsed = datetime.fromisoformat(timestamp)
+    except ValueError:
         return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
 
-# Helper: Parse MCP tool result expected to be a list of dictionaries
-def parse_mcp_list_result(tool_response: Optional[Any], tool_name_for_log: str = "MCP tool") -> List[Dict[str, Any]]:
-    parsed_list: List[Dict[str, Any]] = []
-    if tool_response is None:
-        logging.warning(f"[insight_worker_parser] {tool_name_for_log} call returned None.")
-        return parsed_list
-    
-    if hasattr(tool_response, 'content') and isinstance(tool_response.content, list):
-        for text_content_item in tool_response.content:
-            if hasattr(text_content_item, 'text') and isinstance(text_content_item.text, str):
-                try:
-                    item_data = json.loads(text_content_item.text)
-                    if isinstance(item_data, dict):
-                        parsed_list.append(item_data)
-                    elif isinstance(item_data, list):
-                        for sub_item in item_data:
-                            if isinstance(sub_item, dict):
-                                parsed_list.append(sub_item)
-                            else:
-                                logging.warning(f"[insight_worker_parser] Sub-item in JSON list from {tool_name_for_log} is not a dict: {type(sub_item)}")
-                    else:
-                        logging.warning(f"[insight_worker_parser] Parsed item from {tool_name_for_log} is not a dict or list: {type(item_data)}")
-                except json.JSONDecodeError as je:
-                    logging.error(f"[insight_worker_parser] Failed to parse JSON from {tool_name_for_log} response: '{text_content_item.text}'. Error: {je}")
-    elif isinstance(tool_response, list):
-        for item in tool_response:
-            if isinstance(item, dict):
-                parsed_list.append(item)
-    else:
-        logging.warning(f"[insight_worker_parser] Unexpected {tool_name_for_log} response type: {type(tool_response)}")
-    return parsed_list
+class DecayingCounter:
+    """A count whose past contributions fade as exp(-age / tau); value / tau is the recent rate per second."""
+
+    def __init__(self, tau: float) -> None:
+        self.tau = tau
+        self.value = 0.0
+        self.updated = 0.0
+
+    def _decay_to(self, now: float) -> None:
+        if now > self.updated:
+            self.value *= math.exp((self.updated - now) / self.tau)
+            self.updated = now
+
+    def add(self, now: float, amount: float = 1.0) -> None:
+        if now >= self.updated:
+            self._decay_to(now)
+            self.value += amount
+        else: # Late event: counts as if decayed since it happened
+            self.value += amount * math.exp((now - self.updated) / self.tau)
+
+    def read(self, now: float) -> float:
+        self._decay_to(now)
+        return self.value
+
+class WindowedCounter:
+    """Counts over the last `window` seconds, kept in a ring of `buckets` time slots."""
+
+    def __init__(self, window: float, buckets: int = 30) -> None:
+        self.slot_seconds = window / buckets
+        self.counts = [0.0] * buckets
+        self.slots = [-1] * buckets
+
+    def add(self, now: float, amount: float = 1.0) -> None:
+        slot = int(now // self.slot_seconds)
+        i = slot % len(self.counts)
+        if self.slots[i] != slot:
+            if self.slots[i] > slot: # Older than the window
+                return
+            self.slots[i], self.counts[i] = slot, 0.0
+        self.counts[i] += amount
+
+    def total(self, now: float) -> float:
+        oldest = int(now // self.slot_seconds) - len(self.counts)
+        return sum(count for count, slot in zip(self.counts, self.slots) if slot > oldest)
+
+class LogHistogram:
+    """
+    HDR-style histogram: buckets grow geometrically by `precision` between `lowest` and `highest`, so
+    quantiles are within that relative error and memory and query cost are fixed by the range.
+    """
+
+    def __init__(self, lowest: float, highest: float, precision: float = 0.01) -> None:
+        self.lowest = lowest
+        self.log_base = math.log1p(precision)
+        self.counts = [0] * (int(math.log(highest / lowest) / self.log_base) + 2)
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        i = 0 if value <= self.lowest else min(len(self.counts) - 1, int(math.log(value / self.lowest) / self.log_base) + 1)
+        self.counts[i] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "LogHistogram") -> "LogHistogram":
+        merged = LogHistogram.__new__(LogHistogram)
+        merged.lowest, merged.log_base = self.lowest, self.log_base
+        merged.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        merged.count, merged.max = self.count + other.count, max(self.max, other.max)
+        return merged
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                # Geometric middle of the bucket, never above the largest value recorded
+                return min(self.max, self.lowest if i == 0 else self.lowest * math.exp((i - 0.5) * self.log_base))
+        return self.max
+
+class RollingHistogram:
+    """A LogHistogram over roughly the last `window` seconds: two half-window histograms, the older one dropped as they rotate."""
+
+    def __init__(self, window: float, lowest: float, highest: float, precision: float = 0.01) -> None:
+        self.half = window / 2
+        self.bounds = (lowest, highest, precision)
+        self.period = 0
+        self.current = LogHistogram(*self.bounds)
+        self.previous = LogHistogram(*self.bounds)
+
+    def _rotate(self, now: float) -> None:
+        period = int(now // self.half)
+        if period > self.period: # Late events from an earlier period go into the current one
+            self.previous = self.current if period == self.period + 1 else LogHistogram(*self.bounds)
+            self.current = LogHistogram(*self.bounds)
+            self.period = period
+
+    def record(self, now: float, value: float) -> None:
+        self._rotate(now)
+        self.current.record(value)
+
+    def quantiles(self, now: float, qs: List[float]) -> Dict[str, Any]:
+        self._rotate(now)
+        merged = self.current.merge(self.previous)
+        summary: Dict[str, Any] = {"count": merged.count}
+        for q in qs:
+            value = merged.quantile(q)
+            summary[f"p{round(q * 100):02d}"] = None if value is None else round(value, 4)
+        summary["max"] = round(merged.max, 4) if merged.count else None
+        return summary
+
+class RateAndRatio:
+    """Events and successes among them, as decaying and windowed counts."""
+
+    def __init__(self) -> None:
+        self.total = 0
+        self.recent = DecayingCounter(INSIGHT_EWMA_SECONDS)
+        self.recent_ok = DecayingCounter(INSIGHT_EWMA_SECONDS)
+        self.window = WindowedCounter(INSIGHT_WINDOW_SECONDS)
+        self.window_ok = WindowedCounter(INSIGHT_WINDOW_SECONDS)
+
+    def add(self, now: float, ok: Optional[bool] = None) -> None:
+        self.total += 1
+        self.recent.add(now)
+        self.window.add(now)
+        if ok:
+            self.recent_ok.add(now)
+            self.window_ok.add(now)
+
+    def rate_summary(self, now: float) -> Dict[str, Any]:
+        return {"total": self.total, "per_minute_ewma": round(self.recent.read(now) / INSIGHT_EWMA_SECONDS * 60, 3),
+                "in_window": int(self.window.total(now))}
+
+    def ratio_summary(self, now: float) -> Dict[str, Any]:
+        recent, in_window = self.recent.read(now), self.window.total(now)
+        return {"attempts_in_window": int(in_window),
+                "success_ewma": round(self.recent_ok.read(now) / recent, 4) if recent > 1e-9 else None,
+                "success_in_window": round(self.window_ok.total(now) / in_window, 4) if in_window else None}
+
+class MarketplaceAnalytics:
+    """Folds match events into fixed-size aggregates: O(1) per event, whatever the history length."""
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.events = 0
+        self.matches_by_classification: Dict[str, RateAndRatio] = {}
+        self.fulfillment = RateAndRatio()
+        self.delivery = RateAndRatio()
+        self.need_to_match = RollingHistogram(INSIGHT_WINDOW_SECONDS, 0.001, 30 * 86400.0)
+        self.price_to_budget = RollingHistogram(INSIGHT_WINDOW_SECONDS, 0.01, 100.0)
+        self.over_budget = RateAndRatio() # Priced matches with a budget; "success" = over budget
+        self.without_budget = 0
+
+    def observe(self, match: Dict[str, Any]) -> None:
+        now = _epoch(match.get("timestamp")) or time.time()
+        self.events += 1
+        classification = str(match.get("classification") or "unknown")
+        per_class = self.matches_by_classification.get(classification)
+        if per_class is None:
+            if len(self.matches_by_classification) >= INSIGHT_MAX_CLASSIFICATIONS:
+                classification = "other"
+            per_class = self.matches_by_classification.setdefault(classification, RateAndRatio())
+        per_class.add(now)
+        if match.get("fulfillment_attempted"):
+            self.fulfillment.add(now, bool(match.get("fulfillment_successful")))
+        if match.get("delivery_attempted"):
+            self.delivery.add(now, bool(match.get("delivery_successful")))
+        created = _epoch(match.get("need_created_at"))
+        if created is not None:
+            self.need_to_match.record(now, max(0.0, now - created))
+        price, max_price = match.get("price"), match.get("max_price")
+        if isinstance(price, (int, float)) and isinstance(max_price, (int, float)) and max_price > 0:
+            ratio = price / max_price
+            self.price_to_budget.record(now, ratio)
+            self.over_budget.add(now, ratio > 1.0)
+        else:
+            self.without_budget += 1
+
+    def summary(self) -> Dict[str, Any]:
+        now = time.time()
+        price_to_budget = self.price_to_budget.quantiles(now, [0.1, 0.5, 0.9])
+        price_to_budget["over_budget_share_in_window"] = self.over_budget.ratio_summary(now)["success_in_window"]
+        price_to_budget["matches_without_budget"] = self.without_budget
+        return {
+            "since": datetime.utcfromtimestamp(self.started).isoformat() + "Z",
+            "events": self.events,
+            "window_seconds": INSIGHT_WINDOW_SECONDS,
+            "ewma_seconds": INSIGHT_EWMA_SECONDS,
+            "match_rate_by_classification": {name: counts.rate_summary(now) for name, counts in sorted(self.matches_by_classification.items())},
+            "fulfillment": self.fulfillment.ratio_summary(now),
+            "delivery": self.delivery.ratio_summary(now),
+            "need_to_match_seconds": self.need_to_match.quantiles(now, [0.5, 0.9, 0.99]),
+            "price_to_budget": price_to_budget,
+        }
+
+ANALYTICS = MarketplaceAnalytics()
+MATCH_EVENTS_CURSOR = 0
 
 class BasePredictor:
     def predict(self, matches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -126,46 +315,101 @@ class MLPredictor(BasePredictor):
 
 predictor = MLPredictor()
 
-async def sync_and_predict():
+async def predict_cycle() -> None:
+    """Fetches the current matches once and rebuilds PREDICTIONS from them."""
+    with tracing.start_span("insight.predict_cycle", service=mcp_server.name):
+        await _run_predict_cycle()
+
+async def _run_predict_cycle() -> None:
     global PREDICTIONS # Ensure we modify the global list
+    logging.info("[insight_worker] Fetching matches from match-agent via MCP...")
+    # Call match-agent's "match_list_tool"
+    matches, changed = await read_versioned(MATCH_MCP_URL, "match_list")
+    if matches is not None and not changed:
+        logging.info("[insight_worker] Matches unchanged since the last cycle; keeping %d predictions.", len(PREDICTIONS))
+        return
+
+    if not matches:
+        logging.info("[insight_worker] No matches received from match-agent.")
+        if PREDICTIONS:
+            PREDICTION_READS.bump()
+        PREDICTIONS.clear() # Clear old predictions if no new matches
+        return
+
+    logging.info(f"[insight_worker] Received {len(matches)} matches. Generating predictions...")
+    
+    new_predictions_list = [] # Build a new list
+    preds = predictor.predict(matches)
+    timestamp = datetime.utcnow().isoformat() + "Z"
+    for p_detail in preds:
+        new_predictions_list.append({
+            "id": str(uuid.uuid4()),
+            "prediction": p_detail, # p_detail already contains need_id, offer_sku, predicted_success
+            "timestamp": timestamp
+        })
+    
+    PREDICTIONS[:] = new_predictions_list # Atomic update of the global list
+    PREDICTION_READS.bump()
+    logging.info(f"[insight_worker] Generated {len(PREDICTIONS)} new predictions.")
+
+async def consume_match_events() -> int:
+    """Reads the match events since the cursor into ANALYTICS; returns how many were read."""
+    global MATCH_EVENTS_CURSOR
+    read = 0
     while True:
-        logging.info("[insight_worker] Fetching matches from match-agent via MCP...")
-        # Call match-agent's "match_list_tool"
-        raw_matches_response = await call_mcp_tool_async(MATCH_MCP_URL, "match_list")
-        matches = parse_mcp_list_result(raw_matches_response, "match_list")
-        
-        if not matches:
-            logging.info("[insight_worker] No matches received from match-agent.")
-            PREDICTIONS.clear() # Clear old predictions if no new matches
-            await asyncio.sleep(60)
-            continue
+        response = await call_mcp_tool_async(MATCH_MCP_URL, "match_events", {"after": MATCH_EVENTS_CURSOR, "limit": INSIGHT_EVENT_BATCH}, idempotent=True)
+        page = parse_mcp_single_dict_result(response, "match_events")
+        if not page or not page.get("events"):
+            return read
+        if page.get("dropped"):
+            INSIGHT_EVENTS_DROPPED.inc(page["dropped"])
+            logging.warning("[insight_worker] %d match events left the match agent's buffer unread.", page["dropped"])
+        for event in page["events"]:
+            ANALYTICS.observe(event)
+        read += len(page["events"])
+        INSIGHT_EVENTS.inc(len(page["events"]))
+        MATCH_EVENTS_CURSOR = page.get("next", MATCH_EVENTS_CURSOR)
+        if len(page["events"]) < INSIGHT_EVENT_BATCH:
+            return read
 
-        logging.info(f"[insight_worker] Received {len(matches)} matches. Generating predictions...")
-        
-        new_predictions_list = [] # Build a new list
-        preds = predictor.predict(matches)
-        timestamp = datetime.utcnow().isoformat() + "Z"
-        for p_detail in preds:
-            new_predictions_list.append({
-                "id": str(uuid.uuid4()),
-                "prediction": p_detail, # p_detail already contains need_id, offer_sku, predicted_success
-                "timestamp": timestamp
-            })
-        
-        PREDICTIONS[:] = new_predictions_list # Atomic update of the global list
-        logging.info(f"[insight_worker] Generated {len(PREDICTIONS)} new predictions.")
-        await asyncio.sleep(60) # Wait for the next cycle
+async def stream_analytics():
+    while True:
+        await consume_match_events()
+        await asyncio.sleep(INSIGHT_POLL_SECONDS)
+
+async def sync_and_predict():
+    while True:
+        await predict_cycle()
+        await asyncio.sleep(PREDICTION_CYCLE_INTERVAL_SECONDS) # Wait for the next cycle
 
 # MCP Tool for this worker's server
 @mcp_server.tool("prediction_list")
-def prediction_list_tool() -> List[Dict[str, Any]]:
-    logging.info(f"[insight_worker_server] prediction_list_tool called. Returning {len(PREDICTIONS)} predictions.")
-    return PREDICTIONS
+def prediction_list_tool(known_version: Optional[str] = None, accept: Optional[str] = None) -> CallToolResult:
+    """
+    The predictions of the latest cycle. The version is in the result's _meta; pass it back as
+    `known_version` to get a {"status": "not_modified"} reply while they are unchanged.
+    `accept` lists the bulk encodings the caller reads (common.bulk).
+    """
+    logging.debug("[insight_worker_server] prediction_list_tool called. Returning %d predictions.", len(PREDICTIONS))
+    return PREDICTION_READS.respond(("prediction_list",), known_version, lambda: PREDICTIONS, accept)
+
+@mcp_server.tool("insight_summary")
+def insight_summary_tool() -> Dict[str, Any]:
+    """
+    Rolling marketplace analytics from the match stream: matches per minute by need classification,
+    fulfillment and delivery success ratios, need-to-match latency and price/budget percentiles.
+    """
+    return ANALYTICS.summary()
+
+def startup() -> None:
+    asyncio.create_task(sync_and_predict()) # Call it with the event loop running
+    asyncio.create_task(stream_analytics())
+    start_loop_monitor()
 
 async def main():
     logging.info("[insight_worker] Insight Worker (MCP Server) starting...")
     # Start the background task
-    asyncio.create_task(sync_and_predict())
+    startup()
     
     # Run the MCP server
     logging.info(f"[insight_worker] MCP server starting on {mcp_server.settings.host}:{mcp_server.settings.port}")
@@ -1,7 +1,6 @@
 import uuid
 import random
 import time
-from datetime import datetime
 import asyncio
 import logging
 import json
@@ -10,12 +9,17 @@ from typing import Any, Optional, Dict, List
 from mcp.client.streamable_http import streamablehttp_client
 from mcp import ClientSession
 
-# Configure basic logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from common.logging_setup import configure_logging
+from common.mcp_client import parse_mcp_list_result
+from common.pricing import reprice_and_publish
+
+# Configure logging (LOG_LEVEL / LOG_FORMAT from the environment)
+configure_logging("merchant-simulator")
 
 # MCP endpoints
 SUPPLY_MCP_URL = "http://supplier-agent:9005/mcp"
 OFFER_MCP_URL  = "http://opportunity-agent:9003/mcp"
+NEED_MCP_URL   = "http://needs-worker:9001/mcp" # need_demand, for pricing
 
 # Define merchant profiles
 MERCHANT_TYPES = [
@@ -108,7 +112,8 @@ def create_merchants(n: int = 5):
             "name": name,
             "type": profile["type"],
             "specialty": profile["specialty"],
-            "markup": profile["markup"]
+            "markup": profile["markup"],
+            "inventory": {} # sku -> quantity held, offered at the prices common.pricing sets each cycle
         })
     logging.info(f"Created {len(MERCHANTS)} merchants.")
 
@@ -117,35 +122,8 @@ def simulate_cycle():
     logging.info("Starting simulation cycle...")
     
     # Get supplies from supplier-agent (now MCP)
-    supplies_response_raw = asyncio.run(call_mcp_tool(SUPPLY_MCP_URL, "supply_list"))
-    supplies: List[Dict[str, Any]] = []
-
-    if supplies_response_raw is not None:
-        if hasattr(supplies_response_raw, 'content') and isinstance(supplies_response_raw.content, list):
-            logging.info(f"Processing CallToolResult from supply_list with {len(supplies_response_raw.content)} items in content.")
-            for text_content_item in supplies_response_raw.content:
-                if hasattr(text_content_item, 'text') and isinstance(text_content_item.text, str):
-                    try:
-                        json_dict = json.loads(text_content_item.text)
-                        if isinstance(json_dict, dict):
-                            supplies.append(json_dict)
-                        else:
-                            logging.warning(f"Parsed item from supply_list is not a dict: {type(json_dict)}")
-                    except json.JSONDecodeError as je:
-                        logging.error(f"Failed to parse JSON from TextContent in supply_list response: '{text_content_item.text}'. Error: {je}")
-                else:
-                    logging.warning(f"Item in supply_list response.content is not TextContent or 'text' is not str: {text_content_item}")
-        elif isinstance(supplies_response_raw, list): # Fallback if it ever returns a direct list
-            logging.info("Received direct list from supply_list.")
-            for item in supplies_response_raw:
-                if isinstance(item, dict):
-                    supplies.append(item)
-                else:
-                    logging.warning(f"Item in direct list from supply_list is not a dict: {type(item)}")
-        else:
-            logging.warning(f"Received an unexpected response type from supply_list: {type(supplies_response_raw)} - {supplies_response_raw}")
-    else:
-        logging.warning("Received None response from supply_list call.")
+    # supply_list sends the whole list in one content item; the shared parser reads both layouts
+    supplies = parse_mcp_list_result(asyncio.run(call_mcp_tool(SUPPLY_MCP_URL, "supply_list")), "supply_list")
 
     if not supplies:
         logging.warning("No supplies available from supplier-agent. Skipping merchant processing for this cycle.")
@@ -177,33 +155,14 @@ def simulate_cycle():
             delivered_quantity = purchase_result_dict.get('quantity_delivered', 0)
             logging.info(f"Merchant {m['name']} successfully purchased {delivered_quantity}x {item_to_purchase['sku']} via MCP.")
             
-            price_bought = item_to_purchase.get("price", 0)
-            sell_price = round(price_bought * (1 + m["markup"]), 2)
-            
-            offer_payload = {
-                "sku": item_to_purchase["sku"],
-                "supplier_sku": item_to_purchase.get("sku"),
-                "merchant_id": m["id"],
-                "merchant_name": m["name"],
-                "type": item_to_purchase.get("type"),
-                "name": item_to_purchase.get("name"),
-                "price": sell_price,
-                "quantity": delivered_quantity
-            }
-            
-            mcp_arguments = {"offer": offer_payload}
-            logging.info(f"Merchant {m['name']} attempting to publish offer for {offer_payload['sku']} via MCP to opportunity-agent.")
-            
-            offer_publish_response_raw = asyncio.run(call_mcp_tool(OFFER_MCP_URL, "offer_publish", arguments=mcp_arguments))
-            offer_publish_result_dict = parse_mcp_single_dict_result(offer_publish_response_raw)
-            
-            if offer_publish_result_dict and (offer_publish_result_dict.get("status") == "stored" or offer_publish_result_dict.get("status") == "added" or offer_publish_result_dict.get("status") == "updated"): # Accommodate new statuses from upgraded opportunity_agent
-                logging.info(f"[{datetime.utcnow().isoformat()}Z] Merchant {m['name']} listed {offer_payload['quantity']}x {offer_payload['sku']} at {sell_price}. MCP Parsed Response: {offer_publish_result_dict}")
-            else:
-                logging.warning(f"[{datetime.utcnow().isoformat()}Z] Merchant {m['name']} failed to list offer for {offer_payload['sku']}. MCP Raw Response: {offer_publish_response_raw}, Parsed: {offer_publish_result_dict}")
+            inventory = m["inventory"]
+            inventory[item_to_purchase["sku"]] = inventory.get(item_to_purchase["sku"], 0) + delivered_quantity
         else:
             logging.warning(f"Merchant {m['name']} failed to purchase {item_to_purchase['sku']} via MCP. Raw Response: {purchase_response_raw}, Parsed: {purchase_result_dict}")
 
+    # Price everything the merchants hold from this cycle's demand, stock and competing offers, in one batch
+    asyncio.run(reprice_and_publish(MERCHANTS, supplies, NEED_MCP_URL, OFFER_MCP_URL))
+
 if __name__ == "__main__":
     create_merchants(n=8) # Create 8 merchants by default
     logging.info("Merchant Simulator started. Press Ctrl+C to stop.")
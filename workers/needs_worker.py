@@ -1,66 +1,177 @@
 import asyncio
+import os
 import uuid
 import logging
+from collections import deque
 from datetime import datetime
 import json # For MCP response parsing if this worker calls other MCP services
-from typing import Any, Optional, Dict, List
+from typing import Any, Optional, Dict, List, Union
 
 from mcp.server.fastmcp import FastMCP
+from mcp.types import CallToolResult
+
+from common import metrics
+from common.debug import start_loop_monitor
+from common.expiry import ExpiryScheduler, parse_deadline
+from common.journal import Journal
+from common.leases import partition_of
+from common.logging_setup import configure_logging
+from common.read_cache import ReadCache
+from common.server import instrument_server
 # from mcp.client.streamable_http import streamablehttp_client # If it needs to call other MCP services
 # from mcp import ClientSession # If it needs to call other MCP services
 
-# Configure basic logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Configure logging (LOG_LEVEL / LOG_FORMAT from the environment)
+configure_logging("needs-worker")
 
 # MCP Server for this worker
 mcp_server = FastMCP("needs-worker")
 mcp_server.settings.port = 9001 # Port for this worker's MCP server
 mcp_server.settings.host = "0.0.0.0" # Recommended for Docker
+instrument_server(mcp_server) # Metrics middleware for every tool below
 
 # In-memory store for needs
 NEEDS: List[Dict[str, Any]] = []
 NEEDS_CREATED_COUNT: int = 0
 NEEDS_FULFILLED_COUNT: int = 0
+NEEDS_EXPIRED_COUNT: int = 0
+# Expired needs leave NEEDS; the most recent ones stay visible to need_get / need_list("expired")
+EXPIRED_NEEDS_RETENTION = int(os.getenv("EXPIRED_NEEDS_RETENTION", "1000"))
+EXPIRED_NEEDS: deque = deque(maxlen=EXPIRED_NEEDS_RETENTION)
+metrics.register_store_gauge(mcp_server.name, "needs", NEEDS)
+metrics.register_store_gauge(mcp_server.name, "expired_needs", EXPIRED_NEEDS)
+NEEDS_JOURNAL = Journal("needs", lambda: ((need["id"], need) for need in NEEDS)) # No-op unless STORE_DATA_DIR is set
+NEEDS_EXPIRED_TOTAL = metrics.REGISTRY.counter("needs_expired_total", "Needs moved to 'expired' at their expires_at.", agent=mcp_server.name)
+NEED_READS = ReadCache(mcp_server.name, "needs") # Versions need_list / need_summary; bumped on every change to NEEDS
 
-# --- MCP Tools ---
-@mcp_server.tool("need_add")
-def need_add_tool(need_data: Dict[str, Any]) -> Dict[str, Any]:
-    global NEEDS, NEEDS_CREATED_COUNT # Add NEEDS_CREATED_COUNT
-    if not isinstance(need_data, dict) or not need_data.get("what"): # Basic validation
-        logging.warning(f"[needs_worker_server] need_add_tool received invalid data: {need_data}")
-        return {"status": "error", "message": "Invalid need data provided."}
 
-    need_id = need_data.get("id", str(uuid.uuid4()))
+def expire_needs(need_ids: List[str]) -> None:
+    """Expiry callback: moves the due needs out of NEEDS with status 'expired'."""
+    global NEEDS_EXPIRED_COUNT
+    due = set(need_ids)
+    expired_at = datetime.utcnow().isoformat() + "Z"
+    remaining = []
+    for need in NEEDS:
+        if need.get("id") in due:
+            need["status"] = "expired"
+            need["expired_at"] = expired_at
+            EXPIRED_NEEDS.append(need)
+            NEEDS_JOURNAL.delete(need["id"])
+            NEEDS_EXPIRED_COUNT += 1
+            NEEDS_EXPIRED_TOTAL.inc()
+        else:
+            remaining.append(need)
+    expired_now = len(NEEDS) - len(remaining)
+    NEEDS[:] = remaining
+    NEED_READS.bump() # need_summary's pending_expiries changed even if the needs had gone already
+    logging.info("[needs_worker_server] Expired %d needs. Total expired: %d", expired_now, NEEDS_EXPIRED_COUNT)
+
+
+NEED_EXPIRY = ExpiryScheduler("needs", expire_needs)
+
+
+def restore_needs() -> None:
+    """Reloads NEEDS from the journal and re-arms their expiry deadlines."""
+    NEEDS[:] = list(NEEDS_JOURNAL.recover().values())
+    NEED_READS.bump()
+    for need in NEEDS:
+        deadline = parse_deadline(need.get("expires_at"))
+        if deadline is not None:
+            NEED_EXPIRY.schedule(need["id"], deadline)
+
+def store_need(need_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalizes a validated need, stores it, journals it and schedules its expiry."""
+    global NEEDS_CREATED_COUNT
+    need_id = need_data["id"] if "id" in need_data else str(uuid.uuid4()) # Only mint an id when none was given
     new_need = {
         "id": need_id,
         "what": need_data["what"],
         "classification": need_data.get("classification", "unknown"),
         "elements": need_data.get("elements", {}),
         "status": need_data.get("status", "open"), # Default to open
-        "created_at": need_data.get("created_at", datetime.utcnow().isoformat() + "Z"),
+        "created_at": need_data["created_at"] if "created_at" in need_data else datetime.utcnow().isoformat() + "Z",
         "expires_at": need_data.get("expires_at"), # Can be None
         "context": need_data.get("context", {})
     }
     NEEDS.append(new_need)
+    NEEDS_JOURNAL.put(need_id, new_need)
+    NEED_READS.bump()
     NEEDS_CREATED_COUNT += 1 # Increment created count
-    logging.info(f"[needs_worker_server] need_add_tool: Added need {new_need['id']}. Total created: {NEEDS_CREATED_COUNT}")
+    if new_need["expires_at"] is not None:
+        deadline = parse_deadline(new_need["expires_at"])
+        if deadline is None:
+            logging.warning("[needs_worker_server] Need %s has unparseable expires_at %r; it will not expire.", need_id, new_need["expires_at"])
+        else:
+            NEED_EXPIRY.schedule(need_id, deadline)
+    return new_need
+
+# --- MCP Tools ---
+@mcp_server.tool("need_add")
+def need_add_tool(need_data: Dict[str, Any]) -> Dict[str, Any]:
+    if not isinstance(need_data, dict) or not need_data.get("what"): # Basic validation
+        logging.warning(f"[needs_worker_server] need_add_tool received invalid data: {need_data}")
+        return {"status": "error", "message": "Invalid need data provided."}
+
+    new_need = store_need(need_data)
+    logging.info("[needs_worker_server] need_add_tool: Added need %s. Total created: %d", new_need['id'], NEEDS_CREATED_COUNT)
     return {"status": "added", "id": new_need["id"], "need": new_need}
 
+@mcp_server.tool("need_add_many")
+def need_add_many_tool(needs_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Adds a batch of needs in one call (bulk loaders and generators).
+    Invalid entries are skipped and reported in 'rejected' by their index.
+    """
+    if not isinstance(needs_data, list):
+        logging.warning(f"[needs_worker_server] need_add_many_tool received non-list data: {type(needs_data)}")
+        return {"status": "error", "message": "Invalid needs data provided, expected a list."}
+
+    ids, rejected = [], []
+    for index, need_data in enumerate(needs_data):
+        if not isinstance(need_data, dict) or not need_data.get("what"):
+            rejected.append({"index": index, "message": "Invalid need data provided."})
+            continue
+        ids.append(store_need(need_data)["id"])
+    logging.info("[needs_worker_server] need_add_many_tool: Added %d needs, %d rejected. Total created: %d", len(ids), len(rejected), NEEDS_CREATED_COUNT)
+    return {"status": "added", "ids": ids, "rejected": rejected}
+
 @mcp_server.tool("need_list")
-def need_list_tool(status_filter: Optional[str] = None) -> List[Dict[str, Any]]:
-    global NEEDS
-    logging.info(f"[needs_worker_server] need_list_tool called. Status filter: {status_filter}")
-    if status_filter:
-        return [need for need in NEEDS if need.get("status") == status_filter]
-    return NEEDS
+def need_list_tool(status_filter: Optional[str] = None, partitions: Optional[List[int]] = None,
+                   partition_count: Optional[int] = None, known_version: Optional[str] = None,
+                   accept: Optional[str] = None) -> CallToolResult:
+    """
+    Lists needs, optionally by status. With `partitions` and `partition_count`, only needs whose
+    id hashes (common.leases.partition_of) into one of those partitions are returned.
+    The collection version is in the result's _meta; pass it back as `known_version` to get a
+    {"status": "not_modified"} reply instead of the list while no need changed. `accept` lists the
+    bulk encodings the caller reads (common.bulk); without it the list is JSON.
+    """
+    logging.debug("[needs_worker_server] need_list_tool called. Status filter: %s", status_filter)
+    key = ("need_list", status_filter, tuple(partitions) if partitions is not None else None, partition_count)
+    return NEED_READS.respond(key, known_version, lambda: _list_needs(status_filter, partitions, partition_count), accept)
+
+def _list_needs(status_filter: Optional[str], partitions: Optional[List[int]], partition_count: Optional[int]) -> List[Dict[str, Any]]:
+    if status_filter == "expired":
+        needs = list(EXPIRED_NEEDS)
+    elif status_filter:
+        needs = [need for need in NEEDS if need.get("status") == status_filter]
+    else:
+        needs = NEEDS
+    if partitions is not None and partition_count:
+        wanted = set(partitions)
+        needs = [need for need in needs if partition_of(str(need.get("id", "")), partition_count) in wanted]
+    return needs
 
 @mcp_server.tool("need_get")
 def need_get_tool(id: str) -> Optional[Dict[str, Any]]:
     global NEEDS
-    logging.info(f"[needs_worker_server] need_get_tool called for ID: {id}")
+    logging.debug("[needs_worker_server] need_get_tool called for ID: %s", id)
     for need in NEEDS:
         if need.get("id") == id:
             return need
+    for need in EXPIRED_NEEDS:
+        if need.get("id") == id:
+            return need
     return None
 
 @mcp_server.tool("need_fulfill")
@@ -71,7 +182,7 @@ def need_fulfill_tool(id: str) -> Dict[str, Any]:
     A more robust implementation might change its status to 'fulfilled'.
     """
     global NEEDS, NEEDS_FULFILLED_COUNT # Add NEEDS_FULFILLED_COUNT
-    logging.info(f"[needs_worker_server] need_fulfill_tool called for ID: {id}")
+    logging.debug("[needs_worker_server] need_fulfill_tool called for ID: %s", id)
     need_found = False
     # Iterate backwards if removing to avoid index issues, or filter to a new list
     next_needs_list = []
@@ -83,39 +194,96 @@ def need_fulfill_tool(id: str) -> Dict[str, Any]:
             # next_needs_list.append(need) # Keep it in the list but as fulfilled
             # logging.info(f"[needs_worker_server] Need {id} status changed to fulfilled.")
             # Option 2: Remove (as currently implemented)
-            logging.info(f"[needs_worker_server] Need {id} fulfilled and will be removed.")
+            logging.info("[needs_worker_server] Need %s fulfilled and will be removed.", id)
             continue # Skip adding it to next_needs_list
         next_needs_list.append(need)
     
     if need_found:
         NEEDS[:] = next_needs_list # Update the list
+        NEED_READS.bump()
         NEEDS_FULFILLED_COUNT += 1 # Increment fulfilled count
+        NEED_EXPIRY.cancel(id)
+        NEEDS_JOURNAL.delete(id)
         return {"status": "fulfilled", "id": id, "message": "Need marked as fulfilled (removed/status updated)."}
     else:
         logging.warning(f"[needs_worker_server] Need {id} not found for fulfillment.")
         return {"status": "not_found", "id": id, "message": "Need not found."}
 
+def _need_budget(need: Dict[str, Any]) -> Optional[float]:
+    """The need's max_price (first numeric alternative), or None."""
+    max_price = need.get("elements", {}).get("max_price", {})
+    for value in max_price.get("alternatives", []) if isinstance(max_price, dict) else []:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+@mcp_server.tool("need_demand")
+def need_demand_tool(group_by: str = "what") -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Open-need demand per normalized `what` (lower case, single spaces), or per `classification` with
+    group_by="classification": the number of open needs and the quantiles of their max_price budgets.
+    Merchants pull it once per pricing cycle.
+    """
+    if group_by not in ("what", "classification"):
+        logging.warning(f"[needs_worker_server] need_demand_tool received invalid group_by: {group_by}")
+        return {"status": "error", "message": "group_by must be 'what' or 'classification'."}
+    groups: Dict[str, List[Any]] = {}
+    for need in NEEDS:
+        if need.get("status") != "open":
+            continue
+        key = " ".join(str(need.get(group_by) or "").lower().split()) if group_by == "what" else str(need.get(group_by) or "unknown")
+        group = groups.setdefault(key, [0, []])
+        group[0] += 1
+        budget = _need_budget(need)
+        if budget is not None:
+            group[1].append(budget)
+    demand = []
+    for key, (open_count, budgets) in groups.items():
+        budgets.sort()
+        row: Dict[str, Any] = {group_by: key, "open": open_count, "with_budget": len(budgets)}
+        for name, q in (("p25", 0.25), ("p50", 0.5), ("p75", 0.75), ("p90", 0.9)):
+            row[f"max_price_{name}"] = budgets[min(len(budgets) - 1, int(q * len(budgets)))] if budgets else None
+        demand.append(row)
+    logging.debug("[needs_worker_server] need_demand_tool(group_by=%s) -> %d groups.", group_by, len(demand))
+    return demand
+
 @mcp_server.tool("need_summary")
-def need_summary_tool() -> Dict[str, Any]: # Return type includes Any for "Error" case
+def need_summary_tool(known_version: Optional[str] = None) -> CallToolResult:
     """
-    Returns a summary of need counts.
+    Returns a summary of need counts. Versioned like need_list (`known_version`).
     """
-    global NEEDS, NEEDS_CREATED_COUNT, NEEDS_FULFILLED_COUNT
+    return NEED_READS.respond(("need_summary",), known_version, _summarize_needs)
+
+def _summarize_needs() -> Dict[str, Any]:
     # Count current open needs accurately by checking status
     current_open_needs_count = sum(1 for need in NEEDS if need.get("status") == "open")
-    logging.info(f"[needs_worker_server] need_summary_tool called. Returning counts.")
+    next_expiry = NEED_EXPIRY.next_deadline()
+    logging.debug("[needs_worker_server] need_summary_tool called. Returning counts.")
     return {
         "current_open_needs": current_open_needs_count,
         "total_needs_created": NEEDS_CREATED_COUNT,
         "total_needs_fulfilled": NEEDS_FULFILLED_COUNT,
+        "total_needs_expired": NEEDS_EXPIRED_COUNT,
+        "current_expired_retained": len(EXPIRED_NEEDS),
+        "pending_expiries": len(NEED_EXPIRY),
+        "next_expiry_at": datetime.utcfromtimestamp(next_expiry).isoformat() + "Z" if next_expiry is not None else None,
         "current_total_in_list": len(NEEDS) # For debugging or more detailed view
     }
 
+def startup() -> None:
+    """Restores the journal and starts the expiry sweeper; call it with the event loop running."""
+    # Needs are managed via MCP tool calls (need_add, need_fulfill); the expiry sweeper moves
+    # needs past their expires_at to 'expired'. It also starts on the first scheduled deadline.
+    restore_needs()
+    NEED_EXPIRY.start()
+    start_loop_monitor()
+
 async def main():
     logging.info("[needs_worker] Needs Worker (MCP Server) starting...")
-    # Automatic need generation and expiration tasks have been removed.
-    # Needs will be managed via MCP tool calls (e.g., need_add, need_fulfill).
-    
+    startup()
+
     # Run the MCP server
     logging.info(f"[needs_worker] MCP server starting on {mcp_server.settings.host}:{mcp_server.settings.port}")
     await mcp_server.run_streamable_http_async()
@@ -1,189 +1,190 @@
 import asyncio
-import uuid
+import hashlib
+import json
+import os
 import random
 import time
 from datetime import datetime
-import json
 import logging
-from typing import Any, Optional, Dict, List
+from typing import Any, Optional, Dict, List, Set, Tuple
 
-from mcp.client.streamable_http import streamablehttp_client
-from mcp import ClientSession
+from common.journal import Journal
+from common.logging_setup import configure_logging
+from common.mcp_client import call_mcp_tool_async, parse_mcp_single_dict_result, read_versioned
 
-# Configure basic logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Configure logging (LOG_LEVEL / LOG_FORMAT from the environment)
+configure_logging("supplier-product-creator")
 
 # MCP endpoints
-NEED_MCP_URL    = "http://needs-worker:9001/mcp"
-SUPPLY_MCP_URL  = "http://supplier-agent:9005/mcp"
-
-# --- MCP Client Helper ---
-async def call_mcp_tool_async(mcp_url: str, tool_name: str, arguments: Optional[Dict[str, Any]] = None) -> Optional[Any]:
-    """
-    Calls a tool on an MCP server asynchronously.
-    """
-    try:
-        async with streamablehttp_client(mcp_url) as (read_stream, write_stream, _):
-            async with ClientSession(read_stream, write_stream) as session:
-                await session.initialize()
-                logging.debug(f"[supplier_product_creator] Calling MCP tool '{tool_name}' at {mcp_url} with arguments: {arguments}")
-                response = await session.call_tool(tool_name, arguments=arguments or {})
-                logging.debug(f"[supplier_product_creator] MCP response from '{tool_name}': {response}")
-                return response
-    except Exception as e:
-        logging.error(f"[supplier_product_creator] MCP call to tool '{tool_name}' at {mcp_url} failed: {e}", exc_info=True)
-        return None
-
-# Helper: Parse MCP tool result expected to be a list of dictionaries
-def parse_mcp_list_result(tool_response: Optional[Any], tool_name_for_log: str = "MCP tool") -> List[Dict[str, Any]]:
-    parsed_list: List[Dict[str, Any]] = []
-    if tool_response is None:
-        logging.warning(f"[supplier_product_creator_parser] {tool_name_for_log} call returned None.")
-        return parsed_list
-    
-    if hasattr(tool_response, 'content') and isinstance(tool_response.content, list):
-        for text_content_item in tool_response.content:
-            if hasattr(text_content_item, 'text') and isinstance(text_content_item.text, str):
-                try:
-                    item_data = json.loads(text_content_item.text)
-                    if isinstance(item_data, dict):
-                        parsed_list.append(item_data)
-                    elif isinstance(item_data, list): # If the text content itself is a JSON list
-                        for sub_item in item_data:
-                            if isinstance(sub_item, dict):
-                                parsed_list.append(sub_item)
-                            else:
-                                logging.warning(f"[supplier_product_creator_parser] Sub-item in JSON list from {tool_name_for_log} is not a dict: {type(sub_item)}")
-                    else:
-                        logging.warning(f"[supplier_product_creator_parser] Parsed item from {tool_name_for_log} is not a dict or list: {type(item_data)}")
-                except json.JSONDecodeError as je:
-                    logging.error(f"[supplier_product_creator_parser] Failed to parse JSON from {tool_name_for_log} response: '{text_content_item.text}'. Error: {je}")
-    elif isinstance(tool_response, list): # Direct list response
-        for item in tool_response:
-            if isinstance(item, dict):
-                parsed_list.append(item)
-    else:
-        logging.warning(f"[supplier_product_creator_parser] Unexpected {tool_name_for_log} response type: {type(tool_response)}")
-    return parsed_list
-
-# Helper: Parse MCP tool result expected to be a single dictionary
-def parse_mcp_single_dict_result(tool_response: Optional[Any], tool_name_for_log: str = "MCP tool") -> Optional[Dict[str, Any]]:
-    if tool_response is None:
-        logging.warning(f"[supplier_product_creator_parser] {tool_name_for_log} call returned None.")
-        return None
-    
-    if hasattr(tool_response, 'content') and isinstance(tool_response.content, list):
-        if not tool_response.content:
-            logging.warning(f"[supplier_product_creator_parser] {tool_name_for_log} response content is empty list.")
-            return None
-        first_content_item = tool_response.content[0]
-        if hasattr(first_content_item, 'text') and isinstance(first_content_item.text, str):
-            try:
-                parsed_dict = json.loads(first_content_item.text)
-                if isinstance(parsed_dict, dict):
-                    return parsed_dict
-                else:
-                    logging.error(f"[supplier_product_creator_parser] Parsed JSON from {tool_name_for_log} is not a dict: {type(parsed_dict)}")
-                    return None
-            except json.JSONDecodeError as je:
-                logging.error(f"[supplier_product_creator_parser] Failed to parse JSON from {tool_name_for_log}: '{first_content_item.text}'. Error: {je}")
-                return None
-    elif isinstance(tool_response, dict): # Direct dict response
-        return tool_response
-    else:
-        logging.warning(f"[supplier_product_creator_parser] Unexpected {tool_name_for_log} response type for single dict: {type(tool_response)}")
-        return None
-
-# Generate a supply item matching a need
-def generate_item_for_need(need: Dict[str, Any], supplier_id: str) -> Dict[str, Any]:
+NEED_MCP_URL    = os.getenv("NEED_MCP_URL", "http://needs-worker:9001/mcp")
+SUPPLY_MCP_URL  = os.getenv("SUPPLY_MCP_URL", "http://supplier-agent:9005/mcp")
+
+CREATOR_CYCLE_INTERVAL_SECONDS = float(os.getenv("CREATOR_CYCLE_INTERVAL_SECONDS", "60"))
+SUPPLY_ADD_BATCH_SIZE = int(os.getenv("SUPPLY_ADD_BATCH_SIZE", "50"))        # Supplies per supply_add_many call
+SUPPLY_ADD_CONCURRENCY = int(os.getenv("SUPPLY_ADD_CONCURRENCY", "4"))       # supply_add_many calls in flight
+SUPPLIER_ID = os.getenv("SUPPLIER_ID", "supplier-auto")
+
+# Needs already turned into supply: need id -> {"hash": content hash, "sku": shared SKU}.
+# Entries are evicted once the need is no longer open (fulfilled or expired).
+PROCESSED_NEEDS: Dict[str, Dict[str, str]] = {}
+PROCESSED_NEEDS_JOURNAL = Journal("processed_needs", PROCESSED_NEEDS.items) # Survives restarts when STORE_DATA_DIR is set
+
+def need_content_hash(need: Dict[str, Any]) -> str:
+    """Hash of the fields that shape the generated supply; an edited need is processed again."""
+    content = {field: need.get(field) for field in ("what", "classification", "elements")}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def classify_need(need: Dict[str, Any]) -> Tuple[str, str]:
+    """Returns (item_type, item_category) for a need."""
     classification = need.get('classification', 'unknown').lower()
     item_type = 'product' if classification == 'goods' else 'service' # Default to service if not goods
 
-    # Base price variation from need's max_price if available
-    max_price_elem = need.get('elements', {}).get('max_price', {})
-    alts = max_price_elem.get('alternatives', [])
-    base_price = 100.0 # Default base price
-    try:
-        if alts and isinstance(alts[0], (str, int, float)):
-            base_price = float(alts[0])
-    except ValueError:
-        logging.warning(f"Could not parse base_price from need: {alts[0]}")
-
-    price = round(base_price * random.uniform(0.7, 1.5), 2) # Supplier price can be lower or higher
-
-    need_what = need.get('what', 'Generic Item')
-    sku_suffix = ''.join(random.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789", k=6))
-    sku = f"SUPPLY-{need.get('id', 'UNKNOWNID')[:4]}-{sku_suffix}"
-    
-    name = f"Supply for: {need_what}"
-    if "consulting" in need_what.lower():
+    need_what = need.get('what', 'Generic Item').lower()
+    if "consulting" in need_what:
         item_category = "consulting"
-    elif "financial" in need_what.lower():
+    elif "financial" in need_what:
         item_category = "financial services"
-    elif "electronic" in need_what.lower() or "laptop" in need_what.lower() or "phone" in need_what.lower():
+    elif "electronic" in need_what or "laptop" in need_what or "phone" in need_what:
         item_category = "electronics"
-    elif "cleaning" in need_what.lower():
+    elif "cleaning" in need_what:
         item_category = "cleaning"
     else:
         item_category = "general"
+    return item_type, item_category
+
+def demand_key(need: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Needs with the same key share one SKU: same type and category, same item wanted."""
+    item_type, item_category = classify_need(need)
+    return item_type, item_category, " ".join(need.get('what', 'Generic Item').lower().split())
+
+def sku_for(key: Tuple[str, str, str]) -> str:
+    """Deterministic SKU for a demand key, so restarts and other creators reuse it."""
+    digest = hashlib.sha1("|".join(key).encode()).hexdigest()[:8].upper()
+    return f"SUPPLY-{key[1].upper().replace(' ', '')[:10]}-{digest}"
 
+def need_base_price(need: Dict[str, Any]) -> Optional[float]:
+    alts = need.get('elements', {}).get('max_price', {}).get('alternatives', [])
+    try:
+        if alts and isinstance(alts[0], (str, int, float)):
+            return float(alts[0])
+    except ValueError:
+        logging.warning(f"Could not parse base_price from need: {alts[0]}")
+    return None
 
+# Generate one supply item covering every need in a demand group
+def generate_item_for_group(sku: str, key: Tuple[str, str, str], needs: List[Dict[str, Any]], supplier_id: str) -> Dict[str, Any]:
+    item_type, item_category, _ = key
+    prices = [price for price in (need_base_price(need) for need in needs) if price is not None]
+    base_price = sum(prices) / len(prices) if prices else 100.0 # Default base price
+    price = round(base_price * random.uniform(0.7, 1.5), 2) # Supplier price can be lower or higher
+
+    need_what = needs[0].get('what', 'Generic Item')
     return {
         "sku": sku,
-        "name": name,
+        "name": f"Supply for: {need_what}",
         "type": item_type, # product or service
         "category": item_category, # e.g. electronics, consulting
-        "description": f"Generated supply for need '{need.get('id')}': {need_what}",
-        "stock": random.randint(10, 200),
+        "description": f"Generated supply for {len(needs)} need(s): {need_what}",
+        "stock": max(random.randint(10, 200), len(needs)),
         "price": price,
         "supplier_id": supplier_id, # Could be useful for tracking
         "created_at": datetime.utcnow().isoformat() + "Z",
-        "original_need_id": need.get('id')
+        "original_need_id": needs[0].get('id')
     }
 
-async def process_needs_and_create_supplies():
-    logging.info("[supplier_product_creator] Fetching needs from needs-worker via MCP...")
-    needs_response_raw = await call_mcp_tool_async(NEED_MCP_URL, "need_list")
-    needs = parse_mcp_list_result(needs_response_raw, "need_list")
+async def submit_supplies(items: List[Dict[str, Any]]) -> Set[str]:
+    """Sends items in supply_add_many batches, several batches at a time. Returns the SKUs accepted."""
+    semaphore = asyncio.Semaphore(SUPPLY_ADD_CONCURRENCY)
+
+    async def submit_batch(batch: List[Dict[str, Any]]) -> List[str]:
+        async with semaphore:
+            response_raw = await call_mcp_tool_async(SUPPLY_MCP_URL, "supply_add_many", arguments={"supplies": batch})
+        result = parse_mcp_single_dict_result(response_raw, "supply_add_many")
+        if not result or result.get("status") != "added_or_updated":
+            logging.warning(f"[supplier_product_creator] Failed to add a batch of {len(batch)} supplies via MCP. Parsed: {result}")
+            return []
+        if result.get("rejected"):
+            logging.warning(f"[supplier_product_creator] supply_add_many rejected: {result['rejected']}")
+        return result.get("skus", [])
+
+    batches = [items[start:start + SUPPLY_ADD_BATCH_SIZE] for start in range(0, len(items), SUPPLY_ADD_BATCH_SIZE)]
+    accepted: Set[str] = set()
+    for skus in await asyncio.gather(*(submit_batch(batch) for batch in batches)):
+        accepted.update(skus)
+    return accepted
+
+def evict_closed_needs(open_need_ids: Set[str]) -> int:
+    closed = [need_id for need_id in PROCESSED_NEEDS if need_id not in open_need_ids]
+    for need_id in closed:
+        del PROCESSED_NEEDS[need_id]
+        PROCESSED_NEEDS_JOURNAL.delete(need_id)
+    return len(closed)
 
-    if not needs:
-        logging.info("[supplier_product_creator] No needs found to process.")
+async def process_needs_and_create_supplies():
+    started = time.perf_counter()
+    logging.info("[supplier_product_creator] Fetching open needs from needs-worker via MCP...")
+    needs, _ = await read_versioned(NEED_MCP_URL, "need_list", {"status_filter": "open"})
+    if needs is None:
+        logging.warning("[supplier_product_creator] need_list failed; keeping the processed-need cache as is.")
         return
 
-    supplier_id = f"supplier-auto-{uuid.uuid4().hex[:6]}" # Generic supplier ID for this creator
-    logging.info(f"[supplier_product_creator] Processing {len(needs)} needs for supplier {supplier_id}...")
-
+    open_need_ids: Set[str] = set()
+    groups: Dict[str, Tuple[Tuple[str, str, str], List[Dict[str, Any]]]] = {} # sku -> (demand key, new needs)
+    pending_hashes: Dict[str, str] = {}
     for need in needs:
         if not isinstance(need, dict) or not need.get('id'):
             logging.warning(f"[supplier_product_creator] Skipping invalid need object: {need}")
             continue
-        
-        # Simple logic: create one supply item for each need found
-        supply_item = generate_item_for_need(need, supplier_id)
-        logging.info(f"[supplier_product_creator] Generated supply item: {supply_item['sku']} for need: {need.get('id')}")
-
-        mcp_arguments = {"supply": supply_item}
-        add_response_raw = await call_mcp_tool_async(SUPPLY_MCP_URL, "supply_add", arguments=mcp_arguments)
-        add_result = parse_mcp_single_dict_result(add_response_raw, "supply_add")
-
-        if add_result and add_result.get("status") == "added_or_updated":
-            logging.info(f"[supplier_product_creator] Successfully added/updated supply {supply_item['sku']} via MCP. Response: {add_result}")
-        else:
-            logging.warning(f"[supplier_product_creator] Failed to add/update supply {supply_item['sku']} via MCP. Raw: {add_response_raw}, Parsed: {add_result}")
-        
-        await asyncio.sleep(0.1) # Small delay between processing each need
+        open_need_ids.add(need['id'])
+        content_hash = need_content_hash(need)
+        cached = PROCESSED_NEEDS.get(need['id'])
+        if cached is not None and cached["hash"] == content_hash:
+            continue
+        key = demand_key(need)
+        groups.setdefault(sku_for(key), (key, []))[1].append(need)
+        pending_hashes[need['id']] = content_hash
+    evicted = evict_closed_needs(open_need_ids)
 
-if __name__ == "__main__":
+    if not groups:
+        logging.info("[supplier_product_creator] No new needs among %d open (%d evicted from cache).", len(open_need_ids), evicted)
+        return
+
+    # One supply_list per cycle tells which shared SKUs already exist (also after a supplier restart)
+    supplies, _ = await read_versioned(SUPPLY_MCP_URL, "supply_list")
+    if supplies is None:
+        logging.warning("[supplier_product_creator] supply_list failed; retrying the new needs next cycle.")
+        return
+    existing_skus = {supply.get("sku") for supply in supplies}
+
+    new_items = [generate_item_for_group(sku, key, group, SUPPLIER_ID)
+                 for sku, (key, group) in groups.items() if sku not in existing_skus]
+    accepted_skus = await submit_supplies(new_items) if new_items else set()
+
+    processed = 0
+    for sku, (_, group) in groups.items():
+        if sku in existing_skus or sku in accepted_skus:
+            for need in group:
+                PROCESSED_NEEDS[need['id']] = {"hash": pending_hashes[need['id']], "sku": sku}
+                PROCESSED_NEEDS_JOURNAL.put(need['id'], PROCESSED_NEEDS[need['id']])
+                processed += 1
+    logging.info("[supplier_product_creator] Processed %d of %d new needs into %d SKUs (%d created, %d reused), %d evicted, in %.3fs.",
+                 processed, len(pending_hashes), len(groups), len(accepted_skus), len(groups) - len(new_items), evicted,
+                 time.perf_counter() - started)
+
+async def main():
     logging.info("Supplier Product Creator (MCP) starting...")
+    PROCESSED_NEEDS.update(PROCESSED_NEEDS_JOURNAL.recover())
+    while True:
+        await process_needs_and_create_supplies()
+        logging.info(f"[supplier_product_creator] Cycle finished. Waiting for {CREATOR_CYCLE_INTERVAL_SECONDS} seconds...")
+        await asyncio.sleep(CREATOR_CYCLE_INTERVAL_SECONDS)
+
+if __name__ == "__main__":
     try:
-        while True:
-            asyncio.run(process_needs_and_create_supplies())
-            sleep_duration = 60 # seconds
-            logging.info(f"[supplier_product_creator] Cycle finished. Waiting for {sleep_duration} seconds...")
-            time.sleep(sleep_duration)
+        asyncio.run(main())
     except KeyboardInterrupt:
         logging.info("[supplier_product_creator] Stopped by user.")
     except Exception as e:
         logging.error(f"[supplier_product_creator] An unexpected error occurred: {e}", exc_info=True)
     finally:
-        logging.info("[supplier_product_creator] Shutting down.")
\ No newline at end of file
+        logging.info("[supplier_product_creator] Shutting down.")